@@ -21,6 +21,7 @@ from pru.trajectory_files import POSITIONS, TRAJECTORIES, TRAJ_METRICS
 from pru.trajectory_functions import generate_positions
 from pru.SmoothedTrajectory import write_SmoothedTrajectories_json_header, \
     SMOOTHED_TRAJECTORY_JSON_FOOTER
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -32,6 +33,7 @@ POSITION_FIELD_NAMES = POSITION_FIELDS[:-1].split(',')
 """The position fields for the pandas Dataframe."""
 
 
+@measure_stage
 def analyse_position_data(filename,
                           across_track_tolerance=DEFAULT_ACROSS_TRACK_TOLERANCE,
                           time_method=MOVING_AVERAGE_SPEED,
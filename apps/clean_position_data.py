@@ -21,6 +21,7 @@ from pru.trajectory_fields import POSITION_FIELDS, POSITION_ERROR_FIELDS, \
     CSV_FILE_EXTENSION
 from pru.trajectory_files import RAW, POSITIONS, ERROR_METRICS
 from pru.trajectory_functions import generate_positions
+from pru.stage_metrics import measure_stage, count_rows_in, count_rows_out
 from pru.logger import logger
 
 log = logger(__name__)
@@ -29,6 +30,7 @@ POSITION_FIELD_NAMES = POSITION_FIELDS[:-1].split(',')
 """The position fields for the pandas Dataframe."""
 
 
+@measure_stage
 def clean_position_data(filename, max_speed=DEFAULT_MAX_SPEED,
                         distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
     """
@@ -107,6 +109,9 @@ def clean_position_data(filename, max_speed=DEFAULT_MAX_SPEED,
                                            header=False, mode='a',
                                            date_format=ISO8601_DATETIME_FORMAT)
 
+                    count_rows_in(len(positions))
+                    count_rows_out(len(valid_positions))
+
                     error_metrics.insert(0, flight_id)
                     error_writer.writerow(error_metrics)
 
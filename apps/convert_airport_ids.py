@@ -13,6 +13,8 @@ import errno
 import pandas as pd
 from pru.trajectory_fields import is_valid_iso8601_date, read_iso8601_date_string
 from pru.trajectory_files import create_flights_filename, FR24, IATA
+from pru.airport_codes import compile_airport_codes
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -21,6 +23,7 @@ DEFAULT_AIRPORTS_FILENAME = 'airports.csv'
 """ The default name of the file containing airport codes. """
 
 
+@measure_stage
 def convert_airport_ids(flights_filename,
                         airports_filename=DEFAULT_AIRPORTS_FILENAME):
 
@@ -50,22 +53,18 @@ def convert_airport_ids(flights_filename,
 
     log.info('flights file read ok')
 
-    # Read the airports into a pandas DataFrame
-    airports_df = pd.DataFrame()
+    # Read the airport codes, compiling them if necessary
     try:
-        airports_df = pd.read_csv(airports_filename, memory_map=True)
+        airport_codes = compile_airport_codes(airports_filename)
     except EnvironmentError:
         log.error('could not read file: %s', airports_filename)
         return errno.ENOENT
 
     log.info('airports file read ok')
 
-    # Create a new dataframe indexed by IATA_AP_CODE, referencing ICAO_AP_CODE
-    airport_codes_df = airports_df.set_index('IATA_AP_CODE')['ICAO_AP_CODE']
-
     # Replace flight IATA airport codes with ICAO airport codes
-    flights_df['ADEP'] = flights_df['ADEP'].replace(airport_codes_df)
-    flights_df['ADES'] = flights_df['ADES'].replace(airport_codes_df)
+    flights_df['ADEP'] = airport_codes.translate_iata_ids(flights_df['ADEP'].values)
+    flights_df['ADES'] = airport_codes.translate_iata_ids(flights_df['ADES'].values)
 
     log.info('airport ids converted')
 
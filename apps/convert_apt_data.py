@@ -9,16 +9,18 @@ Software to read Eurocontrol APDS files.
 
 import sys
 import os
-import bz2
-import csv
 import errno
+import numpy as np
 import pandas as pd
 from enum import IntEnum, unique
 from pru.trajectory_fields import \
     FLIGHT_FIELDS, FLIGHT_EVENT_FIELDS, POSITION_FIELDS, FlightEventType, \
-    is_valid_iso8601_date, iso8601_datetime_parser, has_bz2_extension, \
-    split_dual_date
+    is_valid_iso8601_date, split_dual_date
 from pru.trajectory_files import create_convert_apds_filenames
+from pru.airport_stands import AirportStands, compile_airport_stands
+from pru.csv_writers import write_flights, write_positions, write_events, \
+    FLIGHT_COLUMNS
+from pru.stage_metrics import measure_stage, count_rows_in, count_rows_out
 from pru.logger import logger
 
 log = logger(__name__)
@@ -51,100 +53,147 @@ class ApdsField(IntEnum):
     C100_BEARING = 21
 
 
-class ApdsEvent:
-    'A class for storing and outputting a APDS event'
-
-    def __init__(self, id, event, date_time):
-        self.id = id
-        self.event = event
-        self.date_time = date_time
-
-    def __lt__(self, other):
-        return self.event < other.event
-
-    def __repr__(self):
-        return '{},{},{}Z'. \
-            format(self.id, self.event, self.date_time.isoformat())
-
-
-class ApdsPosition:
-    'A class for storing and outputting a APDS poistion'
-
-    def __init__(self, id, date_time, latitude, longitude, airport, stand):
-        self.id = id
-        self.date_time = date_time
-        self.latitude = latitude
-        self.longitude = longitude
-        self.airport = airport
-        self.stand = stand
-
-    def __lt__(self, other):
-        return self.date_time < other.date_time
-
-    def __repr__(self):
-        return '{},,{}Z,{:.5f},{:.5f},,,,,1,APDS {} {},,'. \
-            format(self.id, self.date_time.isoformat(),
-                   self.latitude, self.longitude, self.airport, self.stand)
-
-
-class ApdsFlight:
-    'A class for reading, storing and outputting data for an APDS flight'
-
-    def __init__(self, apds_fields, airport_stands):
-        self.id = apds_fields[ApdsField.APDS_ID]
-        self.callsign = apds_fields[ApdsField.AP_C_FLTID]
-        self.registration = apds_fields[ApdsField.AP_C_REG]
-        self.aircraft_type = apds_fields[ApdsField.ARCTYP]
-        self.departure = apds_fields[ApdsField.ADEP_ICAO]
-        self.destination = apds_fields[ApdsField.ADES_ICAO]
-        self.events = []
-        self.positions = []
-
-        is_arrival = (apds_fields[ApdsField.SRC_PHASE] == 'ARR')
-        airport = self.destination if (is_arrival) else self.destination
-
-        # Get the take-off or landing event
-        if apds_fields[ApdsField.MVT_TIME_UTC]:
-            movement_event = FlightEventType.WHEELS_ON if (is_arrival) \
-                else FlightEventType.WHEELS_OFF
-            movement_time = iso8601_datetime_parser(apds_fields[ApdsField.MVT_TIME_UTC])
-            self.events.append(ApdsEvent(self.id, movement_event, movement_time))
-
-            # if the airport and runway is known, create a position
-            # if airport and apds_fields[ApdsField.AP_C_RWY]:
-
-        # Get the actual off-block or in-block event
-        if apds_fields[ApdsField.BLOCK_TIME_UTC]:
-            block_event = FlightEventType.GATE_IN if (is_arrival) \
-                else FlightEventType.GATE_OUT
-            block_time = iso8601_datetime_parser(apds_fields[ApdsField.BLOCK_TIME_UTC])
-            self.events.append(ApdsEvent(self.id, block_event, block_time))
-
-            # if the airport and stand is known, create a position
-            if len(airport_stands):
-                stand = apds_fields[ApdsField.AP_C_STND]
-                if airport and stand:
-                    if (airport, stand) in airport_stands.index:
-                        pos = airport_stands.loc[airport, stand]
-                        latitude = pos['LAT']
-                        longitude = pos['LON']
-                        self.positions.append(ApdsPosition(self.id, block_time,
-                                                           latitude, longitude,
-                                                           airport, stand))
-
-        # Get the scheduled off-block or in-block event
-        if apds_fields[ApdsField.SCHED_TIME_UTC]:
-            scheduled_event = FlightEventType.SCHEDULED_IN_BLOCK if (is_arrival) \
-                else FlightEventType.SCHEDULED_OFF_BLOCK
-            scheduled_time = iso8601_datetime_parser(apds_fields[ApdsField.SCHED_TIME_UTC])
-            self.events.append(ApdsEvent(self.id, scheduled_event, scheduled_time))
-
-    def __repr__(self):
-        return '{},{},{},{},,{},{}'. \
-            format(self.id, self.callsign, self.registration, self.aircraft_type,
-                   self.departure, self.destination)
-
-
+APDS_FIELDS = ['APDS_ID', 'AP_C_FLTID', 'AP_C_REG', 'ADEP_ICAO', 'ADES_ICAO',
+               'SRC_PHASE', 'MVT_TIME_UTC', 'BLOCK_TIME_UTC', 'SCHED_TIME_UTC',
+               'ARCTYP', 'AP_C_STND']
+""" The fields of an APDS line that are converted. """
+
+APDS_FLIGHT_COLUMNS = FLIGHT_COLUMNS[:FLIGHT_COLUMNS.index('ADES') + 1]
+""" The output flight columns, without the flight summary columns. """
+
+APDS_EVENT_TIMES = [('MVT_TIME_UTC', FlightEventType.WHEELS_ON,
+                     FlightEventType.WHEELS_OFF),
+                    ('BLOCK_TIME_UTC', FlightEventType.GATE_IN,
+                     FlightEventType.GATE_OUT),
+                    ('SCHED_TIME_UTC', FlightEventType.SCHEDULED_IN_BLOCK,
+                     FlightEventType.SCHEDULED_OFF_BLOCK)]
+""" The time fields of an APDS line with their arrival and departure events. """
+
+
+def apds_datetimes(values):
+    """
+    Parse APDS date time strings, e.g. 2017-08-01T12:34:56Z.
+
+    The format is parsed as an ISO 8601 format with a UTC offset, since
+    pandas parses ISO 8601 strings much faster than other formats.
+
+    Returns
+    -------
+    A numpy array of datetime64s in UTC.
+    """
+    return pd.to_datetime(values, format='%Y-%m-%dT%H:%M:%S%z').values
+
+
+def read_apds_flights(filename):
+    """
+    Read an APDS file into a DataFrame of typed columns.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the APDS file, it may be bz2 compressed.
+
+    Returns
+    -------
+    A pandas DataFrame of the APDS_FIELDS of the flights, sorted by APDS_ID,
+    and the number of lines read.
+    If a flight is repeated, its first line is used.
+    """
+    apds_df = pd.read_csv(filename, header=0,
+                          names=[field.name for field in ApdsField],
+                          usecols=APDS_FIELDS, dtype=str, na_filter=False)
+    lines_count = len(apds_df)
+    apds_df.drop_duplicates('APDS_ID', inplace=True)
+    apds_df.sort_values('APDS_ID', kind='mergesort', inplace=True)
+    apds_df.reset_index(drop=True, inplace=True)
+    return apds_df, lines_count
+
+
+def convert_apds_flights(apds_df):
+    """ The output flight columns of APDS flights. """
+    return pd.DataFrame({'FLIGHT_ID': apds_df['APDS_ID'].values,
+                         'CALLSIGN': apds_df['AP_C_FLTID'].values,
+                         'AIRCRAFT_REG': apds_df['AP_C_REG'].values,
+                         'AIRCRAFT_TYPE': apds_df['ARCTYP'].values,
+                         'ADEP': apds_df['ADEP_ICAO'].values,
+                         'ADES': apds_df['ADES_ICAO'].values})
+
+
+def convert_apds_events(apds_df):
+    """
+    Derive the events of APDS flights from their times.
+
+    Parameters
+    ----------
+    apds_df: a pandas DataFrame
+        The APDS flights, sorted by APDS_ID, see read_apds_flights.
+
+    Returns
+    -------
+    A pandas DataFrame of the FLIGHT_EVENT_COLUMNS of the events,
+    sorted by flight and event type.
+    """
+    is_arrival = (apds_df['SRC_PHASE'] == 'ARR').values
+    flights = []
+    event_types = []
+    times = []
+    for field, arrival_event, departure_event in APDS_EVENT_TIMES:
+        has_time = (apds_df[field] != '').values
+        flights.append(np.flatnonzero(has_time))
+        event_types.append(np.where(is_arrival[has_time], int(arrival_event),
+                                    int(departure_event)))
+        times.append(apds_datetimes(apds_df[field].values[has_time]))
+
+    flights = np.concatenate(flights)
+    event_types = np.concatenate(event_types)
+    indicies = np.lexsort((event_types, flights))
+    return pd.DataFrame({'FLIGHT_ID': apds_df['APDS_ID'].values[flights[indicies]],
+                         'EVENT_TYPE': event_types[indicies],
+                         'TIME': np.concatenate(times)[indicies]})
+
+
+def convert_apds_positions(apds_df, airport_stands):
+    """
+    Find the positions of APDS flights at their stands.
+
+    A flight has a position at its stand at its block time if its stand
+    is known: the arrival stand at ADES or the departure stand at ADEP.
+
+    Parameters
+    ----------
+    apds_df: a pandas DataFrame
+        The APDS flights, sorted by APDS_ID, see read_apds_flights.
+
+    airport_stands: an AirportStands
+        The positions of the airport stands.
+
+    Returns
+    -------
+    A pandas DataFrame of the positions, sorted by flight.
+    """
+    airports = np.where(apds_df['SRC_PHASE'] == 'ARR',
+                        apds_df['ADES_ICAO'], apds_df['ADEP_ICAO'])
+    stands = apds_df['AP_C_STND'].values
+    has_stand = (apds_df['BLOCK_TIME_UTC'] != '').values & \
+        (airports != '') & (stands != '')
+
+    latitudes, longitudes = airport_stands.find_positions(airports[has_stand],
+                                                          stands[has_stand])
+    is_known = ~np.isnan(latitudes)
+    flights = np.flatnonzero(has_stand)[is_known]
+    airports = airports[flights].astype(str)
+    stands = stands[flights].astype(str)
+    return pd.DataFrame(
+        {'FLIGHT_ID': apds_df['APDS_ID'].values[flights],
+         'TIME': apds_datetimes(apds_df['BLOCK_TIME_UTC'].values[flights]),
+         'LAT': latitudes[is_known],
+         'LON': longitudes[is_known],
+         'ON_GROUND': 1,
+         'SURVEILLANCE_SOURCE': np.char.add(np.char.add('APDS ', airports),
+                                            np.char.add(' ', stands))})
+
+
+@measure_stage
 def convert_apds_data(filename, stands_filename):
 
     # Extract the start and finish date strings from the filename
@@ -162,13 +211,10 @@ def convert_apds_data(filename, stands_filename):
 
     log.info('apds data file: %s', filename)
 
-    airport_stands_df = pd.DataFrame()
+    airport_stands = AirportStands()
     if stands_filename:
         try:
-            airport_stands_df = pd.read_csv(stands_filename,
-                                            index_col=['ICAO_ID', 'STAND_ID'],
-                                            memory_map=True)
-            airport_stands_df.sort_index()
+            airport_stands = compile_airport_stands(stands_filename)
         except EnvironmentError:
             log.error('could not read file: %s', stands_filename)
             return errno.ENOENT
@@ -177,19 +223,10 @@ def convert_apds_data(filename, stands_filename):
     else:
         log.info('airport stands not provided')
 
-    # A dict to hold the APDS flights
-    flights = {}
-
-    # Read the APDS flights file into flights
+    # Read the APDS flights file
     try:
-        is_bz2 = has_bz2_extension(filename)
-        with bz2.open(filename, 'rt',  newline="") if (is_bz2) else \
-                open(filename, 'r') as file:
-            reader = csv.reader(file, delimiter=',')
-            next(reader, None)  # skip the headers
-            for row in reader:
-                flights.setdefault(row[ApdsField.APDS_ID],
-                                   ApdsFlight(row, airport_stands_df))
+        apds_df, lines_count = read_apds_flights(filename)
+        count_rows_in(lines_count)
 
     except EnvironmentError:
         log.error('could not read file: %s', filename)
@@ -197,18 +234,15 @@ def convert_apds_data(filename, stands_filename):
 
     log.info('apds flights read ok')
 
-    valid_flights = 0
-
     # Output the APDS flight data
-    # finish_date
     output_files = create_convert_apds_filenames(start_date, finish_date)
     flight_file = output_files[0]
+    valid_flights = 0
     try:
         with open(flight_file, 'w') as file:
             file.write(FLIGHT_FIELDS)
-            for key, value in sorted(flights.items()):
-                print(value, file=file)
-                valid_flights += 1
+            valid_flights = write_flights(file, convert_apds_flights(apds_df),
+                                          columns=APDS_FLIGHT_COLUMNS)
 
         log.info('written file: %s', flight_file)
 
@@ -216,15 +250,13 @@ def convert_apds_data(filename, stands_filename):
         log.error('could not write file: %s', flight_file)
 
     # if airport stand data was provided
-    if len(airport_stands_df):
+    if len(airport_stands):
         # Output the APDS position data
         positions_file = output_files[1]
         try:
             with open(positions_file, 'w') as file:
                 file.write(POSITION_FIELDS)
-                for key, value in sorted(flights.items()):
-                    for event in sorted(value.positions):
-                        print(event, file=file)
+                write_positions(file, convert_apds_positions(apds_df, airport_stands))
 
             log.info('written file: %s', positions_file)
 
@@ -236,9 +268,7 @@ def convert_apds_data(filename, stands_filename):
     try:
         with open(event_file, 'w') as file:
             file.write(FLIGHT_EVENT_FIELDS)
-            for key, value in sorted(flights.items()):
-                for event in sorted(value.events):
-                    print(event, file=file)
+            count_rows_out(write_events(file, convert_apds_events(apds_df)))
 
         log.info('written file: %s', event_file)
 
@@ -8,16 +8,21 @@ Software to read a Eurocontrol archieved Correlated Position Report (CPR) file.
 
 import sys
 import os
-import gzip
-import csv
 import errno
+import gzip
+import numpy as np
 import pandas as pd
 from enum import IntEnum, unique
 import datetime
 from pru.trajectory_fields import \
     FLIGHT_FIELDS, FLIGHT_EVENT_FIELDS, POSITION_FIELDS, dms2decimal, \
     FlightEventType, ISO8601_DATE_FORMAT
+from pru.csv_writers import write_flights, write_positions, write_events, \
+    DEFAULT_FLIGHT_FORMATS, DEFAULT_POSITION_FORMATS
 from pru.trajectory_files import create_convert_cpr_filenames
+from pru.line_blocks import read_line_blocks, block_reader, map_line_blocks, \
+    DEFAULT_BLOCK_SIZE
+from pru.stage_metrics import measure_stage, count_rows_in, count_rows_out
 from pru.logger import logger
 
 log = logger(__name__)
@@ -57,6 +62,29 @@ CPR_DATETIME_FORMAT = '%y/%m/%d %H:%M:%S'
 """ The format of a date time string in a CPR file. """
 
 
+CPR_FIELDS = ['TACT_ID', 'DATE_TIME', 'SAC', 'SIC', 'CALLSIGN', 'DEPARTURE',
+              'DESTINATION', 'EOBT', 'LAT_LONG', 'FLIGHT_LEVEL', 'SSR_CODE',
+              'TRACK_VELOCITY', 'TRACK_MAGNETIC', 'VERTICAL_RATE',
+              'AIRCRAFT_ADDRESS']
+""" The fields of a CPR line that are converted. """
+
+CPR_FLIGHT_COLUMNS = ['CALLSIGN', 'DEPARTURE', 'DESTINATION', 'EOBT']
+""" The flight fields of the converted positions. """
+
+DUPLICATE_POSITION_COLUMNS = ['KEY', 'TIME', 'LAT', 'LON', 'ALT', 'SSR_CODE',
+                              'SAC', 'SIC', 'AIRCRAFT_ADDRESS']
+""" The columns that duplicate positions have in common. """
+
+CPR_FLIGHT_FORMATS = dict(DEFAULT_FLIGHT_FORMATS, FLIGHT_ID='{:d}')
+""" The formats of the output flight columns. """
+
+CPR_POSITION_FORMATS = dict(DEFAULT_POSITION_FORMATS, FLIGHT_ID='{:d}')
+""" The formats of the output position columns. """
+
+DEFAULT_PROCESSES = 1
+""" The default number of processes to convert the CPR lines. """
+
+
 def cpr_date_parser(d):
     """ Parse a CPR date into python datetime format. """
     return datetime.datetime.strptime(d, CPR_DATE_FORMAT)
@@ -102,127 +130,300 @@ def cpr_track2decimal(input):
     return dms2decimal(degrees, minutes, seconds)
 
 
-class CprPosition:
-    'A class for reading, storing and outputting a postion from a CPR file line entry'
-
-    def __init__(self, cpr_fields):
-        self.id = int(cpr_fields[CprField.TACT_ID])
-        self.date_time = cpr_datetime_parser(cpr_fields[CprField.DATE_TIME])
-        self.sac = int(cpr_fields[CprField.SAC]) if cpr_fields[CprField.SAC] else 0
-        self.sic = int(cpr_fields[CprField.SIC]) if cpr_fields[CprField.SIC] else 0
-
-        self.latitude, self.longitude = \
-            cpr_latlong2decimal(cpr_fields[CprField.LAT_LONG])
-
-        self.altitude = 0
-        if cpr_fields[CprField.FLIGHT_LEVEL]:
-            self.altitude = 100 * int(cpr_fields[CprField.FLIGHT_LEVEL])
-        self.ssr_code = cpr_fields[CprField.SSR_CODE]
-        self.ground_speed = 0.0
-        if cpr_fields[CprField.TRACK_VELOCITY]:
-            self.ground_speed = float(cpr_fields[CprField.TRACK_VELOCITY])
-        self.track_magnetic = -1.0
-        if cpr_fields[CprField.TRACK_MAGNETIC]:
-            self.track_magnetic = cpr_track2decimal(cpr_fields[CprField.TRACK_MAGNETIC])
-        self.vertical_rate = 0
-        if cpr_fields[CprField.VERTICAL_RATE]:
-            self.vertical_rate = int(cpr_fields[CprField.VERTICAL_RATE])
-        self.aircraft_address = ''
-        if cpr_fields[CprField.AIRCRAFT_ADDRESS]:
-            self.aircraft_address = '0x' + cpr_fields[CprField.AIRCRAFT_ADDRESS]
-
-    def __hash__(self):
-        return hash(hash(self.id) ^ hash(self.date_time) ^
-                    hash(self.latitude) ^ hash(self.longitude) ^
-                    hash(self.altitude) ^ hash(self.ssr_code) ^
-                    hash(self.sac) ^ hash(self.sic) ^
-                    hash(self.aircraft_address))
-
-    def __eq__(self, other):
-        return (self.id == other.id) \
-            and (self.date_time == other.date_time) \
-            and (self.latitude == other.latitude) \
-            and (self.longitude == other.longitude) \
-            and (self.altitude == other.altitude) \
-            and (self.ssr_code == other.ssr_code) \
-            and (self.sac == other.sac) \
-            and (self.sic == other.sic) \
-            and (self.aircraft_address == other.aircraft_address)
-
-    def __repr__(self):
-        return '{:d},,{}Z,{:.5f},{:.5f},{:d},{:.1f},{:.5f},{:d},,CPR 0x{:02x} 0x{:02x},{},\'{}\''. \
-            format(self.id, self.date_time.isoformat(), self.latitude, self.longitude,
-                   self.altitude, self.ground_speed, self.track_magnetic, self.vertical_rate,
-                   self.sac, self.sic, self.aircraft_address, self.ssr_code)
-
-
-class CprFlight:
-    'A class for reading, storing and outputting data for a CPR flight'
-
-    def __init__(self, cpr_fields):
-        self.id = int(cpr_fields[CprField.TACT_ID])
-        self.callsign = cpr_fields[CprField.CALLSIGN]
-        self.departure = cpr_fields[CprField.DEPARTURE]
-        self.destination = cpr_fields[CprField.DESTINATION]
-        self.eobt = cpr_datetime_parser(cpr_fields[CprField.EOBT]) \
-            if (0 < len(cpr_fields[CprField.EOBT])) else ''
-        self.aircraft_address = ''
-        self.callsign2 = ''
-        self.aircraft_address2 = []
-        self.aircraft_addresses = []
-        self.ssr_codes = []
-        self.positions = []
-
-    def append(self, cpr_fields):
-        self.positions.append(CprPosition(cpr_fields))
-        if not self.callsign:
-            self.callsign = cpr_fields[CprField.CALLSIGN]
-        elif self.callsign != cpr_fields[CprField.CALLSIGN]:
-            self.callsign2 = cpr_fields[CprField.CALLSIGN]
-
-        if cpr_fields[CprField.AIRCRAFT_ADDRESS]:
-            mode_s_address = '0x' + cpr_fields[CprField.AIRCRAFT_ADDRESS]
-            self.aircraft_addresses.append(mode_s_address)
-
-        ssr_code = cpr_fields[CprField.SSR_CODE]
-        if ssr_code and (ssr_code != '0000') and (ssr_code not in self.ssr_codes):
-            self.ssr_codes.append(ssr_code)
-
-    def sort(self):
-        # Convert to a set and back to remove duplicate positions
-        self.positions = list(set(self.positions))
-        self.positions.sort(key=lambda position: position.date_time)
-
-        aircraft_addresses = pd.Series(self.aircraft_addresses)
-        addresses = aircraft_addresses.value_counts().index.tolist()
-        if addresses:
-            self.aircraft_address = addresses[0]
-            # aircraft_address2 lists first multiple aircraft_addresses, if any
-            if len(addresses) > 1:
-                self.aircraft_address2 = [addresses[1]]
-
-        # Ignore 0000 squawks
-        if self.ssr_codes and ('0000' in self.ssr_codes):
-            self.ssr_codes.remove('0000')
-
-    def is_valid(self):
-        """ Determine whether flight is valid """
-        return self.id and (len(self.positions) > 1)
-
-    def __repr__(self):
-        ssr_code_str = ''
-        if self.ssr_codes:
-            ssr_code_str = ' '.join(self.ssr_codes)
-
-        return '{:d},{},,,{},{},{},[{}],{}Z,{}Z,{}'. \
-            format(self.id, self.callsign, self.aircraft_address,
-                   self.departure, self.destination, ssr_code_str,
-                   self.positions[0].date_time.isoformat(),
-                   self.positions[-1].date_time.isoformat(),
-                   self.aircraft_address2)
-
-
-def convert_cpr_data(filename):
+def cpr_latlongs2decimals(latlongs):
+    """
+    Convert CPR file Latitudes and Longitudes into decimal angles.
+
+    The vectorised equivalent of cpr_latlong2decimal.
+
+    Parameters
+    ----------
+    latlongs: a pandas Series of strings
+        The CPR Latitude and Longitude strings.
+
+    Returns
+    -------
+    The latitudes and longitudes as numpy arrays of floats.
+    """
+    is_valid = (latlongs.str.len() == 16).values
+    valid = latlongs.loc[is_valid].str
+    latitudes = np.full(len(latlongs), -90.0)
+    longitudes = np.full(len(latlongs), -180.0)
+
+    latitudes[is_valid] = valid.slice(0, 2).astype(np.int64).values + \
+        (valid.slice(2, 4).astype(np.int64).values / 60.0) + \
+        (valid.slice(4, 6).astype(np.int64).values / 3600.0)
+    latitudes[is_valid] *= np.where((valid.get(6) == 'S').values, -1.0, 1.0)
+
+    longitudes[is_valid] = valid.slice(8, 11).astype(np.int64).values + \
+        (valid.slice(11, 13).astype(np.int64).values / 60.0) + \
+        (valid.slice(13, 15).astype(np.int64).values / 3600.0)
+    longitudes[is_valid] *= np.where((valid.get(15) == 'W').values, -1.0, 1.0)
+
+    return latitudes, longitudes
+
+
+def cpr_tracks2decimals(tracks):
+    """
+    Convert CPR file tracks into decimal angles.
+
+    The vectorised equivalent of cpr_track2decimal, empty tracks are -1.0.
+
+    Parameters
+    ----------
+    tracks: a pandas Series of strings
+        The CPR track strings.
+
+    Returns
+    -------
+    The tracks as a numpy array of floats.
+    """
+    is_valid = (tracks != '').values
+    valid = tracks.loc[is_valid].str
+    angles = np.full(len(tracks), -1.0)
+    angles[is_valid] = valid.slice(0, 3).astype(np.int64).values + \
+        (valid.slice(4, 6).astype(np.int64).values / 60.0) + \
+        (valid.slice(7, 9).astype(np.int64).values / 3600.0)
+    return angles
+
+
+def cpr_integers(values):
+    """ Convert CPR file integer strings into integers, empty strings are zero. """
+    return values.where(values != '', '0').astype(np.int64).values
+
+
+def convert_cpr_positions(cpr_df):
+    """
+    Convert the fields of CPR file lines into positions.
+
+    Parameters
+    ----------
+    cpr_df: a pandas DataFrame
+        The CPR_FIELDS of the lines as strings, lines without a TACT_ID
+        are ignored.
+
+    Returns
+    -------
+    A pandas DataFrame of the positions, with KEY (the TACT_ID string),
+    FLIGHT_ID, TIME, LAT, LON, ALT, SPEED_GND, TRACK_GND, VERT_SPEED, SAC,
+    SIC, AIRCRAFT_ADDRESS and SSR_CODE columns and the flight fields of the
+    positions in the CPR_FLIGHT_COLUMNS.
+    """
+    cpr_df = cpr_df.loc[cpr_df['TACT_ID'] != '']
+    latitudes, longitudes = cpr_latlongs2decimals(cpr_df['LAT_LONG'])
+    addresses = cpr_df['AIRCRAFT_ADDRESS']
+    return pd.DataFrame({'KEY': cpr_df['TACT_ID'].values,
+                         'FLIGHT_ID': cpr_df['TACT_ID'].astype(np.int64).values,
+                         'TIME': pd.to_datetime(cpr_df['DATE_TIME'],
+                                                format=CPR_DATETIME_FORMAT).values,
+                         'LAT': latitudes,
+                         'LON': longitudes,
+                         'ALT': 100 * cpr_integers(cpr_df['FLIGHT_LEVEL']),
+                         'SPEED_GND': cpr_df['TRACK_VELOCITY'].where(
+                             cpr_df['TRACK_VELOCITY'] != '', '0').astype(float).values,
+                         'TRACK_GND': cpr_tracks2decimals(cpr_df['TRACK_MAGNETIC']),
+                         'VERT_SPEED': cpr_integers(cpr_df['VERTICAL_RATE']),
+                         'SAC': cpr_integers(cpr_df['SAC']),
+                         'SIC': cpr_integers(cpr_df['SIC']),
+                         'AIRCRAFT_ADDRESS': addresses.where(addresses == '',
+                                                             '0x' + addresses).values,
+                         'SSR_CODE': cpr_df['SSR_CODE'].values,
+                         'CALLSIGN': cpr_df['CALLSIGN'].values,
+                         'DEPARTURE': cpr_df['DEPARTURE'].values,
+                         'DESTINATION': cpr_df['DESTINATION'].values,
+                         'EOBT': cpr_df['EOBT'].values})
+
+
+def convert_cpr_block(block):
+    """
+    Convert a block of CPR file lines into positions.
+
+    Parameters
+    ----------
+    block: bytes
+        The lines, see read_line_blocks.
+
+    Returns
+    -------
+    See convert_cpr_lines.
+    """
+    cpr_df = pd.read_csv(block_reader(block), sep=';', header=None,
+                         names=[field.name for field in CprField],
+                         usecols=CPR_FIELDS, dtype=str, na_filter=False)
+    return convert_cpr_lines(cpr_df)
+
+
+def convert_cpr_lines(cpr_df):
+    """
+    Convert the fields of CPR file lines into positions.
+
+    Parameters
+    ----------
+    cpr_df: a pandas DataFrame
+        The CPR_FIELDS of the lines as strings.
+
+    Returns
+    -------
+    A pandas DataFrame of the positions, see convert_cpr_positions, without
+    the CPR_FLIGHT_COLUMNS.
+    A pandas DataFrame of the KEY and CPR_FLIGHT_COLUMNS of the lines with
+    the flight fields.
+    The number of lines.
+    """
+    positions_df = convert_cpr_positions(cpr_df)
+
+    # Only the flight fields of the first line of each flight and the
+    # first line with a callsign are required
+    is_flight_line = ~positions_df.duplicated('KEY') | \
+        ((positions_df['CALLSIGN'] != '') &
+         ~positions_df.duplicated(['KEY', 'CALLSIGN']))
+    return positions_df.drop(columns=CPR_FLIGHT_COLUMNS), \
+        positions_df.loc[is_flight_line, ['KEY'] + CPR_FLIGHT_COLUMNS], len(cpr_df)
+
+
+def read_cpr_positions(filename, processes=DEFAULT_PROCESSES,
+                       blocksize=DEFAULT_BLOCK_SIZE):
+    """
+    Read the positions in a CPR file, in blocks of lines.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the CPR file, gzip compressed if it ends with 'z'.
+
+    processes: int
+        The number of processes to convert the blocks of lines.
+
+    blocksize: int
+        The size of the blocks of lines to convert at a time [Bytes].
+
+    Returns
+    -------
+    A pandas DataFrame of the positions in file order, see
+    convert_cpr_positions, without the CPR_FLIGHT_COLUMNS.
+    A pandas DataFrame of the KEY and CPR_FLIGHT_COLUMNS of the lines with
+    the flight fields, in file order.
+    The number of lines in the file.
+    """
+    is_gzip = (filename[-1] == 'z')
+    with gzip.open(filename, 'rb') if is_gzip else open(filename, 'rb') as file:
+        blocks = list(map_line_blocks(convert_cpr_block,
+                                      read_line_blocks(file, blocksize), processes))
+
+    # An empty file has no blocks, convert no lines for the empty DataFrames
+    if not blocks:
+        blocks = [convert_cpr_lines(pd.DataFrame(columns=CPR_FIELDS, dtype=str))]
+
+    frames, flight_frames, lines_counts = zip(*blocks)
+
+    return pd.concat(frames, ignore_index=True), \
+        pd.concat(flight_frames, ignore_index=True), sum(lines_counts)
+
+
+def summarise_cpr_flights(positions_df, flight_lines_df):
+    """
+    Summarise the positions of CPR flights.
+
+    Parameters
+    ----------
+    positions_df: a pandas DataFrame
+        All of the positions of the flights in file order, including
+        duplicates, see read_cpr_positions.
+
+    flight_lines_df: a pandas DataFrame
+        The flight fields of the lines of the flights in file order,
+        see read_cpr_positions.
+
+    Returns
+    -------
+    A pandas DataFrame of the flights, indexed and sorted by flight KEY with:
+    FLIGHT_ID, CALLSIGN, AIRCRAFT_ADDRESS, ADEP, ADES, SSR_CODES, PERIOD_START,
+    PERIOD_FINISH, SOURCE_IDS and EOBT columns.
+    """
+    flights = positions_df.groupby('KEY', sort=True)
+    flights_df = pd.DataFrame({'FLIGHT_ID': flights['FLIGHT_ID'].first(),
+                               'PERIOD_START': flights['TIME'].min(),
+                               'PERIOD_FINISH': flights['TIME'].max()})
+
+    # The departure, destination and EOBT of the first position of each flight
+    first_df = flight_lines_df.drop_duplicates('KEY').set_index('KEY')
+    flights_df['ADEP'] = first_df['DEPARTURE']
+    flights_df['ADES'] = first_df['DESTINATION']
+    flights_df['EOBT'] = first_df['EOBT']
+
+    # The first non-empty callsign of each flight
+    callsigns_df = flight_lines_df.loc[flight_lines_df['CALLSIGN'] != '']
+    flights_df['CALLSIGN'] = callsigns_df.drop_duplicates('KEY').set_index('KEY')['CALLSIGN']
+
+    # The most frequent aircraft addresses of each flight, the first address
+    # is the most frequent, ties are in order of first position
+    addresses_df = positions_df.loc[positions_df['AIRCRAFT_ADDRESS'] != '',
+                                    ['KEY', 'AIRCRAFT_ADDRESS']]
+    addresses_df = addresses_df.reset_index().groupby(['KEY', 'AIRCRAFT_ADDRESS'],
+                                                      sort=False)['index']
+    addresses_df = addresses_df.agg(['size', 'min']).reset_index()
+    addresses_df.sort_values(['KEY', 'size', 'min'], ascending=[True, False, True],
+                             inplace=True)
+    ranks = addresses_df.groupby('KEY', sort=False).cumcount().values
+    flights_df['AIRCRAFT_ADDRESS'] = \
+        addresses_df.loc[ranks == 0].set_index('KEY')['AIRCRAFT_ADDRESS']
+    flights_df['SOURCE_IDS'] = \
+        addresses_df.loc[ranks == 1].set_index('KEY')['AIRCRAFT_ADDRESS']
+
+    # The SSR codes of each flight in order of first position, ignoring 0000
+    ssr_codes_df = positions_df.loc[(positions_df['SSR_CODE'] != '') &
+                                    (positions_df['SSR_CODE'] != '0000'),
+                                    ['KEY', 'SSR_CODE']].drop_duplicates()
+    flights_df['SSR_CODES'] = ssr_codes_df.groupby('KEY', sort=False)['SSR_CODE'].agg(' '.join)
+
+    flights_df.fillna('', inplace=True)
+    return flights_df
+
+
+def remove_duplicate_positions(positions_df):
+    """
+    Remove duplicate positions and sort the positions by flight KEY and time.
+
+    Positions are duplicates if they have the same: flight, time, latitude,
+    longitude, altitude, SSR code, SAC, SIC and aircraft address.
+    The first of the duplicate positions is kept and positions at the same
+    time are in file order.
+
+    Parameters
+    ----------
+    positions_df: a pandas DataFrame
+        The positions in file order, see read_cpr_positions.
+
+    Returns
+    -------
+    A pandas DataFrame of the unique positions.
+    """
+    positions_df = positions_df.loc[~positions_df.duplicated(DUPLICATE_POSITION_COLUMNS)]
+    return positions_df.sort_values(['KEY', 'TIME'], kind='mergesort')
+
+
+def cpr_surveillance_sources(sacs, sics):
+    """
+    The surveillance sources of positions from their SAC and SIC codes.
+
+    Parameters
+    ----------
+    sacs, sics: numpy arrays of integers
+        The SAC and SIC codes of the positions.
+
+    Returns
+    -------
+    A list of the surveillance source strings, e.g. 'CPR 0x12 0x34'.
+    """
+    codes, inverse = np.unique(np.stack([sacs, sics], axis=1), axis=0,
+                               return_inverse=True)
+    sources = np.array(['CPR 0x{:02x} 0x{:02x}'.format(sac, sic)
+                        for sac, sic in codes.tolist()], dtype=object)
+    return sources[inverse.reshape(-1)].tolist()
+
+
+@measure_stage
+def convert_cpr_data(filename, processes=DEFAULT_PROCESSES):
     # Extract the date string from the filename and validate it
     file_date = os.path.basename(filename)[2:10]
     date = datetime.time()
@@ -238,59 +439,52 @@ def convert_cpr_data(filename):
 
     log.info('cpr file: %s', filename)
 
-    # A dict to hold the CPR flights
-    flights = {}
-
-    # Read the CPR file into flights
+    # Read the CPR file positions
+    positions_df = pd.DataFrame()
     try:
-        is_gzip = (filename[-1] == 'z')
-        with gzip.open(filename, 'rt',  newline="") if (is_gzip) else \
-                open(filename, 'r') as file:
-            reader = csv.reader(file, delimiter=';')
-            for row in reader:
-                # Only process lines with a valid TACT_ID
-                flight_id = row[CprField.TACT_ID]
-                if flight_id:
-                    flights.setdefault(flight_id, CprFlight(row)).append(row)
+        positions_df, flight_lines_df, lines_count = \
+            read_cpr_positions(filename, processes)
+        count_rows_in(lines_count)
 
     except EnvironmentError:
         log.error('could not read file: %s', filename)
         return errno.ENOENT
 
-    # sort positions in date time (time of track) order
-    for key, values in flights.items():
-        values.sort()
+    # Summarise the flights, then sort the unique positions in date time
+    # (time of track) order
+    flights_df = summarise_cpr_flights(positions_df, flight_lines_df)
+    positions_df = remove_duplicate_positions(positions_df)
     log.info('cpr file read ok')
 
-    valid_flights = 0
-
-    # Output the CPR flight data for all valid flights
+    # Output the CPR flight data for all flights
     output_files = create_convert_cpr_filenames(file_date)
     flight_file = output_files[0]
+    valid_flights = 0
     try:
         with open(flight_file, 'w') as file:
             file.write(FLIGHT_FIELDS)
-            for key, value in sorted(flights.items()):
-                if value.is_valid:
-                    print(value, file=file)
-                    valid_flights += 1
+            source_ids = flights_df['SOURCE_IDS']
+            valid_flights = write_flights(file, flights_df.assign(
+                SOURCE_IDS=source_ids.where(source_ids == '', "'" + source_ids + "'")),
+                CPR_FLIGHT_FORMATS)
 
         log.info('written file: %s', flight_file)
 
     except EnvironmentError:
         log.error('could not write file: %s', flight_file)
 
-    # Output the CPR event data for all valid flights
+    # Output the CPR event data for all flights
     events_file = output_files[1]
     try:
         with open(events_file, 'w') as file:
             file.write(FLIGHT_EVENT_FIELDS)
-            for key, value in sorted(flights.items()):
-                # Note: an event requires an eobt as well as a valid flight
-                if value.is_valid and value.eobt:
-                    scheduled_time = value.eobt.isoformat() + 'Z'
-                    print(key, int(FlightEventType.SCHEDULED_OFF_BLOCK),
-                          scheduled_time, sep=',', file=file)
+            # Note: an event requires an eobt
+            events_df = flights_df.loc[flights_df['EOBT'] != '']
+            write_events(file, pd.DataFrame(
+                {'FLIGHT_ID': events_df.index,
+                 'EVENT_TYPE': int(FlightEventType.SCHEDULED_OFF_BLOCK),
+                 'TIME': pd.to_datetime(events_df['EOBT'],
+                                        format=CPR_DATETIME_FORMAT).values}))
 
         log.info('written file: %s', events_file)
 
@@ -302,10 +496,10 @@ def convert_cpr_data(filename):
     try:
         with open(positions_file, 'w') as file:
             file.write(POSITION_FIELDS)
-            for key, value in sorted(flights.items()):
-                if value.is_valid:
-                    for pos in value.positions:
-                        print(pos, file=file)
+            positions_df['SURVEILLANCE_SOURCE'] = \
+                cpr_surveillance_sources(positions_df['SAC'].values,
+                                         positions_df['SIC'].values)
+            count_rows_out(write_positions(file, positions_df, CPR_POSITION_FORMATS))
 
         log.info('written file: %s', positions_file)
 
@@ -321,9 +515,13 @@ def convert_cpr_data(filename):
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print('Usage: convert_cpr_data.py <filename>')
+        print('Usage: convert_cpr_data.py <filename> [processes]')
         sys.exit(errno.EINVAL)
 
-    error_code = convert_cpr_data(sys.argv[1])
+    processes = DEFAULT_PROCESSES
+    if len(sys.argv) >= 3:
+        processes = int(sys.argv[2])
+
+    error_code = convert_cpr_data(sys.argv[1], processes)
     if error_code:
         sys.exit(error_code)
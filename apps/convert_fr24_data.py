@@ -4,18 +4,34 @@
 # Consult your license regarding permissions and restrictions.
 """
 Software to read Eurocontrol ADS-B flights and points files.
+
+The points file is read in a single streaming pass: each block of lines is
+converted into typed columns (optionally by multiple processes) and the
+points are appended to the temporary file of the partition of their flights.
+The flights are partitioned by their position in FLIGHT_ID order, so the
+partitions can be sorted and written independently (optionally in parallel)
+and then concatenated in order. Peak memory is proportional to the size of
+a partition rather than the whole day.
 """
 
 import sys
 import os
 import bz2
-import csv
 import errno
+import shutil
+import tempfile
+import concurrent.futures as cf
+import numpy as np
+import pandas as pd
 from enum import IntEnum, unique
 from pru.trajectory_fields import \
-    FLIGHT_FIELDS, POSITION_FIELDS, is_valid_iso8601_date, iso8601_datetime_parser, \
-    has_bz2_extension, read_iso8601_date_string
+    FLIGHT_FIELDS, POSITION_FIELDS, is_valid_iso8601_date, \
+    ISO8601_DATETIME_FORMAT, has_bz2_extension, read_iso8601_date_string
 from pru.trajectory_files import create_convert_fr24_filenames
+from pru.csv_writers import write_flights, write_positions, DEFAULT_POSITION_FORMATS
+from pru.line_blocks import read_line_blocks, block_reader, map_line_blocks, \
+    DEFAULT_BLOCK_SIZE
+from pru.stage_metrics import measure_stage, count_rows_in, count_rows_out
 from pru.logger import logger
 
 log = logger(__name__)
@@ -59,108 +75,264 @@ ICAO codes of special aircraft and others i.e.: 0000 and GRND.
 Not required in the output.
 """
 
-
-class AdsbPosition:
-    'A class for reading, storing and outputting a postion from an ADS-B file line entry'
-
-    def __init__(self, adsb_fields, aircraft_address):
-        self.id = '0x' + adsb_fields[AdsbPointField.FLIGHT_ID]
-        self.date_time = iso8601_datetime_parser(adsb_fields[AdsbPointField.EVENT_TIME])
-        self.radar_id = adsb_fields[AdsbPointField.RADAR_ID]
-        self.latitude = float(adsb_fields[AdsbPointField.LAT])
-        self.longitude = float(adsb_fields[AdsbPointField.LONG])
-        self.altitude = int(adsb_fields[AdsbPointField.ALT])
-        self.ssr_code = adsb_fields[AdsbPointField.SQUAWK]
-
-        self.ground_speed = 0.0
-        if adsb_fields[AdsbPointField.SPEED]:
-            self.ground_speed = float(adsb_fields[AdsbPointField.SPEED])
-        self.ground_track = -1.0
-        if adsb_fields[AdsbPointField.TRACK_GND]:
-            self.ground_track = float(adsb_fields[AdsbPointField.TRACK_GND])
-        self.vertical_rate = 0
-        if adsb_fields[AdsbPointField.VERT_SPEED]:
-            self.vertical_rate = int(adsb_fields[AdsbPointField.VERT_SPEED])
-
-        self.on_ground = adsb_fields[AdsbPointField.ON_GROUND]
-        self.aircraft_address = aircraft_address
-
-    def __hash__(self):
-        return hash(hash(self.id) ^ hash(self.date_time) ^
-                    hash(self.latitude) ^ hash(self.longitude) ^
-                    hash(self.altitude) ^ hash(self.ssr_code) ^
-                    hash(self.radar_id) ^ hash(self.aircraft_address))
-
-    def __eq__(self, other):
-        return (self.id == other.id) \
-            and (self.date_time == other.date_time) \
-            and (self.latitude == other.latitude) \
-            and (self.longitude == other.longitude) \
-            and (self.altitude == other.altitude) \
-            and (self.ssr_code == other.ssr_code) \
-            and (self.radar_id == other.radar_id) \
-            and (self.aircraft_address == other.aircraft_address)
-
-    def __repr__(self):
-        return '{},,{}Z,{:.5f},{:.5f},{:d},{:.1f},{:.3f},{:d},{},FR24 {},{},\'{}\''. \
-            format(self.id, self.date_time.isoformat(), self.latitude, self.longitude, self.altitude,
-                   self.ground_speed, self.ground_track, self.vertical_rate,
-                   self.on_ground, self.radar_id, self.aircraft_address, self.ssr_code)
-
-
-class AdsbFlight:
-    'A class for reading, storing and outputting data for an ADS-B flight'
-
-    def __init__(self, adsb_fields):
-        self.id = '0x' + adsb_fields[AdsbFlightField.FLIGHT_ID]
-        self.callsign = adsb_fields[AdsbFlightField.CALLSIGN]
-        self.registration = adsb_fields[AdsbFlightField.REG]
-        self.aircraft_type = adsb_fields[AdsbFlightField.MODEL]
-        self.departure = adsb_fields[AdsbFlightField.ADEP]
-        self.destination = adsb_fields[AdsbFlightField.ADES]
-        self.aircraft_address = '0x' + adsb_fields[AdsbFlightField.ADDRESS]
-        self.ssr_codes = []
-        self.positions = []
-        is_special_aircraft_type = self.aircraft_type and \
-            (self.aircraft_type in ICAO_SPECIAL_AIRCRAFT_TYPE_DESIGNATORS)
-        is_invalid_aircraft_address = (self.aircraft_address == '0x000000') or \
-            (self.aircraft_address == '0xFFFFFF')
-        self.is_valid = not is_special_aircraft_type and \
-            not is_invalid_aircraft_address
-
-    def append(self, adsb_fields):
-        self.positions.append(AdsbPosition(adsb_fields, self.aircraft_address))
-
-        ssr_code = adsb_fields[AdsbPointField.SQUAWK]
-        if ssr_code and (ssr_code != '0000') and (ssr_code not in self.ssr_codes):
-            self.ssr_codes.append(ssr_code)
-
-    def sort(self):
-        # Convert to a set and back to remove duplicate positions
-        self.positions = list(set(self.positions))
-
-        self.is_valid = self.is_valid and (len(self.positions) > 1)
-        if self.is_valid:
-            self.positions.sort(key=lambda position: position.date_time)
-
-            # Ignore 0000 squawks
-            if self.ssr_codes and ('0000' in self.ssr_codes):
-                self.ssr_codes.remove('0000')
-
-    def __repr__(self):
-        ssr_code_str = ''
-        if self.ssr_codes:
-            ssr_code_str = ' '.join(self.ssr_codes)
-
-        return '{},{},{},{},{},{},{},[{}],{}Z,{}Z,[]'. \
-            format(self.id, self.callsign, self.registration, self.aircraft_type,
-                   self.aircraft_address,
-                   self.departure, self.destination, ssr_code_str,
-                   self.positions[0].date_time.isoformat(),
-                   self.positions[-1].date_time.isoformat())
-
-
-def convert_fr24_data(filenames):
+INVALID_AIRCRAFT_ADDRESSES = frozenset(['0x000000', '0xFFFFFF'])
+""" Aircraft addresses of flights that are not required in the output. """
+
+PARTITION_COLUMNS = {'FLIGHT': np.int64, 'TIME': np.int64, 'LAT': float,
+                     'LON': float, 'ALT': np.int64, 'SPEED_GND': float,
+                     'TRACK_GND': float, 'VERT_SPEED': np.int64,
+                     'ON_GROUND': str, 'RADAR_ID': str, 'SSR_CODE': str}
+""" The columns of the points in a partition file and their types, in file order. """
+
+DUPLICATE_POSITION_COLUMNS = ['FLIGHT', 'TIME', 'LAT', 'LON', 'ALT',
+                              'SSR_CODE', 'RADAR_ID']
+""" The columns that duplicate positions have in common. """
+
+ADSB_POSITION_FORMATS = dict(DEFAULT_POSITION_FORMATS, TRACK_GND='{:.3f}')
+""" The formats of the output position columns. """
+
+DEFAULT_PARTITIONS = 16
+""" The default number of partitions of the flights. """
+
+DEFAULT_PROCESSES = 1
+""" The default number of processes to convert the points and the partitions. """
+
+
+def read_fr24_flights(filename):
+    """
+    Read the valid flights in an ADS-B flights file.
+
+    Only the first line of each flight is used. Flights of special aircraft
+    types or with invalid aircraft addresses are not valid.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the flights file, bz2 compressed if it ends with '.bz2'.
+
+    Returns
+    -------
+    A pandas DataFrame of the valid flights in FLIGHT_ID order, with:
+    KEY (the FLIGHT_ID in the file), FLIGHT_ID, CALLSIGN, AIRCRAFT_REG,
+    AIRCRAFT_TYPE, AIRCRAFT_ADDRESS, ADEP and ADES columns.
+    """
+    adsb_df = pd.read_csv(filename, header=0,
+                          names=[field.name for field in AdsbFlightField],
+                          dtype=str, na_filter=False,
+                          compression='bz2' if has_bz2_extension(filename) else None)
+    adsb_df = adsb_df.drop_duplicates('FLIGHT_ID')
+
+    addresses = '0x' + adsb_df['ADDRESS']
+    is_valid = ~adsb_df['MODEL'].isin(ICAO_SPECIAL_AIRCRAFT_TYPE_DESIGNATORS) & \
+        ~addresses.isin(INVALID_AIRCRAFT_ADDRESSES)
+
+    flights_df = pd.DataFrame({'KEY': adsb_df['FLIGHT_ID'],
+                               'FLIGHT_ID': '0x' + adsb_df['FLIGHT_ID'],
+                               'CALLSIGN': adsb_df['CALLSIGN'],
+                               'AIRCRAFT_REG': adsb_df['REG'],
+                               'AIRCRAFT_TYPE': adsb_df['MODEL'],
+                               'AIRCRAFT_ADDRESS': addresses,
+                               'ADEP': adsb_df['ADEP'],
+                               'ADES': adsb_df['ADES']}).loc[is_valid]
+    return flights_df.sort_values('KEY').reset_index(drop=True)
+
+
+def adsb_floats(values, default):
+    """ Convert ADS-B file float strings into floats, empty strings are default. """
+    return values.where(values != '', str(default)).astype(float).values
+
+
+def adsb_integers(values):
+    """ Convert ADS-B file integer strings into integers, empty strings are zero. """
+    return values.where(values != '', '0').astype(np.int64).values
+
+
+def convert_fr24_points(points_df, flight_keys):
+    """
+    Convert the fields of ADS-B points file lines into typed columns.
+
+    Parameters
+    ----------
+    points_df: a pandas DataFrame
+        The fields of the lines as strings.
+
+    flight_keys: a pandas Index
+        The KEYs of the flights, points of other flights are ignored.
+
+    Returns
+    -------
+    A dict of numpy arrays of the PARTITION_COLUMNS, where FLIGHT is the
+    position of the flight in flight_keys and TIME is in nanoseconds.
+    """
+    flights = flight_keys.get_indexer(points_df['FLIGHT_ID'])
+    is_flight = flights >= 0
+    points_df = points_df.loc[is_flight]
+    times = pd.to_datetime(points_df['EVENT_TIME'], format=ISO8601_DATETIME_FORMAT)
+    return {'FLIGHT': flights[is_flight],
+            'TIME': times.values.view(np.int64),
+            'LAT': points_df['LAT'].astype(float).values,
+            'LON': points_df['LONG'].astype(float).values,
+            'ALT': points_df['ALT'].astype(np.int64).values,
+            'SPEED_GND': adsb_floats(points_df['SPEED'], 0.0),
+            'TRACK_GND': adsb_floats(points_df['TRACK_GND'], -1.0),
+            'VERT_SPEED': adsb_integers(points_df['VERT_SPEED']),
+            'ON_GROUND': np.array(points_df['ON_GROUND'].tolist(), dtype=str),
+            'RADAR_ID': np.array(points_df['RADAR_ID'].tolist(), dtype=str),
+            'SSR_CODE': np.array(points_df['SQUAWK'].tolist(), dtype=str)}
+
+
+def _set_flight_keys(flight_keys):
+    """ Set the flight KEYs of a process, see convert_fr24_block. """
+    global _flight_keys
+    _flight_keys = flight_keys
+
+
+def convert_fr24_block(block):
+    """
+    Convert a block of ADS-B points file lines into typed columns.
+
+    The flight KEYs are set by _set_flight_keys.
+
+    Returns
+    -------
+    The columns, see convert_fr24_points, and the number of lines in the block.
+    """
+    points_df = pd.read_csv(block_reader(block), header=None,
+                            names=[field.name for field in AdsbPointField],
+                            dtype=str, na_filter=False)
+    return convert_fr24_points(points_df, _flight_keys), len(points_df)
+
+
+def write_partition_columns(file, columns):
+    """ Append the PARTITION_COLUMNS of points to a partition file. """
+    for column in PARTITION_COLUMNS:
+        np.save(file, columns[column], allow_pickle=False)
+
+
+def read_partition_columns(filename):
+    """
+    Read the points in a partition file.
+
+    Returns
+    -------
+    A pandas DataFrame of the PARTITION_COLUMNS of the points in file order.
+    """
+    chunks = {column: [] for column in PARTITION_COLUMNS}
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as file:
+        while file.tell() < size:
+            for column in PARTITION_COLUMNS:
+                chunks[column].append(np.load(file, allow_pickle=False))
+
+    return pd.DataFrame({column: np.concatenate(arrays) if arrays else
+                         np.array([], dtype=PARTITION_COLUMNS[column])
+                         for column, arrays in chunks.items()})
+
+
+def partition_flights(flights, flights_count, partitions):
+    """
+    The partitions of flights by their positions in FLIGHT_ID order.
+
+    Each partition contains a contiguous range of flights, so the output of
+    the partitions are in FLIGHT_ID order.
+    """
+    return (np.asarray(flights, dtype=np.int64) * partitions) // max(flights_count, 1)
+
+
+def summarise_fr24_flights(points_df, flights_df):
+    """
+    Summarise the positions of ADS-B flights.
+
+    Positions are duplicates if they have the same: flight, time, latitude,
+    longitude, altitude, SSR code and radar id; the first is kept.
+    Flights with fewer than two unique positions are not valid.
+
+    Parameters
+    ----------
+    points_df: a pandas DataFrame
+        The PARTITION_COLUMNS of the points of the flights in file order.
+
+    flights_df: a pandas DataFrame
+        The flights, indexed by FLIGHT, see read_fr24_flights.
+
+    Returns
+    -------
+    A pandas DataFrame of the valid flights in FLIGHT order, with the
+    flights_df columns and: SSR_CODES, PERIOD_START, PERIOD_FINISH and
+    SOURCE_IDS columns.
+    A pandas DataFrame of the unique positions of the valid flights sorted
+    by FLIGHT and TIME, positions at the same time are in file order.
+    """
+    points_df = points_df.loc[~points_df.duplicated(DUPLICATE_POSITION_COLUMNS)]
+    counts = points_df.groupby('FLIGHT').size()
+    points_df = points_df.loc[points_df['FLIGHT'].isin(counts.index[counts > 1])]
+
+    # The SSR codes of each flight in order of first position, ignoring 0000
+    ssr_codes_df = points_df.loc[(points_df['SSR_CODE'] != '') &
+                                 (points_df['SSR_CODE'] != '0000'),
+                                 ['FLIGHT', 'SSR_CODE']].drop_duplicates()
+    ssr_codes = ssr_codes_df.groupby('FLIGHT', sort=False)['SSR_CODE'].agg(' '.join)
+
+    points_df = points_df.sort_values(['FLIGHT', 'TIME'], kind='mergesort')
+    points_df['TIME'] = points_df['TIME'].values.view('datetime64[ns]')
+    flights = points_df.groupby('FLIGHT', sort=True)['TIME']
+
+    flights_df = flights_df.loc[flights.size().index].copy()
+    flights_df['SSR_CODES'] = ssr_codes
+    flights_df['PERIOD_START'] = flights.first()
+    flights_df['PERIOD_FINISH'] = flights.last()
+    flights_df['SOURCE_IDS'] = ''
+    flights_df.fillna('', inplace=True)
+    return flights_df, points_df
+
+
+def convert_partition(partition_filename, flights_df,
+                      flights_filename, positions_filename):
+    """
+    Sort the points in a partition file and write the flights and positions
+    of the partition.
+
+    Parameters
+    ----------
+    partition_filename: string
+        The name of the partition file.
+
+    flights_df: a pandas DataFrame
+        The flights of the partition, indexed by FLIGHT.
+
+    flights_filename, positions_filename: strings
+        The names of the output files, without headers.
+
+    Returns
+    -------
+    The number of flights and positions written.
+    """
+    valid_df, positions_df = \
+        summarise_fr24_flights(read_partition_columns(partition_filename), flights_df)
+
+    with open(flights_filename, 'w') as file:
+        flights_count = write_flights(file, valid_df)
+
+    flights = positions_df['FLIGHT'].values
+    positions_df['FLIGHT_ID'] = valid_df['FLIGHT_ID'].reindex(flights).values
+    positions_df['AIRCRAFT_ADDRESS'] = valid_df['AIRCRAFT_ADDRESS'].reindex(flights).values
+    positions_df['SURVEILLANCE_SOURCE'] = 'FR24 ' + positions_df['RADAR_ID']
+    with open(positions_filename, 'w') as file:
+        positions_count = write_positions(file, positions_df, ADSB_POSITION_FORMATS)
+
+    return flights_count, positions_count
+
+
+def copy_files(filenames, file):
+    """ Append the contents of files to a file. """
+    for filename in filenames:
+        with open(filename, 'r') as input_file:
+            shutil.copyfileobj(input_file, file)
+
+
+@measure_stage
+def convert_fr24_data(filenames, partitions=DEFAULT_PARTITIONS,
+                      processes=DEFAULT_PROCESSES, blocksize=DEFAULT_BLOCK_SIZE):
 
     flights_filename = filenames[0]
     points_filename = filenames[1]
@@ -193,93 +365,117 @@ def convert_fr24_data(filenames):
                   flights_date, points_date)
         return errno.EINVAL
 
-    # A dict to hold the ADS-B flights
-    flights = {}
-
-    # Read the ADS-B flights file into flights
+    # Read the ADS-B flights file
+    flights_df = pd.DataFrame()
     try:
-        is_bz2 = has_bz2_extension(flights_filename)
-        with bz2.open(flights_filename, 'rt',  newline="") if (is_bz2) else \
-                open(flights_filename, 'r') as file:
-            reader = csv.reader(file, delimiter=',')
-            next(reader, None)  # skip the headers
-            for row in reader:
-                flights.setdefault(row[AdsbFlightField.FLIGHT_ID],
-                                   AdsbFlight(row))
-
+        flights_df = read_fr24_flights(flights_filename)
     except EnvironmentError:
         log.error('could not read file: %s', flights_filename)
         return errno.ENOENT
 
     log.info('fr24 flights read ok')
 
-    # Read the ADS-B points file into flights
-    try:
-        is_bz2 = has_bz2_extension(points_filename)
-        with bz2.open(points_filename, 'rt',  newline="") if (is_bz2) else \
-                open(points_filename, 'r') as file:
-            reader = csv.reader(file, delimiter=',')
-            next(reader, None)  # skip the headers
-            for row in reader:
-                if row[AdsbPointField.FLIGHT_ID] in flights:
-                    flights[row[AdsbPointField.FLIGHT_ID]].append(row)
-
-    except EnvironmentError:
-        log.error('could not read file: %s', points_filename)
-        return errno.ENOENT
-
-    log.info('fr24 points read ok')
-
-    # sort positions in date time (of position) order
-    for key, values in flights.items():
-        values.sort()
-    log.info('fr24 points sorted')
-
-    valid_flights = 0
-
-    # Output the ADS-B flight data for all flights
-    output_files = create_convert_fr24_filenames(flights_date)
-    flight_file = output_files[0]
-    try:
-        with open(flight_file, 'w') as file:
-            file.write(FLIGHT_FIELDS)
-            for key, values in sorted(flights.items()):
-                if values.is_valid:
-                    print(values, file=file)
-                    valid_flights += 1
-
-        log.info('written file: %s', flight_file)
-
-    except EnvironmentError:
-        log.error('could not write file: %s', flight_file)
-
-    # Output the ADS-B position data for all flights
-    positions_file = output_files[1]
-    try:
-        with open(positions_file, 'w') as file:
-            file.write(POSITION_FIELDS)
-            for key, values in sorted(flights.items()):
-                if values.is_valid:
-                    for pos in values.positions:
-                        print(pos, file=file)
-
-        log.info('written file: %s', positions_file)
-
-    except EnvironmentError:
-        log.error('could not write file: %s', positions_file)
-        return errno.EACCES
+    flight_keys = pd.Index(flights_df['KEY'])
+    flights_df.index.name = 'FLIGHT'
+    partitions = max(1, min(partitions, len(flights_df)))
+
+    with tempfile.TemporaryDirectory(prefix='fr24_partitions_', dir='.') as directory:
+        partition_files = [os.path.join(directory, 'partition_{}.npy'.format(partition))
+                           for partition in range(partitions)]
+
+        # Read the ADS-B points file and append the points to their partitions
+        try:
+            is_bz2 = has_bz2_extension(points_filename)
+            files = [open(filename, 'wb') for filename in partition_files]
+            try:
+                with bz2.open(points_filename, 'rb') if is_bz2 else \
+                        open(points_filename, 'rb') as points_file:
+                    points_file.readline()  # skip the headers
+                    blocks = read_line_blocks(points_file, blocksize)
+                    for columns, lines_count in \
+                            map_line_blocks(convert_fr24_block, blocks, processes,
+                                            _set_flight_keys, (flight_keys,)):
+                        count_rows_in(lines_count)
+                        flight_partitions = partition_flights(columns['FLIGHT'],
+                                                              len(flights_df), partitions)
+                        for partition in np.unique(flight_partitions):
+                            is_partition = (flight_partitions == partition)
+                            write_partition_columns(files[partition],
+                                                    {column: values[is_partition]
+                                                     for column, values in columns.items()})
+            finally:
+                for file in files:
+                    file.close()
+
+        except EnvironmentError:
+            log.error('could not read file: %s', points_filename)
+            return errno.ENOENT
+
+        log.info('fr24 points partitioned')
+
+        # Sort and write the partitions
+        flights_bounds = np.searchsorted(partition_flights(flights_df.index, len(flights_df),
+                                                           partitions),
+                                         np.arange(partitions + 1))
+        arguments = [(partition_files[partition],
+                      flights_df.iloc[flights_bounds[partition]:flights_bounds[partition + 1]],
+                      partition_files[partition] + '.flights',
+                      partition_files[partition] + '.positions')
+                     for partition in range(partitions)]
+        if processes > 1:
+            with cf.ProcessPoolExecutor(max_workers=processes) as executor:
+                counts = list(executor.map(convert_partition, *zip(*arguments)))
+        else:
+            counts = [convert_partition(*args) for args in arguments]
+
+        log.info('fr24 points sorted')
+
+        # Concatenate the partitions in flight order
+        output_files = create_convert_fr24_filenames(flights_date)
+        flight_file = output_files[0]
+        try:
+            with open(flight_file, 'w') as file:
+                file.write(FLIGHT_FIELDS)
+                copy_files([args[2] for args in arguments], file)
+
+            log.info('written file: %s', flight_file)
+
+        except EnvironmentError:
+            log.error('could not write file: %s', flight_file)
+
+        positions_file = output_files[1]
+        try:
+            with open(positions_file, 'w') as file:
+                file.write(POSITION_FIELDS)
+                copy_files([args[3] for args in arguments], file)
+                count_rows_out(sum(positions for _, positions in counts))
+
+            log.info('written file: %s', positions_file)
+
+        except EnvironmentError:
+            log.error('could not write file: %s', positions_file)
+            return errno.EACCES
 
     log.info('fr24 conversion complete for %s flights on %s',
-             valid_flights, points_date)
+             sum(flights for flights, _ in counts), points_date)
 
     return 0
 
 
 if __name__ == '__main__':
     if len(sys.argv) < 3:
-        print('Usage: convert_fr24_data py <flights_filename> <points_filename>')
+        print('Usage: convert_fr24_data.py <flights_filename> <points_filename>'
+              ' [partitions] [processes]')
         sys.exit(errno.EINVAL)
 
-    error_code = convert_fr24_data(sys.argv[1:])
+    partitions = DEFAULT_PARTITIONS
+    if len(sys.argv) >= 4:
+        partitions = int(sys.argv[3])
+
+    processes = DEFAULT_PROCESSES
+    if len(sys.argv) >= 5:
+        processes = int(sys.argv[4])
+
+    error_code = convert_fr24_data(sys.argv[1:3], partitions, processes)
     if error_code:
         sys.exit(error_code)
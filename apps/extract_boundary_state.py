@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Extract the boundary state of a day's merged flights: the flights that start
+or finish near midnight, with their positions in ECEF coordinates.
+
+The head and tail of the day are written to separate files. The boundary
+states of consecutive days can be matched by
+match_consecutive_day_trajectories.py, instead of the days flights and
+positions files.
+
+Note: the daily pipeline writes the head and tail of each day while merging
+its data, this application extracts them from existing flights and positions
+files, e.g. for a day merged before boundary states were written.
+"""
+
+import sys
+import os
+import errno
+import pandas as pd
+from uuid import UUID
+from pru.trajectory_fields import is_valid_iso8601_date, read_iso8601_date_string
+from pru.trajectory_files import CPR_FR24, create_boundary_state_filename
+from pru.boundary_state import write_boundary_state, find_boundary_flights, \
+    create_flight_positions, BOUNDARY_FLIGHT_FIELDS, DEFAULT_BOUNDARY_HOURS
+from pru.stage_metrics import measure_stage
+from pru.logger import logger
+
+log = logger(__name__)
+
+
+@measure_stage
+def extract_boundary_state(flights_filename, positions_filename,
+                           hours=DEFAULT_BOUNDARY_HOURS):
+
+    # Extract date strings from the input filenames and validate them
+    flights_date = read_iso8601_date_string(flights_filename)
+    if not is_valid_iso8601_date(flights_date):
+        log.error('flights file: %s, invalid date: %s',
+                  flights_filename, flights_date)
+        return errno.EINVAL
+
+    positions_date = read_iso8601_date_string(positions_filename)
+    if positions_date != flights_date:
+        log.error('Files are not for the same date flights date: %s, '
+                  'positions date: %s', flights_date, positions_date)
+        return errno.EINVAL
+
+    log.info('flights file: %s', flights_filename)
+    log.info('positions file: %s', positions_filename)
+    log.info('boundary hours: %f', hours)
+
+    # Read the flights into a pandas DataFrame
+    flights_df = pd.DataFrame()
+    try:
+        flights_df = pd.read_csv(flights_filename,
+                                 parse_dates=['PERIOD_START', 'PERIOD_FINISH'],
+                                 converters={'FLIGHT_ID': lambda x: UUID(x)},
+                                 usecols=BOUNDARY_FLIGHT_FIELDS)
+    except EnvironmentError:
+        log.error('could not read file: %s', flights_filename)
+        return errno.ENOENT
+
+    log.info('flights read ok')
+
+    # Only the positions of the boundary flights are required
+    is_head, is_tail = find_boundary_flights(flights_df, flights_date, hours)
+    boundary_ids = set(flights_df.loc[is_head | is_tail, 'FLIGHT_ID'].astype(str))
+
+    # Read the positions into a pandas DataFrame, in chunks
+    points_df = pd.DataFrame()
+    try:
+        chunks = pd.read_csv(positions_filename, parse_dates=['TIME'],
+                             usecols=['FLIGHT_ID', 'TIME', 'LAT', 'LON', 'ALT'],
+                             chunksize=1000000)
+        points_df = pd.concat([chunk.loc[chunk['FLIGHT_ID'].isin(boundary_ids)]
+                               for chunk in chunks])
+    except EnvironmentError:
+        log.error('could not read file: %s', positions_filename)
+        return errno.ENOENT
+
+    positions = create_flight_positions(points_df)
+
+    log.info('positions read ok')
+
+    for is_tail in [False, True]:
+        output_filename = create_boundary_state_filename(CPR_FR24, flights_date,
+                                                         is_tail=is_tail)
+        try:
+            flights_count = write_boundary_state(output_filename, flights_df,
+                                                 positions, flights_date, hours,
+                                                 is_tail=is_tail)
+        except EnvironmentError:
+            log.error('could not write file: %s', output_filename)
+            return errno.EACCES
+
+        log.info('written file: %s, boundary flights: %d', output_filename,
+                 flights_count)
+
+    log.info('boundary state extraction complete')
+
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        app_name = os.path.basename(sys.argv[0])
+        print('Usage: ' + app_name + ' <flights filename> <positions filename>'
+              ' [boundary hours]')
+        sys.exit(errno.EINVAL)
+
+    hours = DEFAULT_BOUNDARY_HOURS
+    if len(sys.argv) > 3:
+        hours = float(sys.argv[3])
+
+    error_code = extract_boundary_state(sys.argv[1], sys.argv[2], hours)
+    if error_code:
+        sys.exit(error_code)
@@ -14,11 +14,13 @@ import errno
 import pandas as pd
 from pru.trajectory_fields import is_valid_iso8601_date, read_iso8601_date_string
 from pru.trajectory_files import create_fleet_data_filename
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
 
 
+@measure_stage
 def extract_fleet_data(flights_filename):
 
     # Extract the date string from the filename and validate it
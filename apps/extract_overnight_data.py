@@ -17,6 +17,7 @@ from pru.trajectory_fields import \
 from pru.trajectory_files import CPR_FR24, create_positions_filename, \
     create_events_filename
 from pru.trajectory_merging import replace_old_flight_ids
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -37,6 +38,12 @@ def extract_next_day_items(filename, ids_df, date_fields=[]):
     Returns a pandas DataFrame containing items with matching ids in
     the FLIGHT_ID column, with the flight ids from the NEW_FLIGHT_ID.
 
+    Note: unlike matching, this cannot be limited to the boundary state.
+    The ids in ids_df are only known to be active in the first hours of the
+    day, but all of their items must be moved, however late in the day,
+    and every other item must be copied into the 'new_' file.
+    So the whole file is read and written once.
+
     """
     # An empty data frame to return
     new_items_df = pd.DataFrame()
@@ -88,6 +95,7 @@ input_filenames = ['ids file',
 """ The filenames required by the application. """
 
 
+@measure_stage
 def extract_overnight_data(filenames):
     """
     Extract flights, postions and events for the previosu day from the data.
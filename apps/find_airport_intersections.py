@@ -9,6 +9,7 @@ Find trajectory airport intersections.
 import sys
 import os
 import errno
+import numpy as np
 import pandas as pd
 from via_sphere import global_Point3d
 from pru.SmoothedTrajectory import generate_SmoothedTrajectories
@@ -18,6 +19,8 @@ from pru.trajectory_fields import ISO8601_DATETIME_US_FORMAT,  BZ2_FILE_EXTENSIO
     CSV_FILE_EXTENSION, JSON_FILE_EXTENSION, has_bz2_extension, \
     read_iso8601_date_string, is_valid_iso8601_date, AIRPORT_INTERSECTION_FIELDS
 from pru.trajectory_files import TRAJECTORIES, AIRPORT_INTERSECTIONS
+from pru.airport_codes import compile_airport_codes
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 
@@ -33,6 +36,7 @@ DEFAULT_LOGGING_COUNT = 5000
 """ The default number of flights between each log message. """
 
 
+@measure_stage
 def find_airport_intersections(flights_filename, trajectories_filename,
                                radius=DEFAULT_RADIUS,
                                airports_filename=DEFAULT_MOVEMENTS_AIRPORTS_FILENAME,
@@ -90,11 +94,8 @@ def find_airport_intersections(flights_filename, trajectories_filename,
     log.info(f'radius: {radius} NM')
     log.info(f'distance_tolerance: {distance_tolerance} NM')
 
-    airports_df = pd.DataFrame()
     try:
-        airports_df = pd.read_csv(airports_filename,
-                                  index_col='AIRPORT',
-                                  memory_map=True)
+        airport_codes = compile_airport_codes(airports_filename)
 
         log.info(f'{airports_filename} read ok')
     except EnvironmentError:
@@ -113,11 +114,20 @@ def find_airport_intersections(flights_filename, trajectories_filename,
         log.error(f'could not read file: {flights_filename}')
         return errno.ENOENT
 
-    # Determine the departure and arrival flights
-    departures_df = pd.merge(flights_df, airports_df,
-                             left_on='ADEP', right_index=True)
-    destinations_df = pd.merge(flights_df, airports_df,
-                               left_on='ADES', right_index=True)
+    # Determine the departure and arrival flights and their airports
+    flight_ids = flights_df.index.values
+    departures = airport_codes.find_airports(flights_df['ADEP'].values)
+    destinations = airport_codes.find_airports(flights_df['ADES'].values)
+    departure_airports = dict(zip(flight_ids[departures >= 0],
+                                  departures[departures >= 0].tolist()))
+    destination_airports = dict(zip(flight_ids[destinations >= 0],
+                                    destinations[destinations >= 0].tolist()))
+
+    # The reference points of the airports
+    airports = airport_codes.airports
+    airport_ids = airports['ICAO_ID'].tolist()
+    ref_points = global_Point3d(np.ascontiguousarray(airports['LAT']),
+                                np.ascontiguousarray(airports['LON']))
 
     trajectories_filename = os.path.basename(trajectories_filename)
     is_bz2 = has_bz2_extension(trajectories_filename)
@@ -138,20 +148,18 @@ def find_airport_intersections(flights_filename, trajectories_filename,
                 try:
                     flight_id = smooth_traj.flight_id
 
-                    is_departure = flight_id in departures_df.index
-                    is_arrival = flight_id in destinations_df.index
+                    is_departure = flight_id in departure_airports
+                    is_arrival = flight_id in destination_airports
 
                     if is_departure or is_arrival:
 
                         traj_path = smooth_traj.path.ecef_path()
 
                         if is_departure:
-                            dep_row = departures_df.loc[flight_id]
-                            departure = dep_row['ADEP']
+                            airport = departure_airports[flight_id]
+                            departure = airport_ids[airport]
                             if len(departure) == AIRPORT_NAME_LENGTH:
-                                latitude = dep_row['LATITUDE']
-                                longitude = dep_row['LONGITUDE']
-                                ref_point = global_Point3d(latitude, longitude)
+                                ref_point = ref_points[airport]
                                 dep_intersection = find_airport_intersection(smooth_traj, traj_path,
                                                                              departure, ref_point,
                                                                              radius, False,
@@ -162,12 +170,10 @@ def find_airport_intersections(flights_filename, trajectories_filename,
                                                             date_format=ISO8601_DATETIME_US_FORMAT)
 
                         if is_arrival:
-                            dest_row = destinations_df.loc[flight_id]
-                            destination = dest_row['ADES']
+                            airport = destination_airports[flight_id]
+                            destination = airport_ids[airport]
                             if len(destination) == AIRPORT_NAME_LENGTH:
-                                latitude = dest_row['LATITUDE']
-                                longitude = dest_row['LONGITUDE']
-                                ref_point = global_Point3d(latitude, longitude)
+                                ref_point = ref_points[airport]
                                 dest_intersection = find_airport_intersection(smooth_traj, traj_path,
                                                                               destination, ref_point,
                                                                               radius, True,
@@ -14,6 +14,7 @@ from pru.trajectory_user_airspace_intersections import find_trajectory_user_airs
 from pru.trajectory_fields import ISO8601_DATETIME_US_FORMAT, has_bz2_extension, \
     CSV_FILE_EXTENSION, JSON_FILE_EXTENSION, BZ2_FILE_EXTENSION, AIRSPACE_INTERSECTION_FIELDS
 from pru.trajectory_files import TRAJECTORIES, USER_INTERSECTIONS
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -22,6 +23,7 @@ DEFAULT_LOGGING_COUNT = 5000
 """ The default number of flights between each log message. """
 
 
+@measure_stage
 def find_user_airspace_intersections(filename, logging_msg_count=DEFAULT_LOGGING_COUNT):
     """
     Find intersections between trajectories and user defined airspace volumes.
@@ -15,6 +15,7 @@ from pru.trajectory_interpolation import interpolate_trajectory_positions, \
 from pru.trajectory_fields import ISO8601_DATETIME_US_FORMAT, BZ2_FILE_EXTENSION, \
     CSV_FILE_EXTENSION, JSON_FILE_EXTENSION, has_bz2_extension, POSITION_FIELDS
 from pru.trajectory_files import TRAJECTORIES, SYNTH_POSITIONS
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -23,6 +24,7 @@ DEFAULT_LOGGING_COUNT = 5000
 """ The default number of flights between each log message. """
 
 
+@measure_stage
 def interpolate_trajectories(filename,
                              straight_interval=DEFAULT_STRAIGHT_INTERVAL,
                              turn_interval=DEFAULT_TURN_INTERVAL,
@@ -13,38 +13,76 @@ import pandas as pd
 from uuid import UUID
 from pru.trajectory_fields import read_iso8601_date_string, \
     is_valid_iso8601_date, split_dual_date
-from pru.trajectory_files import APDS, create_matching_ids_filename
+from pru.trajectory_files import APDS, create_matching_ids_filename, \
+    create_apds_event_index_filename
+from pru.event_matching import EventIndex, DEFAULT_EVENT_TIME_TOLERANCE
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
 
 
-def match_events(day_flights_df, apds_flights_df, day_events_df, apds_events_df):
+def read_apds_event_index(index_filename, apds_flights_filename,
+                          apds_events_filename):
+    """
+    Reads the APDS event index from index_filename if it is newer than the
+    APDS flights and events files. Otherwise it builds the index from the
+    APDS flights and events files and writes it to index_filename, so that
+    it is only built once for the APDS date range.
+
+    Returns an EventIndex.
+    Raises EnvironmentError if the APDS files could not be read.
+    """
+    if os.path.exists(index_filename):
+        index_time = os.path.getmtime(index_filename)
+        if (index_time >= os.path.getmtime(apds_flights_filename)) and \
+                (index_time >= os.path.getmtime(apds_events_filename)):
+            event_index = EventIndex.load(index_filename)
+            log.info('apds event index read ok')
+            return event_index
+
+    apds_flights_df = pd.read_csv(apds_flights_filename,
+                                  usecols=['FLIGHT_ID', 'CALLSIGN',
+                                           'ADEP', 'ADES'],
+                                  memory_map=True)
+    log.info('apds flights read ok')
+
+    apds_events_df = pd.read_csv(apds_events_filename,
+                                 parse_dates=['TIME'],
+                                 memory_map=True)
+    log.info('apds events read ok')
+
+    event_index = EventIndex()
+    event_index.update(apds_flights_df, apds_events_df)
+    try:
+        event_index.save(index_filename)
+        log.info('written file: %s', index_filename)
+    except EnvironmentError:
+        log.warning('could not write file: %s', index_filename)
+
+    return event_index
+
+
+def match_events(day_flights_df, day_events_df, apds_event_index,
+                 tolerance=DEFAULT_EVENT_TIME_TOLERANCE):
     """
     Finds common events both data sets.
 
     It matches on: callsign, departure airport, destination airport, event type,
-    and time.
+    and time within tolerance seconds.
 
     Returns a pandas DataFrame containing the APT id and the matching days ids
     in 'FLIGHT_ID' and 'NEW_FLIGHT_ID' columns respectively.
     """
-    day_flight_events_df = pd.merge(day_flights_df, day_events_df, on='FLIGHT_ID')
-    apds_flight_events_df = pd.merge(apds_flights_df, apds_events_df, on='FLIGHT_ID')
-
-    # Find events at the same time in both sets.
-    apds_day_flights = pd.merge(apds_flight_events_df, day_flight_events_df,
-                                on=['CALLSIGN', 'ADEP', 'ADES',
-                                    'EVENT_TYPE', 'TIME'])
+    apds_ids, day_ids = apds_event_index.find_matches(day_flights_df, day_events_df,
+                                                      tolerance)
+    apds_day_flights = pd.DataFrame({'FLIGHT_ID': apds_ids,
+                                     'NEW_FLIGHT_ID': day_ids})
 
     # sort by the apds flight id and drop duplicates (if any)
-    apds_day_flights.sort_values(by=['FLIGHT_ID_x'], inplace=True)
+    apds_day_flights.sort_values(by=['FLIGHT_ID'], kind='mergesort', inplace=True)
     apds_day_flights.drop_duplicates(inplace=True)
 
-    apds_day_flights.rename(index=str, columns={'FLIGHT_ID_x': 'FLIGHT_ID',
-                                                'FLIGHT_ID_y': 'NEW_FLIGHT_ID'},
-                            inplace=True)
-
     return apds_day_flights
 
 
@@ -55,7 +93,8 @@ input_filenames = ['daily flights file',
 """ The filenames required by the application. """
 
 
-def match_apds_trajectories(filenames):
+@measure_stage
+def match_apds_trajectories(filenames, tolerance=DEFAULT_EVENT_TIME_TOLERANCE):
 
     day_flights_filename = filenames[0]
     apds_flights_filename = filenames[1]
@@ -132,19 +171,6 @@ def match_apds_trajectories(filenames):
 
     log.info('daily flights read ok')
 
-    # Read APT flights into a pandas DataFrame
-    apds_flights_df = pd.DataFrame()
-    try:
-        apds_flights_df = pd.read_csv(apds_flights_filename,
-                                      usecols=['FLIGHT_ID', 'CALLSIGN',
-                                               'ADEP', 'ADES'],
-                                      memory_map=True)
-    except EnvironmentError:
-        log.error('could not read file: %s', apds_flights_filename)
-        return errno.ENOENT
-
-    log.info('apds flights read ok')
-
     # Read days events into a pandas DataFrame
     day_events_df = pd.DataFrame()
     try:
@@ -158,23 +184,23 @@ def match_apds_trajectories(filenames):
 
     log.info('daily events read ok')
 
-    # Read APT events into a pandas DataFrame
-    apds_events_df = pd.DataFrame()
+    # Read or build the APDS event index
+    from_date, to_date = split_dual_date(os.path.basename(apds_events_filename))
+    apds_event_index = EventIndex()
     try:
-        apds_events_df = pd.read_csv(apds_events_filename,
-                                     parse_dates=['TIME'],
-                                     memory_map=True)
+        apds_event_index = \
+            read_apds_event_index(create_apds_event_index_filename(from_date, to_date),
+                                  apds_flights_filename, apds_events_filename)
     except EnvironmentError:
-        log.error('could not read file: %s', apds_events_filename)
+        log.error('could not read files: %s, %s',
+                  apds_flights_filename, apds_events_filename)
         return errno.ENOENT
 
-    log.info('apds events read ok')
-
     ############################################################################
     # Match events
 
-    apds_day_flights = match_events(day_flights_df, apds_flights_df,
-                                    day_events_df, apds_events_df)
+    apds_day_flights = match_events(day_flights_df, day_events_df,
+                                    apds_event_index, tolerance)
 
     # Output the days ids
     apds_ids_file = create_matching_ids_filename(APDS, days_date)
@@ -183,7 +209,7 @@ def match_apds_trajectories(filenames):
                                 columns=['FLIGHT_ID', 'NEW_FLIGHT_ID'])
     except EnvironmentError:
         log.error('could not write file: %s', apds_ids_file)
-        return errno.EACCESreturn
+        return errno.EACCES
 
     log.info('written file: %s', apds_ids_file)
 
@@ -200,9 +226,15 @@ if __name__ == '__main__':
     app_name = os.path.basename(sys.argv[0])
     if len(sys.argv) <= len(input_filenames):
         app_name = os.path.basename(sys.argv[0])
-        print('Usage: ' + app_name + ' <' + filenames_string + '>')
+        print('Usage: ' + app_name + ' <' + filenames_string + '>'
+              ' [event time tolerance]')
         sys.exit(errno.EINVAL)
 
-    error_code = match_apds_trajectories(sys.argv[1:])
+    tolerance = DEFAULT_EVENT_TIME_TOLERANCE
+    if len(sys.argv) > len(input_filenames) + 1:
+        tolerance = float(sys.argv[len(input_filenames) + 1])
+
+    error_code = match_apds_trajectories(sys.argv[1:len(input_filenames) + 1],
+                                         tolerance)
     if error_code:
         sys.exit(error_code)
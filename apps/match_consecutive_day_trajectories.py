@@ -9,14 +9,18 @@ Software to match trajectories on consecutive days.
 import sys
 import os
 import errno
-import numpy as np
 import pandas as pd
 from uuid import UUID
-from via_sphere import global_Point3d
-from pru.trajectory_matching import compare_trajectory_positions
+from pru.trajectory_verification import FlightPositions, \
+    compare_flight_positions_in_shards, DEFAULT_VERIFICATION_PROCESSES, \
+    DEFAULT_VERIFICATION_SAMPLES
+from pru.flight_matching import merge_consecutive_flights
 from pru.trajectory_fields import read_iso8601_date_string, \
-    is_valid_iso8601_date, NEW_ID_FIELDS
+    is_valid_iso8601_date, NEW_ID_FIELDS, NPZ_FILE_EXTENSION
 from pru.trajectory_files import create_matching_ids_filename, PREV_DAY
+from pru.boundary_state import read_boundary_state, read_boundary_hours, \
+    SECONDS_PER_HOUR
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -29,49 +33,138 @@ DEFAULT_MAXIMUM_SPEED = 750.0
 
 
 def verify_matches(flight_matches, positions1, positions2, flight_ids,
-                   delta_time, max_speed):
+                   delta_time, max_speed, *, keys=None,
+                   processes=DEFAULT_VERIFICATION_PROCESSES,
+                   samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Verifies the pairs of flight ids in flight_matches by calling
-    compare_trajectory_positions with the cpr_positions and adsb_positions
-    of each flight against the delta_time threshold.
+    compare_flight_positions with the positions of the next and previous
+    flights against the delta_time threshold at samples times.
+
+    The pairs are verified in shards by their keys using up to processes
+    processes, the ids are then updated in the same order as a single process.
 
     It adds new matches to the flight_ids dicts and returns the number of newly
     matched flights.
     """
     matches = 0
-    next_pos_match = pd.merge(positions2, flight_matches,
-                              left_index=True, right_on='FLIGHT_ID_y')
-
-    for next_id, next_pos in next_pos_match.groupby('FLIGHT_ID_y'):
-        # Ensure that next_pos is new has more than one value!
-        if next_id not in flight_ids and \
-                isinstance(next_pos['TIME'], pd.Series):
-
-            next_times = next_pos['TIME'].values
-            next_points = global_Point3d(next_pos['LAT'].values,
-                                         next_pos['LON'].values)
-            next_alts = next_pos['ALT'].values
-
-            for prev_id in next_pos['FLIGHT_ID_x'].unique():
-                prev_pos = positions1.loc[prev_id]
-                # Ensure that prev_pos has more than one value!
-                if isinstance(prev_pos['TIME'], pd.Series):
-                    prev_times = prev_pos['TIME'].values
-                    prev_points = global_Point3d(prev_pos['LAT'].values,
-                                                 prev_pos['LON'].values)
-                    prev_alts = prev_pos['ALT'].values
-                    valid_match = compare_trajectory_positions(next_times, prev_times,
-                                                               next_points, prev_points,
-                                                               next_alts, prev_alts,
-                                                               time_threshold=delta_time,
-                                                               speed_threshold=max_speed)
-                    if (valid_match):
-                        matches += 1
-                        flight_ids[next_id] = prev_id
+
+    # Only verify next flights with positions and previous flights with more than one
+    prev_flight_ids = flight_matches['FLIGHT_ID_x'].values
+    next_flight_ids = flight_matches['FLIGHT_ID_y'].values
+    has_positions = positions2.position_counts(next_flight_ids) > 0
+    valid_matches = \
+        compare_flight_positions_in_shards(positions2, next_flight_ids,
+                                           positions1, prev_flight_ids, keys,
+                                           processes=processes,
+                                           time_threshold=delta_time,
+                                           speed_threshold=max_speed,
+                                           samples=samples) & \
+        (positions1.position_counts(prev_flight_ids) > 1)
+
+    # Update the ids in order of next flight id, then previous flight id matches
+    pairs_df = pd.DataFrame({'NEXT_ID': next_flight_ids[has_positions],
+                             'PREV_ID': prev_flight_ids[has_positions],
+                             'VALID': valid_matches[has_positions]})
+    pairs_df = pairs_df.drop_duplicates(['NEXT_ID', 'PREV_ID'])
+    pairs_df = pairs_df.sort_values('NEXT_ID', kind='mergesort')
+
+    # Flights matched before this call are not matched again
+    previous_ids = set(flight_ids.keys())
+    for next_id, prev_id, valid_match in zip(pairs_df['NEXT_ID'].values,
+                                             pairs_df['PREV_ID'].values,
+                                             pairs_df['VALID'].values):
+        if valid_match and next_id not in previous_ids:
+            matches += 1
+            flight_ids[next_id] = prev_id
 
     return matches
 
 
+def match_consecutive_flights(prev_flights_df, next_flights_df,
+                              prev_positions, next_positions,
+                              max_time_difference, max_speed, processes,
+                              samples=DEFAULT_VERIFICATION_SAMPLES):
+    """
+    Match the previous and next days flights on aircraft address, callsign
+    and departure and destination airports and verify the matches with
+    their positions.
+
+    Returns a dict of the matching previous flight ids by next flight id.
+    """
+    # Dict to hold the flight ids
+    flight_ids = {}
+
+    # Get the prev flights with aircraft addresses
+    prev_flights_aa = prev_flights_df.loc[prev_flights_df['AIRCRAFT_ADDRESS'].notnull()]
+    next_flights_aa = next_flights_df.loc[next_flights_df['AIRCRAFT_ADDRESS'].notnull()]
+
+    ############################################################################
+    # Match the flights
+
+    # match previous and next flights on aircraft address and times wihin max_time_difference
+    merge_aa_time = merge_consecutive_flights(prev_flights_aa, next_flights_aa,
+                                              'AIRCRAFT_ADDRESS', max_time_difference)
+
+    # verify aircraft address matches
+    aa_matches = verify_matches(merge_aa_time, prev_positions, next_positions,
+                                flight_ids, max_time_difference, max_speed,
+                                keys=merge_aa_time['AIRCRAFT_ADDRESS'],
+                                processes=processes, samples=samples)
+    log.info('aircraft address matches: %d, flight_ids: %d',
+             aa_matches, len(flight_ids))
+
+    # match previous and next flights on callsign and times wihin max_time_difference
+    merge_cs_time = merge_consecutive_flights(prev_flights_df, next_flights_df,
+                                              'CALLSIGN', max_time_difference)
+
+    # verify callsign matches
+    cs_matches = verify_matches(merge_cs_time, prev_positions, next_positions,
+                                flight_ids, max_time_difference, max_speed,
+                                keys=merge_cs_time['CALLSIGN'],
+                                processes=processes, samples=samples)
+    log.info('callsign matches: %d, total matches:%d, flight_ids: %d',
+             cs_matches, aa_matches + cs_matches, len(flight_ids))
+
+    # match previous and next flights on departure, destination and overlaping start & end times
+    merge_dep_des_time = merge_consecutive_flights(prev_flights_df, next_flights_df,
+                                                   ['ADEP', 'ADES'], max_time_difference)
+
+    # verify departure and destination airport matches
+    apt_matches = verify_matches(merge_dep_des_time, prev_positions, next_positions,
+                                 flight_ids, max_time_difference, max_speed,
+                                 keys=merge_dep_des_time[['ADEP', 'ADES']],
+                                 processes=processes, samples=samples)
+    log.info('airport matches: %d, total matches:%d, flight_ids: %d',
+             apt_matches, apt_matches + aa_matches + cs_matches, len(flight_ids))
+
+    return flight_ids
+
+
+def write_prev_day_ids(flight_ids, next_days_date):
+    """
+    Write the matching flight ids to the previous day matching ids file.
+
+    Returns zero if successful, an errno otherwise.
+    """
+    # Output the previous day ids
+    prev_ids_filename = create_matching_ids_filename(PREV_DAY, next_days_date)
+    try:
+        with open(prev_ids_filename, 'w') as file:
+            file.write(NEW_ID_FIELDS)
+            for key, value in flight_ids.items():
+                print(key, value, sep=',', file=file)
+    except EnvironmentError:
+        log.error('could not write file: %s', prev_ids_filename)
+        return errno.EACCES
+
+    log.info('written file: %s', prev_ids_filename)
+
+    log.info('consecutive day matching complete')
+
+    return 0
+
+
 input_filenames = ['prev flights file',
                    'next flights file',
                    'prev positions file',
@@ -79,9 +172,12 @@ input_filenames = ['prev flights file',
 """ The filenames required by the application. """
 
 
+@measure_stage
 def match_consecutive_day_trajectories(filenames,
                                        max_time_difference=DEFAULT_MAXIMUM_TIME_DELTA,
-                                       max_speed=DEFAULT_MAXIMUM_SPEED):
+                                       max_speed=DEFAULT_MAXIMUM_SPEED,
+                                       processes=DEFAULT_VERIFICATION_PROCESSES,
+                                       samples=DEFAULT_VERIFICATION_SAMPLES):
 
     prev_flights_filename = filenames[0]
     next_flights_filename = filenames[1]
@@ -116,6 +212,8 @@ def match_consecutive_day_trajectories(filenames,
     next_days_date = input_date_strings[1]
 
     log.info('Maximum time difference: %f', max_time_difference)
+    log.info('Verification processes: %d', processes)
+    log.info('Verification samples: %d', samples)
 
     ############################################################################
     # Read the files
@@ -178,65 +276,104 @@ def match_consecutive_day_trajectories(filenames,
 
     log.info('next points read ok')
 
-    # Dict to hold the flight ids
-    flight_ids = {}
+    # Convert the positions to ECEF points once, for all of the matches
+    prev_positions = FlightPositions(prev_points_df)
+    next_positions = FlightPositions(next_points_df)
+    del prev_points_df, next_points_df
 
-    # Get the prev flights with aircraft addresses
-    prev_flights_aa = prev_flights_df.loc[prev_flights_df['AIRCRAFT_ADDRESS'].notnull()]
-    next_flights_aa = next_flights_df.loc[next_flights_df['AIRCRAFT_ADDRESS'].notnull()]
+    flight_ids = match_consecutive_flights(prev_flights_df, next_flights_df,
+                                           prev_positions, next_positions,
+                                           max_time_difference, max_speed,
+                                           processes, samples)
 
-    ############################################################################
-    # Match the flights
+    return write_prev_day_ids(flight_ids, next_days_date)
 
-    # match previous and next flights on aircraft address and times wihin max_time_difference
-    merge_aa = pd.merge(prev_flights_aa, next_flights_aa, on='AIRCRAFT_ADDRESS')
-    merge_aa_time = merge_aa.loc[((merge_aa.PERIOD_START_y - merge_aa.PERIOD_FINISH_x) /
-                                  np.timedelta64(1, 's')) < max_time_difference]
 
-    # verify aircraft address matches
-    aa_matches = verify_matches(merge_aa_time, prev_points_df, next_points_df,
-                                flight_ids, max_time_difference, max_speed)
-    log.info('aircraft address matches: %d, flight_ids: %d',
-             aa_matches, len(flight_ids))
+boundary_input_filenames = ['prev boundary state file',
+                            'next boundary state file']
+""" The boundary state filenames required by the application. """
 
-    # match previous and next flights on callsign and times wihin max_time_difference
-    merge_cs = pd.merge(prev_flights_df, next_flights_df, on='CALLSIGN')
-    merge_cs_time = merge_cs.loc[((merge_cs.PERIOD_START_y - merge_cs.PERIOD_FINISH_x) /
-                                  np.timedelta64(1, 's')) < max_time_difference]
 
-    # verify callsign matches
-    cs_matches = verify_matches(merge_cs_time, prev_points_df, next_points_df,
-                                flight_ids, max_time_difference, max_speed)
-    log.info('callsign matches: %d, total matches:%d, flight_ids: %d',
-             cs_matches, aa_matches + cs_matches, len(flight_ids))
+@measure_stage
+def match_consecutive_day_boundary_states(filenames,
+                                          max_time_difference=DEFAULT_MAXIMUM_TIME_DELTA,
+                                          max_speed=DEFAULT_MAXIMUM_SPEED,
+                                          processes=DEFAULT_VERIFICATION_PROCESSES,
+                                          samples=DEFAULT_VERIFICATION_SAMPLES):
+    """
+    Match the flights in the tail of the previous day with the flights in
+    the head of the next day from their boundary state files,
+    see extract_boundary_state.py.
 
-    # match previous and next flights on departure, destination and overlaping start & end times
-    merge_dep_des = pd.merge(prev_flights_df, next_flights_df, on=['ADEP', 'ADES'])
-    merge_dep_des_time = merge_cs.loc[((merge_dep_des.PERIOD_START_y - merge_dep_des.PERIOD_FINISH_x) /
-                                       np.timedelta64(1, 's')) < max_time_difference]
+    The matches are only the same as the matches of the whole days if
+    max_time_difference is less than the boundary hours of both files,
+    otherwise errno.EINVAL is returned.
+    """
+    prev_boundary_filename = filenames[0]
+    next_boundary_filename = filenames[1]
 
-    # verify departure and destination airport matches
-    apt_matches = verify_matches(merge_dep_des_time, prev_points_df, next_points_df,
-                                 flight_ids, max_time_difference, max_speed)
-    log.info('airport matches: %d, total matches:%d, flight_ids: %d',
-             apt_matches, apt_matches + aa_matches + cs_matches, len(flight_ids))
+    # Extract date strings from the input filenames and validate them
+    input_date_strings = [''] * len(boundary_input_filenames)
+    for i in range(len(boundary_input_filenames)):
+        filename = filenames[i]
+        input_date_strings[i] = read_iso8601_date_string(filename)
+        if is_valid_iso8601_date(input_date_strings[i]):
+            log.info('%s: %s', boundary_input_filenames[i], filename)
+        else:
+            log.error('%s: %s, invalid date: %s',
+                      boundary_input_filenames[i], filename, input_date_strings[i])
+            return errno.EINVAL
+
+    # Ensure that the files are for the correct dates
+    if input_date_strings[0] >= input_date_strings[1]:
+        log.error("Files are not for the correct dates prev date: %s, "
+                  "next date: %s", input_date_strings[0], input_date_strings[1])
+        return errno.EINVAL
+
+    next_days_date = input_date_strings[1]
+
+    log.info('Maximum time difference: %f', max_time_difference)
+    log.info('Verification processes: %d', processes)
+    log.info('Verification samples: %d', samples)
 
-    # Output the previous day ids
-    prev_ids_filename = create_matching_ids_filename(PREV_DAY, next_days_date)
     try:
-        with open(prev_ids_filename, 'w') as file:
-            file.write(NEW_ID_FIELDS)
-            for key, value in flight_ids.items():
-                print(key, value, sep=',', file=file)
+        boundary_hours = min(read_boundary_hours(prev_boundary_filename),
+                             read_boundary_hours(next_boundary_filename))
     except EnvironmentError:
-        log.error('could not write file: %s', prev_ids_filename)
-        return errno.EACCES
+        log.error('could not read files: %s, %s',
+                  prev_boundary_filename, next_boundary_filename)
+        return errno.ENOENT
 
-    log.info('written file: %s', prev_ids_filename)
+    # Flights outside of the boundaries could match otherwise
+    if max_time_difference >= boundary_hours * SECONDS_PER_HOUR:
+        log.error('Maximum time difference: %f is not less than the boundary hours: %f',
+                  max_time_difference, boundary_hours)
+        return errno.EINVAL
 
-    log.info('consecutive day matching complete')
+    try:
+        prev_flights_df, prev_positions = \
+            read_boundary_state(prev_boundary_filename, is_tail=True)
+    except EnvironmentError:
+        log.error('could not read file: %s', prev_boundary_filename)
+        return errno.ENOENT
 
-    return 0
+    log.info('prev boundary flights read ok: %d', len(prev_flights_df))
+
+    try:
+        next_flights_df, next_positions = \
+            read_boundary_state(next_boundary_filename, is_tail=False)
+    except EnvironmentError:
+        log.error('could not read file: %s', next_boundary_filename)
+        return errno.ENOENT
+
+    log.info('next boundary flights read ok: %d', len(next_flights_df))
+
+    flight_ids = match_consecutive_flights(prev_flights_df, next_flights_df,
+                                           prev_positions, next_positions,
+                                           max_time_difference, max_speed,
+                                           processes, samples)
+
+    return write_prev_day_ids(flight_ids, next_days_date)
 
 
 if __name__ == '__main__':
@@ -244,22 +381,41 @@ if __name__ == '__main__':
     filenames_string = '> <'.join(input_filenames)
     """ A string to inform the user of the required filenames. """
 
+    boundary_filenames_string = '> <'.join(boundary_input_filenames)
+    """ A string to inform the user of the boundary state filenames. """
+
+    # Boundary state files are used if the first file is a boundary state file
+    is_boundary = (len(sys.argv) > 1) and sys.argv[1].endswith(NPZ_FILE_EXTENSION)
+    app_filenames = boundary_input_filenames if is_boundary else input_filenames
+
     app_name = os.path.basename(sys.argv[0])
-    if len(sys.argv) <= len(input_filenames):
+    if len(sys.argv) <= len(app_filenames):
         print('Usage: ' + app_name + ' <' + filenames_string + '>'
-              ' [maximum time difference] [max_speed]')
+              ' [maximum time difference] [max_speed] [processes] [samples]')
+        print('   or: ' + app_name + ' <' + boundary_filenames_string + '>'
+              ' [maximum time difference] [max_speed] [processes] [samples]')
         sys.exit(errno.EINVAL)
 
     max_time_difference = DEFAULT_MAXIMUM_TIME_DELTA
-    if len(sys.argv) > (len(input_filenames) + 1):
-        max_time_difference = float(sys.argv[5])
+    if len(sys.argv) > (len(app_filenames) + 1):
+        max_time_difference = float(sys.argv[len(app_filenames) + 1])
 
     max_speed = DEFAULT_MAXIMUM_SPEED
-    if len(sys.argv) > (len(input_filenames) + 2):
-        max_speed = float(sys.argv[6])
-
-    error_code = match_consecutive_day_trajectories(sys.argv[1:5],
-                                                    max_time_difference,
-                                                    max_speed)
+    if len(sys.argv) > (len(app_filenames) + 2):
+        max_speed = float(sys.argv[len(app_filenames) + 2])
+
+    processes = DEFAULT_VERIFICATION_PROCESSES
+    if len(sys.argv) > (len(app_filenames) + 3):
+        processes = int(sys.argv[len(app_filenames) + 3])
+
+    samples = DEFAULT_VERIFICATION_SAMPLES
+    if len(sys.argv) > (len(app_filenames) + 4):
+        samples = int(sys.argv[len(app_filenames) + 4])
+
+    match_function = match_consecutive_day_boundary_states if is_boundary \
+        else match_consecutive_day_trajectories
+    error_code = match_function(sys.argv[1:len(app_filenames) + 1],
+                                max_time_difference, max_speed, processes,
+                                samples)
     if error_code:
         sys.exit(error_code)
@@ -10,12 +10,15 @@ import sys
 import os
 import errno
 import pandas as pd
-import uuid
-from via_sphere import global_Point3d
-from pru.trajectory_matching import compare_trajectory_positions
+from pru.trajectory_verification import FlightPositions, \
+    compare_flight_positions_in_shards, DEFAULT_VERIFICATION_PROCESSES, \
+    DEFAULT_VERIFICATION_SAMPLES
+from pru.flight_matching import merge_overlapping_flights, DisjointSet, \
+    allocate_group_ids
 from pru.trajectory_fields import read_iso8601_date_string, \
     is_valid_iso8601_date, NEW_ID_FIELDS
 from pru.trajectory_files import create_match_cpr_adsb_output_filenames
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -31,86 +34,53 @@ Note: currently set to 50,000 feet to disable altitude proximity testing.
 
 
 def verify_flight_matches(flight_matches, cpr_positions, adsb_positions,
-                          cpr_ids, adsb_ids, merge_ids, distance_threshold,
-                          alt_threshold):
+                          cpr_flights, adsb_flights, matched_flights,
+                          distance_threshold, alt_threshold, *, keys=None,
+                          processes=DEFAULT_VERIFICATION_PROCESSES,
+                          samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Verifies the pairs of flight ids in flight_matches by calling
-    compare_trajectory_positions with the cpr_positions and adsb_positions
-    of each flight against the distance_threshold and alt_threshold.
+    compare_flight_positions with the cpr_positions and adsb_positions
+    of the flights against the distance_threshold and alt_threshold at
+    samples times across their common period.
 
-    It adds new matches to the: cpr_ids, adsb_ids and merge_ids dicts and
-    returns the number of newly matched flights.
-    """
-    matches = 0
-    cpr_pos_match = pd.merge(cpr_positions, flight_matches,
-                             left_index=True, right_on='FLIGHT_ID_x')
-
-    for cpr_id, cpr_pos in cpr_pos_match.groupby('FLIGHT_ID_x'):
-        # Ensure that cpr_pos has more than one value!
-        if isinstance(cpr_pos['TIME'], pd.Series):
-            cpr_times = cpr_pos['TIME'].values
-            cpr_points = global_Point3d(cpr_pos['LAT'], cpr_pos['LON'])
-            cpr_alts = cpr_pos['ALT'].values
-
-            for adsb_id in cpr_pos['FLIGHT_ID_y'].unique():
-                match_id = 0
-                # Search for previous matches and set match_id accordingly
-                if cpr_id in cpr_ids:  # previous CPR match
-                    match_id = cpr_ids[cpr_id]
-                    if adsb_id in adsb_ids:  # and a previous ADS-B match
-                        if match_id == adsb_ids[adsb_id]:
-                            continue  # match found previously
-                        else:  # a new match to merge between existing matches
-                            merge_ids[adsb_ids[adsb_id]] = match_id
-                elif adsb_id in adsb_ids:  # previous ADS-B match only
-                    match_id = adsb_ids[adsb_id]
-                else:  # not matched previously
-                    match_id = uuid.uuid4()
-
-                # Ensure that adsb_id exists in adsb_positions
-                adsb_pos = adsb_positions.loc[adsb_id]
-                # Ensure that adsb_pos has more than one value!
-                if isinstance(adsb_pos['TIME'], pd.Series):
-                    adsb_times = adsb_pos['TIME'].values
-                    adsb_points = global_Point3d(adsb_pos['LAT'], adsb_pos['LON'])
-                    adsb_alts = adsb_pos['ALT'].values
-
-                    # compare positions to validate the match
-                    valid_match = \
-                        compare_trajectory_positions(cpr_times, adsb_times,
-                                                     cpr_points, adsb_points,
-                                                     cpr_alts, adsb_alts,
-                                                     distance_threshold=distance_threshold,
-                                                     alt_threshold=alt_threshold)
-                    if (valid_match):
-                        matches += 1
-
-                        if cpr_id not in cpr_ids:
-                            cpr_ids[cpr_id] = match_id
-
-                        if adsb_id not in adsb_ids:
-                            adsb_ids[adsb_id] = match_id
-
-    return matches
+    The pairs are verified in shards by their keys using up to processes
+    processes, the matches are then added in the same order as a single process.
 
-
-def merge_matches(flight_ids, merge_ids):
-    """
-    Replace any flight_ids values that are in the merge_ids keys with the
-    merge_ids value.
+    It unites the groups of the matched flights in the matched_flights
+    DisjointSet, where the CPR flights are indexed by cpr_flights and the
+    ADS-B flights are indexed by adsb_flights, offset by the number of
+    CPR flights. It returns the number of newly matched flights.
     """
-    for key, value in flight_ids.items():
-        if value in merge_ids:
-            flight_ids[key] = merge_ids[value]
+    matches = 0
 
+    # Only verify CPR flights with positions and ADS-B flights with more than one
+    cpr_flight_ids = flight_matches['FLIGHT_ID_x'].values
+    adsb_flight_ids = flight_matches['FLIGHT_ID_y'].values
+    has_positions = cpr_positions.position_counts(cpr_flight_ids) > 0
+    valid_matches = \
+        compare_flight_positions_in_shards(cpr_positions, cpr_flight_ids,
+                                           adsb_positions, adsb_flight_ids, keys,
+                                           processes=processes,
+                                           distance_threshold=distance_threshold,
+                                           alt_threshold=alt_threshold,
+                                           samples=samples) & \
+        (adsb_positions.position_counts(adsb_flight_ids) > 1)
+
+    # Add the matches in order of CPR flight id, then ADS-B flight id
+    pairs_df = pd.DataFrame({'CPR_ID': cpr_flight_ids[has_positions],
+                             'ADSB_ID': adsb_flight_ids[has_positions],
+                             'VALID': valid_matches[has_positions]})
+    pairs_df = pairs_df.loc[pairs_df['VALID']].drop_duplicates(['CPR_ID', 'ADSB_ID'])
+    pairs_df = pairs_df.sort_values('CPR_ID', kind='mergesort')
+
+    cpr_items = cpr_flights.get_indexer(pairs_df['CPR_ID'].values)
+    adsb_items = adsb_flights.get_indexer(pairs_df['ADSB_ID'].values) + len(cpr_flights)
+    for cpr_item, adsb_item in zip(cpr_items.tolist(), adsb_items.tolist()):
+        if matched_flights.union(cpr_item, adsb_item):
+            matches += 1
 
-def allocate_remaining_ids(flight_ids, df_fight_ids):
-    """
-    Allocate new UUIDS to the flights in df_fight_ids without an id in flight_ids.
-    """
-    for id in df_fight_ids:
-        if id not in flight_ids:
-            flight_ids[id] = uuid.uuid4()
+    return matches
 
 
 input_filenames = ['cpr flights file',
@@ -120,8 +90,11 @@ input_filenames = ['cpr flights file',
 """ The filenames required by the function. """
 
 
+@measure_stage
 def match_cpr_adsb_trajectories(filenames, distance_threshold=DEFAULT_MATCHING_DISTANCE_THRESHOLD,
-                                alt_threshold=DEFAULT_MATCHING_ALTITUDE_THRESHOLD):
+                                alt_threshold=DEFAULT_MATCHING_ALTITUDE_THRESHOLD,
+                                processes=DEFAULT_VERIFICATION_PROCESSES,
+                                samples=DEFAULT_VERIFICATION_SAMPLES):
 
     # Extract date strings from the input filenames and validate them
     input_date_strings = [''] * len(input_filenames)
@@ -153,6 +126,8 @@ def match_cpr_adsb_trajectories(filenames, distance_threshold=DEFAULT_MATCHING_D
 
     log.info('Distance threshold: %f', distance_threshold)
     log.info('Altitude threshold: %f', alt_threshold)
+    log.info('Verification processes: %d', processes)
+    log.info('Verification samples: %d', samples)
 
     ############################################################################
     # Read the files
@@ -217,10 +192,15 @@ def match_cpr_adsb_trajectories(filenames, distance_threshold=DEFAULT_MATCHING_D
 
     log.info('adsb points read ok')
 
-    # Dicts to hold the flight ids
-    cpr_flight_ids = {}
-    adsb_flight_ids = {}
-    merge_flight_ids = {}
+    # Convert the positions to ECEF points once, for all of the matches
+    cpr_positions = FlightPositions(cpr_points_df)
+    adsb_positions = FlightPositions(adsb_points_df)
+    del cpr_points_df, adsb_points_df
+
+    # The CPR flights followed by the ADS-B flights, grouped by matches
+    cpr_flights = pd.Index(pd.unique(cpr_flights_df['FLIGHT_ID'].values))
+    adsb_flights = pd.Index(pd.unique(adsb_flights_df['FLIGHT_ID'].values))
+    matched_flights = DisjointSet(len(cpr_flights) + len(adsb_flights))
 
     # Get the CPR flights with aircraft addresses
     cpr_flights_aa = cpr_flights_df.loc[cpr_flights_df['AIRCRAFT_ADDRESS'].notnull()]
@@ -229,60 +209,53 @@ def match_cpr_adsb_trajectories(filenames, distance_threshold=DEFAULT_MATCHING_D
     # Match the flights
 
     # match CPR and ADS-B flights on aircraft address and overlaping start & end times
-    merge_aa = pd.merge(cpr_flights_aa, adsb_flights_df, on='AIRCRAFT_ADDRESS')
-    merge_aa_time = merge_aa.loc[(merge_aa.PERIOD_START_x <= merge_aa.PERIOD_FINISH_y) &
-                                 (merge_aa.PERIOD_START_y <= merge_aa.PERIOD_FINISH_x)]
+    merge_aa_time = merge_overlapping_flights(cpr_flights_aa, adsb_flights_df,
+                                              'AIRCRAFT_ADDRESS')
 
     log.info('aircraft address time matches: %d', len(merge_aa_time))
 
     # verify aircraft address matches
-    aa_matches = verify_flight_matches(merge_aa_time, cpr_points_df, adsb_points_df,
-                                       cpr_flight_ids, adsb_flight_ids, merge_flight_ids,
-                                       distance_threshold, alt_threshold)
-    log.info('aircraft address matches: %d, cpr_ids: %d, adsb_ids: %d, merge_ids: %d',
-             aa_matches, len(cpr_flight_ids), len(adsb_flight_ids), len(merge_flight_ids))
+    aa_matches = verify_flight_matches(merge_aa_time, cpr_positions, adsb_positions,
+                                       cpr_flights, adsb_flights, matched_flights,
+                                       distance_threshold, alt_threshold,
+                                       keys=merge_aa_time['AIRCRAFT_ADDRESS'],
+                                       processes=processes, samples=samples)
+    log.info('aircraft address matches: %d', aa_matches)
 
     # match CPR and ADS-B flights on callsign and overlaping start & end times
-    merge_cs = pd.merge(cpr_flights_df, adsb_flights_df, on='CALLSIGN')
-    merge_cs_time = merge_cs.loc[(merge_cs.PERIOD_START_x <= merge_cs.PERIOD_FINISH_y) &
-                                 (merge_cs.PERIOD_START_y <= merge_cs.PERIOD_FINISH_x)]
+    merge_cs_time = merge_overlapping_flights(cpr_flights_df, adsb_flights_df,
+                                              'CALLSIGN')
 
     log.info('callsign time matches: %d', len(merge_cs_time))
 
     # verify callsign matches
-    cs_matches = verify_flight_matches(merge_cs_time, cpr_points_df, adsb_points_df,
-                                       cpr_flight_ids, adsb_flight_ids, merge_flight_ids,
-                                       distance_threshold, alt_threshold)
-    log.info('callsign matches: %d, cpr_ids: %d, adsb_ids: %d, merge_ids: %d',
-             cs_matches, len(cpr_flight_ids), len(adsb_flight_ids), len(merge_flight_ids))
-
-    # merge overlapping aircraft address and callsign matches
-    if len(merge_flight_ids):
-        merge_matches(cpr_flight_ids, merge_flight_ids)
-        merge_matches(adsb_flight_ids, merge_flight_ids)
-        merge_flight_ids.clear()
+    cs_matches = verify_flight_matches(merge_cs_time, cpr_positions, adsb_positions,
+                                       cpr_flights, adsb_flights, matched_flights,
+                                       distance_threshold, alt_threshold,
+                                       keys=merge_cs_time['CALLSIGN'],
+                                       processes=processes, samples=samples)
+    log.info('callsign matches: %d', cs_matches)
 
     # match CPR and ADS-B flights on departure, destination and overlaping start & end times
-    merge_dep_des = pd.merge(cpr_flights_df, adsb_flights_df, on=['ADEP', 'ADES'])
-    merge_dep_des_time = merge_cs.loc[(merge_dep_des.PERIOD_START_x <= merge_dep_des.PERIOD_FINISH_y) &
-                                      (merge_dep_des.PERIOD_START_y <= merge_dep_des.PERIOD_FINISH_x)]
+    merge_dep_des_time = merge_overlapping_flights(cpr_flights_df, adsb_flights_df,
+                                                   ['ADEP', 'ADES'])
+
+    log.info('airport time matches: %d', len(merge_dep_des_time))
 
     # verify departure, destination matches
-    dep_des_matches = verify_flight_matches(merge_dep_des_time, cpr_points_df, adsb_points_df,
-                                            cpr_flight_ids, adsb_flight_ids, merge_flight_ids,
-                                            distance_threshold, alt_threshold)
-    log.info('airport matches: %d, cpr_ids: %d, adsb_ids: %d, merge_ids: %d',
-             dep_des_matches, len(cpr_flight_ids), len(adsb_flight_ids), len(merge_flight_ids))
-
-    # merge overlapping aircraft address, callsign and airport matches
-    if len(merge_flight_ids):
-        merge_matches(cpr_flight_ids, merge_flight_ids)
-        merge_matches(adsb_flight_ids, merge_flight_ids)
-        merge_flight_ids.clear()
-
-    # Add unmatched flight ids to cpr_flight_ids and adsb_flight_ids
-    allocate_remaining_ids(cpr_flight_ids, cpr_flights_df['FLIGHT_ID'].values)
-    allocate_remaining_ids(adsb_flight_ids, adsb_flights_df['FLIGHT_ID'].values)
+    dep_des_matches = verify_flight_matches(merge_dep_des_time, cpr_positions, adsb_positions,
+                                            cpr_flights, adsb_flights, matched_flights,
+                                            distance_threshold, alt_threshold,
+                                            keys=merge_dep_des_time[['ADEP', 'ADES']],
+                                            processes=processes, samples=samples)
+    log.info('airport matches: %d', dep_des_matches)
+
+    # Allocate new ids to the groups of matched and the unmatched flights
+    new_flight_ids = allocate_group_ids(matched_flights)
+    cpr_new_ids = new_flight_ids[:len(cpr_flights)]
+    adsb_new_ids = new_flight_ids[len(cpr_flights):]
+    log.info('cpr flights: %d, adsb flights: %d, new flight ids: %d',
+             len(cpr_flights), len(adsb_flights), len(set(new_flight_ids)))
 
     ############################################################################
     # Output the matching ids
@@ -293,8 +266,7 @@ def match_cpr_adsb_trajectories(filenames, distance_threshold=DEFAULT_MATCHING_D
     try:
         with open(cpr_ids_file, 'w') as file:
             file.write(NEW_ID_FIELDS)
-            for key in cpr_flight_ids:
-                value = cpr_flight_ids[key]
+            for key, value in zip(cpr_flights, cpr_new_ids):
                 print(key, value, sep=',', file=file)
     except EnvironmentError:
         log.error('could not write file: %s', cpr_ids_file)
@@ -307,8 +279,8 @@ def match_cpr_adsb_trajectories(filenames, distance_threshold=DEFAULT_MATCHING_D
     try:
         with open(adsb_ids_file, 'w', newline='') as file:
             file.write(NEW_ID_FIELDS)
-            for key in adsb_flight_ids:
-                adsb_str = '0x{:06x},{}'.format(key, adsb_flight_ids[key])
+            for key, value in zip(adsb_flights, adsb_new_ids):
+                adsb_str = '0x{:06x},{}'.format(key, value)
                 print(adsb_str, file=file)
     except EnvironmentError:
         log.error('could not write file: %s', adsb_ids_file)
@@ -329,7 +301,7 @@ if __name__ == '__main__':
     app_name = os.path.basename(sys.argv[0])
     if len(sys.argv) <= len(input_filenames):
         print('Usage: ' + app_name + ' <' + filenames_string + '>'
-              ' [distance_threshold] [altitude_threshold]')
+              ' [distance_threshold] [altitude_threshold] [processes] [samples]')
         sys.exit(errno.EINVAL)
 
     distance_threshold = DEFAULT_MATCHING_DISTANCE_THRESHOLD
@@ -340,7 +312,16 @@ if __name__ == '__main__':
     if len(sys.argv) > (len(input_filenames) + 2):
         alt_threshold = float(sys.argv[6])
 
+    processes = DEFAULT_VERIFICATION_PROCESSES
+    if len(sys.argv) > (len(input_filenames) + 3):
+        processes = int(sys.argv[7])
+
+    samples = DEFAULT_VERIFICATION_SAMPLES
+    if len(sys.argv) > (len(input_filenames) + 4):
+        samples = int(sys.argv[8])
+
     error_code = match_cpr_adsb_trajectories(sys.argv[1:5],
-                                             distance_threshold, alt_threshold)
+                                             distance_threshold, alt_threshold,
+                                             processes, samples)
     if error_code:
         sys.exit(error_code)
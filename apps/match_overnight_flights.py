@@ -9,12 +9,13 @@ Software to match trajectories on consecutive days.
 import sys
 import os
 import errno
-import numpy as np
 import pandas as pd
 from uuid import UUID
+from pru.flight_matching import merge_consecutive_flights
 from pru.trajectory_fields import read_iso8601_date_string, \
     is_valid_iso8601_date, NEW_ID_FIELDS
 from pru.trajectory_files import create_matching_ids_filename, PREV_DAY
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -46,6 +47,7 @@ def add_matches(flight_matches, flight_ids):
     return matches
 
 
+@measure_stage
 def match_overnight_flights(filenames,
                             max_time_difference=DEFAULT_MAXIMUM_TIME_DELTA):
     """
@@ -125,9 +127,8 @@ def match_overnight_flights(filenames,
     # Match the flights
 
     # match previous and next flights on aircraft address and times wihin max_time_difference
-    merge_aa = pd.merge(prev_flights_aa, next_flights_aa, on='AIRCRAFT_ADDRESS')
-    merge_aa_time = merge_aa.loc[((merge_aa.PERIOD_START_y - merge_aa.PERIOD_FINISH_x) /
-                                  np.timedelta64(1, 's')) < max_time_difference]
+    merge_aa_time = merge_consecutive_flights(prev_flights_aa, next_flights_aa,
+                                              'AIRCRAFT_ADDRESS', max_time_difference)
 
     # add aircraft address matches
     aa_matches = add_matches(merge_aa_time, flight_ids)
@@ -135,9 +136,8 @@ def match_overnight_flights(filenames,
              aa_matches, len(flight_ids))
 
     # match previous and next flights on callsign and times wihin max_time_difference
-    merge_cs = pd.merge(prev_flights_df, next_flights_df, on='CALLSIGN')
-    merge_cs_time = merge_cs.loc[((merge_cs.PERIOD_START_y - merge_cs.PERIOD_FINISH_x) /
-                                  np.timedelta64(1, 's')) < max_time_difference]
+    merge_cs_time = merge_consecutive_flights(prev_flights_df, next_flights_df,
+                                              'CALLSIGN', max_time_difference)
 
     # add callsign matches
     cs_matches = add_matches(merge_cs_time, flight_ids)
@@ -16,6 +16,7 @@ from pru.trajectory_fields import read_iso8601_date_string, \
 from pru.trajectory_files import create_merge_apds_output_filenames
 from pru.trajectory_merging import \
     read_dataframe_with_new_ids, replace_old_flight_ids
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -72,6 +73,7 @@ input_filenames = ['apds ids file',
 """ The filenames required by the application. """
 
 
+@measure_stage
 def merge_apds_trajectories(filenames):
 
     apds_ids_filename = filenames[0]
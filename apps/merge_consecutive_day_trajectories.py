@@ -4,6 +4,9 @@
 # Consult your license regarding permissions and restrictions.
 """
 Merges merged flights, positions and events data on consecutive days.
+
+Also writes the tail of the boundary state of the next day, for matching with
+the day after it, see pru/boundary_state.py.
 """
 
 import sys
@@ -11,11 +14,17 @@ import os
 import gc
 import errno
 import pandas as pd
+from io import BytesIO
 from uuid import UUID
 from pru.trajectory_fields import \
-    is_valid_iso8601_date, ISO8601_DATETIME_FORMAT, \
+    is_valid_iso8601_date, ISO8601_DATETIME_FORMAT, POSITION_FIELDS, \
     has_bz2_extension, BZ2_FILE_EXTENSION, read_iso8601_date_string
-from pru.trajectory_merging import replace_old_flight_ids
+from pru.trajectory_files import CPR_FR24, create_boundary_state_filename
+from pru.trajectory_merging import replace_old_flight_ids, \
+    create_new_ids_map, merge_flight_items_files, remove_flight_items
+from pru.boundary_state import write_boundary_state, create_flight_positions, \
+    find_boundary_flights, BOUNDARY_FLIGHT_FIELDS, DEFAULT_BOUNDARY_HOURS
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -33,7 +42,8 @@ def get_next_day_items(next_filename, ids_df, log, *, date_fields=[],
     without the matching ids.
 
     Returns a pandas DataFrame containing flights with the new flight ids in
-    the FLIGHT_ID column.
+    the FLIGHT_ID column and a pandas DataFrame of the next items without the
+    matching ids.
     """
     # An empty data frame to return
     new_items_df = pd.DataFrame()
@@ -51,12 +61,12 @@ def get_next_day_items(next_filename, ids_df, log, *, date_fields=[],
         log.info('%s read ok', next_filename)
     except EnvironmentError:
         log.error('could not read file: %s', next_filename)
-        return new_items_df  # return empty DataFrame
+        return new_items_df, next_df  # return empty DataFrames
 
-    if write_new_next_dataframe:
-        # Create a new dataframe WITHOUT any items that are in ids_df
-        new_next_df = next_df[(~next_df['FLIGHT_ID'].isin(ids_df.index))]
+    # Create a new dataframe WITHOUT any items that are in ids_df
+    new_next_df = next_df[(~next_df['FLIGHT_ID'].isin(ids_df.index))]
 
+    if write_new_next_dataframe:
         # Output the new next items
         new_next_filename = 'new_' + next_filename
         try:
@@ -69,16 +79,13 @@ def get_next_day_items(next_filename, ids_df, log, *, date_fields=[],
             log.info('written file: %s', new_next_filename)
         except EnvironmentError:
             log.error('could not write file: %s', new_next_filename)
-            return new_items_df  # return empty DataFrame
-
-    # Free up memory used by new_next_df
-    gc.collect()
+            return new_items_df, new_next_df  # return empty new items
 
     # get the new items from the next DataFrame
     new_items_df = pd.merge(ids_df, next_df, left_index=True, right_on='FLIGHT_ID')
     replace_old_flight_ids(new_items_df)
 
-    return new_items_df  # return new items
+    return new_items_df, new_next_df  # return new items and new next items
 
 
 def update_flight_data(prev_flights_df, new_items_df):
@@ -115,9 +122,9 @@ def merge_flights(prev_flights_filename, next_flights_filename, ids_df, log):
     It writes the new next days and previous days flights to files prepended
     with new.
 
-    it returns True if successful, False otherwise.
+    it returns the new next days flights if successful, None otherwise.
     """
-    new_items_df = get_next_day_items(next_flights_filename, ids_df, log)
+    new_items_df, new_next_df = get_next_day_items(next_flights_filename, ids_df, log)
 
     # free memory used by get_next_day_items
     gc.collect()
@@ -131,7 +138,7 @@ def merge_flights(prev_flights_filename, next_flights_filename, ids_df, log):
         log.info('%s read ok', prev_flights_filename)
     except EnvironmentError:
         log.error('could not read file: %s', prev_flights_filename)
-        return False
+        return None
 
     # merge next days flight data with the previous days flight data
     update_flight_data(prev_flights_df, new_items_df)
@@ -148,12 +155,41 @@ def merge_flights(prev_flights_filename, next_flights_filename, ids_df, log):
         log.info('written file: %s', new_prev_flights_filename)
     except EnvironmentError:
         log.error('could not write file: %s', new_prev_flights_filename)
-        return False
+        return None
 
-    return True
+    return new_next_df
+
+
+def find_tail_flights(flights_df, date, hours=DEFAULT_BOUNDARY_HOURS):
+    """
+    Find the flights that finish within hours of the end of the day,
+    see find_boundary_flights.
+
+    Returns a pandas DataFrame of the flights with the BOUNDARY_FLIGHT_FIELDS
+    columns.
+    """
+    flights_df = flights_df[BOUNDARY_FLIGHT_FIELDS].copy()
+    for field in ['PERIOD_START', 'PERIOD_FINISH']:
+        flights_df[field] = pd.to_datetime(flights_df[field], utc=True)
+
+    _, is_tail = find_boundary_flights(flights_df, date, hours)
+    return flights_df.loc[is_tail]
+
+
+def create_select_lines(flight_ids, selected_lines):
+    """
+    Create a function that appends the lines of the flights in flight_ids
+    to selected_lines, see copy_flight_runs.
+    """
+    def select_lines(flight_id, lines):
+        if flight_id in flight_ids:
+            selected_lines.extend(lines)
+
+    return select_lines
 
 
-def merge_next_day_items(prev_filename, next_filename, ids_df, log):
+def merge_next_day_items(prev_filename, next_filename, ids_df, log, *,
+                         select_lines=None):
     """
     Gets the next days items (positions or events) that are the continuation
     of the previous days items them with the previous days items.
@@ -161,40 +197,41 @@ def merge_next_day_items(prev_filename, next_filename, ids_df, log):
     It writes the new next days and previous days items to files prepended
     with new.
 
+    The items are merged by FLIGHT_ID and TIME from the files, see
+    merge_flight_items.
+
+    If select_lines is given, it is called with the lines of each flight
+    in the new next days items, see remove_flight_items.
+
     it returns True if successful, False otherwise.
     """
-    new_items_df = get_next_day_items(next_filename, ids_df,
-                                      log, date_fields=['TIME'])
+    # Write the new next items WITHOUT any items that are in ids_df
+    new_next_filename = 'new_' + next_filename
+    if has_bz2_extension(next_filename):
+        new_next_filename = new_next_filename[:-BZ2_LENGTH]
 
-    # free memory used by get_next_day_items
-    gc.collect()
-
-    prev_df = pd.DataFrame()
     try:
-        prev_df = pd.read_csv(prev_filename, parse_dates=['TIME'],
-                              converters={'FLIGHT_ID': lambda x: UUID(x)},
-                              memory_map=True)
-        log.info('%s read ok', prev_filename)
+        remove_flight_items(next_filename, new_next_filename,
+                            set(ids_df.index.astype(str)),
+                            select_lines=select_lines)
+        log.info('written file: %s', new_next_filename)
     except EnvironmentError:
-        log.error('could not read file: %s', prev_filename)
+        log.error('could not write file: %s', new_next_filename)
         return False
 
-    # merge the new items into the previous DataFrame
-    new_prev_df = pd.concat([prev_df, new_items_df], ignore_index=True)
-    new_prev_df.sort_values(by=['FLIGHT_ID', 'TIME'], inplace=True)
-
-    # Output the new previous items
+    # Merge the new items into the previous items
     new_prev_filename = 'new_' + prev_filename
-    try:
-        is_bz2 = has_bz2_extension(prev_filename)
-        if is_bz2:
-            new_prev_filename = new_prev_filename[:-BZ2_LENGTH]
+    is_bz2 = has_bz2_extension(prev_filename)
+    if is_bz2:
+        new_prev_filename = new_prev_filename[:-BZ2_LENGTH]
 
-        new_prev_df.to_csv(new_prev_filename, index=False,
-                           date_format=ISO8601_DATETIME_FORMAT)
+    try:
+        merge_flight_items_files(new_prev_filename, [prev_filename, next_filename],
+                                 [None, create_new_ids_map(ids_df)])
         log.info('written file: %s', new_prev_filename)
     except EnvironmentError:
-        log.error('could not write file: %s', new_prev_filename)
+        log.error('could not merge files: %s and %s into %s',
+                  prev_filename, next_filename, new_prev_filename)
         return False
 
     return True
@@ -211,7 +248,8 @@ input_filenames = ['daily ids file',
 """ The filenames required by the application. """
 
 
-def merge_consecutive_day_trajectories(filenames):
+@measure_stage
+def merge_consecutive_day_trajectories(filenames, boundary_hours=DEFAULT_BOUNDARY_HOURS):
 
     day_ids_filename = filenames[0]
 
@@ -266,18 +304,45 @@ def merge_consecutive_day_trajectories(filenames):
         return errno.ENOENT
 
     # Merge flights
-    if not merge_flights(prev_flights_filename, next_flights_filename, ids_df, log):
+    next_flights_df = merge_flights(prev_flights_filename, next_flights_filename,
+                                    ids_df, log)
+    if next_flights_df is None:
         return errno.ENOENT
 
+    # The flights in the tail of the merged next day
+    tail_flights_df = find_tail_flights(next_flights_df, next_date, boundary_hours)
+    del next_flights_df
+
     # free memory used by merge_flights
     gc.collect()
 
-    # Merge positions
+    # Merge positions, selecting the positions of the tail flights
+    tail_lines = []
+    select_lines = create_select_lines(set(tail_flights_df['FLIGHT_ID'].astype(str)),
+                                       tail_lines)
     if not merge_next_day_items(prev_positions_filename, next_positions_filename,
-                                ids_df, log):
+                                ids_df, log, select_lines=select_lines):
         return errno.ENOENT
 
+    # Output the tail of the boundary state of the merged next day
+    boundary_filename = create_boundary_state_filename(CPR_FR24, next_date,
+                                                       is_tail=True)
+    try:
+        points_df = pd.read_csv(BytesIO(POSITION_FIELDS.encode() + b''.join(tail_lines)),
+                                usecols=['FLIGHT_ID', 'TIME', 'LAT', 'LON', 'ALT'],
+                                parse_dates=['TIME'])
+        flights_count = write_boundary_state(boundary_filename, tail_flights_df,
+                                             create_flight_positions(points_df),
+                                             next_date, boundary_hours, is_tail=True)
+    except EnvironmentError:
+        log.error('could not write file: %s', boundary_filename)
+        return errno.EACCES
+
+    log.info('written file: %s, boundary flights: %d', boundary_filename,
+             flights_count)
+
     # free memory used by merge_next_day_items
+    del tail_lines, points_df
     gc.collect()
 
     # Merge events
@@ -297,9 +362,15 @@ if __name__ == '__main__':
 
     app_name = os.path.basename(sys.argv[0])
     if len(sys.argv) <= len(input_filenames):
-        print('Usage: ' + app_name + ' <' + filenames_string + '>')
+        print('Usage: ' + app_name + ' <' + filenames_string + '>'
+              ' [boundary hours]')
         sys.exit(errno.EINVAL)
 
-    error_code = merge_consecutive_day_trajectories(sys.argv[1:])
+    boundary_hours = DEFAULT_BOUNDARY_HOURS
+    if len(sys.argv) > (len(input_filenames) + 1):
+        boundary_hours = float(sys.argv[len(input_filenames) + 1])
+
+    error_code = merge_consecutive_day_trajectories(sys.argv[1:len(input_filenames) + 1],
+                                                    boundary_hours)
     if error_code:
         sys.exit(error_code)
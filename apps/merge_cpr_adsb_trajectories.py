@@ -4,19 +4,33 @@
 # Consult your license regarding permissions and restrictions.
 """
 Merges CPR and ADS-B flights and positions data.
+
+Also writes the head of the boundary state of the day, for matching with the
+previous day, see pru/boundary_state.py.
 """
 
 import sys
 import os
+import csv
 import errno
+import numpy as np
 import pandas as pd
+from io import StringIO
 from uuid import UUID
 from pru.trajectory_fields import \
     is_valid_iso8601_date, ISO8601_DATETIME_FORMAT, \
     read_iso8601_date_string, create_iso8601_csv_filename
 from pru.trajectory_files import create_merge_cpr_adsb_output_filenames
 from pru.trajectory_merging import \
-    read_dataframe_with_new_ids, replace_old_flight_ids
+    read_dataframe_with_new_ids, replace_old_flight_ids, \
+    create_new_ids_map, merge_flight_items, write_flight_items, \
+    relabel_flight_items, iso8601_datetime_key
+from pru.trajectory_cleaning import find_invalid_positions, \
+    DEFAULT_MAX_SPEED, DEFAULT_DISTANCE_ACCURACY
+from pru.trajectory_verification import FlightPositions
+from pru.EcefPoint import lat_long_to_xyz
+from pru.boundary_state import write_boundary_state, DEFAULT_BOUNDARY_HOURS
+from pru.stage_metrics import measure_stage, count_rows_in, count_rows_out
 from pru.logger import logger
 
 log = logger(__name__)
@@ -64,46 +78,190 @@ def get_merged_flights(flights1_filename, flights2_filename, ids1_df, ids2_df):
                          get_flights_with_new_ids(flights1_filename, ids1_df))
 
 
-def merge_positions(positions1_df, positions2_df):
+def summarise_flight_positions(flight_summaries, flight_positions, time_index, ssr_code_index):
+    """
+    Summarise the positions of merged flights and pass them through.
+
+    Parameters
+    ----------
+    flight_summaries: a list
+        A list to append the summaries of the flights to.
+
+    flight_positions: an iterable of (flight id, rows) tuples
+        The merged positions, see merge_flight_items.
+
+    time_index, ssr_code_index: ints
+        The indicies of the TIME and SSR_CODE fields of the rows.
+
+    Returns
+    -------
+    A generator of the flight_positions.
     """
-    Merges pandas DataFrames containing positions: positions_1 and positions_2
+    for flight_id, rows in flight_positions:
+        # The source flight ids and SSR codes in the order that they occur
+        source_ids = list(dict.fromkeys(row[0] for row in rows))
+        ssr_codes = list(dict.fromkeys(row[ssr_code_index] for row in rows
+                                       if row[ssr_code_index]))
+        flight_summaries.append((flight_id, rows[0][time_index], rows[-1][time_index],
+                                source_ids, ssr_codes))
+        yield flight_id, rows
 
-    Returns: a pandas DataFrame containing the new positions.
-    Note: the postions are sorted in new flight id and time order.
+
+def clean_head_positions(rows, fields, max_speed, distance_accuracy):
     """
-    new_positions_df = pd.concat([positions1_df, positions2_df], ignore_index=True)
-    new_positions_df.sort_values(by=['NEW_FLIGHT_ID', 'TIME'], inplace=True)
-    return new_positions_df
+    Clean the positions of a flight in the head of the day, in the same way
+    that clean_position_data.py cleans the merged positions file.
+
+    Parameters
+    ----------
+    rows: a list of lists of strings
+        The merged positions of the flight, see merge_flight_items.
+
+    fields: a list of strings
+        The fields of the rows.
 
+    max_speed: float
+        The maximum speed betwen valid positions [Knots].
 
-def get_merged_positions(positions1_filename, positions2_filename, ids1_df, ids2_df):
+    distance_accuracy: float
+        The accuracy of the positions [Nautical Miles].
+
+    Returns
+    -------
+    The times [nanoseconds], latitudes, longitudes and altitudes of the
+    valid positions of the flight as numpy arrays.
     """
-    Reads the positions files, changes their flight ids, merges and sorts them.
+    position_string = StringIO()
+    csv.writer(position_string, lineterminator='\n').writerows(rows)
+    position_string.seek(0)
+    positions = pd.read_csv(position_string, header=None, names=fields,
+                            parse_dates=['TIME'])
+    invalid_positions, _ = \
+        find_invalid_positions(positions, max_speed=max_speed,
+                               distance_accuracy=distance_accuracy)
+    valid_positions = positions[~invalid_positions]
+    return np.asarray(valid_positions['TIME'].values,
+                      dtype='datetime64[ns]').view(np.int64), \
+        valid_positions['LAT'].values.astype(float), \
+        valid_positions['LON'].values.astype(float), \
+        valid_positions['ALT'].values.astype(float)
+
+
+def select_head_positions(head_positions, flight_positions, fields, head_finish,
+                          max_speed, distance_accuracy):
     """
-    return merge_positions(read_dataframe_with_new_ids(positions1_filename, ids1_df),
-                           read_dataframe_with_new_ids(positions2_filename, ids2_df))
+    Clean the positions of merged flights that start in the head of the day
+    and pass the flights through.
+
+    The head positions are reduced to arrays as the flights pass, so only
+    the arrays are held in memory, see clean_head_positions.
+
+    Parameters
+    ----------
+    head_positions: a list
+        A list to append the (flight id, times, latitudes, longitudes,
+        altitudes) tuples of the valid positions of the flights to.
 
+    flight_positions: an iterable of (flight id, rows) tuples
+        The merged positions, see merge_flight_items.
 
-def update_flight_data(flights_df, positions_df):
+    fields: a list of strings
+        The fields of the rows.
+
+    head_finish: string
+        The finish of the head of the day in ISO8601_DATETIME_FORMAT.
+
+    max_speed: float
+        The maximum speed betwen valid positions [Knots].
+
+    distance_accuracy: float
+        The accuracy of the positions [Nautical Miles].
+
+    Returns
+    -------
+    A generator of the flight_positions.
     """
-    Update the flights_df with the FLIGHT_IDs SSR_CODEs and starts and ends
-    of the positions periods.
+    time_index = fields.index('TIME')
+    head_finish_key = iso8601_datetime_key(head_finish)
+    for flight_id, rows in flight_positions:
+        if iso8601_datetime_key(rows[0][time_index]) < head_finish_key:
+            try:
+                arrays = clean_head_positions(rows, fields, max_speed,
+                                              distance_accuracy)
+                if len(arrays[0]):
+                    head_positions.append((flight_id,) + arrays)
+            except (ValueError, TypeError):
+                log.exception('find_invalid_positions flight id: %s', flight_id)
+        yield flight_id, rows
+
+
+def create_head_positions(head_positions):
     """
-    for flight_id, positions in positions_df.groupby('NEW_FLIGHT_ID'):
+    Create the FlightPositions of the flights in the head of the day.
+
+    Parameters
+    ----------
+    head_positions: a list of tuples
+        The (flight id, times, latitudes, longitudes, altitudes) of the
+        valid positions of the flights, see select_head_positions.
+
+    Returns
+    -------
+    The FlightPositions of the flights, indexed by UUID flight id.
+    """
+    if not head_positions:
+        return FlightPositions.from_arrays([], [], [], [], [])
+
+    flight_ids, times, lats, lons, alts = zip(*head_positions)
+    x, y, z = lat_long_to_xyz(np.concatenate(lats), np.concatenate(lons))
+    return FlightPositions.from_arrays([UUID(flight_id) for flight_id in flight_ids],
+                                       [len(flight_times) for flight_times in times],
+                                       np.concatenate(times),
+                                       np.column_stack((x, y, z)),
+                                       np.concatenate(alts))
+
 
-        if flight_id in flights_df.index:
-            flight_ids = positions['FLIGHT_ID'].drop_duplicates()
-            flights_df.at[flight_id, 'SOURCE_IDS'] = flight_ids.values
+def update_flight_data(flights_df, flight_summaries):
+    """
+    Update the flights_df with the FLIGHT_IDs SSR_CODEs and starts and ends
+    of the positions periods.
 
-            ssr_codes = positions['SSR_CODE'].drop_duplicates().values.tolist()
-            ssr_code_str = ' '.join(ssr_codes)
-            flights_df.at[flight_id, 'SSR_CODES'] = ''.join(['[', ssr_code_str, ']'])
+    Parameters
+    ----------
+    flights_df: a pandas DataFrame
+        The flights, indexed by new flight id.
 
-            times = positions['TIME']
-            start_time = times.iloc[0]
-            flights_df.at[flight_id, 'PERIOD_START'] = start_time
-            finish_time = times.iloc[-1]
-            flights_df.at[flight_id, 'PERIOD_FINISH'] = finish_time
+    flight_summaries: a list of tuples
+        The (flight id, start time, finish time, source ids, ssr codes)
+        of the flights, see summarise_flight_positions.
+    """
+    if not flight_summaries:
+        return
+
+    flight_ids, start_times, finish_times, flights_source_ids, flights_ssr_codes = \
+        zip(*flight_summaries)
+    rows = flights_df.index.get_indexer([UUID(flight_id) for flight_id in flight_ids])
+    is_flight = rows >= 0
+
+    # The start and finish times of the flights
+    start_times = pd.to_datetime(pd.Series(start_times))
+    finish_times = pd.to_datetime(pd.Series(finish_times))
+    flights_df.iloc[rows[is_flight], flights_df.columns.get_loc('PERIOD_START')] = \
+        start_times[is_flight].array
+    flights_df.iloc[rows[is_flight], flights_df.columns.get_loc('PERIOD_FINISH')] = \
+        finish_times[is_flight].array
+
+    # The source flight ids and SSR codes of the flights
+    # Note: CPR flight ids are integers
+    source_ids = flights_df['SOURCE_IDS'].values.astype(object)
+    ssr_codes = flights_df['SSR_CODES'].values.astype(object)
+    for row, values, codes in zip(rows, flights_source_ids, flights_ssr_codes):
+        if row >= 0:
+            values = [int(value) if value.isdigit() else value for value in values]
+            source_ids[row] = np.array(values, dtype=object)
+            ssr_codes[row] = ''.join(['[', ' '.join(codes), ']'])
+    flights_df['SOURCE_IDS'] = source_ids
+    flights_df['SSR_CODES'] = ssr_codes
 
 
 input_filenames = ['cpr ids file',
@@ -116,7 +274,10 @@ input_filenames = ['cpr ids file',
 """ The filenames required by the application. """
 
 
-def merge_cpr_adsb_trajectories(filenames):
+@measure_stage
+def merge_cpr_adsb_trajectories(filenames, max_speed=DEFAULT_MAX_SPEED,
+                                distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                                boundary_hours=DEFAULT_BOUNDARY_HOURS):
 
     cpr_ids_filename = filenames[0]
     adsb_ids_filename = filenames[1]
@@ -170,7 +331,7 @@ def merge_cpr_adsb_trajectories(filenames):
         adsb_ids_df = pd.read_csv(adsb_ids_filename, index_col='FLIGHT_ID',
                                   converters={'NEW_FLIGHT_ID': lambda x: UUID(x)},
                                   memory_map=True)
-        cpr_ids_df.sort_index(inplace=True)
+        adsb_ids_df.sort_index(inplace=True)
     except EnvironmentError:
         log.error('could not read file: %s', adsb_ids_filename)
         return errno.ENOENT
@@ -191,37 +352,41 @@ def merge_cpr_adsb_trajectories(filenames):
     log.info('read and merged flights files: %s,%s',
              cpr_flights_filename, adsb_flights_filename)
 
-    # Read and merge the position
-    positions_df = pd.DataFrame()
-    try:
-        positions_df = get_merged_positions(cpr_positions_filename,
-                                            adsb_positions_filename,
-                                            cpr_ids_df, adsb_ids_df)
-    except EnvironmentError:
-        log.error('could not read file: %s or %s',
-                  cpr_positions_filename, adsb_positions_filename)
-        return errno.ENOENT
-
-    # Read and merge the positions
-    log.info('read and merged positions files: %s,%s',
-             cpr_positions_filename, adsb_positions_filename)
-
-    # Read and merge the events
-    events_df = pd.DataFrame()
+    # Merge the positions by new flight id and time and output them,
+    # summarising the positions of each flight and cleaning the positions
+    # of the flights in the head of the day
+    output_files = create_merge_cpr_adsb_output_filenames(input_date_strings[0])
+    output_positions_filename = output_files[1]
+    head_finish = (pd.Timestamp(input_date_strings[0]) +
+                   pd.Timedelta(hours=boundary_hours)).strftime(ISO8601_DATETIME_FORMAT)
+    flight_summaries = []
+    head_positions = []
     try:
-        events_df = read_dataframe_with_new_ids(cpr_events_filename, cpr_ids_df)
-        replace_old_flight_ids(events_df)
+        fields, flight_positions = \
+            merge_flight_items([cpr_positions_filename, adsb_positions_filename],
+                               [create_new_ids_map(cpr_ids_df),
+                                create_new_ids_map(adsb_ids_df)])
+        flight_positions = \
+            summarise_flight_positions(flight_summaries, flight_positions,
+                                       fields.index('TIME'), fields.index('SSR_CODE'))
+        flight_positions = \
+            select_head_positions(head_positions, flight_positions, fields,
+                                  head_finish, max_speed, distance_accuracy)
+        with open(output_positions_filename, 'w', newline='') as file:
+            positions_count = write_flight_items(file, fields, flight_positions)
     except EnvironmentError:
-        log.error('could not read file:  %s', cpr_events_filename)
-        return errno.ENOENT
+        log.error('could not merge files: %s and %s into %s',
+                  cpr_positions_filename, adsb_positions_filename,
+                  output_positions_filename)
+        return errno.EACCES
 
-    # Read and merge the positions
-    log.info('read and merged events file: %s', cpr_events_filename)
+    count_rows_in(positions_count)
+    count_rows_out(positions_count)
+    log.info('written file: %s', output_positions_filename)
 
-    update_flight_data(flights_df, positions_df)
+    update_flight_data(flights_df, flight_summaries)
 
     # Output the flights
-    output_files = create_merge_cpr_adsb_output_filenames(input_date_strings[0])
     output_flights_filename = output_files[0]
     try:
         flights_df.to_csv(output_flights_filename, index=False,
@@ -232,28 +397,31 @@ def merge_cpr_adsb_trajectories(filenames):
 
     log.info('written file: %s', output_flights_filename)
 
-    # Convert the positions prior to output
-    replace_old_flight_ids(positions_df)
-    output_positions_filename = output_files[1]
+    # Relabel and output the events
+    output_events_filename = output_files[2]
     try:
-        positions_df.to_csv(output_positions_filename, index=False,
-                            date_format=ISO8601_DATETIME_FORMAT)
+        relabel_flight_items(cpr_events_filename, output_events_filename,
+                             create_new_ids_map(cpr_ids_df))
     except EnvironmentError:
-        log.error('could not write file: %s', output_positions_filename)
+        log.error('could not relabel file: %s into %s',
+                  cpr_events_filename, output_events_filename)
         return errno.EACCES
 
-    log.info('written file: %s', output_positions_filename)
+    log.info('written file: %s', output_events_filename)
 
-    # Output the events
-    output_events_filename = output_files[2]
+    # Output the head of the boundary state
+    output_boundary_filename = output_files[3]
     try:
-        events_df.to_csv(output_events_filename, index=False,
-                         date_format=ISO8601_DATETIME_FORMAT)
+        flights_count = write_boundary_state(output_boundary_filename, flights_df,
+                                             create_head_positions(head_positions),
+                                             input_date_strings[0], boundary_hours,
+                                             is_tail=False)
     except EnvironmentError:
-        log.error('could not write file: %s', output_events_filename)
+        log.error('could not write file: %s', output_boundary_filename)
         return errno.EACCES
 
-    log.info('written file: %s', output_events_filename)
+    log.info('written file: %s, boundary flights: %d', output_boundary_filename,
+             flights_count)
 
     log.info('merging complete')
 
@@ -14,44 +14,40 @@ from uuid import UUID
 from pru.trajectory_fields import read_iso8601_date_string, \
     is_valid_iso8601_date, ISO8601_DATETIME_FORMAT
 from pru.trajectory_files import RAW
+from pru.trajectory_merging import merge_flight_items_files
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
 
 
-def merge_overnight_items(new_filename, overnight_df):
+def merge_overnight_items(new_filename, overnight_filename, output_filename):
     """
-    Read the new_filename, merge with data from overnight_df and write to filename.
+    Merge the items (positions or events) in new_filename with the items in
+    overnight_filename by FLIGHT_ID and TIME and write them to output_filename.
 
-    Read the items (positions or events) into a DataFrame from new_filename,
-    merge with the overnight_df DataFrame, sort values by FLIGHT_ID abd TIME.
+    Both files must be sorted by FLIGHT_ID and TIME, see merge_flight_items.
 
-    Write the merged dataframe into a file with 'new_' removed from the
-    start of the filename.
+    Returns True if successful, False otherwise.
     """
-    # read data
-    new_df = pd.DataFrame()
     try:
-        new_df = pd.read_csv(new_filename, parse_dates=['TIME'],
-                             converters={'FLIGHT_ID': lambda x: UUID(x)},
-                             memory_map=True)
+        merge_flight_items_files(output_filename, [new_filename, overnight_filename])
     except EnvironmentError:
-        log.error('could not read file: %s', new_filename)
-        return new_df  # return an empty data frame
+        log.error('could not merge files: %s and %s into %s',
+                  new_filename, overnight_filename, output_filename)
+        return False
 
-    # merge data
-    merged_items_df = pd.concat([new_df, overnight_df], ignore_index=True)
-    return merged_items_df.sort_values(by=['FLIGHT_ID', 'TIME'])
+    log.info('written file: %s', output_filename)
+    return True
 
 
 def update_flight_data(flights_df, positions_df):
     """ Update flights_df with the times of the last positions. """
-    for flight_id, positions in positions_df.groupby('FLIGHT_ID'):
-
-        if flight_id in flights_df.index:
-            times = positions['TIME']
-            finish_time = times.iloc[-1]
-            flights_df.at[flight_id, 'PERIOD_FINISH'] = finish_time
+    last_positions_df = positions_df.drop_duplicates('FLIGHT_ID', keep='last')
+    rows = pd.Index(flights_df['FLIGHT_ID']).get_indexer(last_positions_df['FLIGHT_ID'])
+    is_flight = rows >= 0
+    flights_df.iloc[rows[is_flight], flights_df.columns.get_loc('PERIOD_FINISH')] = \
+        last_positions_df['TIME'].iloc[is_flight].array
 
 
 ################################################################################
@@ -63,6 +59,7 @@ input_filenames = ['new flights file',
 """ The filenames required by the application. """
 
 
+@measure_stage
 def merge_overnight_flight_data(filenames):
     """
     Merge the positions and events data and update flight data with new times.
@@ -104,6 +101,7 @@ def merge_overnight_flight_data(filenames):
     flights_df = pd.DataFrame()
     try:
         flights_df = pd.read_csv(new_flights_filename,
+                                 parse_dates=['PERIOD_START', 'PERIOD_FINISH'],
                                  converters={'FLIGHT_ID': lambda x: UUID(x)},
                                  memory_map=True)
     except EnvironmentError:
@@ -134,46 +132,17 @@ def merge_overnight_flight_data(filenames):
     ############################################################################
 
     # Now merge the positions
-    merged_positions = merge_overnight_items(new_positions_filename, overnight_pos_df)
-    if merged_positions.empty:
-        log.error('Error merging: %s', new_positions_filename)
-        return errno.ENOENT
-
-    # write merged position data
     raw_positions_filename = '_'.join([RAW, new_positions_filename[4:]])
-    try:
-        merged_positions.to_csv(raw_positions_filename, index=False,
-                                date_format=ISO8601_DATETIME_FORMAT)
-        log.info('written file: %s', raw_positions_filename)
-    except EnvironmentError:
-        log.error('could not write file: %s', raw_positions_filename)
+    if not merge_overnight_items(new_positions_filename, overnight_positions_filename,
+                                 raw_positions_filename):
         return errno.ENOENT
 
     ############################################################################
 
-    # # Merge the events
-    overnight_events_df = pd.DataFrame()
-    try:
-        overnight_events_df = pd.read_csv(overnight_events_filename,
-                                          parse_dates=['TIME'],
-                                          converters={'FLIGHT_ID': lambda x: UUID(x)},
-                                          memory_map=True)
-    except EnvironmentError:
-        log.error('could not read file: %s', overnight_events_filename)
-        return errno.ENOENT
-
-    merged_events = merge_overnight_items(new_events_filename, overnight_events_df)
-    if merged_events.empty:
-        log.error('Error merging: %s', new_events_filename)
-        return errno.ENOENT
-
+    # Merge the events
     events_filename = new_events_filename[4:]
-    try:
-        merged_events.to_csv(events_filename, index=False,
-                             date_format=ISO8601_DATETIME_FORMAT)
-        log.info('written file: %s', events_filename)
-    except EnvironmentError:
-        log.error('could not write file: %s', events_filename)
+    if not merge_overnight_items(new_events_filename, overnight_events_filename,
+                                 events_filename):
         return errno.ENOENT
 
     return 0
@@ -0,0 +1,226 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Airport codes and reference points, for translating IATA airport codes to
+ICAO airport codes and for finding the positions of airports.
+
+An airports file is a csv file with ICAO_AP_CODE (or AIRPORT), LATITUDE and
+LONGITUDE columns and an optional IATA_AP_CODE column, e.g. airports.csv and
+movements_reporting_airports.csv.
+It is compiled into an AirportCodes: a numpy structured array of the airports
+with categorical indexes of their ICAO and IATA codes.
+The compiled airports are saved in a numpy npy file next to the csv file,
+so that they are only compiled when the csv file changes and can be memory
+mapped when they are loaded.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from pru.trajectory_fields import NPY_FILE_EXTENSION
+from pru.logger import logger
+
+log = logger(__name__)
+
+ICAO_ID_COLUMNS = ['ICAO_AP_CODE', 'AIRPORT']
+""" The alternative names of the ICAO code column of an airports file. """
+
+IATA_ID_COLUMN = 'IATA_AP_CODE'
+""" The name of the IATA code column of an airports file. """
+
+AIRPORT_FIELDS = ['ICAO_ID', 'IATA_ID', 'LAT', 'LON']
+""" The fields of a compiled airport. """
+
+
+def create_airports_array(icao_ids, iata_ids, latitudes, longitudes):
+    """
+    Create a numpy structured array of airports with AIRPORT_FIELDS.
+
+    Parameters
+    ----------
+    icao_ids, iata_ids: arrays of strings
+        The ICAO and IATA codes of the airports, empty if not known.
+
+    latitudes, longitudes: arrays of floats
+        The reference points of the airports [Degrees].
+    """
+    icao_ids = np.asarray(icao_ids, dtype=str)
+    iata_ids = np.asarray(iata_ids, dtype=str)
+    dtype = [('ICAO_ID', icao_ids.dtype if len(icao_ids) else 'U4'),
+             ('IATA_ID', iata_ids.dtype if len(iata_ids) else 'U3'),
+             ('LAT', float), ('LON', float)]
+    airports = np.empty(len(icao_ids), dtype=dtype)
+    airports['ICAO_ID'] = icao_ids
+    airports['IATA_ID'] = iata_ids
+    airports['LAT'] = latitudes
+    airports['LON'] = longitudes
+    return airports
+
+
+def create_code_categories(codes, keep):
+    """
+    Create the categories of a column of airport codes.
+
+    Parameters
+    ----------
+    codes: a numpy array of strings
+        The codes of the airports, empty codes are ignored.
+
+    keep: string
+        The airport of a repeated code, 'first' or 'last'.
+
+    Returns
+    -------
+    The pandas Index of the unique codes and a numpy array of the airport
+    of each code.
+    """
+    index = pd.Index(codes)
+    is_category = ~index.duplicated(keep=keep) & (codes != '')
+    return index[is_category], np.flatnonzero(is_category)
+
+
+class AirportCodes:
+    """
+    The codes and reference points of airports.
+    """
+    __slots__ = ('__airports', '__icao_ids', '__icao_airports',
+                 '__iata_ids', '__iata_airports')
+
+    def __init__(self, airports):
+        """
+        Create an AirportCodes.
+
+        Parameters
+        ----------
+        airports: a numpy structured array with AIRPORT_FIELDS
+            The airports, see create_airports_array.
+            If an ICAO code is repeated, the first airport is used.
+            If an IATA code is repeated, the last airport is used.
+        """
+        self.__airports = airports
+        self.__icao_ids, self.__icao_airports = \
+            create_code_categories(airports['ICAO_ID'], 'first')
+        self.__iata_ids, self.__iata_airports = \
+            create_code_categories(airports['IATA_ID'], 'last')
+
+    def __len__(self):
+        return len(self.__airports)
+
+    @property
+    def airports(self):
+        'Accessor for the structured array of airports.'
+        return self.__airports
+
+    def find_airports(self, icao_ids):
+        """
+        Find airports by ICAO code.
+
+        Parameters
+        ----------
+        icao_ids: array like
+            The ICAO codes of the airports, may contain NaNs.
+
+        Returns
+        -------
+        A numpy array of the indicies of the airports, -1 where an airport
+        is not known.
+        """
+        codes = pd.Categorical(icao_ids, categories=self.__icao_ids).codes
+        indicies = np.full(len(codes), -1)
+        is_known = codes >= 0
+        indicies[is_known] = np.take(self.__icao_airports, codes[is_known])
+        return indicies
+
+    def translate_iata_ids(self, iata_ids):
+        """
+        Translate IATA airport codes to ICAO airport codes.
+
+        Parameters
+        ----------
+        iata_ids: array like
+            The IATA codes of the airports, may contain NaNs.
+
+        Returns
+        -------
+        A numpy object array of the ICAO codes of the airports.
+        Codes that are not known IATA codes are not translated.
+        """
+        icao_ids = np.array(iata_ids, dtype=object)
+        codes = pd.Categorical(icao_ids, categories=self.__iata_ids).codes
+        is_known = codes >= 0
+        airports = np.take(self.__iata_airports, codes[is_known])
+        icao_ids[is_known] = self.__airports['ICAO_ID'][airports]
+        return icao_ids
+
+    def save(self, filename):
+        """
+        Save the airports to a numpy npy file.
+        """
+        np.save(filename, self.__airports)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the airports from a numpy npy file, see save.
+
+        The airports are memory mapped from the file.
+        """
+        return cls(np.load(filename, mmap_mode='r'))
+
+
+def read_airport_codes(filename):
+    """
+    Read an airports csv file.
+
+    The codes are read as strings, so that codes such as NAN are not read
+    as missing values.
+    """
+    airports_df = pd.read_csv(filename, dtype=str, keep_default_na=False)
+    icao_column = next(column for column in ICAO_ID_COLUMNS
+                       if column in airports_df.columns)
+    iata_ids = airports_df[IATA_ID_COLUMN].values \
+        if IATA_ID_COLUMN in airports_df.columns else np.full(len(airports_df), '')
+    latitudes = pd.to_numeric(airports_df['LATITUDE'], errors='coerce')
+    longitudes = pd.to_numeric(airports_df['LONGITUDE'], errors='coerce')
+    airports = create_airports_array(airports_df[icao_column].values, iata_ids,
+                                     latitudes.values, longitudes.values)
+    return AirportCodes(airports)
+
+
+def create_compiled_airports_filename(filename):
+    """ The name of the compiled file of an airports csv file. """
+    return os.path.splitext(filename)[0] + NPY_FILE_EXTENSION
+
+
+def compile_airport_codes(filename):
+    """
+    Read an airports file, using its compiled file if it is up to date.
+
+    If the compiled file does not exist or is older than the csv file, the
+    csv file is read and the compiled file is (re)written.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the airports csv file or of a compiled airports file.
+
+    Returns
+    -------
+    The AirportCodes.
+    """
+    if filename.endswith(NPY_FILE_EXTENSION):
+        return AirportCodes.load(filename)
+
+    compiled_filename = create_compiled_airports_filename(filename)
+    if os.path.exists(compiled_filename) and \
+            os.path.getmtime(compiled_filename) >= os.path.getmtime(filename):
+        return AirportCodes.load(compiled_filename)
+
+    airport_codes = read_airport_codes(filename)
+    try:
+        airport_codes.save(compiled_filename)
+    except EnvironmentError:
+        log.warning('could not write file: %s', compiled_filename)
+
+    return airport_codes
@@ -0,0 +1,167 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+The positions of airport stands, for finding the positions of APDS flights
+at their stands.
+
+An airport stands file is a csv file with ICAO_ID, STAND_ID, LAT and LON
+columns. It is compiled into an AirportStands: a dict of (ICAO_ID, STAND_ID)
+to (LAT, LON) with an index for finding the positions of many stands at once.
+The compiled stands are saved in a numpy npz file next to the csv file, so
+that they are only compiled when the csv file changes.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from pru.trajectory_fields import NPZ_FILE_EXTENSION
+from pru.logger import logger
+
+log = logger(__name__)
+
+STANDS_FIELDS = ['ICAO_ID', 'STAND_ID', 'LAT', 'LON']
+""" The fields of an airport stands file. """
+
+
+class AirportStands:
+    """
+    The positions of airport stands, by airport ICAO id and stand id.
+    """
+    __slots__ = ('__positions', '__index', '__latitudes', '__longitudes')
+
+    def __init__(self, airports=(), stands=(), latitudes=(), longitudes=()):
+        """
+        Create an AirportStands.
+
+        Parameters
+        ----------
+        airports, stands: arrays of strings
+            The airport ICAO ids and stand ids of the stands.
+            If a stand is repeated, the first position is used.
+
+        latitudes, longitudes: arrays of floats
+            The positions of the stands [Degrees].
+        """
+        positions = {}
+        for key, position in zip(zip(airports, stands), zip(latitudes, longitudes)):
+            positions.setdefault(key, position)
+        self.__positions = positions
+
+        keys = list(positions)
+        self.__index = pd.MultiIndex.from_tuples(keys, names=STANDS_FIELDS[:2]) \
+            if keys else None
+        self.__latitudes = np.array([lat for lat, _ in positions.values()], dtype=float)
+        self.__longitudes = np.array([lon for _, lon in positions.values()], dtype=float)
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def __contains__(self, key):
+        return key in self.__positions
+
+    def __getitem__(self, key):
+        """ The (LAT, LON) of an (ICAO_ID, STAND_ID) key. """
+        return self.__positions[key]
+
+    @property
+    def positions(self):
+        'Accessor for the dict of (ICAO_ID, STAND_ID) to (LAT, LON).'
+        return self.__positions
+
+    def find_positions(self, airports, stands):
+        """
+        Find the positions of stands.
+
+        Parameters
+        ----------
+        airports, stands: arrays of strings
+            The airport ICAO ids and stand ids.
+
+        Returns
+        -------
+        The latitudes and longitudes of the stands as numpy arrays,
+        NaN where a stand is not known.
+        """
+        latitudes = np.full(len(airports), np.nan)
+        longitudes = np.full(len(airports), np.nan)
+        if self.__index is not None and len(airports):
+            keys = pd.MultiIndex.from_arrays([np.asarray(airports, dtype=object),
+                                              np.asarray(stands, dtype=object)])
+            indicies = self.__index.get_indexer(keys)
+            is_known = indicies >= 0
+            latitudes[is_known] = self.__latitudes[indicies[is_known]]
+            longitudes[is_known] = self.__longitudes[indicies[is_known]]
+
+        return latitudes, longitudes
+
+    def save(self, filename):
+        """
+        Save the stands to a numpy npz file.
+        """
+        keys = list(self.__positions)
+        np.savez(filename,
+                 ICAO_ID=np.array([airport for airport, _ in keys], dtype=str),
+                 STAND_ID=np.array([stand for _, stand in keys], dtype=str),
+                 LAT=self.__latitudes, LON=self.__longitudes)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the stands from a numpy npz file, see save.
+        """
+        with np.load(filename) as data:
+            return cls(data['ICAO_ID'].tolist(), data['STAND_ID'].tolist(),
+                       data['LAT'], data['LON'])
+
+
+def read_airport_stands(filename):
+    """
+    Read an airport stands csv file.
+
+    The ids are read as strings, so that numeric stand ids match the stand
+    ids of APDS files.
+    """
+    stands_df = pd.read_csv(filename, usecols=STANDS_FIELDS,
+                            dtype={'ICAO_ID': str, 'STAND_ID': str},
+                            na_filter=False)
+    return AirportStands(stands_df['ICAO_ID'].values, stands_df['STAND_ID'].values,
+                         stands_df['LAT'].values, stands_df['LON'].values)
+
+
+def create_compiled_stands_filename(filename):
+    """ The name of the compiled file of an airport stands csv file. """
+    return os.path.splitext(filename)[0] + NPZ_FILE_EXTENSION
+
+
+def compile_airport_stands(filename):
+    """
+    Read an airport stands file, using its compiled file if it is up to date.
+
+    If the compiled file does not exist or is older than the csv file, the
+    csv file is read and the compiled file is (re)written.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the airport stands csv file or of a compiled stands file.
+
+    Returns
+    -------
+    The AirportStands.
+    """
+    if filename.endswith(NPZ_FILE_EXTENSION):
+        return AirportStands.load(filename)
+
+    compiled_filename = create_compiled_stands_filename(filename)
+    if os.path.exists(compiled_filename) and \
+            os.path.getmtime(compiled_filename) >= os.path.getmtime(filename):
+        return AirportStands.load(compiled_filename)
+
+    airport_stands = read_airport_stands(filename)
+    try:
+        airport_stands.save(compiled_filename)
+    except EnvironmentError:
+        log.warning('could not write file: %s', compiled_filename)
+
+    return airport_stands
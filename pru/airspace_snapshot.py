@@ -0,0 +1,306 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Airspace snapshots: the elementary sectors of an AIRAC cycle compiled into a
+binary file, for loading the sectors without parsing csv or geojson files.
+
+A snapshot contains a numpy structured array of the sectors, with their
+names, altitude bands (in feet, as stored in the sectors table) and
+bounding caps, and the geometries of the sectors as EWKB (SRID 4326).
+A bounding cap is the centre and radius of a spherical cap that contains
+the boundary of a sector, for quickly rejecting sectors that a trajectory
+cannot intersect.
+
+A snapshot is saved in a numpy npz file next to the sectors file, named by
+its AIRAC cycle, e.g. ES_428_1805.npz. It records the SHA-256 checksum of
+the sectors file that it was compiled from, so that a stale snapshot is
+compiled again when the sectors file changes.
+"""
+
+import os
+import hashlib
+import numpy as np
+from shapely import wkb, wkt
+from pru.db.io import read_sectors, check_varchar
+from pru.EcefPoint import lat_long_to_xyz
+from pru.trajectory_fields import NPZ_FILE_EXTENSION
+from pru.logger import logger
+
+log = logger(__name__)
+
+SNAPSHOT_VERSION = 1
+""" The version of the airspace snapshot file format. """
+
+SECTOR_DTYPE = [('AC_ID', int), ('AV_AIRSPACE_ID', 'U20'),
+                ('AV_ICAO_STATE_ID', 'U2'),
+                ('MIN_ALTITUDE', int), ('MAX_ALTITUDE', int),
+                ('AV_NAME', 'U100'), ('SECTOR_TYPE', 'U2'), ('OBJECT_ID', int),
+                ('CAP_LAT', float), ('CAP_LON', float), ('CAP_RADIUS', float)]
+""" The fields of a snapshot sector, sizes as the columns of the sectors table. """
+
+SRID = 4326
+""" The spatial reference id of the sector geometries. """
+
+CHECKSUM_BLOCK_SIZE = 1 << 20
+""" The size of the blocks of a file read to calculate its checksum. """
+
+
+def calculate_file_checksum(filename):
+    """ The SHA-256 checksum of a file as a hexadecimal string. """
+    checksum = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(CHECKSUM_BLOCK_SIZE), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def find_exterior_coordinates(geometry):
+    """
+    The coordinates of the exterior of a geometry: the exterior rings of
+    polygons, otherwise its points.
+
+    Returns
+    -------
+    A list of (longitude, latitude) tuples [Degrees].
+    """
+    if hasattr(geometry, 'geoms'):
+        return [coords for part in geometry.geoms
+                for coords in find_exterior_coordinates(part)]
+    elif hasattr(geometry, 'exterior'):
+        return list(geometry.exterior.coords)
+    else:
+        return list(geometry.coords)
+
+
+def calculate_bounding_cap(latitudes, longitudes):
+    """
+    Calculate a spherical cap that contains the points.
+
+    The centre of the cap is the normalised mean of the points, its radius
+    is the distance to the furthest point.
+
+    Parameters
+    ----------
+    latitudes, longitudes: float arrays
+        The positions of the points [Degrees].
+
+    Returns
+    -------
+    The latitude and longitude of the centre of the cap [Degrees] and its
+    radius [radians].
+    """
+    points = np.transpose(lat_long_to_xyz(np.asarray(latitudes, dtype=float),
+                                          np.asarray(longitudes, dtype=float)))
+    centre = points.sum(axis=0)
+    centre /= np.linalg.norm(centre)
+    radius = np.arccos(np.clip(points.dot(centre), -1.0, 1.0)).max()
+    return np.rad2deg(np.arcsin(centre[2])), \
+        np.rad2deg(np.arctan2(centre[1], centre[0])), radius
+
+
+class AirspaceSnapshot:
+    """
+    The elementary sectors of an AIRAC cycle.
+    """
+    __slots__ = ('__airac_cycle', '__checksum', '__sectors',
+                 '__wkbs', '__wkb_offsets')
+
+    def __init__(self, airac_cycle, checksum, sectors, wkbs, wkb_offsets):
+        """
+        Create an AirspaceSnapshot.
+
+        Parameters
+        ----------
+        airac_cycle: string
+            The AIRAC cycle of the sectors, e.g. '1805'.
+
+        checksum: string
+            The checksum of the sectors file, see calculate_file_checksum.
+
+        sectors: a numpy structured array with SECTOR_DTYPE
+            The sectors.
+
+        wkbs: a numpy uint8 array
+            The EWKB geometries of the sectors, concatenated.
+
+        wkb_offsets: a numpy int array
+            The offsets of the geometries in wkbs, one more than the sectors.
+        """
+        self.__airac_cycle = airac_cycle
+        self.__checksum = checksum
+        self.__sectors = sectors
+        self.__wkbs = wkbs
+        self.__wkb_offsets = wkb_offsets
+
+    def __len__(self):
+        return len(self.__sectors)
+
+    @property
+    def airac_cycle(self):
+        'Accessor for the AIRAC cycle of the sectors.'
+        return self.__airac_cycle
+
+    @property
+    def checksum(self):
+        'Accessor for the checksum of the sectors file.'
+        return self.__checksum
+
+    @property
+    def sectors(self):
+        'Accessor for the structured array of sectors.'
+        return self.__sectors
+
+    def wkb(self, index):
+        """ The EWKB geometry of the sector at index, as bytes. """
+        return self.__wkbs[self.__wkb_offsets[index]:
+                           self.__wkb_offsets[index + 1]].tobytes()
+
+    def geometry(self, index):
+        """ The shapely geometry of the sector at index. """
+        return wkb.loads(self.wkb(index))
+
+    def find_sectors(self, latitudes, longitudes, min_altitude, max_altitude):
+        """
+        Find the sectors that may contain points in an altitude range.
+
+        Parameters
+        ----------
+        latitudes, longitudes: float arrays
+            The positions of the points [Degrees].
+
+        min_altitude, max_altitude: float
+            The altitude range of the points [feet].
+
+        Returns
+        -------
+        A numpy array of the indicies of the sectors whose bounding caps
+        contain any of the points and whose altitude bands intersect the
+        altitude range.
+        """
+        is_vertical = (self.__sectors['MIN_ALTITUDE'] <= max_altitude) & \
+            (min_altitude < self.__sectors['MAX_ALTITUDE'])
+        candidates = np.flatnonzero(is_vertical)
+        caps = self.__sectors[candidates]
+        centres = np.transpose(lat_long_to_xyz(caps['CAP_LAT'], caps['CAP_LON']))
+        points = np.transpose(lat_long_to_xyz(np.asarray(latitudes, dtype=float),
+                                              np.asarray(longitudes, dtype=float)))
+        is_inside = points.dot(centres.T) >= np.cos(caps['CAP_RADIUS'])
+        return candidates[is_inside.any(axis=0)]
+
+    def save(self, filename):
+        """
+        Save the snapshot to a numpy npz file.
+        """
+        np.savez(filename, VERSION=SNAPSHOT_VERSION,
+                 AIRAC_CYCLE=self.__airac_cycle, CHECKSUM=self.__checksum,
+                 SECTORS=self.__sectors, WKBS=self.__wkbs,
+                 WKB_OFFSETS=self.__wkb_offsets)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load the snapshot from a numpy npz file, see save.
+
+        Raises a ValueError if the file is not of the SNAPSHOT_VERSION.
+        """
+        with np.load(filename) as data:
+            version = int(data['VERSION'])
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(f'airspace snapshot: {filename}, '
+                                 f'invalid version: {version}')
+            return cls(str(data['AIRAC_CYCLE']), str(data['CHECKSUM']),
+                       data['SECTORS'], data['WKBS'], data['WKB_OFFSETS'])
+
+
+def create_sector(record):
+    """
+    Create a sector and its EWKB geometry from a record of a sectors file,
+    see pru.db.io.read_sectors.
+
+    Raises a ValueError if a text field is wider than its SECTOR_DTYPE field,
+    rather than numpy truncating it.
+    """
+    geometry = wkt.loads(record[8])
+    longitudes, latitudes = np.transpose(find_exterior_coordinates(geometry))
+    sector = (int(record[0]), check_varchar(record[1], 20),
+              check_varchar(record[2], 2),
+              100 * int(record[3]), 100 * int(record[4]),
+              check_varchar(record[5], 100), check_varchar(record[6], 2),
+              int(record[7])) + \
+        calculate_bounding_cap(latitudes, longitudes)
+    return sector, wkb.dumps(geometry, srid=SRID)
+
+
+def read_airspace_snapshot(filename, airac_cycle):
+    """
+    Read a sectors csv or geojson file into an AirspaceSnapshot.
+
+    Records that cannot be read are logged and ignored.
+    """
+    sectors = []
+    wkbs = []
+    records = read_sectors(filename)
+    # Drop the title row
+    next(records, None)
+    for record in records:
+        try:
+            sector, sector_wkb = create_sector(record)
+            sectors.append(sector)
+            wkbs.append(sector_wkb)
+        except Exception:
+            log.warning('could not read sector: %s', record[:8])
+
+    wkb_offsets = np.zeros(len(wkbs) + 1, dtype=int)
+    wkb_offsets[1:] = np.cumsum([len(sector_wkb) for sector_wkb in wkbs])
+    return AirspaceSnapshot(airac_cycle, calculate_file_checksum(filename),
+                            np.array(sectors, dtype=SECTOR_DTYPE),
+                            np.frombuffer(b''.join(wkbs), dtype=np.uint8),
+                            wkb_offsets)
+
+
+def create_snapshot_filename(filename, airac_cycle):
+    """ The name of the snapshot file of a sectors file and AIRAC cycle. """
+    return '_'.join([os.path.splitext(filename)[0], airac_cycle]) + \
+        NPZ_FILE_EXTENSION
+
+
+def compile_airspace_snapshot(filename, airac_cycle=''):
+    """
+    Read a sectors file, using its snapshot if it is up to date.
+
+    If the snapshot does not exist or its checksum does not match the
+    sectors file, the sectors file is read and the snapshot is (re)written.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the sectors file or of a snapshot file.
+
+    airac_cycle: string
+        The AIRAC cycle of the sectors file, not required for a snapshot file.
+
+    Returns
+    -------
+    The AirspaceSnapshot.
+    """
+    if filename.endswith(NPZ_FILE_EXTENSION):
+        return AirspaceSnapshot.load(filename)
+
+    snapshot_filename = create_snapshot_filename(filename, airac_cycle)
+    if os.path.exists(snapshot_filename):
+        try:
+            snapshot = AirspaceSnapshot.load(snapshot_filename)
+            if snapshot.checksum == calculate_file_checksum(filename):
+                return snapshot
+            log.info('stale airspace snapshot: %s', snapshot_filename)
+        except ValueError:
+            log.warning('could not load airspace snapshot: %s', snapshot_filename)
+
+    snapshot = read_airspace_snapshot(filename, airac_cycle)
+    try:
+        snapshot.save(snapshot_filename)
+    except EnvironmentError:
+        log.warning('could not write file: %s', snapshot_filename)
+
+    return snapshot
@@ -0,0 +1,206 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Functions to read and write the boundary state of a day's flights.
+
+Only flights that are active near midnight can continue on the next day.
+The boundary state of a day contains the flights that start within the
+first hours of the day (the head) and the flights that finish within the
+last hours of the day (the tail), together with their positions in ECEF
+coordinates.
+
+Consecutive days are matched by comparing the tail of the previous day with
+the head of the next day, instead of reading the whole of both days.
+The head of a day is written when its CPR and ADS-B data are merged and its
+tail when it is merged with the previous day, since the flights and positions
+are already being read then.
+Since the flights of a day finish by the end of the day, a next day flight
+that starts after the head of the next day can only match a previous day
+flight that finishes within the maximum time difference of the end of the
+previous day, i.e. in its tail.
+So the boundary matches are the same as the matches of the whole days while
+the maximum time difference is less than the boundary hours, which are
+recorded in the boundary state files, see read_boundary_hours.
+"""
+
+import numpy as np
+import pandas as pd
+from uuid import UUID
+from pru.trajectory_verification import FlightPositions
+
+DEFAULT_BOUNDARY_HOURS = 4.0
+""" The default period of flights at the start and end of a day [Hours]. """
+
+BOUNDARY_FLIGHT_FIELDS = ['FLIGHT_ID', 'CALLSIGN', 'AIRCRAFT_ADDRESS',
+                          'ADEP', 'ADES', 'PERIOD_START', 'PERIOD_FINISH']
+""" The flight fields of a boundary state. """
+
+SECONDS_PER_HOUR = 3600
+""" The number of seconds in an hour. """
+
+NS_PER_HOUR = SECONDS_PER_HOUR * 1000000000
+""" The number of nanoseconds in an hour. """
+
+
+def find_boundary_flights(flights_df, date, hours=DEFAULT_BOUNDARY_HOURS):
+    """
+    Find the flights that start or finish within hours of the start or end
+    of the day.
+
+    Parameters
+    ----------
+    flights_df: a pandas DataFrame
+        The flights with PERIOD_START and PERIOD_FINISH columns.
+
+    date: string
+        The date of the flights in ISO8601 format, e.g. 2017-08-16.
+
+    hours: float
+        The period at each end of the day [Hours].
+
+    Returns
+    -------
+    Boolean numpy arrays of the flights in the head and tail of the day.
+    """
+    day_start = np.datetime64(date, 'ns').astype(np.int64)
+    day_finish = day_start + 24 * NS_PER_HOUR
+    period = int(hours * NS_PER_HOUR)
+
+    starts = np.asarray(flights_df['PERIOD_START'].values,
+                        dtype='datetime64[ns]').view(np.int64)
+    finishes = np.asarray(flights_df['PERIOD_FINISH'].values,
+                          dtype='datetime64[ns]').view(np.int64)
+    return starts < day_start + period, finishes >= day_finish - period
+
+
+def create_flight_positions(points_df):
+    """
+    Create the FlightPositions of flights from a DataFrame of positions.
+
+    Parameters
+    ----------
+    points_df: a pandas DataFrame
+        The positions, with FLIGHT_ID (strings), TIME, LAT, LON and ALT
+        columns, in flight id and time order.
+
+    Returns
+    -------
+    The FlightPositions of the flights, indexed by UUID flight id.
+    """
+    points_df = points_df.set_index(
+        pd.Index([UUID(flight_id) for flight_id in points_df['FLIGHT_ID']],
+                 name='FLIGHT_ID'))
+    return FlightPositions(points_df[['TIME', 'LAT', 'LON', 'ALT']])
+
+
+def write_boundary_state(filename, flights_df, positions, date,
+                         hours=DEFAULT_BOUNDARY_HOURS, *, is_tail=None):
+    """
+    Write the boundary state of a day's flights to a numpy npz file.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the boundary state file.
+
+    flights_df: a pandas DataFrame
+        The flights, with the BOUNDARY_FLIGHT_FIELDS columns.
+
+    positions: a FlightPositions
+        The positions of the flights.
+
+    date: string
+        The date of the flights in ISO8601 format, e.g. 2017-08-16.
+
+    hours: float
+        The period at each end of the day [Hours].
+
+    is_tail: bool, optional
+        If True, only write the flights in the tail of the day, if False,
+        only write the flights in the head of the day, otherwise write both.
+        The positions are only required for the flights that are written.
+
+    Returns
+    -------
+    The number of flights in the boundary state.
+    """
+    is_head, is_tail_flight = find_boundary_flights(flights_df, date, hours)
+    if is_tail is not None:
+        is_head &= not is_tail
+        is_tail_flight &= is_tail
+    is_boundary = is_head | is_tail_flight
+    boundary_df = flights_df.loc[is_boundary, BOUNDARY_FLIGHT_FIELDS]
+
+    flight_ids, counts, times, points, alts = \
+        positions.select(boundary_df['FLIGHT_ID'].values).to_arrays()
+
+    # Null strings are stored as empty strings
+    fields = {field: np.array(boundary_df[field].fillna('').astype(str).tolist(), dtype=str)
+              for field in ['FLIGHT_ID', 'CALLSIGN', 'AIRCRAFT_ADDRESS', 'ADEP', 'ADES']}
+    fields.update({field: np.asarray(boundary_df[field].values,
+                                     dtype='datetime64[ns]').view(np.int64)
+                   for field in ['PERIOD_START', 'PERIOD_FINISH']})
+    np.savez_compressed(filename, HOURS=float(hours), IS_HEAD=is_head[is_boundary],
+                        IS_TAIL=is_tail_flight[is_boundary],
+                        POSITION_FLIGHT_IDS=np.asarray(flight_ids, dtype=str),
+                        POSITION_COUNTS=counts, POSITION_TIMES=times,
+                        POSITION_POINTS=points, POSITION_ALTS=alts, **fields)
+    return len(boundary_df)
+
+
+def read_boundary_hours(filename):
+    """
+    Read the period at each end of the day of a boundary state file.
+
+    Note: boundary state files written before their hours were recorded
+    are assumed to have the DEFAULT_BOUNDARY_HOURS.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the boundary state file.
+
+    Returns
+    -------
+    The boundary hours [Hours].
+    """
+    with np.load(filename) as data:
+        return float(data['HOURS']) if 'HOURS' in data.files \
+            else DEFAULT_BOUNDARY_HOURS
+
+
+def read_boundary_state(filename, *, is_tail):
+    """
+    Read the head or tail of a day's flights from a boundary state file.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the boundary state file.
+
+    is_tail: bool
+        If True, read the flights in the tail of the day, otherwise read the
+        flights in the head of the day.
+
+    Returns
+    -------
+    A pandas DataFrame of the flights, with the BOUNDARY_FLIGHT_FIELDS columns
+    and the FlightPositions of the flights.
+    """
+    with np.load(filename) as data:
+        is_flight = data['IS_TAIL'] if is_tail else data['IS_HEAD']
+        flights_df = pd.DataFrame({field: data[field][is_flight]
+                                   for field in BOUNDARY_FLIGHT_FIELDS})
+        flights_df['FLIGHT_ID'] = [UUID(flight_id) for flight_id in flights_df['FLIGHT_ID']]
+        for field in ['CALLSIGN', 'AIRCRAFT_ADDRESS', 'ADEP', 'ADES']:
+            flights_df[field] = flights_df[field].astype(object).replace('', np.nan)
+        for field in ['PERIOD_START', 'PERIOD_FINISH']:
+            flights_df[field] = pd.to_datetime(flights_df[field], utc=True)
+
+        positions = FlightPositions.from_arrays(
+            [UUID(flight_id) for flight_id in data['POSITION_FLIGHT_IDS']],
+            data['POSITION_COUNTS'], data['POSITION_TIMES'],
+            data['POSITION_POINTS'], data['POSITION_ALTS'])
+
+    return flights_df, positions.select(flights_df['FLIGHT_ID'].values)
@@ -0,0 +1,150 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Functions to write the rows of flights, positions and events files from the
+columns of pandas DataFrames.
+
+The rows are formatted a chunk at a time: datetime columns are formatted in
+bulk and each row is formatted by a single row template. The rows of each
+chunk are written to the file in a single write.
+"""
+
+import numpy as np
+from .trajectory_fields import FLIGHT_FIELDS, POSITION_FIELDS, FLIGHT_EVENT_FIELDS
+
+DEFAULT_WRITE_CHUNK_SIZE = 100000
+""" The default number of rows to format and write at a time. """
+
+FLIGHT_COLUMNS = FLIGHT_FIELDS.strip().split(',')
+""" The columns of a flights file. """
+
+POSITION_COLUMNS = POSITION_FIELDS.strip().split(',')
+""" The columns of a positions file. """
+
+FLIGHT_EVENT_COLUMNS = FLIGHT_EVENT_FIELDS.strip().split(',')
+""" The columns of a flight events file. """
+
+DEFAULT_FLIGHT_FORMATS = {'SSR_CODES': '[{}]', 'SOURCE_IDS': '[{}]'}
+""" The default formats of the flight columns, other columns are '{}'. """
+
+DEFAULT_POSITION_FORMATS = {'LAT': '{:.5f}', 'LON': '{:.5f}', 'ALT': '{:d}',
+                            'SPEED_GND': '{:.1f}', 'TRACK_GND': '{:.5f}',
+                            'VERT_SPEED': '{:d}', 'SSR_CODE': "'{}'"}
+""" The default formats of the position columns, other columns are '{}'. """
+
+
+def format_datetimes(datetimes):
+    """
+    Format datetimes in ISO 8601 format, to whole seconds.
+
+    Parameters
+    ----------
+    datetimes: array like
+        The datetimes, numpy datetime64s or pandas Timestamps in UTC.
+
+    Returns
+    -------
+    A list of the datetime strings, e.g. 2017-08-01T12:34:56Z.
+    """
+    strings = np.datetime_as_string(np.asarray(datetimes, dtype='datetime64[s]'),
+                                    unit='s')
+    return np.char.add(strings, 'Z').tolist()
+
+
+def column_values(df, column):
+    """
+    The values of a column of a DataFrame to format.
+
+    Datetime columns are formatted by format_datetimes.
+    """
+    values = df[column]
+    if values.dtype.kind == 'M':
+        return format_datetimes(values.values)
+    return values.tolist()
+
+
+def create_row_format(columns, formats={}, value_columns=None):
+    """
+    Create the format string of a csv row.
+
+    Parameters
+    ----------
+    columns: a list of strings
+        The columns of the row, in order.
+
+    formats: dict
+        The format strings of the columns, default '{}'.
+
+    value_columns: a collection of strings
+        The columns that have values, the other columns are empty.
+        Default: all of the columns.
+
+    Returns
+    -------
+    The format string of a row, including the line end.
+    """
+    return ','.join(formats.get(column, '{}')
+                    if (value_columns is None) or (column in value_columns) else ''
+                    for column in columns) + '\n'
+
+
+def write_csv_rows(file, df, columns, formats={},
+                   chunksize=DEFAULT_WRITE_CHUNK_SIZE):
+    """
+    Write the rows of a DataFrame to a csv file.
+
+    Parameters
+    ----------
+    file: a file object
+        The file to write to.
+
+    df: a pandas DataFrame
+        The rows to write.
+
+    columns: a list of strings
+        The columns to write, in order.
+        Columns that are not in df are written as empty strings.
+
+    formats: dict
+        The format strings of the columns, default '{}'.
+
+    chunksize: int
+        The number of rows to format and write at a time.
+
+    Returns
+    -------
+    The number of rows written.
+    """
+    row_format = create_row_format(columns, formats, df.columns)
+    for start in range(0, len(df), chunksize):
+        chunk_df = df.iloc[start:start + chunksize]
+        values = [column_values(chunk_df, column) for column in columns
+                  if column in chunk_df.columns]
+        file.write(''.join([row_format.format(*row) for row in zip(*values)]))
+
+    return len(df)
+
+
+def write_flights(file, flights_df, formats=DEFAULT_FLIGHT_FORMATS, *,
+                  columns=FLIGHT_COLUMNS, chunksize=DEFAULT_WRITE_CHUNK_SIZE):
+    """
+    Write flights to a flights file, see write_csv_rows.
+    """
+    return write_csv_rows(file, flights_df, columns, formats, chunksize)
+
+
+def write_positions(file, positions_df, formats=DEFAULT_POSITION_FORMATS, *,
+                    columns=POSITION_COLUMNS, chunksize=DEFAULT_WRITE_CHUNK_SIZE):
+    """
+    Write positions to a positions file, see write_csv_rows.
+    """
+    return write_csv_rows(file, positions_df, columns, formats, chunksize)
+
+
+def write_events(file, events_df, formats={}, *,
+                 columns=FLIGHT_EVENT_COLUMNS, chunksize=DEFAULT_WRITE_CHUNK_SIZE):
+    """
+    Write flight events to an events file, see write_csv_rows.
+    """
+    return write_csv_rows(file, events_df, columns, formats, chunksize)
@@ -6,11 +6,16 @@
 """
 Common operations across stored data types
 """
+import io
+from contextlib import contextmanager
 import pru.db.context as ctx
 
 # NM to metres conversion
 NM_CONVERSION_TO_M = 1852
 
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+""" The escapes of special characters in COPY text format. """
+
 
 def get_geo_db_connection():
     """
@@ -41,3 +46,53 @@ def create_buffer(lon, lat, radius, connection):
     query = "SELECT ST_AsText(ST_Buffer(ST_Point(%s, %s)::geography, %s));"
     cursor.execute(query, (lon, lat, radius))
     return cursor.fetchone()
+
+
+@contextmanager
+def transaction(connection):
+    """
+    Execute statements in a transaction on an autocommit connection.
+
+    The transaction is committed at the end of the with block, or rolled back
+    if an exception is raised.  The connection is returned to autocommit.
+    """
+    autocommit = connection.autocommit
+    connection.autocommit = False
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.autocommit = autocommit
+
+
+def format_copy_row(values):
+    """
+    Format a row of values in COPY text format, None values are NULL.
+    """
+    return '\t'.join('\\N' if value is None else str(value).translate(COPY_ESCAPES)
+                     for value in values) + '\n'
+
+
+def copy_rows(cursor, table_name, columns, rows):
+    """
+    Copy rows into a table with a single COPY statement.
+
+    Parameters
+    ----------
+    cursor: a cursor
+        The cursor to execute the COPY statement.
+
+    table_name: string
+        The name of the table, including its schema name if required.
+
+    columns: a list of strings
+        The names of the columns of the rows.
+
+    rows: a list of rows of values
+        The rows, geometry values may be EWKB hex strings.
+
+    Returns the number of rows copied.
+    """
+    buffer = io.StringIO(''.join([format_copy_row(row) for row in rows]))
+    cursor.copy_expert(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN;", buffer)
+    return len(rows)
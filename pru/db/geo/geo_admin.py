@@ -13,6 +13,7 @@ import time
 from pru.db.geo.geo_init import load_airspace, remove_all_sectors, tear_down
 from pru.db.geo.geo_init import load_airports, remove_all_airports
 from pru.db.geo.geo_init import load_user_airspace, remove_all_user_defined_sectors
+from pru.db.geo.geo_init import create_GIST_index, drop_GIST_index
 from pru.db.common_init import create as create_db, DB_TYPE_GEO
 from pru.db.geo.geo_init import create as create_geo_db
 from pru.logger import logger
@@ -60,6 +61,27 @@ def create_geo_database():
         log.info("Failed to make the airspace db, could not create the database.")
 
 
+def load_indexed_sectors(load_sectors, remove_all, file_path, reset):
+    """
+    Loads a sectors file, then builds the GIST indexes of the sector tables.
+
+    If reset, the sectors are removed and the indexes are dropped before the
+    file is loaded, so that the indexes are built over all the new sectors.
+    """
+    context = ctx.CONTEXT
+    owner_connection = ctx.get_connection(context, ctx.POSTGRES_DB)
+    connection = ctx.get_connection(context, ctx.DB_USER)
+    try:
+        if reset:
+            remove_all()
+            drop_GIST_index(context, owner_connection)
+        load_sectors(file_path, context, connection)
+        create_GIST_index(context, owner_connection)
+    finally:
+        connection.close()
+        owner_connection.close()
+
+
 def initialise_airspace(sector_file_path, reset=False):
     """
     Uses the provided file path to load the sectors file,
@@ -74,12 +96,9 @@ def initialise_airspace(sector_file_path, reset=False):
             A tuple of (False, message) if we fail
 
     """
-    connection = ctx.get_connection(ctx.CONTEXT, ctx.DB_USER)
-    context = ctx.CONTEXT
     if os.path.exists(sector_file_path):
-        if reset:
-            remove_all_sectors()
-        load_airspace(sector_file_path, context, connection)
+        load_indexed_sectors(load_airspace, remove_all_sectors,
+                             sector_file_path, reset)
         return True
     else:
         return (False, "Path not found " + sector_file_path)
@@ -123,12 +142,9 @@ def initialise_user_airspace(user_sector_file_path, reset=False):
             A tuple of (False, message) if we fail
 
     """
-    connection = ctx.get_connection(ctx.CONTEXT, ctx.DB_USER)
-    context = ctx.CONTEXT
     if os.path.exists(user_sector_file_path):
-        if reset:
-            remove_all_user_defined_sectors()
-        load_user_airspace(user_sector_file_path, context, connection)
+        load_indexed_sectors(load_user_airspace, remove_all_user_defined_sectors,
+                             user_sector_file_path, reset)
         return True
     else:
         return (False, "Path not found " + user_sector_file_path)
@@ -11,20 +11,52 @@ airports and user defined sectors tables.
 Provides operations to completely remove the tables.
 
 Operations are provided to add rows to each table when the tables are
-initialise from files of data.
+initialise from files of data.  The files are loaded in bulk: their rows are
+copied into temporary staging tables, with geometries as EWKB, and inserted
+into the tables by a single statement, which also derives the sector
+boundaries and cylinder buffers.
+The sectors may also be loaded from an airspace snapshot, see
+pru.airspace_snapshot, which contains their geometries as EWKB.
 
 """
-from pru.db.io import read_airports_records, read_sectors
-from pru.db.common_operations import NM_CONVERSION_TO_M, create_buffer
+from pru.db.io import read_airports_records, read_sectors, check_varchar
+from pru.airspace_snapshot import AirspaceSnapshot
+from pru.trajectory_fields import NPZ_FILE_EXTENSION
+from pru.db.common_operations import NM_CONVERSION_TO_M, create_buffer, \
+    copy_rows, transaction
 import pru.db.context as ctx
 from pru.logger import logger
 from psycopg2.extensions import AsIs
+from shapely import wkb, wkt
 from psycopg2 import DataError, InternalError, OperationalError, Error
 from psycopg2 import ProgrammingError, IntegrityError
 
 
 log = logger(__name__)
 
+GIST_INDEXES = {'sectors': 'sector_index',
+                'user_defined_sectors': 'user_sector_index'}
+""" The names of the GIST indexes on the geometries of the sector tables. """
+
+AIRSPACE_COLUMNS = ['ac_id', 'av_airspace_id', 'av_icao_state_id',
+                    'min_altitude', 'max_altitude', 'av_name', 'sector_type',
+                    'object_id', 'wkt']
+""" The columns of the sectors staging table. """
+
+SNAPSHOT_FIELDS = ['AC_ID', 'AV_AIRSPACE_ID', 'AV_ICAO_STATE_ID',
+                   'MIN_ALTITUDE', 'MAX_ALTITUDE', 'AV_NAME', 'SECTOR_TYPE',
+                   'OBJECT_ID']
+""" The airspace snapshot fields of the sectors staging table columns. """
+
+AIRPORT_COLUMNS = ['iata_ap_code', 'icao_ap_code', 'iso_ct_code',
+                   'latitude', 'longitude']
+""" The columns of the airports table that are loaded. """
+
+USER_SECTOR_COLUMNS = ['org_id', 'user_id', 'sector_name', 'latitude',
+                       'longitude', 'radius', 'min_altitude', 'max_altitude',
+                       'is_cylinder', 'wkt']
+""" The columns of the user sectors staging table. """
+
 
 def remove_all_sectors():
     """
@@ -467,16 +499,232 @@ def add_user_sector(user_sector, context, connection):
 
 def create_GIST_index(context, connection):
     """
-    Creates or recreates a GIST index on the geom column of the
-    airspace table.
+    Creates the GIST indexes on the wkt geometry columns of the sector
+    tables, if they are not present.
+
+    The indexes are built over all of the rows of each table, so they should
+    be created after the tables have been loaded.
+    Use the owner connection for this call.
     """
-    cursor = connection.cursor()
     schema_name = AsIs(context[ctx.SCHEMA_NAME])
     try:
-        cursor.execute("CREATE INDEX sector_index ON unit.sectors USING GIST"
-                       "(wkt gist_geometry_ops_nd);", schema_name)
-    except ProgrammingError:
-        log.warning("Failed to add index, already present.")
+        with connection.cursor() as cursor:
+            for table_name, index_name in GIST_INDEXES.items():
+                cursor.execute("CREATE INDEX IF NOT EXISTS %s ON %s.%s USING GIST"
+                               "(wkt gist_geometry_ops_nd);",
+                               [AsIs(index_name), schema_name, AsIs(table_name)])
+                cursor.execute("ANALYZE %s.%s;", [schema_name, AsIs(table_name)])
+        return True
+    except Error:
+        log.exception("Failed to create the GIST indexes.")
+        return False
+
+
+def drop_GIST_index(context, connection):
+    """
+    Drops the GIST indexes on the sector tables, e.g. before the tables are
+    reloaded.
+    Use the owner connection for this call.
+    """
+    schema_name = AsIs(context[ctx.SCHEMA_NAME])
+    try:
+        with connection.cursor() as cursor:
+            for index_name in GIST_INDEXES.values():
+                cursor.execute("DROP INDEX IF EXISTS %s.%s;",
+                               [schema_name, AsIs(index_name)])
+        return True
+    except Error:
+        log.exception("Failed to drop the GIST indexes.")
+        return False
+
+
+def create_ewkb(wkt_text):
+    """
+    Convert a wkt geometry to a hex EWKB geometry in WGS84, for COPY.
+    """
+    return wkb.dumps(wkt.loads(wkt_text), hex=True, srid=4326)
+
+
+def create_airspace_row(airspace):
+    """
+    Creates a row of the sectors staging table from an airspace record,
+    see add_airspace_geometry.
+    """
+    return (int(airspace[0]), check_varchar(airspace[1], 20),
+            check_varchar(airspace[2], 2),
+            100 * int(airspace[3]), 100 * int(airspace[4]),
+            check_varchar(airspace[5], 100), check_varchar(airspace[6], 2),
+            int(airspace[7]), create_ewkb(airspace[8]))
+
+
+def create_airport_row(airport):
+    """
+    Creates a row of the airports table from an airport record,
+    see add_airport.
+    """
+    if len(airport) > 3:
+        # Assume its the full fat record.
+        return (check_varchar(airport[0], 20), check_varchar(airport[1], 20),
+                check_varchar(airport[2], 2),
+                float(airport[3]), float(airport[4]))
+    else:
+        # Assume its the skinny record
+        return (None, check_varchar(airport[0], 20), None,
+                float(airport[2]), float(airport[1]))
+
+
+def float_or_zero(value):
+    """
+    Converts a value to a float, zero if it is not a number.
+    """
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def create_user_sector_row(user_sector):
+    """
+    Creates a row of the user sectors staging table from a user sector record,
+    see create_user_sector_parameters.
+    The geometry of a cylinder is NULL, its buffer is created when the
+    staged rows are inserted.
+    """
+    is_cylinder = user_sector[8] in ["True", "true", "t", "T", "TRUE"]
+    return (check_varchar(user_sector[0], 100),
+            check_varchar(user_sector[1], 100),
+            check_varchar(user_sector[2], 100),
+            float_or_zero(user_sector[3]), float_or_zero(user_sector[4]),
+            float(user_sector[5]) * NM_CONVERSION_TO_M,
+            100 * int(user_sector[6]), 100 * int(user_sector[7]),
+            is_cylinder, None if is_cylinder else create_ewkb(user_sector[9]))
+
+
+def create_rows(records, create_row):
+    """
+    Creates the rows to copy from records.
+
+    Note: the exceptions that shapely raises for an invalid wkt depend upon
+    its version, so any exception marks a record as bad.
+
+    Returns the rows and a list of the records that could not be converted.
+    """
+    rows = []
+    bad_records = []
+    for record in records:
+        try:
+            rows.append(create_row(record))
+        except Exception:
+            bad_records.append(record)
+    return rows, bad_records
+
+
+def create_snapshot_rows(snapshot):
+    """
+    Creates the rows of the sectors staging table from an airspace snapshot.
+    """
+    columns = [snapshot.sectors[field].tolist() for field in SNAPSHOT_FIELDS]
+    return [row + (snapshot.wkb(index).hex(),)
+            for index, row in enumerate(zip(*columns))]
+
+
+def log_bad_records(bad_records):
+    """
+    Logs the records that could not be loaded.
+    """
+    if len(bad_records) > 0:
+        log.debug("Bad records list:")
+        [log.debug(bad_record) for bad_record in bad_records]
+
+
+def copy_airspace(airspaces, context, connection):
+    """
+    Adds airspace rows to the sectors table in bulk, in one transaction.
+
+    Note: the rows are checked by create_airspace_row, if the database
+    rejects any other row, e.g. an invalid geometry, the transaction is
+    rolled back and no sectors are added.
+
+    Returns the number of sectors added.
+    """
+    schema_name = AsIs(context[ctx.SCHEMA_NAME])
+    with transaction(connection), connection.cursor() as cursor:
+        cursor.execute("CREATE TEMPORARY TABLE sectors_staging "
+                       "(ac_id int,"
+                       "av_airspace_id varchar (20),"
+                       "av_icao_state_id varchar(2),"
+                       "min_altitude int,"
+                       "max_altitude int,"
+                       "av_name varchar(100),"
+                       "sector_type varchar(2),"
+                       "object_id int,"
+                       "wkt geometry) ON COMMIT DROP;")
+        copy_rows(cursor, 'sectors_staging', AIRSPACE_COLUMNS, airspaces)
+        cursor.execute("INSERT INTO %s.sectors (ac_id, av_airspace_id, "
+                       "av_icao_state_id, min_altitude, max_altitude, "
+                       "av_name, sector_type, object_id, wkt, bounded_sector) "
+                       "SELECT ac_id, av_airspace_id, av_icao_state_id, "
+                       "min_altitude, max_altitude, av_name, sector_type, "
+                       "object_id, wkt, ST_Boundary(wkt) FROM sectors_staging;",
+                       [schema_name])
+        return cursor.rowcount
+
+
+def copy_airports(airports, context, connection):
+    """
+    Adds airport rows to the airports table in bulk, in one COPY.
+
+    Note: the rows are checked by create_airport_row, if the database
+    rejects any other row no airports are added.
+
+    Returns the number of airports added.
+    """
+    schema_name = context[ctx.SCHEMA_NAME]
+    with connection.cursor() as cursor:
+        return copy_rows(cursor, f'{schema_name}.airports', AIRPORT_COLUMNS, airports)
+
+
+def copy_user_sectors(user_sectors, context, connection):
+    """
+    Adds user sector rows to the user defined sectors table in bulk, in one
+    transaction.  Sectors that are already present, by org_id, user_id and
+    sector_name, are not added.
+
+    Note: the rows are checked by create_user_sector_row, if the database
+    rejects any other row, e.g. an invalid geometry, the transaction is
+    rolled back and no user sectors are added.
+
+    Returns the number of user sectors added.
+    """
+    schema_name = AsIs(context[ctx.SCHEMA_NAME])
+    with transaction(connection), connection.cursor() as cursor:
+        cursor.execute("CREATE TEMPORARY TABLE user_sectors_staging "
+                       "(org_id varchar(100),"
+                       "user_id varchar (100),"
+                       "sector_name varchar (100),"
+                       "latitude float,"
+                       "longitude float,"
+                       "radius float,"
+                       "min_altitude int,"
+                       "max_altitude int,"
+                       "is_cylinder boolean,"
+                       "wkt geometry) ON COMMIT DROP;")
+        copy_rows(cursor, 'user_sectors_staging', USER_SECTOR_COLUMNS, user_sectors)
+        # Create the cylinder buffers, then the boundaries of all the sectors
+        cursor.execute("INSERT INTO %s.user_defined_sectors (org_id, "
+                       "user_id, sector_name, latitude, longitude, "
+                       "radius, min_altitude, max_altitude, is_cylinder, "
+                       "wkt, bounded_sector) "
+                       "SELECT org_id, user_id, sector_name, latitude, longitude, "
+                       "radius, min_altitude, max_altitude, is_cylinder, "
+                       "geom, ST_Boundary(geom) FROM "
+                       "(SELECT *, CASE WHEN is_cylinder THEN "
+                       "ST_Buffer(ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)"
+                       "::geography, radius)::geometry "
+                       "ELSE wkt END AS geom FROM user_sectors_staging) AS sectors "
+                       "ON CONFLICT (org_id, user_id, sector_name) DO NOTHING;",
+                       [schema_name])
+        return cursor.rowcount
 
 
 def load_user_airspace(user_sectors_file, context, connection):
@@ -490,18 +738,12 @@ def load_user_airspace(user_sectors_file, context, connection):
             airspace_source = read_sectors(user_sectors_file)
             # Drop the title row
             next(airspace_source)
-            count = 0
-            bad_records = []
-            for airspace in airspace_source:
-                if add_user_sector(airspace, context, connection)[0]:
-                    count += 1
-                else:
-                    bad_records.append(airspace)
+            rows, bad_records = create_rows(airspace_source, create_user_sector_row)
+            count = copy_user_sectors(rows, context, connection)
             log.info('Made ' + str(count) + ' user defined airspace entries')
-            log.info('Failed to make ' + str(len(bad_records)) + ' user defined airspace entries')
-            if len(bad_records) > 0:
-                log.debug("Bad records list:")
-                [log.debug(bad_record) for bad_record in bad_records]
+            log.info('Failed to make ' + str(len(bad_records) + len(rows) - count) +
+                     ' user defined airspace entries')
+            log_bad_records(bad_records)
             return True
         except Exception:
             log.exception("Failed to read user defined sector file : " + user_sectors_file +
@@ -515,23 +757,23 @@ def load_user_airspace(user_sectors_file, context, connection):
 def load_airspace(sectors_file, context, connection):
     """
     Load the sectors file if found else return False.
+
+    The sectors file may be a csv or geojson file, or an airspace snapshot
+    (npz) file.
     """
     if sectors_file:
         log.info(f"Loading the sectors data table using file : {sectors_file}")
         try:
-            airspace_source = read_sectors(sectors_file)
-            count = 0
-            bad_records = []
-            for airspace in airspace_source:
-                if add_airspace_geometry(airspace, context, connection)[0]:
-                    count += 1
-                else:
-                    bad_records.append(airspace)
+            if sectors_file.endswith(NPZ_FILE_EXTENSION):
+                rows = create_snapshot_rows(AirspaceSnapshot.load(sectors_file))
+                bad_records = []
+            else:
+                airspace_source = read_sectors(sectors_file)
+                rows, bad_records = create_rows(airspace_source, create_airspace_row)
+            count = copy_airspace(rows, context, connection)
             log.info('Made ' + str(count) + ' airspace entries')
             log.info('Failed to make ' + str(len(bad_records)) + ' airspace entries')
-            if len(bad_records) > 0:
-                log.debug("Bad records list:")
-                [log.debug(bad_record) for bad_record in bad_records]
+            log_bad_records(bad_records)
             return True
         except Exception:
             log.exception("Failed to read sector init file : " + sectors_file +
@@ -550,18 +792,11 @@ def load_airports(airports_file, context, connection):
         log.info(f"Loading the airports data table using file : {airports_file}")
         try:
             airports_source = read_airports_records(airports_file)
-            count = 0
-            bad_records = []
-            for airport in airports_source:
-                if add_airport(airport, context, connection)[0]:
-                    count += 1
-                else:
-                    bad_records.append(airport)
+            rows, bad_records = create_rows(airports_source, create_airport_row)
+            count = copy_airports(rows, context, connection)
             log.info('Made ' + str(count) + ' airport entries')
             log.info('Failed to make ' + str(len(bad_records)) + ' airport entries')
-            if len(bad_records) > 0:
-                log.debug("Bad records list:")
-                [log.debug(bad_record) for bad_record in bad_records]
+            log_bad_records(bad_records)
             return True
         except Exception:
             log.exception("Failed to read airports init file : " + airports_file +
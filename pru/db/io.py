@@ -311,3 +311,15 @@ def read_airports_records(path):
             return iter(())
     else:
         return iter(())
+
+
+def check_varchar(value, width):
+    """
+    Checks that a value fits in a varchar(width) column, so that a record
+    that is too wide is bad, rather than failing the COPY.
+
+    Raises a ValueError if the value is longer than width.
+    """
+    if value is not None and len(value) > width:
+        raise ValueError(f'value: {value} is longer than {width} characters')
+    return value
@@ -7,8 +7,8 @@ Database inititialisation code for the reference db.  This creates the
 tables and allows fleet data to be added.
 """
 
-from pru.db.io import read_fleet_records
 import pru.db.context as ctx
+from pru.db.common_operations import transaction
 from pru.logger import logger
 from psycopg2.extensions import AsIs
 from psycopg2 import OperationalError, Error, ProgrammingError, DataError, InternalError, IntegrityError
@@ -16,6 +16,9 @@ from psycopg2 import OperationalError, Error, ProgrammingError, DataError, Inter
 
 log = logger(__name__)
 
+FLEET_INDEX_NAME = 'fleet_aircraft_idx'
+""" The unique index of fleet records by registration, type and address. """
+
 
 def remove_all_reference_data():
     """
@@ -87,6 +90,9 @@ def create_fleet_table(context, connection):
                            "AIRCRAFT_TYPE varchar(20) NOT NULL,"
                            "AIRCRAFT_ADDRESS varchar(20),"
                            "PERIOD_START timestamp without time zone);", [schema_name])
+            cursor.execute("CREATE UNIQUE INDEX %s ON %s.fleet"
+                           "(AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS);",
+                           [AsIs(FLEET_INDEX_NAME), schema_name])
             cursor.execute("GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA %s TO %s;",
                            [schema_name, admin_name])
             cursor.execute("GRANT USAGE, SELECT ON ALL SEQUENCES IN SCHEMA %s TO %s;",
@@ -101,6 +107,56 @@ def create_fleet_table(context, connection):
         return False
 
 
+def has_fleet_index(context, connection):
+    """
+    Whether the fleet table has the unique index required by upsert_fleet_data.
+
+    Fleet tables created before the index was added do not have it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_indexes WHERE schemaname = %s "
+                       "AND tablename = 'fleet' AND indexname = %s;",
+                       [context[ctx.SCHEMA_NAME], FLEET_INDEX_NAME])
+        return cursor.fetchone() is not None
+
+
+def migrate_fleet_table(context, connection):
+    """
+    Adds the unique index to a fleet table created without it.
+
+    Duplicate records by registration, type and address are deleted first,
+    keeping the record with the earliest PERIOD_START, as upsert_fleet_data
+    would have done. Records without an address are not duplicates, since
+    the index does not compare NULLs.
+
+    The connection must be able to create an index on the fleet table,
+    i.e. it must be a connection of the table owner.
+
+    Returns True if the fleet table has the index, False otherwise.
+    """
+    log.info("Migrating the fleet table.")
+
+    schema_name = AsIs(context[ctx.SCHEMA_NAME])
+    try:
+        with transaction(connection), connection.cursor() as cursor:
+            cursor.execute("DELETE FROM %s.fleet WHERE id IN "
+                           "(SELECT id FROM "
+                           "(SELECT id, ROW_NUMBER() OVER "
+                           "(PARTITION BY AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS "
+                           "ORDER BY PERIOD_START NULLS LAST, id) AS row_number "
+                           "FROM %s.fleet WHERE AIRCRAFT_ADDRESS IS NOT NULL) AS records "
+                           "WHERE row_number > 1);",
+                           [schema_name, schema_name])
+            log.info(f"Deleted {cursor.rowcount} duplicate fleet records")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS %s ON %s.fleet"
+                           "(AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS);",
+                           [AsIs(FLEET_INDEX_NAME), schema_name])
+        return True
+    except Error:
+        log.exception("Failed trying to migrate the fleet table")
+        return False
+
+
 def add_fleet_record(fleet_record, context, connection):
     """
     Adds a fleet data rectord to the fleet database.
@@ -141,6 +197,59 @@ def add_fleet_record(fleet_record, context, connection):
     return True, id
 
 
+def upsert_fleet_data(fleet_file, context, connection):
+    """
+    Adds the records of a fleet data file to the fleet table in bulk.
+
+    The file is copied into a temporary table which is merged into the
+    fleet table by a single insert, in one transaction.
+    Records that are already in the fleet table, by registration, type and
+    address, are not added, but their PERIOD_START is set to the earliest
+    PERIOD_START of the records.
+
+    Parameters
+    ----------
+    fleet_file: string
+        The path of a fleet data csv file, output by extract_fleet_data.py.
+
+    Returns the number of fleet records inserted or updated.
+
+    Raises a RuntimeError if the fleet table does not have the unique index,
+    see migrate_fleet_table.
+    """
+    if not has_fleet_index(context, connection):
+        raise RuntimeError("The fleet table has no unique index on "
+                           "(AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS), "
+                           "run reference_admin.migrate_fleet_data to add it.")
+
+    schema_name = AsIs(context[ctx.SCHEMA_NAME])
+    with transaction(connection), connection.cursor() as cursor, \
+            open(fleet_file, 'r') as file:
+        cursor.execute("CREATE TEMPORARY TABLE fleet_staging"
+                       "(AIRCRAFT_REG varchar(20),"
+                       "AIRCRAFT_TYPE varchar(20),"
+                       "AIRCRAFT_ADDRESS varchar(20),"
+                       "PERIOD_START timestamp without time zone) "
+                       "ON COMMIT DROP;")
+        # Note: empty text fields are empty strings, not NULLs
+        cursor.copy_expert("COPY fleet_staging (AIRCRAFT_REG, AIRCRAFT_TYPE,"
+                           "AIRCRAFT_ADDRESS, PERIOD_START) FROM STDIN WITH "
+                           "(FORMAT csv, HEADER true, FORCE_NOT_NULL "
+                           "(AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS));",
+                           file)
+        cursor.execute("INSERT INTO %s.fleet (AIRCRAFT_REG, AIRCRAFT_TYPE,"
+                       "AIRCRAFT_ADDRESS, PERIOD_START) "
+                       "SELECT DISTINCT ON (AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS) "
+                       "AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS, PERIOD_START "
+                       "FROM fleet_staging "
+                       "ORDER BY AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS, PERIOD_START "
+                       "ON CONFLICT (AIRCRAFT_REG, AIRCRAFT_TYPE, AIRCRAFT_ADDRESS) "
+                       "DO UPDATE SET PERIOD_START = EXCLUDED.PERIOD_START "
+                       "WHERE EXCLUDED.PERIOD_START < fleet.PERIOD_START;",
+                       [schema_name])
+        return cursor.rowcount
+
+
 def load_fleet_data(fleet_file, context, connection):
     """
     Load the fleet file if found else return False.
@@ -148,23 +257,12 @@ def load_fleet_data(fleet_file, context, connection):
     if fleet_file:
         log.info(f"Loading the fleet data base using file : {fleet_file}")
         try:
-            fleet_records = read_fleet_records(fleet_file)
-            # Drop the first line, its always a header line
-            next(fleet_records)
-            count = 0
-            bad_records = []
-            for fleet_record in fleet_records:
-                if add_fleet_record(fleet_record, context, connection):
-                    count += 1
-                else:
-                    bad_records.append(fleet_record)
-            bad_record_count = len(bad_records)
+            count = upsert_fleet_data(fleet_file, context, connection)
             log.info(f"Made {count} fleet data entries")
-            log.info(f"Failed to make {bad_record_count} fleet data entries")
-            if bad_record_count > 0:
-                log.debug("Bad records list:")
-                [log.debug(bad_record) for bad_record in bad_records]
             return True
+        except RuntimeError as error:
+            log.error(str(error))
+            return False
         except Exception:
             log.exception(f"Failed to read fleet data init file : {fleet_file}"
                           " either the file or the directory does not exist.")
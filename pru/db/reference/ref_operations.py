@@ -9,8 +9,7 @@ Uniquness logic
 """
 import pru.db.context as ctx
 from pru.logger import logger
-from pru.db.io import read_fleet_records
-from pru.db.reference.ref_init import add_fleet_record
+from pru.db.reference.ref_init import add_fleet_record, upsert_fleet_data
 from psycopg2.extensions import AsIs
 from psycopg2.extras import DictCursor
 
@@ -154,29 +153,20 @@ def add_fleet_data_file(fleet_file):
     """
     if fleet_file:
         log.info(f"Adding the fleet data base using file : {fleet_file}")
+        connection = ctx.get_connection(ctx.CONTEXT, ctx.REF_DB_USER)
         try:
-            fleet_records = read_fleet_records(fleet_file)
-            # Drop the title row
-            next(fleet_records)
-            count = 0
-            bad_records = []
-            for fleet_record in fleet_records:
-                ok, id = insert_aircraft(*fleet_record)
-                if ok:
-                    count += 1
-                else:
-                    bad_records.append(fleet_record)
-            bad_record_count = len(bad_records)
-            log.info(f"Made {count} fleet data insertions")
-            log.info(f"Failed to make {bad_record_count} fleet data insertions")
-            if bad_record_count > 0:
-                log.debug("Bad records list:")
-                [log.debug(bad_record) for bad_record in bad_records]
+            count = upsert_fleet_data(fleet_file, ctx.CONTEXT, connection)
+            log.info(f"Made {count} fleet data insertions or updates")
             return True
+        except RuntimeError as error:
+            log.error(str(error))
+            return False
         except Exception:
             log.exception(f"Failed to read fleet data init file : {fleet_file}"
                           " either the file or the directory does not exist.")
             return False
+        finally:
+            connection.close()
     else:
         log.info("No fleet file provided")
         return False
@@ -11,6 +11,7 @@ import os
 import socket
 import time
 from pru.db.reference.ref_init import load_fleet_data, remove_all_reference_data, tear_down
+from pru.db.reference.ref_init import migrate_fleet_table
 from pru.db.common_init import create as create_db
 from pru.db.common_init import DB_TYPE_REF
 from pru.db.reference.ref_init import create as create_reference_db
@@ -82,3 +83,19 @@ def initialise_fleet_data(fleet_file_path=None, reset=False):
         return True
     else:
         return (False, "Path not found: " + fleet_file_path)
+
+
+def migrate_fleet_data():
+    """
+    Add the unique fleet index to a reference db created without it.
+
+    Duplicate fleet records are removed, so that fleet files can be upserted.
+
+    return  True if we succeeded, False otherwise.
+    """
+    log.info("Migrating the reference db fleet data")
+    connection = ctx.get_connection(ctx.CONTEXT, ctx.REF_POSTGRES_DB)
+    try:
+        return migrate_fleet_table(ctx.CONTEXT, connection)
+    finally:
+        connection.close()
@@ -0,0 +1,205 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+An index of flight events for matching events by key and time.
+
+The events are indexed by their flight's CALLSIGN, ADEP and ADES and their
+EVENT_TYPE (the key) and their time. Each key is allocated an integer code
+and the events are sorted by a single integer of the key code and the time
+in seconds, so that the events with a key within a time window of a probe
+event are found with a binary search.
+
+The index can be saved to and loaded from a numpy npz file, so that it can
+be built once for a multi-day APDS data set and updated with new events
+rather than rebuilt to match each day.
+"""
+
+import numpy as np
+import pandas as pd
+from pru.flight_matching import datetimes_to_ns, NS_PER_SECOND
+
+EVENT_KEY_FIELDS = ['CALLSIGN', 'ADEP', 'ADES', 'EVENT_TYPE']
+""" The fields that matching events must have in common. """
+
+DEFAULT_EVENT_TIME_TOLERANCE = 0.0
+""" The default maximum time between matching events [Seconds]. """
+
+CODE_SHIFT = 32
+""" The number of bits to shift a key code to combine it with a time in seconds. """
+
+
+def read_event_keys(flights_df, events_df):
+    """
+    Join events with their flights and create the keys of the events.
+
+    Parameters
+    ----------
+    flights_df: a pandas DataFrame
+        The flights, with FLIGHT_ID, CALLSIGN, ADEP and ADES columns.
+
+    events_df: a pandas DataFrame
+        The events, with FLIGHT_ID, EVENT_TYPE and TIME columns.
+
+    Returns
+    -------
+    A list of the key tuples, the flight ids and the event times in
+    nanoseconds of the events of the flights.
+    Events of flights with null key values are not returned.
+    """
+    flight_events_df = pd.merge(flights_df[['FLIGHT_ID', 'CALLSIGN', 'ADEP', 'ADES']],
+                                events_df[['FLIGHT_ID', 'EVENT_TYPE', 'TIME']],
+                                on='FLIGHT_ID')
+    flight_events_df = flight_events_df.loc[
+        flight_events_df[EVENT_KEY_FIELDS].notnull().all(axis=1)]
+    keys = list(zip(*[flight_events_df[field].astype(str).values
+                      for field in EVENT_KEY_FIELDS]))
+    return keys, flight_events_df['FLIGHT_ID'].values, \
+        datetimes_to_ns(flight_events_df['TIME'])
+
+
+def create_search_keys(codes, times):
+    """
+    Combine key codes and times into search keys.
+
+    Parameters
+    ----------
+    codes: a numpy int64 array
+        The key codes.
+
+    times: a numpy int64 array
+        The times in nanoseconds, which are rounded down to whole seconds.
+
+    Returns
+    -------
+    A numpy int64 array of the search keys.
+    """
+    return (np.asarray(codes, dtype=np.int64) << CODE_SHIFT) + \
+        np.floor_divide(times, NS_PER_SECOND)
+
+
+class EventIndex:
+    """
+    An index of events by key and time.
+    """
+    __slots__ = ('__key_codes', '__search_keys', '__times', '__flight_ids')
+
+    def __init__(self):
+        """
+        Create an empty EventIndex.
+        """
+        self.__key_codes = {}
+        self.__search_keys = np.zeros(0, dtype=np.int64)
+        self.__times = np.zeros(0, dtype=np.int64)
+        self.__flight_ids = np.zeros(0, dtype=object)
+
+    def __len__(self):
+        return len(self.__times)
+
+    @property
+    def keys(self):
+        'Accessor for the event keys, in key code order.'
+        return list(self.__key_codes)
+
+    @property
+    def flight_ids(self):
+        'Accessor for the flight ids of the events, in index order.'
+        return self.__flight_ids
+
+    def update(self, flights_df, events_df):
+        """
+        Add the events of flights to the index.
+
+        Parameters
+        ----------
+        flights_df: a pandas DataFrame
+            The flights, with FLIGHT_ID, CALLSIGN, ADEP and ADES columns.
+
+        events_df: a pandas DataFrame
+            The events of the flights, with FLIGHT_ID, EVENT_TYPE and TIME
+            columns.
+        """
+        keys, flight_ids, times = read_event_keys(flights_df, events_df)
+        key_codes = self.__key_codes
+        codes = [key_codes.setdefault(key, len(key_codes)) for key in keys]
+
+        search_keys = np.concatenate((self.__search_keys,
+                                      create_search_keys(codes, times)))
+        order = np.argsort(search_keys, kind='stable')
+        self.__search_keys = search_keys[order]
+        self.__times = np.concatenate((self.__times, times))[order]
+        self.__flight_ids = np.concatenate((self.__flight_ids,
+                                            flight_ids.astype(object)))[order]
+
+    def find_matches(self, flights_df, events_df,
+                     tolerance=DEFAULT_EVENT_TIME_TOLERANCE):
+        """
+        Find the indexed events that match the events of flights.
+
+        Events match if they have the same key and their times are within
+        tolerance of each other.
+
+        Parameters
+        ----------
+        flights_df: a pandas DataFrame
+            The flights, with FLIGHT_ID, CALLSIGN, ADEP and ADES columns.
+
+        events_df: a pandas DataFrame
+            The events of the flights, with FLIGHT_ID, EVENT_TYPE and TIME
+            columns.
+
+        tolerance: float
+            The maximum time between matching events [Seconds].
+
+        Returns
+        -------
+        The indexed flight ids and flight ids of the matching events.
+        """
+        keys, flight_ids, times = read_event_keys(flights_df, events_df)
+        codes = np.array([self.__key_codes.get(key, -1) for key in keys],
+                         dtype=np.int64)
+        is_indexed = codes >= 0
+        codes = codes[is_indexed]
+        flight_ids = flight_ids[is_indexed]
+        times = times[is_indexed]
+
+        # Search for the events within the tolerance in whole seconds
+        delta_time = int(np.ceil(tolerance * NS_PER_SECOND))
+        firsts = np.searchsorted(self.__search_keys,
+                                 create_search_keys(codes, times - delta_time),
+                                 side='left')
+        lasts = np.searchsorted(self.__search_keys,
+                                create_search_keys(codes, times + delta_time),
+                                side='right')
+        counts = lasts - firsts
+
+        # Generate the candidate pairs of events
+        probes = np.repeat(np.arange(len(codes)), counts)
+        offsets = np.arange(len(probes)) - np.repeat(np.cumsum(counts) - counts, counts)
+        indicies = np.repeat(firsts, counts) + offsets
+
+        # Filter the candidates by their exact times
+        is_match = np.abs(self.__times[indicies] - times[probes]) <= delta_time
+        return self.__flight_ids[indicies[is_match]], flight_ids[probes[is_match]]
+
+    def save(self, filename):
+        """
+        Save the index to a numpy npz file.
+        """
+        keys = np.array(self.keys, dtype=str).reshape(-1, len(EVENT_KEY_FIELDS))
+        np.savez(filename, keys=keys, search_keys=self.__search_keys,
+                 times=self.__times, flight_ids=np.array(self.__flight_ids.tolist()))
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Load an index from a numpy npz file, see save.
+        """
+        event_index = cls()
+        with np.load(filename) as data:
+            event_index.__key_codes = {tuple(key): code for code, key in
+                                       enumerate(data['keys'].tolist())}
+            event_index.__search_keys = data['search_keys']
+            event_index.__times = data['times']
+            event_index.__flight_ids = data['flight_ids'].astype(object)
+        return event_index
@@ -0,0 +1,382 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Functions to generate candidate flight matches.
+
+Candidate matches are pairs of flights with equal key values, e.g.:
+AIRCRAFT_ADDRESS, CALLSIGN or ADEP and ADES, whose times overlap.
+
+Instead of merging the flights on the key(s) and then filtering the merged
+flights by time, the flights are joined with a sort-and-sweep interval join.
+The flights are sorted by key and start time and swept in order, keeping
+heaps of the active flights of each side, so only the pairs of flights whose
+times overlap are generated, in time proportional to the number of pairs.
+
+Verified matches are grouped in a DisjointSet across the matching passes,
+and each group of flights is allocated a new flight id once matching is
+complete.
+"""
+
+import os
+import uuid
+import heapq
+import numpy as np
+import pandas as pd
+
+NS_PER_SECOND = 1000000000
+""" The number of nanoseconds in a second. """
+
+
+def datetimes_to_ns(values):
+    """
+    Convert datetimes to nanoseconds since the epoch.
+
+    Parameters
+    ----------
+    values: a pandas Series or numpy array of datetime64s.
+
+    Returns
+    -------
+    A numpy int64 array of the datetimes in nanoseconds.
+    NaT values are converted to the minimum int64 value.
+    """
+    return np.asarray(values, dtype='datetime64[ns]').view(np.int64)
+
+
+def factorize_keys(left_df, right_df, on):
+    """
+    Encode the key values of two DataFrames as common integer codes.
+
+    Parameters
+    ----------
+    left_df, right_df: pandas DataFrames
+        The DataFrames containing the key columns.
+
+    on: a string or a list of strings
+        The name(s) of the key column(s).
+
+    Returns
+    -------
+    The left and right key codes as numpy int64 arrays.
+    Rows with a null key value have a code of -1.
+    """
+    on = [on] if isinstance(on, str) else list(on)
+    keys_df = pd.concat([left_df[on], right_df[on]], ignore_index=True)
+    codes = keys_df.groupby(on, sort=False).ngroup().values.astype(np.int64)
+    return codes[:len(left_df)], codes[len(left_df):]
+
+
+def find_overlapping_intervals(left_codes, left_starts, left_finishes,
+                               right_codes, right_starts, right_finishes):
+    """
+    Find the pairs of left and right intervals with the same code which overlap.
+
+    Intervals overlap if each starts at or before the finish of the other.
+    Intervals with a negative code are ignored.
+
+    Parameters
+    ----------
+    left_codes, right_codes: numpy int64 arrays
+        The key codes of the intervals.
+
+    left_starts, left_finishes, right_starts, right_finishes: numpy int64 arrays
+        The start and finish times of the intervals.
+
+    Returns
+    -------
+    The left and right indicies of the overlapping pairs, ordered by left
+    index then right index.
+    """
+    left_count = len(left_codes)
+    codes = np.concatenate((left_codes, right_codes))
+    starts = np.concatenate((left_starts, right_starts))
+    finishes = np.concatenate((left_finishes, right_finishes))
+
+    # Sort the intervals by code then start time, with left intervals before
+    # right intervals that start at the same time
+    valid = np.flatnonzero(codes >= 0)
+    order = valid[np.lexsort((valid >= left_count, starts[valid], codes[valid]))]
+
+    # Python lists are faster than numpy arrays to access item by item
+    codes = codes.tolist()
+    starts = starts.tolist()
+    finishes = finishes.tolist()
+
+    left_indicies = []
+    right_indicies = []
+    active = ([], [])  # heaps of the active (finish, index) intervals of each side
+    current_code = None
+    for index in order.tolist():
+        code = codes[index]
+        if code != current_code:
+            current_code = code
+            active = ([], [])
+
+        start = starts[index]
+        is_right = index >= left_count
+        others = active[0] if is_right else active[1]
+
+        # Remove intervals of the other side which finished before this start
+        while others and others[0][0] < start:
+            heapq.heappop(others)
+
+        # The remaining intervals of the other side overlap this interval
+        if others:
+            other_indicies = [other for _, other in others]
+            if is_right:
+                left_indicies.extend(other_indicies)
+                right_indicies.extend([index - left_count] * len(others))
+            else:
+                left_indicies.extend([index] * len(others))
+                right_indicies.extend(other_indicies)
+
+        if is_right:
+            heapq.heappush(active[1], (finishes[index], index - left_count))
+        else:
+            heapq.heappush(active[0], (finishes[index], index))
+
+    left_indicies = np.array(left_indicies, dtype=np.int64)
+    right_indicies = np.array(right_indicies, dtype=np.int64)
+    pair_order = np.lexsort((right_indicies, left_indicies))
+    return left_indicies[pair_order], right_indicies[pair_order]
+
+
+def merge_flight_pairs(left_df, right_df, on, left_indicies, right_indicies):
+    """
+    Merge pairs of rows of two DataFrames in the same format as pandas merge.
+
+    Parameters
+    ----------
+    left_df, right_df: pandas DataFrames
+        The flights to merge.
+
+    on: a string or a list of strings
+        The name(s) of the key column(s), which are only output once.
+
+    left_indicies, right_indicies: numpy int64 arrays
+        The positions of the pairs of rows to merge.
+
+    Returns
+    -------
+    A DataFrame of the merged rows, with the '_x' and '_y' suffixes on the
+    names of the other columns that are in both DataFrames.
+    """
+    on = [on] if isinstance(on, str) else list(on)
+    left_rows = left_df.iloc[left_indicies].reset_index(drop=True)
+    right_rows = right_df.drop(columns=on).iloc[right_indicies].reset_index(drop=True)
+
+    common_columns = set(left_rows.columns) & set(right_rows.columns)
+    left_rows.columns = [(name + '_x') if name in common_columns else name
+                         for name in left_rows.columns]
+    right_rows.columns = [(name + '_y') if name in common_columns else name
+                          for name in right_rows.columns]
+    return pd.concat([left_rows, right_rows], axis=1)
+
+
+def merge_overlapping_flights(left_df, right_df, on):
+    """
+    Merge the flights with the same key values whose periods overlap.
+
+    It is equivalent to:
+        merge_df = pd.merge(left_df, right_df, on=on)
+        merge_df.loc[(merge_df.PERIOD_START_x <= merge_df.PERIOD_FINISH_y) &
+                     (merge_df.PERIOD_START_y <= merge_df.PERIOD_FINISH_x)]
+    except that flights with null key values are not matched and the rows
+    are ordered by left flight.
+
+    Parameters
+    ----------
+    left_df, right_df: pandas DataFrames
+        The flights, with PERIOD_START and PERIOD_FINISH columns.
+
+    on: a string or a list of strings
+        The name(s) of the key column(s).
+
+    Returns
+    -------
+    A DataFrame of the merged flights.
+    """
+    left_codes, right_codes = factorize_keys(left_df, right_df, on)
+    left_starts = datetimes_to_ns(left_df['PERIOD_START'])
+    left_finishes = datetimes_to_ns(left_df['PERIOD_FINISH'])
+    right_starts = datetimes_to_ns(right_df['PERIOD_START'])
+    right_finishes = datetimes_to_ns(right_df['PERIOD_FINISH'])
+
+    # Don't match flights without valid times
+    nat = np.iinfo(np.int64).min
+    left_codes[(left_starts == nat) | (left_finishes == nat)] = -1
+    right_codes[(right_starts == nat) | (right_finishes == nat)] = -1
+
+    left_indicies, right_indicies = \
+        find_overlapping_intervals(left_codes, left_starts, left_finishes,
+                                   right_codes, right_starts, right_finishes)
+    return merge_flight_pairs(left_df, right_df, on, left_indicies, right_indicies)
+
+
+def merge_consecutive_flights(prev_df, next_df, on, max_time_difference):
+    """
+    Merge the previous and next flights with the same key values where the
+    next flight starts within max_time_difference of the end of the
+    previous flight.
+
+    It is equivalent to:
+        merge_df = pd.merge(prev_df, next_df, on=on)
+        merge_df.loc[((merge_df.PERIOD_START_y - merge_df.PERIOD_FINISH_x) /
+                      np.timedelta64(1, 's')) < max_time_difference]
+    except that flights with null key values are not matched and the rows
+    are ordered by previous flight.
+
+    Parameters
+    ----------
+    prev_df, next_df: pandas DataFrames
+        The flights, with PERIOD_START and PERIOD_FINISH columns.
+
+    on: a string or a list of strings
+        The name(s) of the key column(s).
+
+    max_time_difference: float
+        The maximum time between the flights [Seconds].
+
+    Returns
+    -------
+    A DataFrame of the merged flights.
+    """
+    prev_codes, next_codes = factorize_keys(prev_df, next_df, on)
+    prev_finishes = datetimes_to_ns(prev_df['PERIOD_FINISH'])
+    next_starts = datetimes_to_ns(next_df['PERIOD_START'])
+
+    nat = np.iinfo(np.int64).min
+    prev_codes[prev_finishes == nat] = -1
+    next_codes[next_starts == nat] = -1
+
+    # The next flight must start before the end of the previous flight plus
+    # max_time_difference, i.e. each previous flight is an interval from the
+    # earliest time until max_time_difference after its finish and each
+    # next flight is an interval at its start time.
+    max_delta = int(np.ceil(max_time_difference * NS_PER_SECOND)) - 1
+    prev_starts = np.full(len(prev_df), nat + 1, dtype=np.int64)
+    prev_limits = prev_finishes + max_delta
+
+    left_indicies, right_indicies = \
+        find_overlapping_intervals(prev_codes, prev_starts, prev_limits,
+                                   next_codes, next_starts, next_starts)
+    return merge_flight_pairs(prev_df, next_df, on, left_indicies, right_indicies)
+
+
+class DisjointSet:
+    """
+    A disjoint-set (union-find) of the integers from zero to count - 1.
+
+    It groups matched flights: each flight is an integer and matching two
+    flights unites their groups. Groups are merged by size and paths are
+    compressed, so chains of matches resolve in near constant time.
+    """
+    __slots__ = ('__parents', '__sizes')
+
+    def __init__(self, count):
+        """
+        Create a DisjointSet of count integers, each in its own group.
+        """
+        self.__parents = list(range(count))
+        self.__sizes = [1] * count
+
+    def __len__(self):
+        return len(self.__parents)
+
+    def find(self, item):
+        """
+        Find the root of the group containing item.
+
+        Parameters
+        ----------
+        item: int
+            The item.
+
+        Returns
+        -------
+        The root item of the group.
+        """
+        parents = self.__parents
+        root = item
+        while parents[root] != root:
+            root = parents[root]
+
+        # Compress the path to the root
+        while parents[item] != root:
+            parents[item], item = root, parents[item]
+
+        return root
+
+    def union(self, a, b):
+        """
+        Unite the groups containing items a and b.
+
+        Returns
+        -------
+        True if the groups were merged, False if a and b were in the same group.
+        """
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return False
+
+        if self.__sizes[a] < self.__sizes[b]:
+            a, b = b, a
+        self.__parents[b] = a
+        self.__sizes[a] += self.__sizes[b]
+        return True
+
+    def roots(self):
+        """
+        The roots of the groups of all of the items.
+
+        Returns
+        -------
+        A numpy array of the root of each item.
+        """
+        parents = np.array(self.__parents, dtype=np.int64)
+        grandparents = parents[parents]
+        while (grandparents != parents).any():
+            parents = grandparents
+            grandparents = parents[parents]
+
+        self.__parents = parents.tolist()
+        return parents
+
+
+def generate_uuids(count):
+    """
+    Generate random (version 4) UUIDs in bulk.
+
+    Parameters
+    ----------
+    count: int
+        The number of UUIDs to generate.
+
+    Returns
+    -------
+    A list of count UUIDs.
+    """
+    data = os.urandom(16 * count)
+    return [uuid.UUID(bytes=data[i:i + 16], version=4)
+            for i in range(0, 16 * count, 16)]
+
+
+def allocate_group_ids(disjoint_set):
+    """
+    Allocate a new UUID to each group of a DisjointSet.
+
+    Parameters
+    ----------
+    disjoint_set: DisjointSet
+        The groups of items.
+
+    Returns
+    -------
+    A numpy array of the UUID of the group of each item.
+    """
+    _, groups = np.unique(disjoint_set.roots(), return_inverse=True)
+    group_ids = np.empty(groups.max() + 1 if len(groups) else 0, dtype=object)
+    group_ids[:] = generate_uuids(len(group_ids))
+    return group_ids[groups]
@@ -0,0 +1,104 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Functions to read a text file in blocks of whole lines and to convert the
+blocks in parallel.
+
+A file is split into byte ranges that end on line boundaries, so each block
+can be parsed independently, e.g. by pandas.read_csv, in a worker process.
+The file is read (and decompressed) by the calling process, the blocks are
+converted by the worker processes and the results are returned in file order.
+
+Note: the lines of the file must not contain quoted line ends.
+"""
+
+import io
+import concurrent.futures as cf
+from collections import deque
+
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+""" The default size of a block of lines to convert at a time [Bytes]. """
+
+BLOCKS_PER_PROCESS = 2
+""" The maximum number of blocks in progress per process. """
+
+
+def read_line_blocks(file, blocksize=DEFAULT_BLOCK_SIZE):
+    """
+    Read a binary file in blocks of whole lines.
+
+    Parameters
+    ----------
+    file: a binary file object
+        The file to read, from its current position.
+
+    blocksize: int
+        The size of the blocks to read, a block is extended to the end of
+        its last line [Bytes].
+
+    Returns
+    -------
+    A generator of bytes objects of the blocks, in file order.
+    """
+    remainder = b''
+    data = file.read(blocksize)
+    while data:
+        data = remainder + data
+        end = data.rfind(b'\n') + 1
+        if end:
+            yield data[:end]
+        remainder = data[end:]
+        data = file.read(blocksize)
+
+    if remainder:
+        yield remainder
+
+
+def block_reader(block):
+    """ A file object to read a block of lines from, e.g. by pandas.read_csv. """
+    return io.BytesIO(block)
+
+
+def map_line_blocks(function, blocks, processes=1, initializer=None, initargs=()):
+    """
+    Convert blocks of lines, using multiple processes.
+
+    Parameters
+    ----------
+    function: a function
+        The function to convert a block, it must be picklable,
+        i.e. defined at the top level of a module.
+
+    blocks: an iterable of bytes objects
+        The blocks of lines, see read_line_blocks.
+
+    processes: int
+        The number of processes to use, default 1: the calling process.
+
+    initializer, initargs: a function and a tuple
+        A function to call with initargs in each process before it converts
+        any blocks, e.g. to set the data shared by the blocks.
+
+    Returns
+    -------
+    A generator of the results of function for each block, in block order.
+    """
+    if processes <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for block in blocks:
+            yield function(block)
+        return
+
+    # Limit the blocks in progress, to limit the memory used
+    with cf.ProcessPoolExecutor(max_workers=processes, initializer=initializer,
+                                initargs=initargs) as executor:
+        futures = deque()
+        for block in blocks:
+            futures.append(executor.submit(function, block))
+            if len(futures) >= BLOCKS_PER_PROCESS * processes:
+                yield futures.popleft().result()
+
+        while futures:
+            yield futures.popleft().result()
@@ -0,0 +1,351 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Metrics of the stages of the data processing pipeline.
+
+The metrics of a stage are: its wall and CPU times, the number of rows
+that it read and wrote, the number of bytes that it read and wrote and its
+peak resident set size (RSS).
+
+The apps functions and scripts tasks are decorated with measure_stage, which
+appends a record of the metrics of each call to a csv file in the current
+directory, alongside the files that the stage produced.
+Within a stage, the apps report the number of rows that they read and wrote
+by calling count_rows_in and count_rows_out.
+"""
+
+import os
+import time
+import errno
+import json
+import resource
+import functools
+from datetime import datetime
+import pandas as pd
+from pru.trajectory_fields import STAGE_METRICS_FIELDS
+from pru.logger import logger
+
+log = logger(__name__)
+
+STAGE_METRICS_FILENAME_ENV = 'STAGE_METRICS_FILENAME'
+""" The name of the environment variable to override the metrics filename. """
+
+DEFAULT_STAGE_METRICS_FILENAME = 'stage_metrics.csv'
+""" The default name of the stage metrics file. """
+
+DEFAULT_RUN_REPORT_FILENAME = 'stage_metrics_report.json'
+""" The default name of the json run report file. """
+
+PROC_IO_FILENAME = '/proc/self/io'
+""" The Linux file containing the I/O counts of the current process. """
+
+PROC_STATUS_FILENAME = '/proc/self/status'
+""" The Linux file containing the status of the current process. """
+
+PROC_CLEAR_REFS_FILENAME = '/proc/self/clear_refs'
+""" The Linux file to reset the peak RSS of the current process. """
+
+_active_stages = []
+""" The stack of stages running in this process. """
+
+
+def stage_metrics_filename():
+    """ The name of the file to write stage metrics to. """
+    return os.environ.get(STAGE_METRICS_FILENAME_ENV,
+                          DEFAULT_STAGE_METRICS_FILENAME)
+
+
+def read_io_counts():
+    """
+    Read the number of bytes read and written by the current process.
+
+    Returns
+    -------
+    A tuple of the bytes read and written, or (None, None) if the counts are
+    not available on this platform.
+    """
+    try:
+        counts = {}
+        with open(PROC_IO_FILENAME, 'r') as file:
+            for line in file:
+                key, value = line.split(':')
+                counts[key] = int(value)
+        return counts['rchar'], counts['wchar']
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS of the current process, if the platform supports it.
+
+    Returns
+    -------
+        True if the peak RSS was reset, False otherwise.
+    """
+    try:
+        with open(PROC_CLEAR_REFS_FILENAME, 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss():
+    """
+    Read the peak RSS of the current process.
+
+    Returns
+    -------
+    The peak RSS [kB].
+    """
+    try:
+        with open(PROC_STATUS_FILENAME, 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # Note: ru_maxrss is in kB on Linux but bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageMetrics:
+    """
+    The metrics of a pipeline stage.
+    """
+    __slots__ = ('stage', 'start_time', 'wall_time', 'cpu_time',
+                 'rows_in', 'rows_out', 'bytes_read', 'bytes_written',
+                 'peak_rss', 'error_code',
+                 '_start_counter', '_start_cpu', '_start_io')
+
+    def __init__(self, stage):
+        'StageMetrics constructor'
+        self.stage = stage
+        self.start_time = datetime.utcnow()
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_read = None
+        self.bytes_written = None
+        self.peak_rss = None
+        self.error_code = 0
+        self._start_counter = 0.0
+        self._start_cpu = 0.0
+        self._start_io = (None, None)
+
+    def start(self):
+        """ Start measuring the stage. """
+        # Don't reset the peak RSS of an enclosing stage
+        if not _active_stages:
+            reset_peak_rss()
+        self._start_io = read_io_counts()
+        self._start_cpu = time.process_time()
+        self._start_counter = time.perf_counter()
+
+    def finish(self):
+        """ Finish measuring the stage. """
+        self.wall_time = time.perf_counter() - self._start_counter
+        self.cpu_time = time.process_time() - self._start_cpu
+        bytes_read, bytes_written = read_io_counts()
+        if bytes_read is not None and self._start_io[0] is not None:
+            self.bytes_read = bytes_read - self._start_io[0]
+            self.bytes_written = bytes_written - self._start_io[1]
+        self.peak_rss = read_peak_rss()
+
+    def __repr__(self):
+        return '{},{}Z,{:.3f},{:.3f},{},{},{},{},{},{}'.format(
+            self.stage, self.start_time.isoformat(timespec='seconds'),
+            self.wall_time, self.cpu_time, self.rows_in, self.rows_out,
+            '' if self.bytes_read is None else self.bytes_read,
+            '' if self.bytes_written is None else self.bytes_written,
+            '' if self.peak_rss is None else self.peak_rss,
+            self.error_code)
+
+
+def count_rows_in(count):
+    """
+    Add to the number of rows read by the current stage.
+
+    Parameters
+    ----------
+    count: int
+        The number of rows read.
+    """
+    if _active_stages:
+        _active_stages[-1].rows_in += int(count)
+
+
+def count_rows_out(count):
+    """
+    Add to the number of rows written by the current stage.
+
+    Parameters
+    ----------
+    count: int
+        The number of rows written.
+    """
+    if _active_stages:
+        _active_stages[-1].rows_out += int(count)
+
+
+def write_stage_metrics(metrics, filename=None):
+    """
+    Append a stage metrics record to a csv file.
+
+    Parameters
+    ----------
+    metrics: StageMetrics
+        The metrics of the stage.
+
+    filename: string
+        The name of the metrics file, default None: stage_metrics_filename().
+    """
+    if filename is None:
+        filename = stage_metrics_filename()
+
+    try:
+        is_new_file = not os.path.exists(filename)
+        with open(filename, 'a') as file:
+            if is_new_file:
+                file.write(STAGE_METRICS_FIELDS)
+            # A single write, so that records from concurrent processes
+            # are not interleaved
+            file.write(repr(metrics) + '\n')
+    except OSError:
+        log.error('could not write stage metrics to file: %s', filename)
+
+
+def result_error_code(result):
+    """
+    The errno error code of a stage function result.
+
+    Stage functions either return an errno error code (zero if successful),
+    or a boolean success flag.
+
+    Returns
+    -------
+    An errno error code, zero if successful.
+    """
+    if isinstance(result, bool):
+        return 0 if result else errno.EIO
+    return result if isinstance(result, int) else 0
+
+
+def measure_stage(function):
+    """
+    A decorator to measure and record the metrics of a stage function.
+
+    Parameters
+    ----------
+    function: function
+        The stage function.
+
+    Returns
+    -------
+    The decorated function.
+    """
+    @functools.wraps(function)
+    def measured_function(*args, **kwargs):
+        metrics = StageMetrics(function.__name__)
+        metrics.start()
+        _active_stages.append(metrics)
+        try:
+            result = function(*args, **kwargs)
+            metrics.error_code = result_error_code(result)
+            return result
+        except Exception:
+            metrics.error_code = errno.EIO
+            raise
+        finally:
+            _active_stages.pop()
+            metrics.finish()
+            # Add the counts of a nested stage to the enclosing stage
+            if _active_stages:
+                _active_stages[-1].rows_in += metrics.rows_in
+                _active_stages[-1].rows_out += metrics.rows_out
+            write_stage_metrics(metrics)
+            log.info('%s metrics: wall_time: %.3fs, cpu_time: %.3fs, rows in: %d, '
+                     'rows out: %d, peak_rss: %s kB', metrics.stage,
+                     metrics.wall_time, metrics.cpu_time, metrics.rows_in,
+                     metrics.rows_out, metrics.peak_rss)
+
+    return measured_function
+
+
+def read_stage_metrics(filename=DEFAULT_STAGE_METRICS_FILENAME):
+    """
+    Read a stage metrics csv file.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the metrics file, default DEFAULT_STAGE_METRICS_FILENAME.
+
+    Returns
+    -------
+    A pandas DataFrame of the stage metrics.
+    """
+    return pd.read_csv(filename, parse_dates=['START_TIME'])
+
+
+def write_run_report(csv_filename=DEFAULT_STAGE_METRICS_FILENAME,
+                     json_filename=DEFAULT_RUN_REPORT_FILENAME, start_time=None):
+    """
+    Write a json run report summarising the records in a stage metrics file.
+
+    The report contains the records and the totals of each stage,
+    with the throughput of each stage in rows per second.
+    Since the stage metrics file accumulates the records of every run in its
+    directory, the records of a run are selected by its start_time.
+
+    Parameters
+    ----------
+    csv_filename: string
+        The name of the stage metrics file,
+        default DEFAULT_STAGE_METRICS_FILENAME.
+
+    json_filename: string
+        The name of the json report file, default DEFAULT_RUN_REPORT_FILENAME.
+
+    start_time: datetime
+        The UTC start time of the run, default None: report all of the records.
+        Only the records of stages that started at or after start_time
+        (to the second) are reported.
+
+    Returns
+    -------
+    An errno error_code if an error occured, zero otherwise.
+    """
+    try:
+        metrics_df = read_stage_metrics(csv_filename)
+    except (OSError, ValueError):
+        log.error('could not read stage metrics file: %s', csv_filename)
+        return errno.ENOENT
+
+    if start_time is not None:
+        run_start = pd.Timestamp(start_time.replace(microsecond=0), tz='UTC')
+        metrics_df = metrics_df.loc[metrics_df['START_TIME'] >= run_start]
+
+    totals_df = metrics_df.groupby('STAGE').agg(
+        {'WALL_TIME': 'sum', 'CPU_TIME': 'sum', 'ROWS_IN': 'sum',
+         'ROWS_OUT': 'sum', 'BYTES_READ': 'sum', 'BYTES_WRITTEN': 'sum',
+         'PEAK_RSS': 'max', 'ERROR_CODE': 'max'})
+    wall_times = totals_df['WALL_TIME'].where(totals_df['WALL_TIME'] > 0.0)
+    totals_df['ROWS_IN_PER_SECOND'] = (totals_df['ROWS_IN'] / wall_times).fillna(0.0)
+    totals_df['ROWS_OUT_PER_SECOND'] = (totals_df['ROWS_OUT'] / wall_times).fillna(0.0)
+
+    report = {'records': json.loads(metrics_df.to_json(
+                  orient='records', date_format='iso')),
+              'stages': json.loads(totals_df.to_json(orient='index'))}
+    try:
+        with open(json_filename, 'w') as file:
+            json.dump(report, file, indent=2)
+    except OSError:
+        log.error('could not write run report file: %s', json_filename)
+        return errno.EACCES
+
+    return 0
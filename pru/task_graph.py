@@ -0,0 +1,590 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+A dependency aware task graph for running pipeline stages.
+
+Each Task declares the files that it reads and writes, e.g. using the
+trajectory_files filename functions.
+A task depends on the tasks that write its input files and on any tasks that
+it explicitly requires.
+
+TaskGraph.run runs tasks concurrently as soon as their dependencies have
+completed, within a CPU and memory budget.
+The completion state of each task is written to a json file, so that a
+rerun skips tasks whose inputs and outputs are unchanged since they last ran.
+"""
+
+import os
+import errno
+import json
+import concurrent.futures as cf
+from pru.logger import logger
+
+log = logger(__name__)
+
+DEFAULT_TASK_CPUS = 1
+""" The default number of CPUs used by a task. """
+
+DEFAULT_TASK_MEMORY = 0.0
+""" The default memory used by a task [GB]. """
+
+
+def is_successful(result):
+    """
+    Whether a task function result indicates success.
+
+    Task functions either return an errno error code (zero if successful), like
+    the apps functions, or a boolean success flag, like the scripts.tasks
+    functions.
+    A task function that returns None is also deemed to be successful.
+
+    Parameters
+    ----------
+    result: int, bool or None
+        The value returned by the task function.
+
+    Returns
+    -------
+        True if the result indicates success, False otherwise.
+    """
+    if isinstance(result, bool):
+        return result
+    return (result is None) or (result == 0)
+
+
+def file_signature(filename):
+    """
+    The signature of a file: its modification time and size.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the file.
+
+    Returns
+    -------
+    A [modification time [nanoseconds], size [bytes]] list,
+    or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+
+def run_task_function(function, args, kwargs, directory=None):
+    """
+    Run a task function, in a directory if given.
+
+    Note: the directory is changed for the whole process, so tasks with a
+    directory must be run by a process executor.
+
+    Parameters
+    ----------
+    function: function
+        The task function.
+
+    args: tuple
+        The task function positional arguments.
+
+    kwargs: dict
+        The task function keyword arguments.
+
+    directory: string
+        The directory to run the task function in, default None.
+
+    Returns
+    -------
+    The result of the task function.
+    """
+    if directory is None:
+        return function(*args, **kwargs)
+
+    current_directory = os.getcwd()
+    os.chdir(directory)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        os.chdir(current_directory)
+
+
+class Task:
+    """
+    A task in a TaskGraph.
+
+    A task calls a function with arguments.
+    The function must be picklable, i.e. a module level function, if the
+    task is run by a process executor.
+    """
+    __slots__ = ('__name', '__function', '__args', '__kwargs',
+                 '__inputs', '__outputs', '__requires',
+                 '__cpus', '__memory', '__directory')
+
+    def __init__(self, name, function, *, args=(), kwargs={},
+                 inputs=[], outputs=[], requires=[],
+                 cpus=DEFAULT_TASK_CPUS, memory=DEFAULT_TASK_MEMORY,
+                 directory=None):
+        """
+        Task constructor.
+
+        Parameters
+        ----------
+        name: string
+            The unique name of the task.
+
+        function: function
+            The function to call.
+
+        args: tuple
+            The function positional arguments.
+
+        kwargs: dict
+            The function keyword arguments.
+
+        inputs: list of strings
+            The names of the files read by the function.
+
+        outputs: list of strings
+            The names of the files written by the function.
+
+        requires: list of strings
+            The names of other tasks that must complete before this task.
+
+        cpus: int
+            The number of CPUs used by the task, default 1.
+
+        memory: float
+            The peak memory used by the task [GB], default 0.0.
+
+        directory: string
+            The directory to run the task in, default None: the current
+            directory. Input and output filenames are relative to it.
+        """
+        self.__name = name
+        self.__function = function
+        self.__args = tuple(args)
+        self.__kwargs = dict(kwargs)
+        self.__inputs = list(inputs)
+        self.__outputs = list(outputs)
+        self.__requires = list(requires)
+        self.__cpus = cpus
+        self.__memory = memory
+        self.__directory = directory
+
+    @property
+    def name(self):
+        'Accessor for the name.'
+        return self.__name
+
+    @property
+    def function(self):
+        'Accessor for the function.'
+        return self.__function
+
+    @property
+    def args(self):
+        'Accessor for the args.'
+        return self.__args
+
+    @property
+    def kwargs(self):
+        'Accessor for the kwargs.'
+        return self.__kwargs
+
+    @property
+    def inputs(self):
+        'Accessor for the inputs.'
+        return self.__inputs
+
+    @property
+    def outputs(self):
+        'Accessor for the outputs.'
+        return self.__outputs
+
+    @property
+    def requires(self):
+        'Accessor for the requires.'
+        return self.__requires
+
+    @property
+    def cpus(self):
+        'Accessor for the cpus.'
+        return self.__cpus
+
+    @property
+    def memory(self):
+        'Accessor for the memory.'
+        return self.__memory
+
+    @property
+    def directory(self):
+        'Accessor for the directory.'
+        return self.__directory
+
+    def path(self, filename):
+        'The path of a task file relative to the current directory.'
+        return os.path.join(self.__directory, filename) \
+            if self.__directory else filename
+
+    def signatures(self):
+        """
+        The signatures of the task input and output files.
+
+        Returns
+        -------
+        A dict with 'inputs' and 'outputs' dicts of file signatures.
+        """
+        return {'inputs': {f: file_signature(self.path(f)) for f in self.inputs},
+                'outputs': {f: file_signature(self.path(f)) for f in self.outputs}}
+
+    def is_up_to_date(self, signatures):
+        """
+        Whether the task is up to date with its previous run.
+
+        Parameters
+        ----------
+        signatures: dict
+            The file signatures recorded when the task last succeeded, may be None.
+
+        Returns
+        -------
+            True if all of the task outputs exist and the input and output
+            file signatures are the same as the recorded signatures.
+        """
+        if not signatures:
+            return False
+
+        current = self.signatures()
+        return all(current['outputs'].values()) and (current == signatures)
+
+    def __repr__(self):
+        return 'Task({})'.format(self.__name)
+
+
+class TaskGraph:
+    """
+    A directed acyclic graph of Tasks.
+    """
+    __slots__ = ('__tasks', '__producers')
+
+    def __init__(self):
+        'TaskGraph constructor'
+        self.__tasks = {}
+        self.__producers = {}
+
+    @property
+    def tasks(self):
+        'Accessor for the tasks, a dict of Tasks by name.'
+        return self.__tasks
+
+    def add(self, task):
+        """
+        Add a task to the graph.
+
+        Parameters
+        ----------
+        task: Task
+            The task to add, its name and outputs must be unique in the graph.
+
+        Returns
+        -------
+        The task.
+        """
+        if task.name in self.__tasks:
+            raise ValueError('duplicate task name: {}'.format(task.name))
+
+        for filename in task.outputs:
+            path = os.path.normpath(task.path(filename))
+            if path in self.__producers:
+                raise ValueError('file: {} is output by tasks: {} and {}'.format(
+                    path, self.__producers[path], task.name))
+            self.__producers[path] = task.name
+
+        self.__tasks[task.name] = task
+        return task
+
+    def add_task(self, name, function, **kwargs):
+        """
+        Create a Task and add it to the graph.
+
+        See the Task constructor for the parameters.
+
+        Returns
+        -------
+        The task.
+        """
+        return self.add(Task(name, function, **kwargs))
+
+    def dependencies(self, task):
+        """
+        The names of the tasks that a task depends upon.
+
+        Parameters
+        ----------
+        task: Task
+            A task in the graph.
+
+        Returns
+        -------
+        A set of task names.
+        """
+        names = set()
+        for filename in task.inputs:
+            path = os.path.normpath(task.path(filename))
+            if path in self.__producers:
+                names.add(self.__producers[path])
+
+        for name in task.requires:
+            if name not in self.__tasks:
+                raise ValueError('task: {} requires unknown task: {}'.format(
+                    task.name, name))
+            names.add(name)
+
+        names.discard(task.name)
+        return names
+
+    def sorted_tasks(self):
+        """
+        The task names in a dependency order.
+
+        Raises a ValueError if the graph contains a cycle.
+
+        Returns
+        -------
+        A list of task names, each after the tasks it depends upon.
+        """
+        dependencies = {name: self.dependencies(task)
+                        for name, task in self.__tasks.items()}
+        ordered = []
+        completed = set()
+        while len(ordered) < len(dependencies):
+            ready = [name for name, deps in dependencies.items()
+                     if (name not in completed) and (deps <= completed)]
+            if not ready:
+                cycle = sorted(set(dependencies) - completed)
+                raise ValueError('task graph contains a cycle: {}'.format(cycle))
+            ordered += ready
+            completed.update(ready)
+
+        return ordered
+
+    def run(self, *, cpu_budget=os.cpu_count(), memory_budget=None,
+            state_filename=None, executor=None):
+        """
+        Run the tasks in the graph.
+
+        Tasks are run as soon as the tasks that they depend upon have succeeded,
+        provided that the total cpus and memory of the running tasks are
+        within the budgets.
+        A task that exceeds a budget on its own is run when no other tasks
+        are running.
+
+        If a state_filename is given, a task is skipped if it succeeded in a
+        previous run, none of its dependencies have run since and the
+        signatures of its input and output files are unchanged.
+
+        Parameters
+        ----------
+        cpu_budget: int
+            The maximum number of CPUs used by running tasks,
+            default: the number of CPUs.
+
+        memory_budget: float
+            The maximum memory used by running tasks [GB], default None: unlimited.
+
+        state_filename: string
+            The name of the json file to persist the task completion state,
+            default None: do not persist the state.
+
+        executor: concurrent.futures.Executor
+            The executor to run tasks, default None: a ProcessPoolExecutor
+            with cpu_budget workers.
+
+        Returns
+        -------
+        A dict of task errno error codes by task name, zero if successful.
+        Tasks that were not run because a dependency failed have the
+        error code errno.ECANCELED.
+        """
+        order = self.sorted_tasks()
+        dependencies = {name: self.dependencies(self.__tasks[name])
+                        for name in order}
+        state = read_task_state(state_filename)
+
+        owns_executor = executor is None
+        if owns_executor:
+            executor = cf.ProcessPoolExecutor(max_workers=cpu_budget)
+
+        results = {}
+        executed = set()
+        running = {}
+        running_cpus = 0
+        running_memory = 0.0
+        try:
+            pending = list(order)
+            while pending or running:
+                progressed = False
+                for name in list(pending):
+                    deps = dependencies[name]
+                    if any(results.get(dep, 0) for dep in deps):
+                        pending.remove(name)
+                        results[name] = errno.ECANCELED
+                        log.error('task: %s cancelled', name)
+                        progressed = True
+                        continue
+
+                    if not (deps <= set(results)):
+                        continue
+
+                    task = self.__tasks[name]
+                    if not (deps & executed) and \
+                            task.is_up_to_date(state.get(name)):
+                        pending.remove(name)
+                        results[name] = 0
+                        log.info('task: %s is up to date', name)
+                        progressed = True
+                        continue
+
+                    cpus = min(task.cpus, cpu_budget)
+                    is_within_budget = \
+                        (running_cpus + cpus <= cpu_budget) and \
+                        ((memory_budget is None) or
+                         (running_memory + task.memory <= memory_budget))
+                    if running and not is_within_budget:
+                        continue
+
+                    log.info('task: %s started', name)
+                    future = executor.submit(run_task_function, task.function,
+                                             task.args, task.kwargs,
+                                             task.directory)
+                    running[future] = name
+                    running_cpus += cpus
+                    running_memory += task.memory
+                    pending.remove(name)
+                    progressed = True
+
+                if progressed or not running:
+                    continue
+
+                done, _ = cf.wait(running, return_when=cf.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    task = self.__tasks[name]
+                    running_cpus -= min(task.cpus, cpu_budget)
+                    running_memory -= task.memory
+                    executed.add(name)
+
+                    error_code = task_error_code(name, future)
+                    results[name] = error_code
+                    if error_code:
+                        state.pop(name, None)
+                    else:
+                        log.info('task: %s succeeded', name)
+                        state[name] = task.signatures()
+                    write_task_state(state_filename, state)
+        finally:
+            if owns_executor:
+                executor.shutdown()
+
+        return results
+
+
+def task_error_code(name, future):
+    """
+    The errno error code of a completed task.
+
+    Parameters
+    ----------
+    name: string
+        The name of the task.
+
+    future: concurrent.futures.Future
+        The completed future of the task function.
+
+    Returns
+    -------
+    Zero if the task succeeded, an errno error code otherwise.
+    A task function that calls sys.exit returns its exit code.
+    """
+    try:
+        result = future.result()
+    except SystemExit as exit_error:
+        # Some task functions call sys.exit, e.g. the scripts.processes
+        result = exit_error.code
+        if not isinstance(result, (int, type(None))):
+            log.error('task: %s exited: %s', name, result)
+            return errno.EIO
+    except Exception:
+        log.exception('task: %s raised an exception', name)
+        return errno.EIO
+
+    if is_successful(result):
+        return 0
+
+    log.error('task: %s failed, result: %s', name, result)
+    return result if (isinstance(result, int) and
+                      not isinstance(result, bool)) else errno.EIO
+
+
+def read_task_state(filename):
+    """
+    Read the task completion state from a json file.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the json file, may be None.
+
+    Returns
+    -------
+    A dict of task file signatures by task name, empty if the file could
+    not be read.
+    """
+    if filename and os.path.exists(filename):
+        try:
+            with open(filename, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            log.warning('could not read task state file: %s', filename)
+
+    return {}
+
+
+def write_task_state(filename, state):
+    """
+    Write the task completion state to a json file.
+
+    The state is written to a temporary file which then replaces the file,
+    so that the state file is always complete.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the json file, may be None.
+
+    state: dict
+        A dict of task file signatures by task name.
+    """
+    if filename:
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'w') as file:
+            json.dump(state, file, indent=1, sort_keys=True)
+        os.replace(temp_filename, filename)
+
+
+def count_failed_tasks(results):
+    """
+    Count the number of tasks which did not succeed.
+
+    Parameters
+    ----------
+    results: dict
+        A dict of task errno error codes by task name, from TaskGraph.run.
+
+    Returns
+    -------
+    The number of failed or cancelled tasks.
+    """
+    return sum(1 for error_code in results.values() if error_code)
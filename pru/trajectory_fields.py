@@ -38,6 +38,10 @@ AIRSPACE_INTERSECTION_FIELDS = 'FLIGHT_ID,SECTOR_ID,IS_EXIT,LAT,LON,ALT,TIME,DIS
 AIRPORT_INTERSECTION_FIELDS = 'FLIGHT_ID,AIRPORT_ID,RADIUS,IS_DESTINATION,LAT,LON,ALT,TIME,DISTANCE\n'
 """ The fields of an airspace intersections record. """
 
+STAGE_METRICS_FIELDS = 'STAGE,START_TIME,WALL_TIME,CPU_TIME,ROWS_IN,ROWS_OUT,' \
+    'BYTES_READ,BYTES_WRITTEN,PEAK_RSS,ERROR_CODE\n'
+""" The fields of a pipeline stage metrics record. """
+
 CSV_FILE_EXTENSION = '.csv'
 """ The file extension of a comma separated variables (csv) file. """
 
@@ -47,6 +51,12 @@ JSON_FILE_EXTENSION = '.json'
 BZ2_FILE_EXTENSION = '.bz2'
 """ The file extension of a bz2 compressed file. """
 
+NPZ_FILE_EXTENSION = '.npz'
+""" The file extension of a numpy compressed arrays file. """
+
+NPY_FILE_EXTENSION = '.npy'
+""" The file extension of a numpy array file. """
+
 
 @unique
 class FlightEventType(IntEnum):
@@ -92,6 +102,24 @@ def iso8601_previous_day(datestring):
     return prev_date.strftime(ISO8601_DATE_FORMAT)
 
 
+def iso8601_next_day(datestring):
+    """ Return the date string of the next day of a ISO 8601 date string. """
+    date = iso8601_date_parser(datestring)
+    next_date = date + timedelta(1)
+    return next_date.strftime(ISO8601_DATE_FORMAT)
+
+
+def iso8601_date_range(from_datestring, to_datestring):
+    """
+    Return the list of ISO 8601 date strings from from_datestring to
+    to_datestring inclusive.
+    """
+    from_date = iso8601_date_parser(from_datestring)
+    days = (iso8601_date_parser(to_datestring) - from_date).days
+    return [(from_date + timedelta(day)).strftime(ISO8601_DATE_FORMAT)
+            for day in range(days + 1)]
+
+
 def compact_date(date):
     """
     Converts an ISO 8601 format date string into a compact date.
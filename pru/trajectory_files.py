@@ -6,7 +6,7 @@ Functions to create names of Eurocontrol PRU refined trajectory files.
 """
 
 from pru.trajectory_fields import CSV_FILE_EXTENSION, JSON_FILE_EXTENSION, \
-    compact_date, iso8601_previous_day, create_iso8601_csv_filename
+    NPZ_FILE_EXTENSION, compact_date, iso8601_previous_day, create_iso8601_csv_filename
 
 # Default file names
 DEFAULT_AIRPORTS_FILENAME = 'airports.csv'
@@ -42,6 +42,8 @@ MATCHING_IDS = 'matching_ids'
 TRAJECTORIES = 'trajectories'
 TRAJ_METRICS = 'traj_metrics'
 SYNTH_POSITIONS = 'synth_positions'
+BOUNDARY_HEAD = 'boundary_head'
+BOUNDARY_TAIL = 'boundary_tail'
 
 INTERSECTIONS = 'intersections'
 SECTOR = 'sector'
@@ -54,6 +56,7 @@ USER_INTERSECTIONS = 'user_intersections'
 
 # Misc
 PREV_DAY = 'prev_day'
+EVENT_INDEX = 'event_index'
 NEW_CPR_FR24 = 'new_cpr_fr24'
 RAW_CPR_FR24 = 'raw_cpr_fr24'
 RAW = 'raw'
@@ -171,6 +174,11 @@ def create_apds_positions_filename(from_date, to_date):
     return '_'.join([APDS, POSITIONS, from_date, to_date + CSV_FILE_EXTENSION])
 
 
+def create_apds_event_index_filename(from_date, to_date):
+    """ Create a filename string for a apds event index file. """
+    return '_'.join([APDS, EVENT_INDEX, from_date, to_date + NPZ_FILE_EXTENSION])
+
+
 def create_convert_apds_filenames(from_date, to_date):
     """ Create the list of filenames output by convert_apt_data.py. """
     return [create_apds_flights_filename(from_date, to_date),
@@ -223,6 +231,16 @@ def create_matching_ids_filename(process, datestring):
     return '_'.join([process, MATCHING_IDS, datestring + CSV_FILE_EXTENSION])
 
 
+def create_boundary_state_filename(process, datestring, *, is_tail):
+    """
+    Create a filename string for the head or tail boundary state file of a day.
+    Note: process is the name of the process that created the flights file:
+    CPR_FR24, etc.
+    """
+    boundary = BOUNDARY_TAIL if is_tail else BOUNDARY_HEAD
+    return '_'.join([process, boundary, datestring + NPZ_FILE_EXTENSION])
+
+
 def create_match_cpr_adsb_output_filenames(datestring):
     """ Create the list of filenames for match_cpr_adsb_trajectories.py. """
     return [create_matching_ids_filename(CPR, datestring),
@@ -240,7 +258,8 @@ def create_merge_cpr_adsb_output_filenames(datestring):
     """ Create the list of filenames output by merge_cpr_adsb_trajectories.py. """
     return [create_flights_filename(CPR_FR24, datestring),
             create_raw_positions_filename(CPR_FR24, datestring),
-            create_events_filename(CPR_FR24, datestring)]
+            create_events_filename(CPR_FR24, datestring),
+            create_boundary_state_filename(CPR_FR24, datestring, is_tail=False)]
 
 
 def create_match_consecutive_day_input_filenames(datestring):
@@ -252,6 +271,16 @@ def create_match_consecutive_day_input_filenames(datestring):
             create_positions_filename(CPR_FR24, datestring)]
 
 
+def create_match_consecutive_day_boundary_filenames(datestring):
+    """
+    Create the list of boundary state filenames for
+    match_consecutive_day_trajectories.py.
+    """
+    prev_datestring = iso8601_previous_day(datestring)
+    return [create_boundary_state_filename(CPR_FR24, prev_datestring, is_tail=True),
+            create_boundary_state_filename(CPR_FR24, datestring, is_tail=False)]
+
+
 def create_match_overnight_flights_input_filenames(datestring):
     """Create the list of filenames for match_overnight_flights.py."""
     prev_datestring = iso8601_previous_day(datestring)
@@ -3,21 +3,73 @@
 
 """
 Common trajectory merging functions.
+
+Items (positions or events) files are sorted by flight id and time, so
+merging items files does not require concatenating and sorting them.
+Instead, the runs of items of each flight are found in each file and the
+runs are sorted by (new) flight id. The runs of each flight are then read
+and merged by time, so that only the items of one flight are in memory
+at a time.
 """
 
+import re
+import bz2
+import csv
+import heapq
+import itertools
 import pandas as pd
+from pru.trajectory_fields import has_bz2_extension
+
+DEFAULT_CHUNK_SIZE = 100000
+""" The default number of rows to read from a file at a time. """
+
+ISO8601_DATETIME_PATTERN = re.compile(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(\.\d+)?Z$')
+""" An ISO 8601 date time string, with or without fractional seconds. """
+
+
+def iso8601_datetime_key(value):
+    """
+    A sort key of an ISO 8601 date time string, with or without fractional
+    seconds, see ISO8601_DATETIME_FORMAT and ISO8601_DATETIME_US_FORMAT.
+
+    Raises a ValueError if value is not an ISO 8601 date time string.
+
+    Returns
+    -------
+    A tuple of the date and time to the second and the fractional seconds.
+    """
+    match = ISO8601_DATETIME_PATTERN.match(value)
+    if match is None:
+        raise ValueError('invalid ISO 8601 date time: ' + value)
+    fraction = match.group(2)
+    return match.group(1), float(fraction) if fraction else 0.0
 
 
-def read_dataframe_with_new_ids(filename, ids_df, *, date_fields=['TIME']):
+def read_dataframe_with_new_ids(filename, ids_df, *, date_fields=['TIME'],
+                                chunksize=DEFAULT_CHUNK_SIZE):
     """
     Reads items (flights, events or positions) from filename into a pandas
     Dataframe and merges with ids_df Dataframe on FLIGHT_ID.
 
+    The file is read in chunks of chunksize rows and the items without new
+    ids are dropped from each chunk, so only the items with new ids are held
+    in memory.
+
     Returns a pandas DataFrame containing items (events or positions) with the
-    new flight ids in the NEW_FLIGHT_ID column.
+    new flight ids in the NEW_FLIGHT_ID column, in the order of the file.
     """
-    df = pd.read_csv(filename, parse_dates=date_fields, memory_map=True)
-    return pd.merge(ids_df, df, left_index=True, right_on='FLIGHT_ID')
+    def merge_chunk(df):
+        # Note: an inner merge preserves the order of the left keys
+        df = pd.merge(df, ids_df, left_on='FLIGHT_ID', right_index=True)
+        return df[list(ids_df.columns) + list(df.columns[:-len(ids_df.columns)])]
+
+    chunks = [merge_chunk(df) for df in
+              pd.read_csv(filename, parse_dates=date_fields, chunksize=chunksize,
+                          memory_map=True)]
+    if not chunks:
+        return merge_chunk(pd.read_csv(filename, parse_dates=date_fields))
+
+    return pd.concat(chunks, ignore_index=True)
 
 
 def replace_old_flight_ids(df):
@@ -26,3 +78,357 @@ def replace_old_flight_ids(df):
     """
     df.drop(labels='FLIGHT_ID', axis='columns', inplace=True)
     df.rename(index=str, columns={'NEW_FLIGHT_ID': 'FLIGHT_ID'}, inplace=True)
+
+
+def open_items_file(filename):
+    """
+    Open a csv items file for binary reading, decompressing bz2 files.
+    """
+    return bz2.open(filename, 'rb') if has_bz2_extension(filename) \
+        else open(filename, 'rb')
+
+
+def read_flight_id(line):
+    """
+    Read the flight id of a line of a csv items file, its first field.
+
+    Raises a ValueError if the line does not contain a comma.
+    """
+    index = line.find(b',')
+    if index < 0:
+        raise ValueError('invalid items line: ' + repr(line))
+    return line[:index]
+
+
+def find_flight_item_runs(filename, new_ids=None):
+    """
+    Find the runs of items of each flight in a csv items file.
+
+    Note: FLIGHT_ID must be the first field of the file.
+    Blank lines are ignored, a ValueError is raised for a line without a
+    comma.
+
+    Parameters
+    ----------
+    filename: string
+        The name of the items file.
+
+    new_ids: a dict, optional
+        A map from the flight ids in the file to new flight ids.
+        Runs of flights that are not in new_ids are ignored.
+
+    Returns
+    -------
+    The header fields of the file and a list of (flight id, offset, size)
+    tuples of the runs in the file, where flight id is the new flight id
+    if new_ids is given.
+    """
+    runs = []
+    with open_items_file(filename) as file:
+        header = file.readline()
+        fields = next(csv.reader([header.decode()]))
+        if not fields or (fields[0] != 'FLIGHT_ID'):
+            raise ValueError('FLIGHT_ID is not the first field of: ' + filename)
+
+        def add_run(flight_id, offset, size):
+            flight_id = flight_id.decode()
+            if new_ids is not None:
+                flight_id = new_ids.get(flight_id)
+            if flight_id is not None:
+                runs.append((flight_id, offset, size))
+
+        run_id = None
+        run_offset = offset = len(header)
+        for line in file:
+            if line.strip():
+                flight_id = read_flight_id(line)
+                if flight_id != run_id:
+                    if run_id is not None:
+                        add_run(run_id, run_offset, offset - run_offset)
+                    run_id = flight_id
+                    run_offset = offset
+            offset += len(line)
+
+        if run_id is not None:
+            add_run(run_id, run_offset, offset - run_offset)
+
+    return fields, runs
+
+
+def copy_flight_runs(input_filename, output_filename, get_flight_id,
+                     sort_buffer_size=0, *, select_lines=None):
+    """
+    Copy the runs of items of each flight from a csv items file to another,
+    changing their flight ids.
+
+    The file is copied a run at a time, so only one flight is in memory,
+    unless sort_buffer_size is set.
+
+    Note: FLIGHT_ID must be the first field of the file.
+    Blank lines are dropped, a ValueError is raised for a line without a
+    comma.
+
+    Parameters
+    ----------
+    input_filename, output_filename: strings
+        The names of the input and output items files.
+
+    get_flight_id: a function
+        A function from the flight id of a run to its output flight id,
+        or None to drop the run.
+
+    sort_buffer_size: int
+        If greater than zero, the runs are sorted by output flight id in
+        buffers of up to sort_buffer_size items before they are written.
+
+    select_lines: a function, optional
+        A function that is called with the output flight id and the lines
+        of each run that is copied, e.g. to keep the items of some flights.
+
+    Returns
+    -------
+    The number of items written.
+    """
+    items_count = 0
+    buffer = []
+    buffer_size = 0
+
+    def write_buffer(output_file):
+        buffer.sort(key=lambda run: run[0])
+        for flight_id, lines in buffer:
+            output_file.writelines(flight_id + line[line.find(b','):]
+                                   for line in lines)
+        buffer.clear()
+
+    with open_items_file(input_filename) as input_file, \
+            open(output_filename, 'wb') as output_file:
+        header = input_file.readline()
+        if not header.startswith(b'FLIGHT_ID,'):
+            raise ValueError('FLIGHT_ID is not the first field of: ' + input_filename)
+        output_file.write(header)
+
+        # runs of lines with the same flight id
+        item_lines = (line for line in input_file if line.strip())
+        for flight_id, lines in itertools.groupby(item_lines, key=read_flight_id):
+            new_flight_id = get_flight_id(flight_id.decode())
+            if new_flight_id is None:
+                continue
+
+            lines = list(lines)
+            if lines[-1][-1:] != b'\n':
+                lines[-1] += b'\n'
+            if select_lines is not None:
+                select_lines(new_flight_id, lines)
+            items_count += len(lines)
+            buffer.append((new_flight_id.encode(), lines))
+            buffer_size += len(lines)
+            if buffer_size >= sort_buffer_size:
+                write_buffer(output_file)
+                buffer_size = 0
+
+        write_buffer(output_file)
+
+    return items_count
+
+
+def relabel_flight_items(input_filename, output_filename, new_ids, *,
+                         sort_buffer_size=0):
+    """
+    Copy the items of the flights in new_ids from a csv items file to
+    another, replacing their flight ids with the new flight ids.
+
+    Items of flights that are not in new_ids are dropped.
+    The fields of the items are copied as text, see copy_flight_runs.
+
+    Parameters
+    ----------
+    input_filename, output_filename: strings
+        The names of the input and output items files.
+
+    new_ids: a dict
+        A map from the flight ids in the file to new flight ids,
+        see create_new_ids_map.
+
+    sort_buffer_size: int
+        If greater than zero, the items are sorted by new flight id in
+        buffers of up to sort_buffer_size items.
+
+    Returns
+    -------
+    The number of items written.
+    """
+    return copy_flight_runs(input_filename, output_filename, new_ids.get,
+                            sort_buffer_size)
+
+
+def remove_flight_items(input_filename, output_filename, flight_ids, *,
+                        select_lines=None):
+    """
+    Copy the items of the flights that are not in flight_ids from a csv
+    items file to another.
+
+    Parameters
+    ----------
+    input_filename, output_filename: strings
+        The names of the input and output items files.
+
+    flight_ids: a set of strings
+        The flight ids of the items to remove.
+
+    select_lines: a function, optional
+        A function that is called with the flight id and the lines of the
+        items of each flight that is copied, see copy_flight_runs.
+
+    Returns
+    -------
+    The number of items written.
+    """
+    return copy_flight_runs(input_filename, output_filename,
+                            lambda flight_id: None if flight_id in flight_ids
+                            else flight_id, select_lines=select_lines)
+
+
+def merge_flight_items(filenames, new_ids=None, *, time_field='TIME'):
+    """
+    Merge csv items files which are sorted by flight id and time.
+
+    The runs of items of each flight in the files are merged by time, so
+    that only the items of one flight are read at a time.
+
+    Note: the TIME values must be ISO 8601 date times, with or without
+    fractional seconds, a ValueError is raised when merging a flight with
+    an invalid time, see iso8601_datetime_key. Runs are read from bz2
+    files by seeking within the decompressed file, which is much slower
+    than reading csv files.
+
+    Parameters
+    ----------
+    filenames: a list of strings
+        The names of the items files, which must have the same fields.
+
+    new_ids: a list of dicts, optional
+        A map from the flight ids to new flight ids for each file,
+        or None where a file's flight ids are unchanged.
+
+    time_field: string
+        The name of the time field, default 'TIME'.
+
+    Returns
+    -------
+    The header fields of the files and a generator of (flight id, rows)
+    tuples in flight id order, where rows is a list of the items of the
+    flight in time order, each item being a list of its csv fields.
+    Note: the rows contain the original FLIGHT_ID of each item.
+    """
+    if new_ids is None:
+        new_ids = [None] * len(filenames)
+
+    fields = None
+    runs = []
+    for index, (filename, file_ids) in enumerate(zip(filenames, new_ids)):
+        file_fields, file_runs = find_flight_item_runs(filename, file_ids)
+        if fields is None:
+            fields = file_fields
+        elif file_fields != fields:
+            raise ValueError('Fields do not match in file: ' + filename)
+
+        runs.extend((flight_id, index, offset, size)
+                    for flight_id, offset, size in file_runs)
+
+    # Sort the runs by flight id, file and position in the file
+    runs.sort()
+    time_index = fields.index(time_field)
+
+    def time_key(row):
+        return iso8601_datetime_key(row[time_index])
+
+    def read_run(file, offset, size):
+        file.seek(offset)
+        # Note: a run may contain blank lines
+        return [row for row in csv.reader(file.read(size).decode().splitlines())
+                if row]
+
+    def generate_flights():
+        files = [open_items_file(filename) for filename in filenames]
+        try:
+            index = 0
+            while index < len(runs):
+                flight_id = runs[index][0]
+                flight_runs = []
+                while (index < len(runs)) and (runs[index][0] == flight_id):
+                    _, file_index, offset, size = runs[index]
+                    flight_runs.append(read_run(files[file_index], offset, size))
+                    index += 1
+
+                if len(flight_runs) == 1:
+                    yield flight_id, flight_runs[0]
+                else:
+                    yield flight_id, list(heapq.merge(*flight_runs, key=time_key))
+        finally:
+            for file in files:
+                file.close()
+
+    return fields, generate_flights()
+
+
+def write_flight_items(file, fields, flights):
+    """
+    Write merged flight items to a csv file, replacing the FLIGHT_ID of each
+    item with the flight id of its flight.
+
+    Parameters
+    ----------
+    file: a text file
+        The file to write to.
+
+    fields: a list of strings
+        The header fields.
+
+    flights: an iterable of (flight id, rows) tuples
+        The items, see merge_flight_items.
+
+    Returns
+    -------
+    The number of items written.
+    """
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(fields)
+    items_count = 0
+    for flight_id, rows in flights:
+        for row in rows:
+            row[0] = flight_id
+        writer.writerows(rows)
+        items_count += len(rows)
+
+    return items_count
+
+
+def merge_flight_items_files(output_filename, filenames, new_ids=None):
+    """
+    Merge csv items files which are sorted by flight id and time into
+    output_filename, see merge_flight_items.
+
+    Returns
+    -------
+    The number of items written.
+    """
+    fields, flights = merge_flight_items(filenames, new_ids)
+    with open(output_filename, 'w', newline='') as file:
+        return write_flight_items(file, fields, flights)
+
+
+def create_new_ids_map(ids_df):
+    """
+    Create a map from old to new flight ids.
+
+    Parameters
+    ----------
+    ids_df: a pandas DataFrame
+        The ids DataFrame, with the old flight ids in the index and the new
+        flight ids in the NEW_FLIGHT_ID column.
+
+    Returns
+    -------
+    A dict from the old flight id strings to the new flight id strings.
+    """
+    return dict(zip(ids_df.index.astype(str), ids_df['NEW_FLIGHT_ID'].astype(str)))
@@ -0,0 +1,561 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+Vectorised trajectory match verification.
+
+The positions of the flights are converted to ECEF points once and stored
+in a FlightPositions object, indexed by flight id.
+compare_flight_positions then verifies a batch of candidate flight pairs at
+once, making the same decisions as compare_trajectory_positions makes for
+each pair.
+
+compare_flight_positions_in_shards partitions the candidate pairs by key,
+e.g. aircraft address or callsign, and verifies the shards concurrently in
+separate processes. Since the decision for each pair is independent of the
+others, the results are the same as compare_flight_positions.
+"""
+
+import concurrent.futures as cf
+import numpy as np
+import pandas as pd
+from .EcefPoint import lat_long_to_xyz, SQ_MIN_LENGTH
+from .trajectory_functions import rad2nm, calculate_speed
+
+NS_PER_SECOND = 1e9
+""" The number of nanoseconds in a second. """
+
+DEFAULT_VERIFICATION_PROCESSES = 1
+""" The default number of processes to verify candidate pairs with. """
+
+DEFAULT_VERIFICATION_SAMPLES = 2
+"""
+The default number of times to compare overlapping trajectories at,
+two: the start and finish of their common period.
+"""
+
+MIN_SHARD_PAIRS = 1000
+""" The minimum number of candidate pairs to verify in a separate process. """
+
+_shard_positions = (None, None)
+""" The FlightPositions of the flights being verified by a worker process. """
+
+
+class FlightPositions:
+    """
+    The positions of flights, in ECEF coordinates, indexed by flight id.
+    """
+    __slots__ = ('__flight_ids', '__starts', '__counts', '__flights',
+                 '__times', '__points', '__alts')
+
+    def __init__(self, positions_df):
+        """
+        Create a FlightPositions from a DataFrame of positions.
+
+        Parameters
+        ----------
+        positions_df: a pandas DataFrame
+            The positions, indexed by FLIGHT_ID, with TIME, LAT, LON and ALT
+            columns. The positions of each flight must be in time order.
+        """
+        codes, flight_ids = pd.factorize(positions_df.index)
+        order = np.argsort(codes, kind='stable')
+        self.__flight_ids = pd.Index(flight_ids)
+        self.__flights = codes[order]
+        self.__counts = np.bincount(codes, minlength=len(flight_ids))
+        self.__starts = np.cumsum(self.__counts) - self.__counts
+
+        self.__times = np.asarray(positions_df['TIME'].values,
+                                  dtype='datetime64[ns]').view(np.int64)[order]
+        x, y, z = lat_long_to_xyz(positions_df['LAT'].values[order],
+                                  positions_df['LON'].values[order])
+        self.__points = np.column_stack((x, y, z))
+        self.__alts = positions_df['ALT'].values[order].astype(float)
+
+    @classmethod
+    def from_arrays(cls, flight_ids, counts, times, points, alts):
+        """
+        Create a FlightPositions from arrays of positions, see to_arrays.
+
+        Parameters
+        ----------
+        flight_ids: array like
+            The flight ids.
+
+        counts: a numpy array
+            The number of positions of each flight.
+
+        times, points, alts: numpy arrays
+            The times [nanoseconds], ECEF points and altitudes of the
+            positions, ordered by flight then time.
+        """
+        positions = cls.__new__(cls)
+        positions.__flight_ids = pd.Index(flight_ids)
+        positions.__counts = np.asarray(counts, dtype=np.int64)
+        positions.__starts = np.cumsum(positions.__counts) - positions.__counts
+        positions.__flights = np.repeat(np.arange(len(positions.__counts)),
+                                        positions.__counts)
+        positions.__times = np.asarray(times, dtype=np.int64)
+        positions.__points = np.asarray(points, dtype=float).reshape(-1, 3)
+        positions.__alts = np.asarray(alts, dtype=float)
+        return positions
+
+    def to_arrays(self):
+        """
+        The arrays of the positions, see from_arrays.
+
+        Returns
+        -------
+        The flight ids, position counts, times, points and altitudes.
+        """
+        return self.__flight_ids.values, self.__counts, self.__times, \
+            self.__points, self.__alts
+
+    def select(self, flight_ids):
+        """
+        Select the positions of flights.
+
+        Parameters
+        ----------
+        flight_ids: array like
+            The flight ids, unknown flights are ignored.
+
+        Returns
+        -------
+        A FlightPositions containing the positions of the flights.
+        """
+        indicies = self.flight_indicies(flight_ids)
+        indicies = indicies[indicies >= 0]
+        counts = self.__counts[indicies]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = np.repeat(self.__starts[indicies], counts) + offsets
+        return FlightPositions.from_arrays(self.__flight_ids[indicies], counts,
+                                           self.__times[rows], self.__points[rows],
+                                           self.__alts[rows])
+
+    @property
+    def flight_ids(self):
+        'Accessor for the flight ids.'
+        return self.__flight_ids
+
+    @property
+    def times(self):
+        'Accessor for the position times [nanoseconds].'
+        return self.__times
+
+    @property
+    def points(self):
+        'Accessor for the position ECEF points.'
+        return self.__points
+
+    @property
+    def alts(self):
+        'Accessor for the position altitudes.'
+        return self.__alts
+
+    @property
+    def starts(self):
+        'Accessor for the index of the first position of each flight.'
+        return self.__starts
+
+    @property
+    def counts(self):
+        'Accessor for the number of positions of each flight.'
+        return self.__counts
+
+    def __len__(self):
+        return len(self.__flight_ids)
+
+    def flight_indicies(self, flight_ids):
+        """
+        The indicies of flights by flight id.
+
+        Parameters
+        ----------
+        flight_ids: array like
+            The flight ids.
+
+        Returns
+        -------
+        A numpy array of the flight indicies, -1 for unknown flights.
+        """
+        return self.__flight_ids.get_indexer(flight_ids)
+
+    def position_counts(self, flight_ids):
+        """
+        The number of positions of flights by flight id.
+
+        Parameters
+        ----------
+        flight_ids: array like
+            The flight ids.
+
+        Returns
+        -------
+        A numpy array of the position counts, zero for unknown flights.
+        """
+        indicies = self.flight_indicies(flight_ids)
+        return np.where(indicies >= 0, self.__counts[indicies], 0)
+
+    def bisect_left(self, flights, times):
+        """
+        Find the insertion points of times in the times of flights.
+
+        The vectorised equivalent of bisect.bisect_left on the position
+        times of each flight.
+
+        Parameters
+        ----------
+        flights: numpy array of ints
+            The flight indicies.
+
+        times: numpy array of int64s
+            The times to search for [nanoseconds].
+
+        Returns
+        -------
+        A numpy array of the indicies within each flight.
+        """
+        # Sort the times with the flight positions, times before positions
+        # at the same time, and count the positions before each time
+        count = len(self.__times)
+        all_flights = np.concatenate((self.__flights, flights))
+        all_times = np.concatenate((self.__times, times))
+        is_position = np.concatenate((np.ones(count, dtype=np.int64),
+                                      np.zeros(len(times), dtype=np.int64)))
+        order = np.lexsort((is_position, all_times, all_flights))
+        positions_before = np.cumsum(is_position[order]) - is_position[order]
+
+        is_time = order >= count
+        indicies = np.empty(len(times), dtype=np.int64)
+        indicies[order[is_time] - count] = positions_before[is_time]
+        return indicies - self.__starts[flights]
+
+    def value_references(self, flights, times):
+        """
+        Find the position indicies and ratios of times in flights.
+
+        The vectorised equivalent of calculate_value_reference.
+
+        Parameters
+        ----------
+        flights: numpy array of ints
+            The flight indicies.
+
+        times: numpy array of int64s
+            The times to search for [nanoseconds].
+
+        Returns
+        -------
+        indicies: the indicies of the positions at or just before the times.
+        ratios: the ratios from the positions to the times.
+        Zero if the time is at the position.
+        """
+        counts = self.__counts[flights]
+        starts = self.__starts[flights]
+        indicies = self.bisect_left(flights, times)
+        ratios = np.zeros(len(times))
+
+        is_inside = indicies < counts
+        index_times = self.__times[starts + np.minimum(indicies, counts - 1)]
+        is_before = is_inside & (indicies > 0) & (times < index_times)
+        indicies = np.where(is_before, indicies - 1, indicies)
+        indicies = np.where(is_inside, indicies, counts - 1)
+
+        prev_times = self.__times[starts + indicies]
+        denoms = (index_times - prev_times) / NS_PER_SECOND
+        deltas = (times - prev_times) / NS_PER_SECOND
+        is_ratio = is_before & (denoms > 0.0)
+        ratios[is_ratio] = deltas[is_ratio] / denoms[is_ratio]
+
+        return indicies, ratios
+
+    def positions(self, flights, indicies, ratios):
+        """
+        Calculate the positions at indicies and ratios along flights.
+
+        The vectorised equivalent of calculate_position.
+
+        Returns
+        -------
+        A numpy array of the ECEF points.
+        """
+        counts = self.__counts[flights]
+        indicies = self.__starts[flights] + indicies
+        points = self.__points[indicies]
+
+        is_between = (ratios > 0.0) & (indicies < self.__starts[flights] + counts - 1)
+        if is_between.any():
+            a = points[is_between]
+            b = self.__points[indicies[is_between] + 1]
+            poles = normalize(np.cross(a, b))
+            distances = ratios[is_between] * distance_radians(a, b)
+            points[is_between] = np.cos(distances)[:, np.newaxis] * a + \
+                np.sin(distances)[:, np.newaxis] * np.cross(poles, a)
+
+        return points
+
+    def values(self, flights, indicies, ratios):
+        """
+        Calculate the altitudes at indicies and ratios along flights.
+
+        The vectorised equivalent of calculate_value.
+
+        Returns
+        -------
+        A numpy array of the altitudes.
+        """
+        counts = self.__counts[flights]
+        indicies = self.__starts[flights] + indicies
+        values = self.__alts[indicies]
+
+        is_between = (ratios > 0.0) & (indicies < self.__starts[flights] + counts - 1)
+        next_values = self.__alts[np.where(is_between, indicies + 1, indicies)]
+        return np.where(is_between, values + ratios * (next_values - values), values)
+
+
+def normalize(points):
+    """
+    Normalize ECEF vectors, vectors that are too short are set to zero.
+
+    The vectorised equivalent of EcefPoint.normalize.
+    """
+    sq_lengths = np.einsum('ij,ij->i', points, points)
+    is_long = sq_lengths > SQ_MIN_LENGTH
+    result = np.zeros_like(points)
+    result[is_long] = points[is_long] / np.sqrt(sq_lengths[is_long])[:, np.newaxis]
+    return result
+
+
+def distance_radians(a, b):
+    """
+    The Great Circle distances between arrays of ECEF points: a and b.
+
+    The vectorised equivalent of EcefPoint.distance_radians.
+    """
+    x = np.cross(a, b)
+    sin_angles = np.sqrt(np.einsum('ij,ij->i', x, x))
+    cos_angles = np.einsum('ij,ij->i', a, b)
+    return np.arctan2(sin_angles, cos_angles)
+
+
+def compare_flight_positions(a_positions, a_flight_ids, b_positions, b_flight_ids,
+                             *, distance_threshold=2.0, alt_threshold=200.0,
+                             time_threshold=0.0, speed_threshold=750.0,
+                             samples=DEFAULT_VERIFICATION_SAMPLES):
+    """
+    Compare the positions of pairs of flights to determine whether they are
+    for the same flight.
+
+    The vectorised equivalent of calling compare_trajectory_positions
+    for each pair of flights, with the default samples.
+    Trajectories that overlap in time are compared at samples evenly
+    spaced times across their common period, all pairs and samples at once.
+
+    Parameters
+    ----------
+    a_positions, b_positions: FlightPositions
+        The positions of the flights.
+
+    a_flight_ids, b_flight_ids: array like
+        The flight ids of the pairs of flights.
+
+    distance_threshold: float
+        The distance threshold [Nautical Miles] above which positions are
+        not considered to be on the same trajectory, default 2 NM.
+
+    alt_threshold: float
+        The altitude threshold [feeet] above which positions are
+        not considered to be on the same trajectory, default 200 feet.
+
+    time_threshold: float
+        The maximum time [seconds] between trajectory positions to be
+        considered to be on the same trajectory, default zero seconds.
+
+    speed_threshold: float
+        The maximum speed [Knots] between trajectory positions to be
+        considered to be on the same trajectory, default 750 Knots.
+
+    samples: int
+        The number of times to compare overlapping trajectories at,
+        including the start and finish of their common period, minimum 2,
+        default DEFAULT_VERIFICATION_SAMPLES.
+
+    Returns
+    -------
+    A numpy boolean array, True where the pair of flights are the same flight.
+    Pairs with a flight without positions are not the same flight.
+    """
+    a_flights = a_positions.flight_indicies(a_flight_ids)
+    b_flights = b_positions.flight_indicies(b_flight_ids)
+    results = np.zeros(len(a_flights), dtype=bool)
+
+    # Only compare flights with positions
+    is_valid = (a_flights >= 0) & (b_flights >= 0)
+    pairs = np.flatnonzero(is_valid)
+    if not len(pairs):
+        return results
+
+    a_flights = a_flights[pairs]
+    b_flights = b_flights[pairs]
+    a_firsts = a_positions.starts[a_flights]
+    a_lasts = a_firsts + a_positions.counts[a_flights] - 1
+    b_firsts = b_positions.starts[b_flights]
+    b_lasts = b_firsts + b_positions.counts[b_flights] - 1
+
+    # Calculate the common periods of the flights
+    start_times = np.maximum(a_positions.times[a_firsts], b_positions.times[b_firsts])
+    finish_times = np.minimum(a_positions.times[a_lasts], b_positions.times[b_lasts])
+    delta_times = (start_times - finish_times) / NS_PER_SECOND
+
+    # Trajectories that overlap in time:
+    # compare the positions at samples times from the start to the finish
+    # of the common period
+    overlap = np.flatnonzero(delta_times < 0.0)
+    if len(overlap):
+        samples = max(int(samples), 2)
+        a = np.repeat(a_flights[overlap], samples)
+        b = np.repeat(b_flights[overlap], samples)
+        starts = np.repeat(start_times[overlap], samples)
+        periods = np.repeat(finish_times[overlap] - start_times[overlap], samples)
+        steps = np.tile(np.arange(samples, dtype=np.int64), len(overlap))
+        times = starts + (periods * steps) // (samples - 1)
+
+        a_indicies, a_ratios = a_positions.value_references(a, times)
+        b_indicies, b_ratios = b_positions.value_references(b, times)
+        distances = rad2nm(distance_radians(
+            a_positions.positions(a, a_indicies, a_ratios),
+            b_positions.positions(b, b_indicies, b_ratios)))
+        delta_alts = np.abs(a_positions.values(a, a_indicies, a_ratios) -
+                            b_positions.values(b, b_indicies, b_ratios))
+
+        # Like compare_trajectory_positions: the positions before the finish
+        # fail if they exceed a threshold, the finish must be within them
+        distances = distances.reshape(-1, samples)
+        delta_alts = delta_alts.reshape(-1, samples)
+        results[pairs[overlap]] = \
+            (~(distances[:, :-1] > distance_threshold)).all(axis=1) & \
+            (~(delta_alts[:, :-1] > alt_threshold)).all(axis=1) & \
+            (distances[:, -1] <= distance_threshold) & \
+            (delta_alts[:, -1] <= alt_threshold)
+
+    # Trajectories with a single common time: compare the positions at that time
+    single = np.flatnonzero(delta_times == 0.0)
+    if len(single):
+        a = a_flights[single]
+        b = b_flights[single]
+        times = start_times[single]
+        a_indicies = a_positions.starts[a] + a_positions.bisect_left(a, times)
+        b_indicies = b_positions.starts[b] + b_positions.bisect_left(b, times)
+        distances = rad2nm(distance_radians(a_positions.points[a_indicies],
+                                            b_positions.points[b_indicies]))
+        delta_alts = np.abs(a_positions.alts[a_indicies] - b_positions.alts[b_indicies])
+        results[pairs[single]] = (distances <= distance_threshold) & \
+            (delta_alts <= alt_threshold)
+
+    # Trajectories that do not overlap in time: determine whether they are
+    # within time_threshold and speed_threshold
+    apart = np.flatnonzero((delta_times > 0.0) & (delta_times <= time_threshold))
+    if len(apart):
+        distances = rad2nm(distance_radians(a_positions.points[a_firsts[apart]],
+                                            b_positions.points[b_lasts[apart]]))
+        speeds = calculate_speed(distances, delta_times[apart])
+        results[pairs[apart]] = speeds <= speed_threshold
+
+    return results
+
+
+def shard_pairs(keys, shards_count):
+    """
+    Allocate candidate pairs to shards by key value.
+
+    Pairs with the same key value are allocated to the same shard.
+
+    Parameters
+    ----------
+    keys: a pandas Series or DataFrame
+        The key value(s) of each pair.
+
+    shards_count: int
+        The number of shards.
+
+    Returns
+    -------
+    A numpy array of the shard of each pair.
+    """
+    if isinstance(keys, pd.DataFrame):
+        codes = keys.groupby(list(keys.columns), sort=False).ngroup().values
+    else:
+        codes, _ = pd.factorize(keys)
+
+    # Pairs with null keys are allocated to the first shard
+    return np.maximum(codes, 0) % shards_count
+
+
+def _set_shard_positions(a_positions, b_positions):
+    """ Set the FlightPositions of a worker process. """
+    global _shard_positions
+    _shard_positions = (a_positions, b_positions)
+
+
+def _compare_shard(a_flight_ids, b_flight_ids, kwargs):
+    """ Compare the pairs of flights of a shard in a worker process. """
+    a_positions, b_positions = _shard_positions
+    return compare_flight_positions(a_positions, a_flight_ids,
+                                    b_positions, b_flight_ids, **kwargs)
+
+
+def compare_flight_positions_in_shards(a_positions, a_flight_ids,
+                                       b_positions, b_flight_ids, keys=None,
+                                       *, processes=DEFAULT_VERIFICATION_PROCESSES,
+                                       **kwargs):
+    """
+    Compare the positions of pairs of flights in shards, using multiple
+    processes.
+
+    Parameters
+    ----------
+    a_positions, b_positions: FlightPositions
+        The positions of the flights.
+
+    a_flight_ids, b_flight_ids: array like
+        The flight ids of the pairs of flights.
+
+    keys: a pandas Series or DataFrame
+        The key value(s) to shard the pairs by, default None: a_flight_ids.
+
+    processes: int
+        The maximum number of processes to use,
+        default DEFAULT_VERIFICATION_PROCESSES.
+        Each process verifies at least MIN_SHARD_PAIRS pairs.
+
+    kwargs:
+        The thresholds to pass to compare_flight_positions.
+
+    Returns
+    -------
+    A numpy boolean array, True where the pair of flights are the same flight.
+    """
+    a_flight_ids = np.asarray(a_flight_ids)
+    b_flight_ids = np.asarray(b_flight_ids)
+    shards_count = min(processes, len(a_flight_ids) // MIN_SHARD_PAIRS)
+    if shards_count <= 1:
+        return compare_flight_positions(a_positions, a_flight_ids,
+                                        b_positions, b_flight_ids, **kwargs)
+
+    shards = shard_pairs(pd.Series(a_flight_ids) if keys is None else keys,
+                         shards_count)
+    shard_indicies = [np.flatnonzero(shards == shard) for shard in range(shards_count)]
+
+    # The FlightPositions are passed to each worker process once
+    results = np.zeros(len(a_flight_ids), dtype=bool)
+    with cf.ProcessPoolExecutor(max_workers=shards_count,
+                                initializer=_set_shard_positions,
+                                initargs=(a_positions, b_positions)) as executor:
+        futures = [executor.submit(_compare_shard, a_flight_ids[indicies],
+                                   b_flight_ids[indicies], kwargs)
+                   for indicies in shard_indicies]
+        for indicies, future in zip(shard_indicies, futures):
+            results[indicies] = future.result()
+
+    return results
@@ -0,0 +1,261 @@
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+"""
+A pool of long-lived worker processes to run the apps functions.
+
+Running an app function in a WorkerPool avoids the cost of starting a
+python interpreter and importing pandas, scipy, etc. for every call,
+since the worker processes import the apps modules when they start.
+"""
+
+import os
+import time
+import errno
+import importlib
+import threading
+import multiprocessing as mp
+import concurrent.futures as cf
+from pru.logger import logger
+
+log = logger(__name__)
+
+DEFAULT_WORKER_MODULES = ['apps.convert_cpr_data',
+                          'apps.convert_fr24_data',
+                          'apps.convert_apt_data',
+                          'apps.convert_airport_ids',
+                          'apps.extract_fleet_data',
+                          'apps.clean_position_data',
+                          'apps.match_cpr_adsb_trajectories',
+                          'apps.merge_cpr_adsb_trajectories',
+                          'apps.analyse_position_data',
+                          'apps.interpolate_trajectories']
+""" The modules imported by each worker process when it starts. """
+
+WARM_UP_TIMEOUT = 600.0
+""" The time that a worker process waits for the others during warm up [Seconds]. """
+
+
+def import_modules(modules):
+    """
+    Import modules into a worker process.
+
+    A module that cannot be imported is logged and ignored, it will
+    be imported when a function in it is called.
+
+    Parameters
+    ----------
+    modules: list of strings
+        The names of the modules to import.
+    """
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            log.warning('worker: %d could not import module: %s',
+                        os.getpid(), module)
+
+
+def worker_pid(barrier, timeout):
+    """
+    Wait at the barrier for the other workers and return the id of the
+    worker process.
+
+    The executor only starts a new worker process if the others are busy,
+    so warm up tasks must wait until all of the workers have started and
+    imported their modules.
+    """
+    try:
+        barrier.wait(timeout)
+    except threading.BrokenBarrierError:
+        log.warning('worker: %d timed out waiting for the other workers',
+                    os.getpid())
+    return os.getpid()
+
+
+class AppResult:
+    """
+    The result of running an app function in a worker process.
+    """
+    __slots__ = ('__name', '__error_code', '__wall_time', '__cpu_time',
+                 '__pid', '__exception')
+
+    def __init__(self, name, error_code, wall_time, cpu_time, pid,
+                 exception=None):
+        'AppResult constructor'
+        self.__name = name
+        self.__error_code = error_code
+        self.__wall_time = wall_time
+        self.__cpu_time = cpu_time
+        self.__pid = pid
+        self.__exception = exception
+
+    @property
+    def name(self):
+        'Accessor for the name of the function.'
+        return self.__name
+
+    @property
+    def error_code(self):
+        'Accessor for the errno error code, zero if successful.'
+        return self.__error_code
+
+    @property
+    def wall_time(self):
+        'Accessor for the wall_time [Seconds].'
+        return self.__wall_time
+
+    @property
+    def cpu_time(self):
+        'Accessor for the cpu_time [Seconds].'
+        return self.__cpu_time
+
+    @property
+    def pid(self):
+        'Accessor for the process id of the worker.'
+        return self.__pid
+
+    @property
+    def exception(self):
+        'Accessor for the exception message, None if no exception was raised.'
+        return self.__exception
+
+    def __bool__(self):
+        'True if the function was successful.'
+        return not self.__error_code
+
+    def __repr__(self):
+        return 'AppResult({}, error_code={}, wall_time={:.3f}, cpu_time={:.3f}, ' \
+            'pid={})'.format(self.__name, self.__error_code, self.__wall_time,
+                             self.__cpu_time, self.__pid)
+
+
+def run_app_function(function, args, kwargs):
+    """
+    Run an app function and return an AppResult.
+
+    App functions return an errno error code, zero if successful.
+    Boolean results (as returned by the scripts.tasks functions) are
+    converted to errno.EIO if False and zero if True.
+    If the function raises an exception the error code is errno.EIO.
+
+    Parameters
+    ----------
+    function: function
+        The app function.
+
+    args: tuple
+        The app function positional arguments.
+
+    kwargs: dict
+        The app function keyword arguments.
+
+    Returns
+    -------
+    An AppResult.
+    """
+    name = getattr(function, '__name__', str(function))
+    exception = None
+    start_time = time.perf_counter()
+    start_cpu_time = time.process_time()
+    try:
+        result = function(*args, **kwargs)
+        if isinstance(result, bool):
+            error_code = 0 if result else errno.EIO
+        else:
+            error_code = result if result else 0
+    except Exception as ex:
+        log.exception('app function: %s raised an exception', name)
+        error_code = errno.EIO
+        exception = repr(ex)
+
+    return AppResult(name, error_code, time.perf_counter() - start_time,
+                     time.process_time() - start_cpu_time, os.getpid(),
+                     exception)
+
+
+class WorkerPool(cf.ProcessPoolExecutor):
+    """
+    A ProcessPoolExecutor whose worker processes import the apps modules
+    when they start.
+
+    It can be used as the executor of a TaskGraph.
+    """
+
+    def __init__(self, max_workers=None, modules=DEFAULT_WORKER_MODULES):
+        """
+        WorkerPool constructor.
+
+        Parameters
+        ----------
+        max_workers: int
+            The number of worker processes, default None: the number of CPUs.
+
+        modules: list of strings
+            The modules to import in the worker processes,
+            default DEFAULT_WORKER_MODULES.
+        """
+        super().__init__(max_workers=max_workers, initializer=import_modules,
+                         initargs=(list(modules),))
+        self.__max_workers = max_workers if max_workers else os.cpu_count()
+
+    def warm_up(self):
+        """
+        Start all of the worker processes and wait for them to import their modules.
+
+        Returns
+        -------
+        The set of worker process ids.
+        """
+        with mp.Manager() as manager:
+            barrier = manager.Barrier(self.__max_workers)
+            futures = [self.submit(worker_pid, barrier, WARM_UP_TIMEOUT)
+                       for _ in range(self.__max_workers)]
+            return {future.result() for future in futures}
+
+    def submit_app(self, function, *args, **kwargs):
+        """
+        Run an app function in a worker process.
+
+        Parameters
+        ----------
+        function: function
+            The app function, it must be a module level function.
+
+        args, kwargs:
+            The arguments to call the function with.
+
+        Returns
+        -------
+        A Future of the AppResult.
+        """
+        return self.submit(run_app_function, function, args, kwargs)
+
+    def run_app(self, function, *args, **kwargs):
+        """
+        Run an app function in a worker process and wait for the result.
+
+        Returns
+        -------
+        The AppResult.
+        """
+        return self.submit_app(function, *args, **kwargs).result()
+
+    def map_app(self, function, args_list):
+        """
+        Run an app function in the worker processes for each set of arguments.
+
+        Parameters
+        ----------
+        function: function
+            The app function, it must be a module level function.
+
+        args_list: list of tuples
+            The positional arguments for each call of the function.
+
+        Returns
+        -------
+        A list of AppResults in the same order as args_list.
+        """
+        futures = [self.submit_app(function, *args) for args in args_list]
+        return [future.result() for future in futures]
@@ -0,0 +1,526 @@
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+#
+"""
+Creates TaskGraphs of the stages of the daily processes.
+
+The task input and output files are named by the trajectory_files functions,
+so that the dependencies between the stages are derived from the files that
+they read and write.
+"""
+
+import os
+from pru.task_graph import TaskGraph
+from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, CPR, FR24, CPR_FR24, \
+    create_original_cpr_filename, create_original_fr24_data_filenames, \
+    create_convert_cpr_filenames, create_convert_fr24_filenames, \
+    create_raw_positions_filename, create_flights_filename, \
+    create_fleet_data_filename, create_clean_position_data_filenames, \
+    create_match_cpr_adsb_input_filenames, create_match_cpr_adsb_output_filenames, \
+    create_merge_cpr_adsb_input_filenames, create_merge_cpr_adsb_output_filenames, \
+    create_trajectories_filename, SECTOR_INTERSECTIONS, AIRPORT_INTERSECTIONS, \
+    USER_INTERSECTIONS, TRAJECTORIES, PREV_DAY, create_matching_ids_filename, \
+    create_boundary_state_filename, create_extract_overnight_data_output_filenames, \
+    create_merge_overnight_flight_data_output_filenames, \
+    create_analyse_position_data_filenames
+from pru.trajectory_fields import CSV_FILE_EXTENSION, JSON_FILE_EXTENSION, \
+    iso8601_previous_day, iso8601_next_day, iso8601_date_range
+from pru.filesystem.data_store_operations import get_unprocessed, get_airports, \
+    get_processed, put_processed, REFINED, REFINED_CPR, REFINED_FR24, PRODUCTS, \
+    PRODUCTS_FLEET, ERROR_METRICS, REFINED_MERGED_DAILY_CPR_FR24, \
+    REFINED_MERGED_DAILY_CPR_FR24_IDS, REFINED_MERGED_OVERNIGHT_CPR_FR24, \
+    PRODUCTS_INTERSECTIONS_SECTOR, PRODUCTS_INTERSECTIONS_AIRPORT, \
+    PRODUCTS_INTERSECTIONS_USER
+from pru.trajectory_cleaning import DEFAULT_MAX_SPEED, DEFAULT_DISTANCE_ACCURACY
+from pru.trajectory_verification import DEFAULT_VERIFICATION_SAMPLES
+from pru.trajectory_airport_intersections import DEFAULT_RADIUS, DEFAULT_DISTANCE_TOLERANCE
+from pru.trajectory_analysis import DEFAULT_ACROSS_TRACK_TOLERANCE, MOVING_AVERAGE_SPEED
+
+from apps.convert_cpr_data import convert_cpr_data
+from apps.convert_fr24_data import convert_fr24_data
+from apps.convert_airport_ids import convert_airport_ids
+from apps.extract_fleet_data import extract_fleet_data
+from apps.clean_position_data import clean_position_data
+from apps.match_cpr_adsb_trajectories import match_cpr_adsb_trajectories
+from apps.merge_cpr_adsb_trajectories import merge_cpr_adsb_trajectories
+from apps.find_sector_intersections import find_sector_intersections
+from apps.find_airport_intersections import find_airport_intersections, \
+    DEFAULT_MOVEMENTS_AIRPORTS_FILENAME
+from apps.find_user_airspace_intersections import find_user_airspace_intersections
+
+from scripts.tasks import analyse_positions_on_date, \
+    find_trajectory_sector_intersections, find_trajectory_airport_intersections, \
+    find_trajectory_user_airspace_intersections
+from scripts.processes.import_data_on_day import import_data_on_day
+from scripts.processes.match_overnight_flights_on_day import \
+    match_overnight_flights_on_day
+from scripts.processes.merge_overnight_data_on_day import \
+    merge_overnight_data_on_day
+
+from pru.logger import logger
+
+log = logger(__name__)
+
+CONVERT_CPR_MEMORY = 7.0
+""" The peak memory used converting a day of CPR data [GB]. """
+
+CONVERT_FR24_MEMORY = 7.0
+""" The peak memory used converting a day of FR24 data [GB]. """
+
+CLEAN_POSITIONS_MEMORY = 3.0
+""" The peak memory used cleaning a day of positions [GB]. """
+
+MATCH_MERGE_MEMORY = 6.0
+""" The peak memory used matching or merging a day of CPR and FR24 data [GB]. """
+
+IMPORT_DATA_MEMORY = 14.0
+""" The peak memory used by import_data_on_day [GB]. """
+
+IMPORT_DATA_CPUS = 3
+""" The number of CPUs used by import_data_on_day. """
+
+OVERNIGHT_MEMORY = 4.0
+""" The peak memory used matching, merging or analysing overnight data [GB]. """
+
+DEFAULT_TRAJECTORIES_PREFIX = 'mas_05_'
+""" The prefix of the trajectories files used to find intersections. """
+
+
+def get_airports_file(airports_filename, local_directory='.'):
+    """
+    Get an airports file from the bucket.
+
+    get_airports returns the destination path whether or not the file was
+    found, so the file must be in the local directory for success.
+
+    Returns
+    -------
+        True if the file was got, False otherwise.
+    """
+    get_airports(airports_filename, local_directory)
+    return os.path.exists(os.path.join(local_directory, airports_filename))
+
+
+def get_processed_files(data_type, filenames, local_directory='.'):
+    """
+    Get processed files from the bucket.
+
+    get_processed returns False or a list of the success of each file.
+
+    Returns
+    -------
+        True if all of the files were got, False otherwise.
+    """
+    success = get_processed(data_type, filenames, local_directory)
+    return all(success) if isinstance(success, list) else bool(success)
+
+
+def add_clean_positions_tasks(graph, source, date, max_speed, distance_accuracy,
+                              requires=[]):
+    """
+    Add tasks to clean a raw positions file and put the results into the bucket.
+
+    Parameters
+    ----------
+    graph: TaskGraph
+        The graph to add the tasks to.
+
+    source: string
+        The source of the positions data: CPR, FR24 or CPR_FR24
+
+    date: string
+        The date in ISO8601 format, e.g. 2017-08-16
+
+    max_speed: float
+        The maximum ground speed permitted between adjacent positions [Knots].
+
+    distance_accuracy: float
+        The maximum distance between positions at the same time [Nautical Miles].
+
+    requires: list of strings
+        The names of tasks that must complete before cleaning, default empty.
+    """
+    raw_filename = create_raw_positions_filename(source, date)
+    filenames = create_clean_position_data_filenames(source, date)
+    clean_name = 'clean_' + source
+    graph.add_task(clean_name, clean_position_data,
+                   args=(raw_filename, max_speed, distance_accuracy),
+                   inputs=[raw_filename], outputs=filenames, requires=requires,
+                   memory=CLEAN_POSITIONS_MEMORY)
+
+    source_path = REFINED_MERGED_DAILY_CPR_FR24 \
+        if (source == CPR_FR24) else '/'.join([REFINED, source])
+    graph.add_task('put_' + clean_name, put_processed,
+                   args=(source_path, filenames[:1]), inputs=filenames[:1])
+
+    errors_path = '/'.join([PRODUCTS, ERROR_METRICS, source])
+    graph.add_task('put_' + clean_name + '_errors', put_processed,
+                   args=(errors_path, filenames[1:]), inputs=filenames[1:])
+
+
+def create_import_data_graph(date, *, max_speed=DEFAULT_MAX_SPEED,
+                             distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                             airports_filename=DEFAULT_AIRPORTS_FILENAME,
+                             samples=DEFAULT_VERIFICATION_SAMPLES,
+                             graph=None):
+    """
+    Create a TaskGraph to import, refine and merge the CPR and FR24 data
+    for the given date.
+
+    It performs the same stages as import_data_on_day, but the CPR and FR24
+    stages run concurrently as soon as their inputs are available.
+
+    Parameters
+    ----------
+    date: string
+        The date in ISO8601 format, e.g. 2017-08-16
+
+    max_speed: float
+        The maximum ground speed permitted between adjacent positions [Knots],
+        default: 750 Knots.
+
+    distance_accuracy: float
+        The maximum distance between positions at the same time [Nautical Miles],
+        default: 0.25 NM.
+
+    airports_filename: string
+        The name of a file containing airport codes for IATA to ICAO conversion,
+        default: airports.csv
+
+    samples: int
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
+    graph: TaskGraph
+        The graph to add the tasks to, default None: create a new graph.
+
+    Returns
+    -------
+    The TaskGraph.
+    """
+    if graph is None:
+        graph = TaskGraph()
+
+    # Get and convert the CPR data
+    cpr_filename = create_original_cpr_filename(date)
+    cpr_filenames = create_convert_cpr_filenames(date)
+    graph.add_task('get_cpr', get_unprocessed, args=(CPR, date, '.'),
+                   outputs=[cpr_filename])
+    graph.add_task('convert_cpr', convert_cpr_data, args=(cpr_filename,),
+                   inputs=[cpr_filename], outputs=cpr_filenames,
+                   memory=CONVERT_CPR_MEMORY)
+    graph.add_task('put_convert_cpr', put_processed,
+                   args=(REFINED_CPR, cpr_filenames), inputs=cpr_filenames)
+
+    # Get and convert the FR24 data
+    fr24_filenames = create_original_fr24_data_filenames(date)
+    fr24_output_filenames = create_convert_fr24_filenames(date)
+    graph.add_task('get_fr24', get_unprocessed, args=(FR24, date, '.'),
+                   outputs=fr24_filenames)
+    graph.add_task('convert_fr24', convert_fr24_data, args=(fr24_filenames,),
+                   inputs=fr24_filenames, outputs=fr24_output_filenames,
+                   memory=CONVERT_FR24_MEMORY)
+    graph.add_task('put_convert_fr24', put_processed,
+                   args=(REFINED_FR24, fr24_output_filenames),
+                   inputs=fr24_output_filenames)
+
+    # Convert the FR24 airport ids and extract the fleet data
+    iata_filename = fr24_output_filenames[0]
+    fr24_flights_filename = create_flights_filename(FR24, date)
+    graph.add_task('get_airports', get_airports_file, args=(airports_filename, '.'),
+                   outputs=[airports_filename])
+    graph.add_task('convert_airport_ids', convert_airport_ids,
+                   args=(iata_filename, airports_filename),
+                   inputs=[iata_filename, airports_filename],
+                   outputs=[fr24_flights_filename])
+    graph.add_task('put_fr24_flights', put_processed,
+                   args=(REFINED_FR24, [fr24_flights_filename]),
+                   inputs=[fr24_flights_filename])
+
+    fleet_filename = create_fleet_data_filename(date)
+    graph.add_task('extract_fleet_data', extract_fleet_data,
+                   args=(iata_filename,), inputs=[iata_filename],
+                   outputs=[fleet_filename])
+    graph.add_task('put_fleet_data', put_processed,
+                   args=(PRODUCTS_FLEET, [fleet_filename]),
+                   inputs=[fleet_filename])
+
+    # Clean the CPR and FR24 positions
+    add_clean_positions_tasks(graph, CPR, date, max_speed, distance_accuracy)
+    add_clean_positions_tasks(graph, FR24, date, max_speed, distance_accuracy)
+
+    # Match and merge the CPR and FR24 data
+    match_filenames = create_match_cpr_adsb_input_filenames(date)
+    ids_filenames = create_match_cpr_adsb_output_filenames(date)
+    graph.add_task('match_cpr_fr24', match_cpr_adsb_trajectories,
+                   args=(match_filenames,), kwargs={'samples': samples},
+                   inputs=match_filenames,
+                   outputs=ids_filenames, memory=MATCH_MERGE_MEMORY)
+    graph.add_task('put_match_cpr_fr24', put_processed,
+                   args=(REFINED_MERGED_DAILY_CPR_FR24_IDS, ids_filenames),
+                   inputs=ids_filenames)
+
+    merge_filenames = create_merge_cpr_adsb_input_filenames(date)
+    merged_filenames = create_merge_cpr_adsb_output_filenames(date)
+    graph.add_task('merge_cpr_fr24', merge_cpr_adsb_trajectories,
+                   args=(merge_filenames, max_speed, distance_accuracy),
+                   inputs=merge_filenames,
+                   outputs=merged_filenames, memory=MATCH_MERGE_MEMORY)
+    graph.add_task('put_merge_cpr_fr24', put_processed,
+                   args=(REFINED_MERGED_DAILY_CPR_FR24, merged_filenames),
+                   inputs=merged_filenames)
+
+    # Clean the merged positions
+    add_clean_positions_tasks(graph, CPR_FR24, date, max_speed, distance_accuracy)
+
+    return graph
+
+
+def create_intersections_filename(trajectories_filename, intersections):
+    """
+    Create the name of an intersections file from a trajectories filename.
+
+    Parameters
+    ----------
+    trajectories_filename: string
+        The name of the trajectories file.
+
+    intersections: string
+        The type of intersections: SECTOR_INTERSECTIONS, AIRPORT_INTERSECTIONS
+        or USER_INTERSECTIONS.
+
+    Returns
+    -------
+    The name of the intersections file.
+    """
+    output_filename = trajectories_filename.replace(TRAJECTORIES, intersections)
+    return output_filename.replace(JSON_FILE_EXTENSION, CSV_FILE_EXTENSION)
+
+
+def create_intersections_graph(date, *, source=CPR_FR24,
+                               trajectories_prefix=DEFAULT_TRAJECTORIES_PREFIX,
+                               radius=DEFAULT_RADIUS,
+                               airports_filename=DEFAULT_MOVEMENTS_AIRPORTS_FILENAME,
+                               distance_tolerance=DEFAULT_DISTANCE_TOLERANCE,
+                               graph=None):
+    """
+    Create a TaskGraph to find the sector, airport and user airspace
+    intersections of the trajectories for the given date.
+
+    The three types of intersections are found concurrently.
+
+    Parameters
+    ----------
+    date: string
+        The date in ISO8601 format, e.g. 2017-08-16
+
+    source: string
+        The source of the trajectories, default CPR_FR24.
+
+    trajectories_prefix: string
+        The prefix of the trajectories file, default 'mas_05_'.
+
+    radius: float
+        The radius of the cylinder aroud each airport [Nautical Miles].
+
+    airports_filename: string
+        The name of the airports file, default DEFAULT_MOVEMENTS_AIRPORTS_FILENAME.
+
+    distance_tolerance: float
+        The tolerance for path and cylinder distances.
+
+    graph: TaskGraph
+        The graph to add the tasks to, default None: create a new graph.
+
+    Returns
+    -------
+    The TaskGraph.
+    """
+    if graph is None:
+        graph = TaskGraph()
+
+    trajectories_filename = trajectories_prefix + \
+        create_trajectories_filename(source, date)
+    graph.add_task('get_trajectories', get_processed_files,
+                   args=('/'.join([PRODUCTS, TRAJECTORIES, source]),
+                         [trajectories_filename]),
+                   outputs=[trajectories_filename])
+
+    flights_filename = create_flights_filename(source, date)
+    flights_path = REFINED_MERGED_OVERNIGHT_CPR_FR24 \
+        if (source == CPR_FR24) else '/'.join([REFINED, source])
+    graph.add_task('get_flights', get_processed_files,
+                   args=(flights_path, [flights_filename]),
+                   outputs=[flights_filename])
+    graph.add_task('get_movements_airports', get_airports_file,
+                   args=(airports_filename, '.'), outputs=[airports_filename])
+
+    sector_filename = create_intersections_filename(trajectories_filename,
+                                                    SECTOR_INTERSECTIONS)
+    graph.add_task('find_sector_intersections', find_sector_intersections,
+                   args=(trajectories_filename,), inputs=[trajectories_filename],
+                   outputs=[sector_filename])
+    graph.add_task('put_sector_intersections', put_processed,
+                   args=('/'.join([PRODUCTS_INTERSECTIONS_SECTOR, source]),
+                         [sector_filename]),
+                   inputs=[sector_filename])
+
+    airport_filename = create_intersections_filename(trajectories_filename,
+                                                     AIRPORT_INTERSECTIONS)
+    graph.add_task('find_airport_intersections', find_airport_intersections,
+                   args=(flights_filename, trajectories_filename, radius,
+                         airports_filename, distance_tolerance),
+                   inputs=[flights_filename, trajectories_filename,
+                           airports_filename],
+                   outputs=[airport_filename])
+    graph.add_task('put_airport_intersections', put_processed,
+                   args=('/'.join([PRODUCTS_INTERSECTIONS_AIRPORT, source]),
+                         [airport_filename]),
+                   inputs=[airport_filename])
+
+    user_filename = create_intersections_filename(trajectories_filename,
+                                                  USER_INTERSECTIONS)
+    graph.add_task('find_user_airspace_intersections',
+                   find_user_airspace_intersections,
+                   args=(trajectories_filename,), inputs=[trajectories_filename],
+                   outputs=[user_filename])
+    graph.add_task('put_user_airspace_intersections', put_processed,
+                   args=('/'.join([PRODUCTS_INTERSECTIONS_USER, source]),
+                         [user_filename]),
+                   inputs=[user_filename])
+
+    return graph
+
+
+def create_backfill_graph(from_date, to_date, *, directory='.',
+                          max_speed=DEFAULT_MAX_SPEED,
+                          distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                          samples=DEFAULT_VERIFICATION_SAMPLES,
+                          graph=None):
+    """
+    Create a TaskGraph to process all of the days in a date range.
+
+    The graph runs the processes: import_data_on_day,
+    match_overnight_flights_on_day, merge_overnight_data_on_day,
+    analyse_positions_on_day and find_*_intersections_on_day for each day.
+
+    The only dependencies between days are the overnight dependencies:
+        - matching overnight flights on a day requires the data of the
+        previous day to have been imported,
+        - merging overnight data on a day requires overnight flights to have
+        been matched on the next day.
+
+    So a day is imported while the previous days are being matched and analysed.
+
+    Note: the data for the day before from_date must have already been imported.
+    The data for the day after to_date is imported and matched, so that the
+    overnight data for to_date can be merged.
+
+    The tasks for each day are run in a separate directory, named by the date,
+    since the processes read and write files in the current directory.
+    Each task declares the files that it leaves in the day directory and
+    that no later task of the day overwrites, so that a rerun with a state
+    file only skips a task while its files are unchanged.
+
+    Parameters
+    ----------
+    from_date: string
+        The first date in ISO8601 format, e.g. 2017-08-16
+
+    to_date: string
+        The last date in ISO8601 format, e.g. 2017-08-31
+
+    directory: string
+        The directory containing the day directories, default: the current
+        directory.
+
+    max_speed: float
+        The maximum ground speed permitted between adjacent positions [Knots],
+        default: 750 Knots.
+
+    distance_accuracy: float
+        The maximum distance between positions at the same time [Nautical Miles],
+        default: 0.25 NM.
+
+    samples: int
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
+    graph: TaskGraph
+        The graph to add the tasks to, default None: create a new graph.
+
+    Returns
+    -------
+    The TaskGraph.
+    """
+    if graph is None:
+        graph = TaskGraph()
+
+    dates = iso8601_date_range(from_date, to_date)
+    import_dates = dates + [iso8601_next_day(to_date)] if dates else []
+    for date in import_dates:
+        day_directory = os.path.join(directory, date)
+        os.makedirs(day_directory, exist_ok=True)
+
+        # The matching ids and the head of the day are only written by the import
+        import_filenames = create_match_cpr_adsb_output_filenames(date) + \
+            [create_boundary_state_filename(CPR_FR24, date, is_tail=False)]
+        graph.add_task('import_data_' + date, import_data_on_day,
+                       args=(date, max_speed, distance_accuracy, samples),
+                       outputs=import_filenames,
+                       cpus=IMPORT_DATA_CPUS, memory=IMPORT_DATA_MEMORY,
+                       directory=day_directory)
+
+        # The previous day must be imported before matching overnight flights
+        requires = ['import_data_' + date]
+        prev_date = iso8601_previous_day(date)
+        if prev_date in import_dates:
+            requires.append('import_data_' + prev_date)
+        # The new flights files are downloaded again by the overnight merge
+        match_filenames = [create_matching_ids_filename(PREV_DAY, date)] + \
+            create_extract_overnight_data_output_filenames(date)[3:]
+        graph.add_task('match_overnight_flights_' + date,
+                       match_overnight_flights_on_day, args=(date,),
+                       outputs=match_filenames,
+                       requires=requires, memory=OVERNIGHT_MEMORY,
+                       directory=day_directory)
+
+    for date in dates:
+        day_directory = os.path.join(directory, date)
+
+        # Requires the overnight data extracted by the next day's match
+        requires = ['match_overnight_flights_' + date,
+                    'match_overnight_flights_' + iso8601_next_day(date)]
+        # The positions file is downloaded again by the analysis
+        merge_filenames = create_merge_overnight_flight_data_output_filenames(date) + \
+            create_clean_position_data_filenames(CPR_FR24, date)[1:]
+        graph.add_task('merge_overnight_data_' + date,
+                       merge_overnight_data_on_day,
+                       args=(date, max_speed, distance_accuracy),
+                       outputs=merge_filenames,
+                       requires=requires, memory=OVERNIGHT_MEMORY,
+                       directory=day_directory)
+
+        trajectories_filename = create_analyse_position_data_filenames(
+            CPR_FR24, date, DEFAULT_ACROSS_TRACK_TOLERANCE, MOVING_AVERAGE_SPEED)[0]
+        graph.add_task('analyse_positions_' + date, analyse_positions_on_date,
+                       args=(date, CPR_FR24), outputs=[trajectories_filename],
+                       requires=['merge_overnight_data_' + date],
+                       memory=OVERNIGHT_MEMORY, directory=day_directory)
+
+        for name, function, intersections in \
+                [('find_sector_intersections_',
+                  find_trajectory_sector_intersections, SECTOR_INTERSECTIONS),
+                 ('find_airport_intersections_',
+                  find_trajectory_airport_intersections, AIRPORT_INTERSECTIONS),
+                 ('find_user_airspace_intersections_',
+                  find_trajectory_user_airspace_intersections, USER_INTERSECTIONS)]:
+            graph.add_task(name + date, function,
+                           args=(trajectories_filename, CPR_FR24),
+                           inputs=[trajectories_filename],
+                           outputs=[create_intersections_filename(trajectories_filename,
+                                                                  intersections)],
+                           directory=day_directory)
+
+    return graph
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+"""
+Imports, merges, analyses and finds the intersections of the CPR and FR24 data
+for a range of dates.
+
+Days are pipelined: a day's data is imported while the previous days are
+being matched, merged and analysed.
+"""
+
+import sys
+import os
+import errno
+from datetime import datetime
+
+from pru.trajectory_fields import is_valid_iso8601_date, iso8601_date_range
+from pru.task_graph import count_failed_tasks
+from pru.worker_pool import WorkerPool
+from pru.stage_metrics import DEFAULT_RUN_REPORT_FILENAME, \
+    stage_metrics_filename, write_run_report
+from pru.trajectory_cleaning import DEFAULT_MAX_SPEED, DEFAULT_DISTANCE_ACCURACY
+from scripts.pipeline_graphs import create_backfill_graph
+from pru.logger import logger
+
+log = logger(__name__)
+
+DEFAULT_STATE_FILENAME = 'backfill_state_{}_{}.json'
+""" The format of the backfill task state filename. """
+
+
+def backfill_date_range(from_date, to_date, *, directory='.',
+                        cpu_budget=os.cpu_count(), memory_budget=None,
+                        max_speed=DEFAULT_MAX_SPEED,
+                        distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
+    """
+    Process the CPR and FR24 data for the days from from_date to to_date.
+
+    The task state is persisted in directory, so that an interrupted backfill
+    can be restarted without repeating the completed tasks.
+
+    Parameters
+    ----------
+    from_date: string
+        The first date in ISO8601 format, e.g. 2017-08-01
+
+    to_date: string
+        The last date in ISO8601 format, e.g. 2017-08-31
+
+    directory: string
+        The directory to process the data in, default: the current directory.
+
+    cpu_budget: int
+        The maximum number of CPUs to use, default: the number of CPUs.
+
+    memory_budget: float
+        The maximum memory to use [GB], default None: unlimited.
+
+    max_speed: float
+        The maximum ground speed permitted between adjacent positions [Knots],
+        default: 750 Knots.
+
+    distance_accuracy: float
+        The maximum distance between positions at the same time [Nautical Miles],
+        default: 0.25 NM.
+
+    Returns
+    -------
+    An errno error_code if an error occured, zero otherwise.
+
+    """
+    if not is_valid_iso8601_date(from_date):
+        log.error(f'invalid from_date: {from_date}')
+        return errno.EINVAL
+
+    if not is_valid_iso8601_date(to_date):
+        log.error(f'invalid to_date: {to_date}')
+        return errno.EINVAL
+
+    if to_date < from_date:
+        log.error(f'to_date: {to_date} is before from_date: {from_date}')
+        return errno.EINVAL
+
+    directory = os.path.abspath(directory)
+    graph = create_backfill_graph(from_date, to_date, directory=directory,
+                                  max_speed=max_speed,
+                                  distance_accuracy=distance_accuracy)
+
+    state_filename = os.path.join(directory,
+                                  DEFAULT_STATE_FILENAME.format(from_date, to_date))
+    start_time = datetime.utcnow()
+    with WorkerPool(cpu_budget) as pool:
+        results = graph.run(cpu_budget=cpu_budget, memory_budget=memory_budget,
+                            state_filename=state_filename, executor=pool)
+
+    # Write a run report of the stage metrics in each day's directory
+    for date in iso8601_date_range(from_date, to_date):
+        metrics_filename = os.path.join(directory, date, stage_metrics_filename())
+        if os.path.exists(metrics_filename):
+            write_run_report(metrics_filename,
+                             os.path.join(directory, date, DEFAULT_RUN_REPORT_FILENAME),
+                             start_time)
+
+    failed_count = count_failed_tasks(results)
+    if failed_count:
+        log.error(f'backfill from {from_date} to {to_date}: {failed_count} tasks failed')
+        return errno.EIO
+
+    log.info(f'backfill from {from_date} to {to_date} complete')
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: backfill_date_range.py <from_date> <to_date>'
+              ' [cpu_budget] [memory_budget] [directory]')
+        sys.exit(errno.EINVAL)
+
+    cpu_budget = os.cpu_count()
+    if len(sys.argv) >= 4:
+        try:
+            cpu_budget = int(sys.argv[3])
+        except ValueError:
+            log.error(f'invalid cpu_budget: {sys.argv[3]}')
+            sys.exit(errno.EINVAL)
+
+    memory_budget = None
+    if len(sys.argv) >= 5:
+        try:
+            memory_budget = float(sys.argv[4])
+        except ValueError:
+            log.error(f'invalid memory_budget: {sys.argv[4]}')
+            sys.exit(errno.EINVAL)
+
+    directory = '.'
+    if len(sys.argv) >= 6:
+        directory = sys.argv[5]
+
+    error_code = backfill_date_range(sys.argv[1], sys.argv[2],
+                                     directory=directory,
+                                     cpu_budget=cpu_budget,
+                                     memory_budget=memory_budget)
+    if error_code:
+        sys.exit(error_code)
@@ -8,10 +8,8 @@ Imports, refines and merges CPR and FR24 data for a given day.
 
 import sys
 import errno
-import subprocess
 import gc
 
-from pru.env.env_constants import PROJECT_HOME
 from pru.trajectory_fields import is_valid_iso8601_date
 from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, CPR, FR24, CPR_FR24, \
     create_raw_positions_filename, create_flights_filename, \
@@ -26,6 +24,10 @@ from pru.filesystem.data_store_operations import get_unprocessed, get_airports,
     REFINED, REFINED_MERGED_DAILY_CPR_FR24, REFINED_MERGED_DAILY_CPR_FR24_IDS
 
 from pru.trajectory_cleaning import DEFAULT_MAX_SPEED, DEFAULT_DISTANCE_ACCURACY
+from pru.trajectory_verification import DEFAULT_VERIFICATION_SAMPLES
+from pru.worker_pool import WorkerPool
+from apps.convert_cpr_data import convert_cpr_data
+from apps.clean_position_data import clean_position_data
 from apps.convert_fr24_data import convert_fr24_data
 from apps.convert_airport_ids import convert_airport_ids
 from apps.extract_fleet_data import extract_fleet_data
@@ -36,19 +38,20 @@ from pru.logger import logger
 
 log = logger(__name__)
 
-CLEAN_POSITION_DATA_APP = PROJECT_HOME + '/apps/clean_position_data.py'
-""" The clean_position_data application. """
-CONVERT_CPR_DATA_APP = PROJECT_HOME + '/apps/convert_cpr_data.py'
-""" The convert_cpr_data application. """
+WORKER_POOL_SIZE = 2
+""" The number of worker processes to run the CPR conversion and cleaning. """
 
 
-def clean_raw_positions_data(source, date, max_speed=DEFAULT_MAX_SPEED,
+def clean_raw_positions_data(pool, source, date, max_speed=DEFAULT_MAX_SPEED,
                              distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
     """
-    Call the clean_position_data function as a process to run in parallel.
+    Call the clean_position_data function in a worker process to run in parallel.
 
     Parameters
     ----------
+    pool: WorkerPool
+        The pool of worker processes.
+
     source: string
         The source of the positions data: CPR, FR24 or CPR_FR24
 
@@ -65,34 +68,59 @@ def clean_raw_positions_data(source, date, max_speed=DEFAULT_MAX_SPEED,
 
     Returns
     -------
-    A child process.
+    A Future of the AppResult.
 
     """
     raw_filename = create_raw_positions_filename(source, date)
     log.info(f'Cleaning data in: {raw_filename}')
-    return subprocess.Popen(['python', CLEAN_POSITION_DATA_APP, raw_filename,
-                             str(max_speed), str(distance_accuracy)],
-                            stdout=subprocess.PIPE, universal_newlines=True)
+    return pool.submit_app(clean_position_data, raw_filename,
+                           float(max_speed), float(distance_accuracy))
 
 
-def convert_cpr_data_on_day(date):
+def convert_cpr_data_on_day(pool, date):
     """
-    Call the convert_cpr_data function as a process to run in parallel.
+    Call the convert_cpr_data function in a worker process to run in parallel.
 
     Parameters
     ----------
+    pool: WorkerPool
+        The pool of worker processes.
+
     date: string
         The date in ISO8601 format, e.g. 2017-08-16
 
     Returns
     -------
-    A child process.
+    A Future of the AppResult.
 
     """
     cpr_filename = create_original_cpr_filename(date)
+    return pool.submit_app(convert_cpr_data, cpr_filename)
+
+
+def wait_for_results(futures):
+    """
+    Wait for the worker processes to complete.
+
+    Parameters
+    ----------
+    futures: list of Futures
+        The Futures of AppResults.
+
+    Returns
+    -------
+    The first non-zero errno error_code, zero if all were successful.
 
-    return subprocess.Popen(['python', CONVERT_CPR_DATA_APP, cpr_filename],
-                            stdout=subprocess.PIPE, universal_newlines=True)
+    """
+    error_code = 0
+    for future in futures:
+        result = future.result()
+        log.info(f'{result}')
+        if result.error_code:
+            log.error(f'{result.name} failed, exception: {result.exception}')
+            error_code = error_code if error_code else result.error_code
+
+    return error_code
 
 
 def convert_fr24_data_on_day(date):
@@ -165,7 +193,9 @@ def process_fr24_flights(date, airports_filename):
     put_processed(PRODUCTS_FLEET, [create_fleet_data_filename(date)])
 
 
-def merge_cpr_and_fr24_data(date):
+def merge_cpr_and_fr24_data(date, max_speed=DEFAULT_MAX_SPEED,
+                            distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                            samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Merge the CPR and FR24 data for the given date.
 
@@ -174,21 +204,35 @@ def merge_cpr_and_fr24_data(date):
     date: string
         The date in ISO8601 format, e.g. 2017-08-16
 
+    max_speed: string
+        The maximum ground speed permitted between adjacent positions [Knots],
+        used to clean the positions of the boundary state, default: 750 Knots.
+
+    distance_accuracy: string
+        The maximum distance between positions at the same time [Nautical Miles],
+        used to clean the positions of the boundary state, default: 0.25 NM.
+
+    samples: int
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
     """
     match_filenames = create_match_cpr_adsb_input_filenames(date)
-    error_code = match_cpr_adsb_trajectories(match_filenames)
+    error_code = match_cpr_adsb_trajectories(match_filenames, samples=int(samples))
     if error_code:
         sys.exit(error_code)
     gc.collect()
 
     merge_filenames = create_merge_cpr_adsb_input_filenames(date)
-    error_code = merge_cpr_adsb_trajectories(merge_filenames)
+    error_code = merge_cpr_adsb_trajectories(merge_filenames, float(max_speed),
+                                             float(distance_accuracy))
     if error_code:
         sys.exit(error_code)
 
 
 def import_data_on_day(date, max_speed=DEFAULT_MAX_SPEED,
-                       distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
+                       distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                       samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Import, refine and merge the CPR and FR24 data for the given date.
 
@@ -205,70 +249,76 @@ def import_data_on_day(date, max_speed=DEFAULT_MAX_SPEED,
         The maximum distance between positions at the same time [Nautical Miles],
         default: 0.25 NM.
 
+    samples: int
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
     """
     if is_valid_iso8601_date(date):
 
         log.info(f'Getting data for date: {date}')
 
-        # convert the FR24 data
-        # Note: needs over 13GB memory if run with convert_cpr_data.
-        get_unprocessed(FR24, date, '.')
-        convert_fr24_data_on_day(date)
-        gc.collect()
+        with WorkerPool(WORKER_POOL_SIZE) as pool:
+            # convert the FR24 data
+            # Note: needs over 13GB memory if run with convert_cpr_data.
+            get_unprocessed(FR24, date, '.')
+            convert_fr24_data_on_day(date)
+            gc.collect()
 
-        # Clean the FR24 data in parallel
-        procs = []
-        procs.append(clean_raw_positions_data(FR24, date,
-                                              max_speed, distance_accuracy))
+            # Clean the FR24 data in parallel
+            futures = []
+            futures.append(clean_raw_positions_data(pool, FR24, date,
+                                                    max_speed, distance_accuracy))
 
-        # convert the CPR data in parallel
-        get_unprocessed(CPR, date, '.')
-        cpr_proc = convert_cpr_data_on_day(date)
+            # convert the CPR data in parallel
+            get_unprocessed(CPR, date, '.')
+            cpr_future = convert_cpr_data_on_day(pool, date)
 
-        # write the converted FR24 data to the Google bucket
-        put_processed(REFINED_FR24, create_convert_fr24_filenames(date))
+            # write the converted FR24 data to the Google bucket
+            put_processed(REFINED_FR24, create_convert_fr24_filenames(date))
 
-        process_fr24_flights(date, DEFAULT_AIRPORTS_FILENAME)
-        gc.collect()
+            process_fr24_flights(date, DEFAULT_AIRPORTS_FILENAME)
+            gc.collect()
 
-        # Wait for CPR conversion to finish
-        out, err = cpr_proc.communicate()
-        print(out)
-        gc.collect()
+            # Wait for CPR conversion to finish
+            error_code = wait_for_results([cpr_future])
+            if error_code:
+                return error_code
 
-        # Clean the CPR and FR24 data in parallel
-        procs.append(clean_raw_positions_data(CPR, date,
-                                              max_speed, distance_accuracy))
+            # Clean the CPR and FR24 data in parallel
+            futures.append(clean_raw_positions_data(pool, CPR, date,
+                                                    max_speed, distance_accuracy))
 
-        # write the converted CPR data to the Google bucket
-        put_processed(REFINED_CPR, create_convert_cpr_filenames(date))
+            # write the converted CPR data to the Google bucket
+            put_processed(REFINED_CPR, create_convert_cpr_filenames(date))
 
-        # Wait for the CPR and FR24 cleaning tasks
-        for proc in procs:
-            out, err = proc.communicate()
-            print(out)
+            # Wait for the CPR and FR24 cleaning tasks
+            error_code = wait_for_results(futures)
+            if error_code:
+                return error_code
 
-        # write the CPR and FR24 positions to the Google bucket
-        write_clean_positions_data(CPR, date)
-        write_clean_positions_data(FR24, date)
-        gc.collect()
+            # write the CPR and FR24 positions to the Google bucket
+            write_clean_positions_data(CPR, date)
+            write_clean_positions_data(FR24, date)
+            gc.collect()
 
-        merge_cpr_and_fr24_data(date)
-        gc.collect()
+            merge_cpr_and_fr24_data(date, max_speed, distance_accuracy, samples)
+            gc.collect()
 
-        # Clean the merged positions
-        proc = clean_raw_positions_data(CPR_FR24, date,
-                                        max_speed, distance_accuracy)
+            # Clean the merged positions
+            future = clean_raw_positions_data(pool, CPR_FR24, date,
+                                              max_speed, distance_accuracy)
 
-        # put the merged CPR and FR24 data to the Google bucket
-        put_processed(REFINED_MERGED_DAILY_CPR_FR24_IDS,
-                      create_match_cpr_adsb_output_filenames(date))
-        put_processed(REFINED_MERGED_DAILY_CPR_FR24,
-                      create_merge_cpr_adsb_output_filenames(date))
+            # put the merged CPR and FR24 data to the Google bucket
+            put_processed(REFINED_MERGED_DAILY_CPR_FR24_IDS,
+                          create_match_cpr_adsb_output_filenames(date))
+            put_processed(REFINED_MERGED_DAILY_CPR_FR24,
+                          create_merge_cpr_adsb_output_filenames(date))
 
-        # Wait for cleaning to finish
-        out, err = proc.communicate()
-        print(out)
+            # Wait for cleaning to finish
+            error_code = wait_for_results([future])
+            if error_code:
+                return error_code
 
         # put the merged CPR and FR24 positions to the Google bucket
         write_clean_positions_data(CPR_FR24, date)
@@ -283,7 +333,7 @@ def import_data_on_day(date, max_speed=DEFAULT_MAX_SPEED,
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print('Usage: import_data_on_day.py <date>'
-              ' [max_speed] [distance_accuracy]')
+              ' [max_speed] [distance_accuracy] [samples]')
         sys.exit(errno.EINVAL)
 
     max_speed = DEFAULT_MAX_SPEED
@@ -294,6 +344,11 @@ if __name__ == '__main__':
     if len(sys.argv) >= 4:
         distance_accuracy = float(sys.argv[3])
 
-    error_code = import_data_on_day(sys.argv[1], max_speed, distance_accuracy)
+    samples = DEFAULT_VERIFICATION_SAMPLES
+    if len(sys.argv) >= 5:
+        samples = int(sys.argv[4])
+
+    error_code = import_data_on_day(sys.argv[1], max_speed, distance_accuracy,
+                                    samples)
     if error_code:
         sys.exit(error_code)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+"""
+Runs the import or intersections stages for a given day as a TaskGraph.
+
+The completion state of the stages is persisted in a json file, so that
+rerunning the process only runs the stages that are not up to date.
+The metrics of the stages are summarised in a json run report.
+"""
+
+import sys
+import os
+import errno
+from datetime import datetime
+
+from pru.trajectory_fields import is_valid_iso8601_date
+from pru.task_graph import count_failed_tasks
+from pru.worker_pool import WorkerPool
+from pru.stage_metrics import stage_metrics_filename, write_run_report
+from scripts.pipeline_graphs import create_import_data_graph, \
+    create_intersections_graph
+from pru.logger import logger
+
+log = logger(__name__)
+
+IMPORT = 'import'
+""" Run the stages of import_data_on_day. """
+
+INTERSECTIONS = 'intersections'
+""" Run the stages of the find_*_intersections_on_day processes. """
+
+PIPELINE_GRAPHS = {IMPORT: create_import_data_graph,
+                   INTERSECTIONS: create_intersections_graph}
+""" The functions to create the pipeline graphs. """
+
+DEFAULT_STATE_FILENAME = 'pipeline_state_{}_{}.json'
+""" The format of the default task state filename. """
+
+
+def run_pipeline_on_day(date, pipeline=IMPORT, *, state_filename=None,
+                        cpu_budget=os.cpu_count(), memory_budget=None):
+    """
+    Run the pipeline stages for the given date.
+
+    Parameters
+    ----------
+    date: string
+        The date in ISO8601 format, e.g. 2017-08-16
+
+    pipeline: string
+        The pipeline to run: 'import' or 'intersections', default 'import'.
+
+    state_filename: string
+        The name of the task state file,
+        default None: 'pipeline_state_<pipeline>_<date>.json'.
+
+    cpu_budget: int
+        The maximum number of CPUs to use, default: the number of CPUs.
+
+    memory_budget: float
+        The maximum memory to use [GB], default None: unlimited.
+
+    Returns
+    -------
+    An errno error_code if an error occured, zero otherwise.
+
+    """
+    if not is_valid_iso8601_date(date):
+        log.error(f'invalid date: {date}')
+        return errno.EINVAL
+
+    if pipeline not in PIPELINE_GRAPHS:
+        log.error(f'invalid pipeline: {pipeline}')
+        return errno.EINVAL
+
+    if state_filename is None:
+        state_filename = DEFAULT_STATE_FILENAME.format(pipeline, date)
+
+    graph = PIPELINE_GRAPHS[pipeline](date)
+    start_time = datetime.utcnow()
+    with WorkerPool(cpu_budget) as pool:
+        results = graph.run(cpu_budget=cpu_budget, memory_budget=memory_budget,
+                            state_filename=state_filename, executor=pool)
+
+    metrics_filename = stage_metrics_filename()
+    if os.path.exists(metrics_filename):
+        write_run_report(metrics_filename, start_time=start_time)
+
+    failed_count = count_failed_tasks(results)
+    if failed_count:
+        log.error(f'{pipeline} pipeline for {date}: {failed_count} tasks failed')
+        return errno.EIO
+
+    log.info(f'{pipeline} pipeline for {date} complete')
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: run_pipeline_on_day.py <date> [import|intersections]'
+              ' [cpu_budget] [memory_budget]')
+        sys.exit(errno.EINVAL)
+
+    pipeline = IMPORT
+    if len(sys.argv) >= 3:
+        pipeline = sys.argv[2]
+
+    cpu_budget = os.cpu_count()
+    if len(sys.argv) >= 4:
+        try:
+            cpu_budget = int(sys.argv[3])
+        except ValueError:
+            log.error(f'invalid cpu_budget: {sys.argv[3]}')
+            sys.exit(errno.EINVAL)
+
+    memory_budget = None
+    if len(sys.argv) >= 5:
+        try:
+            memory_budget = float(sys.argv[4])
+        except ValueError:
+            log.error(f'invalid memory_budget: {sys.argv[4]}')
+            sys.exit(errno.EINVAL)
+
+    error_code = run_pipeline_on_day(sys.argv[1], pipeline,
+                                     cpu_budget=cpu_budget,
+                                     memory_budget=memory_budget)
+    if error_code:
+        sys.exit(error_code)
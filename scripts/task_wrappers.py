@@ -12,6 +12,7 @@ from pru.trajectory_fields import is_valid_iso8601_date
 from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, CPR, FR24, CPR_FR24
 from pru.filesystem.data_store_operations import REFINED_DIR
 from pru.trajectory_cleaning import DEFAULT_MAX_SPEED, DEFAULT_DISTANCE_ACCURACY
+from pru.trajectory_verification import DEFAULT_VERIFICATION_SAMPLES
 from pru.trajectory_analysis import DEFAULT_ACROSS_TRACK_TOLERANCE
 from pru.trajectory_interpolation import DEFAULT_STRAIGHT_INTERVAL, DEFAULT_TURN_INTERVAL
 from pru.logger import logger
@@ -96,7 +97,8 @@ def refine_fr24_data(date, *, max_speed=DEFAULT_MAX_SPEED,
 
 
 def merge_cpr_fr24_data(date, *, max_speed=DEFAULT_MAX_SPEED,
-                        distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
+                        distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                        samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Match, merge and clean refined CPR and FR24 ADS-B data for the given date.
 
@@ -113,6 +115,10 @@ def merge_cpr_fr24_data(date, *, max_speed=DEFAULT_MAX_SPEED,
         The maximum distance between positions at the same time [Nautical Miles],
         default: 0.25 NM.
 
+    samples: string
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
     Returns
     -------
         True if succesful, False otherwise.
@@ -120,8 +126,9 @@ def merge_cpr_fr24_data(date, *, max_speed=DEFAULT_MAX_SPEED,
     """
     if is_valid_iso8601_date(date):
         os.chdir(REFINED_DIR)
-        tasks.match_cpr_adsb_trajectories_on(date)
-        tasks.merge_cpr_adsb_trajectories_on(date)
+        tasks.match_cpr_adsb_trajectories_on(date, int(samples))
+        tasks.merge_cpr_adsb_trajectories_on(date, float(max_speed),
+                                             float(distance_accuracy))
 
         return tasks.clean_raw_positions_data(CPR_FR24, date, float(max_speed),
                                               float(distance_accuracy))
@@ -130,7 +137,7 @@ def merge_cpr_fr24_data(date, *, max_speed=DEFAULT_MAX_SPEED,
         return False
 
 
-def merge_cpr_fr24_overnight_flights(date):
+def merge_cpr_fr24_overnight_flights(date, samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Match, merge and clean merged CPR and FR24 ADS-B data for the given date,
     with merged CPR and FR24 ADS-B data for the previous day.
@@ -148,6 +155,10 @@ def merge_cpr_fr24_overnight_flights(date):
         The maximum distance between positions at the same time [Nautical Miles],
         default: 0.25 NM.
 
+    samples: string
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
     Returns
     -------
         True if succesful, False otherwise.
@@ -155,7 +166,7 @@ def merge_cpr_fr24_overnight_flights(date):
     """
     if is_valid_iso8601_date(date):
         os.chdir(REFINED_DIR)
-        if tasks.match_previous_days_flights(date):
+        if tasks.match_previous_days_flights(date, int(samples)):
             if tasks.merge_previous_days_data(date):
                 return tasks.clean_overnight_cpr_fr24_positions(date)
     else:
@@ -10,7 +10,6 @@ trajectories.
 
 import os
 import gc
-import subprocess
 from pru.env.env_constants import DATA_HOME, UPLOAD_DIR
 from pru.filesystem.data_store_operations import REFINED_CPR, REFINED_FR24, REFINED_APDS, \
     FLEET_DATA_DIR, \
@@ -20,10 +19,11 @@ from pru.filesystem.data_store_operations import REFINED_CPR, REFINED_FR24, REFI
     PRODUCTS_ERROR_METRICS_CPR_FR24_OVERNIGHT, PRODUCTS_INTERSECTIONS_SECTOR, \
     PRODUCTS_INTERSECTIONS_AIRPORT, PRODUCTS_INTERSECTIONS_USER, \
     REFINED_MERGED_APDS_CPR_FR24, REFINED_MERGED_APDS_CPR_FR24_IDS, \
-    path_exists, get_unprocessed, put_processed, get_processed, \
+    path_exists, get_unprocessed, put_processed, get_processed, list_bucket, \
     get_airports, get_apds, get_stands, AIRPORTS_STANDS
 from pru.trajectory_fields import iso8601_previous_day, split_dual_date, \
-    read_iso8601_date_string, CSV_FILE_EXTENSION, JSON_FILE_EXTENSION
+    read_iso8601_date_string, CSV_FILE_EXTENSION, JSON_FILE_EXTENSION, \
+    BZ2_FILE_EXTENSION
 from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, DEFAULT_STANDS_FILENAME, \
     APDS, CPR, FR24, CPR_FR24, PREV_DAY, NEW, REF, RAW_CPR_FR24, ERROR_METRICS, \
     TRAJECTORIES, TRAJ_METRICS, SYNTH_POSITIONS, \
@@ -37,12 +37,15 @@ from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, DEFAULT_STANDS_FILEN
     create_match_cpr_adsb_input_filenames, create_match_cpr_adsb_output_filenames, \
     create_merge_cpr_adsb_input_filenames, create_merge_cpr_adsb_output_filenames, \
     create_match_consecutive_day_input_filenames, create_matching_ids_filename, \
+    create_match_consecutive_day_boundary_filenames, create_boundary_state_filename, \
     create_merge_consecutive_day_input_filenames, \
     create_merge_consecutive_day_output_filenames, \
     create_convert_apds_filenames, create_daily_filenames, \
     create_match_apds_input_filenames, \
     create_merge_apds_input_filenames, create_merge_apds_output_filenames
 from pru.trajectory_cleaning import DEFAULT_MAX_SPEED, DEFAULT_DISTANCE_ACCURACY
+from pru.boundary_state import DEFAULT_BOUNDARY_HOURS
+from pru.trajectory_verification import DEFAULT_VERIFICATION_SAMPLES
 from pru.trajectory_analysis import DEFAULT_ACROSS_TRACK_TOLERANCE, MOVING_AVERAGE_SPEED, \
     DEFAULT_MOVING_MEDIAN_SAMPLES, DEFAULT_MOVING_AVERAGE_SAMPLES, \
     DEFAULT_SPEED_MAX_DURATION
@@ -58,7 +61,8 @@ from apps.convert_apt_data import convert_apds_data
 
 from apps.match_cpr_adsb_trajectories import match_cpr_adsb_trajectories
 from apps.merge_cpr_adsb_trajectories import merge_cpr_adsb_trajectories
-from apps.match_consecutive_day_trajectories import match_consecutive_day_trajectories
+from apps.match_consecutive_day_trajectories import match_consecutive_day_trajectories, \
+    match_consecutive_day_boundary_states
 from apps.merge_consecutive_day_trajectories import merge_consecutive_day_trajectories
 from apps.match_apt_trajectories import match_apds_trajectories
 from apps.merge_apt_trajectories import merge_apds_trajectories
@@ -71,6 +75,7 @@ from apps.find_airport_intersections import find_airport_intersections, \
     DEFAULT_MOVEMENTS_AIRPORTS_FILENAME
 from apps.find_user_airspace_intersections import find_user_airspace_intersections
 
+from pru.stage_metrics import measure_stage
 from pru.logger import logger
 
 log = logger(__name__)
@@ -79,6 +84,7 @@ DEFAULT_LOGGING_COUNT = 5000
 """ The default number of flights between each log message. """
 
 
+@measure_stage
 def clean_raw_positions_data(source, date, max_speed=DEFAULT_MAX_SPEED,
                              distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
     """
@@ -125,6 +131,7 @@ def clean_raw_positions_data(source, date, max_speed=DEFAULT_MAX_SPEED,
     return put_processed(source_path, filenames[:1])
 
 
+@measure_stage
 def convert_cpr_file(date):
     """
     Converts a CPR file for the given date into PRU format.
@@ -152,6 +159,7 @@ def convert_cpr_file(date):
     return put_processed(REFINED_CPR, create_convert_cpr_filenames(date))
 
 
+@measure_stage
 def convert_fr24_date(date):
     """
     Converts a FR24 ADS-B data for the given date into PRU format.
@@ -180,6 +188,7 @@ def convert_fr24_date(date):
     return put_processed(REFINED_FR24, create_convert_fr24_filenames(date))
 
 
+@measure_stage
 def convert_airport_codes(date, airports_filename=DEFAULT_AIRPORTS_FILENAME):
     """
     Convert FR24 IATA departure and destination airport codes to ICAO codes.
@@ -214,6 +223,7 @@ def convert_airport_codes(date, airports_filename=DEFAULT_AIRPORTS_FILENAME):
     return put_processed(REFINED_FR24, [create_flights_filename(FR24, date)])
 
 
+@measure_stage
 def extract_fleet_date(date):
     """
     Extract aircraft fleet data from an FR24 flights file for the fleet database.
@@ -245,7 +255,8 @@ def extract_fleet_date(date):
     return copied_ok
 
 
-def match_cpr_adsb_trajectories_on(date):
+@measure_stage
+def match_cpr_adsb_trajectories_on(date, samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Match refined CPR and FR24 ADS-B data for the given date.
 
@@ -254,13 +265,17 @@ def match_cpr_adsb_trajectories_on(date):
     date: string
         The date in ISO8601 format, e.g. 2017-08-16
 
+    samples: int
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
     Returns
     -------
         True if succesful, False otherwise.
 
     """
     filenames = create_match_cpr_adsb_input_filenames(date)
-    if match_cpr_adsb_trajectories(filenames):
+    if match_cpr_adsb_trajectories(filenames, samples=samples):
         return False
     gc.collect()
 
@@ -268,7 +283,10 @@ def match_cpr_adsb_trajectories_on(date):
                          create_match_cpr_adsb_output_filenames(date))
 
 
-def merge_cpr_adsb_trajectories_on(date):
+@measure_stage
+def merge_cpr_adsb_trajectories_on(date, max_speed=DEFAULT_MAX_SPEED,
+                                   distance_accuracy=DEFAULT_DISTANCE_ACCURACY,
+                                   boundary_hours=DEFAULT_BOUNDARY_HOURS):
     """
     Merge refined CPR and FR24 ADS-B data for the given date.
 
@@ -277,13 +295,26 @@ def merge_cpr_adsb_trajectories_on(date):
     date: string
         The date in ISO8601 format, e.g. 2017-08-16
 
+    max_speed: float
+        The maximum ground speed permitted between adjacent positions [Knots],
+        used to clean the positions of the boundary state, default: 750 Knots.
+
+    distance_accuracy: float
+        The maximum distance between positions at the same time [Nautical Miles],
+        used to clean the positions of the boundary state, default: 0.25 NM.
+
+    boundary_hours: float
+        The period at the start of the day of the boundary state [Hours],
+        default: 4 hours.
+
     Returns
     -------
         True if succesful, False otherwise.
 
     """
     filenames = create_merge_cpr_adsb_input_filenames(date)
-    if merge_cpr_adsb_trajectories(filenames):
+    if merge_cpr_adsb_trajectories(filenames, max_speed, distance_accuracy,
+                                   boundary_hours):
         return False
     gc.collect()
 
@@ -294,7 +325,27 @@ def merge_cpr_adsb_trajectories_on(date):
                          create_merge_cpr_adsb_output_filenames(date))
 
 
-def match_previous_days_flights(date):
+def get_boundary_state_file(data_type, filename):
+    """
+    Get a boundary state file from the bucket, if it is not available locally.
+
+    Note: get_processed fails to remove the .bz2 file of a missing file,
+    so the file is only got if it is in the bucket.
+
+    Returns
+    -------
+        True if the file is available, False otherwise.
+
+    """
+    if path_exists(filename):
+        return True
+
+    path = '/'.join([data_type, filename + BZ2_FILE_EXTENSION])
+    return bool(list_bucket(path)) and all(get_processed(data_type, [filename]))
+
+
+@measure_stage
+def match_previous_days_flights(date, samples=DEFAULT_VERIFICATION_SAMPLES):
     """
     Match merged CPR and FR24 ADS-B data for the given date,
     with merged CPR and FR24 ADS-B data for the previous day.
@@ -304,6 +355,10 @@ def match_previous_days_flights(date):
     date: string
         The date in ISO8601 format, e.g. 2017-08-16
 
+    samples: int
+        The number of times to compare candidate trajectories at,
+        default: DEFAULT_VERIFICATION_SAMPLES.
+
     Returns
     -------
         True if succesful, False otherwise.
@@ -328,16 +383,27 @@ def match_previous_days_flights(date):
             log.error('Current days files not found in daily_cpr_fr24 bucket')
             return False
 
+    # Match the tail of the previous day with the head of the current day,
+    # if their boundary states are available
     filenames = create_match_consecutive_day_input_filenames(date)
-    if match_consecutive_day_trajectories(filenames):
-        return False
+    boundary_files = create_match_consecutive_day_boundary_filenames(date)
+    if get_boundary_state_file(REFINED_MERGED_OVERNIGHT_CPR_FR24, boundary_files[0]) and \
+            get_boundary_state_file(REFINED_MERGED_DAILY_CPR_FR24, boundary_files[1]):
+        if match_consecutive_day_boundary_states(boundary_files, samples=samples):
+            return False
+        [os.remove(file_path) for file_path in boundary_files]
+    else:
+        log.debug('Boundary states not found, matching days files')
+        if match_consecutive_day_trajectories(filenames, samples=samples):
+            return False
     gc.collect()
 
     prev_ids_filename = create_matching_ids_filename(PREV_DAY, date)
     return put_processed(REFINED_MERGED_OVERNIGHT_CPR_FR24_IDS, [prev_ids_filename])
 
 
-def merge_previous_days_data(date):
+@measure_stage
+def merge_previous_days_data(date, boundary_hours=DEFAULT_BOUNDARY_HOURS):
     """
     Merge merged CPR and FR24 ADS-B data for the given date,
     with merged CPR and FR24 ADS-B data for the previous day.
@@ -347,28 +413,37 @@ def merge_previous_days_data(date):
     date: string
         The date in ISO8601 format, e.g. 2017-08-16
 
+    boundary_hours: float
+        The period at the end of the day of the boundary state [Hours],
+        default: 4 hours.
+
     Returns
     -------
         True if succesful, False otherwise.
 
     """
     filenames = create_merge_consecutive_day_input_filenames(date)
-    if merge_consecutive_day_trajectories(filenames):
+    if merge_consecutive_day_trajectories(filenames, boundary_hours):
         return False
     gc.collect()
 
     # rename output filenames to input files
     new_files = create_merge_consecutive_day_output_filenames(date)
     log.debug("Moving files: %s", str(new_files))
-    [subprocess.run(['mv', file, file[len(NEW) + 1:]]) for file in new_files]
+    [os.rename(file, file[len(NEW) + 1:]) for file in new_files]
 
     # rename the previous days positions filename to raw_...
     raw_positions_filename = filenames[3].replace(CPR_FR24, RAW_CPR_FR24)
     os.rename(filenames[3], raw_positions_filename)
     filenames[3] = raw_positions_filename
 
-    copied_ok = put_processed(REFINED_MERGED_OVERNIGHT_CPR_FR24, filenames[1:])
+    # The tail of the merged day, for matching the next day
+    boundary_filename = create_boundary_state_filename(CPR_FR24, date, is_tail=True)
+
+    copied_ok = put_processed(REFINED_MERGED_OVERNIGHT_CPR_FR24,
+                              filenames[1:] + [boundary_filename])
     if copied_ok:
+        os.remove(boundary_filename)
         [os.remove(file_path) for file_path in filenames[:3]]
         # Don't remove the raw positions file
         [os.remove(file_path) for file_path in filenames[4:]]
@@ -376,6 +451,7 @@ def merge_previous_days_data(date):
     return copied_ok
 
 
+@measure_stage
 def clean_overnight_cpr_fr24_positions(date, max_speed=DEFAULT_MAX_SPEED,
                                        distance_accuracy=DEFAULT_DISTANCE_ACCURACY):
     """
@@ -422,6 +498,7 @@ def clean_overnight_cpr_fr24_positions(date, max_speed=DEFAULT_MAX_SPEED,
     return True
 
 
+@measure_stage
 def analyse_positions_on_date(date, source=CPR_FR24, *,
                               distance_tolerance=DEFAULT_ACROSS_TRACK_TOLERANCE,
                               time_method=MOVING_AVERAGE_SPEED,
@@ -488,6 +565,7 @@ def analyse_positions_on_date(date, source=CPR_FR24, *,
     return put_processed(output_path, filenames[:1])
 
 
+@measure_stage
 def interpolate_trajectory_file(trajectory_filename, source=CPR_FR24,
                                 straight_interval=DEFAULT_STRAIGHT_INTERVAL,
                                 turn_interval=DEFAULT_TURN_INTERVAL,
@@ -533,6 +611,7 @@ def interpolate_trajectory_file(trajectory_filename, source=CPR_FR24,
     return put_processed(output_path, [output_filename])
 
 
+@measure_stage
 def refine_apds_file(apds_filename, stands_filename=DEFAULT_STANDS_FILENAME):
     """
     Converts an APDS file into PRU format flights, positions and events files.
@@ -573,6 +652,7 @@ def refine_apds_file(apds_filename, stands_filename=DEFAULT_STANDS_FILENAME):
                          create_convert_apds_filenames(from_date, to_date))
 
 
+@measure_stage
 def match_apds_trajectories_on_day(from_date, to_date, date):
     """
     Match refined APDS data with CPR and FR24 ADS-B data for the given date.
@@ -618,6 +698,7 @@ def match_apds_trajectories_on_day(from_date, to_date, date):
                          [create_matching_ids_filename(APDS, date)])
 
 
+@measure_stage
 def merge_apds_trajectories_on_day(from_date, to_date, date):
     """
     Merge refined APDS data with CPR and FR24 ADS-B data for the given date.
@@ -665,6 +746,7 @@ def merge_apds_trajectories_on_day(from_date, to_date, date):
     return ok
 
 
+@measure_stage
 def find_trajectory_sector_intersections(trajectory_filename, source=CPR_FR24,
                                          logging_msg_count=DEFAULT_LOGGING_COUNT):
     """
@@ -688,6 +770,7 @@ def find_trajectory_sector_intersections(trajectory_filename, source=CPR_FR24,
     return put_processed(intersections_path, [output_filename])
 
 
+@measure_stage
 def find_trajectory_airport_intersections(trajectory_filename, source=CPR_FR24,
                                           radius=DEFAULT_RADIUS,
                                           airports_filename=DEFAULT_MOVEMENTS_AIRPORTS_FILENAME,
@@ -726,6 +809,7 @@ def find_trajectory_airport_intersections(trajectory_filename, source=CPR_FR24,
     return put_processed(intersections_path, [output_filename])
 
 
+@measure_stage
 def find_trajectory_user_airspace_intersections(trajectory_filename, source=CPR_FR24,
                                                 logging_msg_count=DEFAULT_LOGGING_COUNT):
     """
@@ -5,12 +5,17 @@
 # Consult your license regarding permissions and restrictions.
 #
 import unittest
+import os
+import tempfile
 from pru.db.reference.reference_admin import remove_ref_db, create_ref_db, initialise_fleet_data
+from pru.db.reference.reference_admin import migrate_fleet_data
 from pru.db.reference.ref_operations import find_by_keys, insert_aircraft
 from pru.db.reference.ref_operations import remove_aircraft, add_fleet_data_file
 from pru.db.reference.ref_operations import find_aircraft, find_by_reg_type, find_by_keys
 from pru.db.reference.ref_operations import REG_KEY, TYPE_KEY, ADDRESS_KEY
-from pru.db.reference.ref_init import add_fleet_record
+from pru.db.reference.ref_init import add_fleet_record, upsert_fleet_data
+from pru.db.reference.ref_init import has_fleet_index, FLEET_INDEX_NAME
+from psycopg2.extensions import AsIs
 import pru.db.context as ctx
 from datetime import datetime
 
@@ -73,6 +78,67 @@ class TestRefOperations(unittest.TestCase):
         print(insert_aircraft(record1[0], record1[1], '0x555555', record1[3]))
         print(insert_aircraft(record1[0], record1[1], '0x555555', now + 'Z'))
 
+    def test_upsert_fleet_data(self):
+        """
+        Records are added once by registration, type and address with their
+        earliest period start.
+        """
+        connection = ctx.get_connection(ctx.CONTEXT, ctx.REF_DB_USER)
+        context = ctx.CONTEXT
+        with tempfile.TemporaryDirectory() as directory:
+            fleet_file = os.path.join(directory, 'fleet_data_2017-08-01.csv')
+            with open(fleet_file, 'w') as file:
+                file.write('AIRCRAFT_REG,AIRCRAFT_TYPE,AIRCRAFT_ADDRESS,PERIOD_START\n')
+                file.write(','.join(record3) + '\n')
+                file.write(','.join(record3[:3] + ['2017-08-01T20:01:59Z']) + '\n')
+                file.write('GZZQQ,MY-PLANE-3,,2017-08-01T22:01:59Z\n')
+            self.assertEqual(upsert_fleet_data(fleet_file, context, connection), 2)
+            self.assertEqual(upsert_fleet_data(fleet_file, context, connection), 0)
+
+        found, rows = find_by_keys({'AIRCRAFT_REG': 'GZZGG', 'AIRCRAFT_TYPE': 'MY-PLANE',
+                                    'AIRCRAFT_ADDRESS': '0x777777'}, context, connection)
+        self.assertTrue(found)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['period_start'], datetime(2017, 8, 1, 20, 1, 59))
+        found, rows = find_by_keys({'AIRCRAFT_REG': 'GZZQQ', 'AIRCRAFT_TYPE': 'MY-PLANE-3',
+                                    'AIRCRAFT_ADDRESS': ''}, context, connection)
+        self.assertTrue(found)
+        [remove_aircraft(row['id'], context, connection) for row in rows]
+
+    def test_migrate_fleet_data(self):
+        """
+        A fleet table without the unique index is deduplicated and indexed.
+        """
+        context = ctx.CONTEXT
+        postgres_connection = ctx.get_connection(context, ctx.REF_POSTGRES_DB)
+        with postgres_connection.cursor() as cursor:
+            cursor.execute("DROP INDEX %s.%s;",
+                           [AsIs(context[ctx.SCHEMA_NAME]), AsIs(FLEET_INDEX_NAME)])
+        postgres_connection.close()
+
+        connection = ctx.get_connection(context, ctx.REF_DB_USER)
+        self.assertFalse(has_fleet_index(context, connection))
+        add_fleet_record(record3, context, connection)
+        add_fleet_record(record3[:3] + ['2017-08-01T20:01:59Z'], context, connection)
+        with tempfile.TemporaryDirectory() as directory:
+            fleet_file = os.path.join(directory, 'fleet_data_2017-08-01.csv')
+            with open(fleet_file, 'w') as file:
+                file.write('AIRCRAFT_REG,AIRCRAFT_TYPE,AIRCRAFT_ADDRESS,PERIOD_START\n')
+                file.write(','.join(record3) + '\n')
+            with self.assertRaises(RuntimeError):
+                upsert_fleet_data(fleet_file, context, connection)
+
+            self.assertTrue(migrate_fleet_data())
+            self.assertTrue(has_fleet_index(context, connection))
+            self.assertEqual(upsert_fleet_data(fleet_file, context, connection), 0)
+
+        found, rows = find_by_keys({'AIRCRAFT_REG': 'GZZGG', 'AIRCRAFT_TYPE': 'MY-PLANE',
+                                    'AIRCRAFT_ADDRESS': '0x777777'}, context, connection)
+        self.assertTrue(found)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['period_start'], datetime(2017, 8, 1, 20, 1, 59))
+        [remove_aircraft(row['id'], context, connection) for row in rows]
+
 
 class TestRefFindOperations(unittest.TestCase):
     def test_find_by_dict(self):
@@ -107,6 +173,8 @@ def suite():
     suite.addTest(TestRefOperations('test_add_fleet_data_file'))
     suite.addTest(TestRefOperations('test_add_record'))
     suite.addTest(TestRefOperations('test_add_same_record'))
+    suite.addTest(TestRefOperations('test_upsert_fleet_data'))
+    suite.addTest(TestRefOperations('test_migrate_fleet_data'))
 
     suite.addTest(TestRefFindOperations('test_find_by_dict'))
     suite.addTest(TestRefFindOperations('test_find_by_bad_dict'))
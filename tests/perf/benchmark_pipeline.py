@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+"""
+Benchmarks the apps of the pipeline on reproducible synthetic traffic data.
+
+The synthetic data is generated by synthetic_traffic.py, the stages are run
+in pipeline order and their metrics (see pru.stage_metrics) are appended to a
+benchmark history file, together with the git commit, scale and seed, so that
+the performance of the stages can be compared across commits.
+
+The sector and user airspace intersections require a PostGIS database.
+They are only run if the database option is given, after the synthetic
+sectors, airports and user airspaces have been loaded into the database.
+A stage whose modules cannot be imported or whose input files do not exist
+is skipped.
+
+Usage: benchmark_pipeline.py <directory> [flights_count] [seed] [stages]
+    [history_filename] [database]
+where stages is a comma separated list of stage names or groups, e.g.
+convert,clean,match_cpr_adsb
+
+The pru and apps packages are imported from the PYTHONPATH, as in the docker
+images, e.g. run from the repository root:
+PYTHONPATH=. python tests/perf/benchmark_pipeline.py <directory>
+"""
+
+import os
+import sys
+import errno
+import subprocess
+from datetime import datetime
+import pandas as pd
+from synthetic_traffic import DEFAULT_FLIGHTS_COUNT, DEFAULT_SEED, \
+    APDS_FILENAME_PREFIX, STANDS_FILENAME, SECTORS_FILENAME, \
+    USER_AIRSPACES_FILENAME, generate_synthetic_data
+from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, \
+    DEFAULT_AIRPORT_MOVEMENTS_FILENAME, CPR, FR24, CPR_FR24, \
+    create_original_cpr_filename, create_original_fr24_data_filenames, \
+    create_convert_fr24_filenames, create_raw_positions_filename, \
+    create_flights_filename, create_positions_filename, \
+    create_match_cpr_adsb_input_filenames, create_merge_cpr_adsb_input_filenames, \
+    create_match_apds_input_filenames, create_merge_apds_input_filenames
+from pru.stage_metrics import STAGE_METRICS_FILENAME_ENV, measure_stage, \
+    read_stage_metrics
+from pru.logger import logger
+
+log = logger(__name__)
+
+BENCHMARK_DATE = '2017-08-01'
+""" The date of the synthetic traffic data. """
+
+DEFAULT_HISTORY_FILENAME = 'benchmark_history.csv'
+""" The default name of the benchmark history file. """
+
+BENCHMARK_METRICS_FILENAME = 'benchmark_metrics.csv'
+""" The name of the stage metrics file of a benchmark run. """
+
+ACROSS_TRACK_TOLERANCE = 0.25
+TIME_METHOD = 'lm'
+""" The analyse_position_data parameters, as used by the pipeline. """
+
+
+def apds_filename(date):
+    """ The name of the synthetic APDS file for the date. """
+    return ''.join([APDS_FILENAME_PREFIX, date, '_', date, '.csv.bz2'])
+
+
+def trajectories_filename(date):
+    """ The name of the trajectories file output by analyse_position_data. """
+    tolerance_string = str(ACROSS_TRACK_TOLERANCE).replace('.', '')
+    return '_'.join([TIME_METHOD, tolerance_string, CPR_FR24, 'trajectories',
+                     date + '.json'])
+
+
+@measure_stage
+def convert_cpr(date):
+    from apps.convert_cpr_data import convert_cpr_data
+    return convert_cpr_data(create_original_cpr_filename(date))
+
+
+@measure_stage
+def convert_fr24(date):
+    from apps.convert_fr24_data import convert_fr24_data
+    return convert_fr24_data(create_original_fr24_data_filenames(date))
+
+
+@measure_stage
+def convert_airports(date):
+    from apps.convert_airport_ids import convert_airport_ids
+    return convert_airport_ids(create_convert_fr24_filenames(date)[0],
+                               DEFAULT_AIRPORTS_FILENAME)
+
+
+@measure_stage
+def extract_fleet(date):
+    from apps.extract_fleet_data import extract_fleet_data
+    return extract_fleet_data(create_convert_fr24_filenames(date)[0])
+
+
+@measure_stage
+def convert_apds(date):
+    from apps.convert_apt_data import convert_apds_data
+    return convert_apds_data(apds_filename(date), STANDS_FILENAME)
+
+
+@measure_stage
+def clean_cpr(date):
+    from apps.clean_position_data import clean_position_data
+    return clean_position_data(create_raw_positions_filename(CPR, date))
+
+
+@measure_stage
+def clean_fr24(date):
+    from apps.clean_position_data import clean_position_data
+    return clean_position_data(create_raw_positions_filename(FR24, date))
+
+
+@measure_stage
+def match_cpr_adsb(date):
+    from apps.match_cpr_adsb_trajectories import match_cpr_adsb_trajectories
+    return match_cpr_adsb_trajectories(create_match_cpr_adsb_input_filenames(date))
+
+
+@measure_stage
+def merge_cpr_adsb(date):
+    from apps.merge_cpr_adsb_trajectories import merge_cpr_adsb_trajectories
+    return merge_cpr_adsb_trajectories(create_merge_cpr_adsb_input_filenames(date))
+
+
+@measure_stage
+def clean_cpr_fr24(date):
+    from apps.clean_position_data import clean_position_data
+    return clean_position_data(create_raw_positions_filename(CPR_FR24, date))
+
+
+@measure_stage
+def match_apds(date):
+    from apps.match_apt_trajectories import match_apds_trajectories
+    return match_apds_trajectories(create_match_apds_input_filenames(date, date, date))
+
+
+@measure_stage
+def merge_apds(date):
+    from apps.merge_apt_trajectories import merge_apds_trajectories
+    return merge_apds_trajectories(create_merge_apds_input_filenames(date, date, date))
+
+
+@measure_stage
+def analyse(date):
+    from apps.analyse_position_data import analyse_position_data
+    return analyse_position_data(create_positions_filename(CPR_FR24, date),
+                                 ACROSS_TRACK_TOLERANCE, TIME_METHOD)
+
+
+@measure_stage
+def interpolate(date):
+    from apps.interpolate_trajectories import interpolate_trajectories
+    return interpolate_trajectories(trajectories_filename(date))
+
+
+@measure_stage
+def airport_intersections(date):
+    from apps.find_airport_intersections import find_airport_intersections
+    return find_airport_intersections(create_flights_filename(CPR_FR24, date),
+                                      trajectories_filename(date),
+                                      airports_filename=DEFAULT_AIRPORT_MOVEMENTS_FILENAME)
+
+
+@measure_stage
+def sector_intersections(date):
+    from apps.find_sector_intersections import find_sector_intersections
+    return find_sector_intersections(trajectories_filename(date))
+
+
+@measure_stage
+def user_intersections(date):
+    from apps.find_user_airspace_intersections import \
+        find_user_airspace_intersections
+    return find_user_airspace_intersections(trajectories_filename(date))
+
+
+BENCHMARK_STAGES = [
+    (convert_cpr, lambda date: [create_original_cpr_filename(date)]),
+    (convert_fr24, create_original_fr24_data_filenames),
+    (convert_airports, lambda date: create_convert_fr24_filenames(date)[:1]),
+    (extract_fleet, lambda date: create_convert_fr24_filenames(date)[:1]),
+    (convert_apds, lambda date: [apds_filename(date)]),
+    (clean_cpr, lambda date: [create_raw_positions_filename(CPR, date)]),
+    (clean_fr24, lambda date: [create_raw_positions_filename(FR24, date)]),
+    (match_cpr_adsb, create_match_cpr_adsb_input_filenames),
+    (merge_cpr_adsb, create_merge_cpr_adsb_input_filenames),
+    (clean_cpr_fr24, lambda date: [create_raw_positions_filename(CPR_FR24, date)]),
+    (match_apds, lambda date: create_match_apds_input_filenames(date, date, date)),
+    (merge_apds, lambda date: create_merge_apds_input_filenames(date, date, date)),
+    (analyse, lambda date: [create_positions_filename(CPR_FR24, date)]),
+    (interpolate, lambda date: [trajectories_filename(date)]),
+    (airport_intersections, lambda date: [trajectories_filename(date)]),
+    (sector_intersections, lambda date: [trajectories_filename(date)]),
+    (user_intersections, lambda date: [trajectories_filename(date)])]
+""" The benchmark stages in pipeline order, with functions to create their input filenames. """
+
+STAGE_GROUPS = {'convert': ['convert_cpr', 'convert_fr24', 'convert_airports',
+                            'extract_fleet', 'convert_apds'],
+                'clean': ['clean_cpr', 'clean_fr24', 'clean_cpr_fr24'],
+                'match': ['match_cpr_adsb', 'match_apds'],
+                'merge': ['merge_cpr_adsb', 'merge_apds'],
+                'analyse': ['analyse'],
+                'interpolate': ['interpolate'],
+                'intersections': ['airport_intersections', 'sector_intersections',
+                                  'user_intersections']}
+""" Groups of benchmark stages. """
+
+DATABASE_STAGES = frozenset(['sector_intersections', 'user_intersections'])
+""" The stages that require a PostGIS database. """
+
+
+def select_stages(names=None):
+    """
+    Select benchmark stages by name or group.
+
+    Parameters
+    ----------
+    names: list of strings
+        The stage or group names, default None: all stages.
+
+    Returns
+    -------
+    A list of the names of the selected stages in pipeline order.
+    """
+    all_stages = [function.__name__ for function, _ in BENCHMARK_STAGES]
+    if not names:
+        return all_stages
+
+    selected = set()
+    for name in names:
+        if name in STAGE_GROUPS:
+            selected.update(STAGE_GROUPS[name])
+        elif name in all_stages:
+            selected.add(name)
+        else:
+            raise ValueError('unknown benchmark stage: ' + name)
+
+    return [name for name in all_stages if name in selected]
+
+
+def git_commit():
+    """ The abbreviated hash of the current git commit, 'unknown' if not available. """
+    try:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=directory, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_database(directory):
+    """
+    Load the synthetic sectors, airports and user airspaces into the database.
+
+    Returns
+    -------
+        True if successful, False otherwise.
+    """
+    try:
+        from pru.db.geo.geo_admin import initialise_airspace, \
+            initialise_airports, initialise_user_airspace
+    except ImportError:
+        log.exception('could not import the database modules')
+        return False
+
+    return initialise_airspace(os.path.join(directory, SECTORS_FILENAME), True) is True \
+        and initialise_airports(os.path.join(directory, DEFAULT_AIRPORT_MOVEMENTS_FILENAME),
+                                True) is True \
+        and initialise_user_airspace(os.path.join(directory, USER_AIRSPACES_FILENAME),
+                                     True) is True
+
+
+def run_benchmarks(directory, *, flights_count=DEFAULT_FLIGHTS_COUNT,
+                   seed=DEFAULT_SEED, stages=None,
+                   history_filename=DEFAULT_HISTORY_FILENAME, database=False):
+    """
+    Generate synthetic data and benchmark the pipeline stages on it.
+
+    Parameters
+    ----------
+    directory: string
+        The directory to generate the data and run the stages in.
+
+    flights_count: int
+        The number of flights per day, default DEFAULT_FLIGHTS_COUNT.
+
+    seed: int
+        The random number generator seed, default DEFAULT_SEED.
+
+    stages: list of strings
+        The stage or group names to run, default None: all stages.
+
+    history_filename: string
+        The name of the benchmark history file, default DEFAULT_HISTORY_FILENAME.
+
+    database: bool
+        Whether to run the stages that require a PostGIS database, default False.
+
+    Returns
+    -------
+    A pandas DataFrame of the benchmark records that were appended to the
+    history file.
+    """
+    stage_names = select_stages(stages)
+    directory = os.path.abspath(directory)
+    history_filename = os.path.abspath(history_filename)
+    date = BENCHMARK_DATE
+
+    generate_synthetic_data(date, date, directory,
+                            flights_count=flights_count, seed=seed)
+    if database and not load_database(directory):
+        log.error('could not load the synthetic airspace into the database')
+        database = False
+
+    metrics_filename = os.path.join(directory, BENCHMARK_METRICS_FILENAME)
+    if os.path.exists(metrics_filename):
+        os.remove(metrics_filename)
+
+    skipped_stages = set()
+    current_directory = os.getcwd()
+    previous_metrics_filename = os.environ.get(STAGE_METRICS_FILENAME_ENV)
+    os.environ[STAGE_METRICS_FILENAME_ENV] = metrics_filename
+    try:
+        os.chdir(directory)
+        for function, input_filenames in BENCHMARK_STAGES:
+            name = function.__name__
+            if name not in stage_names:
+                continue
+
+            if (name in DATABASE_STAGES) and not database:
+                log.warning('skipping stage: %s, it requires a database', name)
+                continue
+
+            missing_filenames = [filename for filename in input_filenames(date)
+                                 if not os.path.exists(filename)]
+            if missing_filenames:
+                log.warning('skipping stage: %s, missing input files: %s',
+                            name, str(missing_filenames))
+                continue
+
+            try:
+                error_code = function(date)
+                if error_code:
+                    log.error('stage: %s failed, error: %s', name, error_code)
+            except ImportError:
+                log.warning('skipping stage: %s, could not import its modules', name)
+                skipped_stages.add(name)
+    finally:
+        os.chdir(current_directory)
+        if previous_metrics_filename is None:
+            del os.environ[STAGE_METRICS_FILENAME_ENV]
+        else:
+            os.environ[STAGE_METRICS_FILENAME_ENV] = previous_metrics_filename
+
+    if not os.path.exists(metrics_filename):
+        log.warning('no benchmark stages were run')
+        return pd.DataFrame()
+
+    metrics_df = read_stage_metrics(metrics_filename)
+    metrics_df = metrics_df[metrics_df['STAGE'].isin(stage_names) &
+                            ~metrics_df['STAGE'].isin(skipped_stages)]
+    metrics_df.insert(0, 'SEED', seed)
+    metrics_df.insert(0, 'FLIGHTS_COUNT', flights_count)
+    metrics_df.insert(0, 'RUN_TIME', datetime.utcnow().isoformat(timespec='seconds') + 'Z')
+    metrics_df.insert(0, 'COMMIT', git_commit())
+
+    is_new_file = not os.path.exists(history_filename)
+    metrics_df.to_csv(history_filename, mode='a', header=is_new_file, index=False,
+                      date_format='%Y-%m-%dT%H:%M:%SZ')
+    log.info('written file: %s', history_filename)
+
+    return metrics_df
+
+
+def compare_benchmarks(history_filename=DEFAULT_HISTORY_FILENAME, *,
+                       flights_count=DEFAULT_FLIGHTS_COUNT, seed=DEFAULT_SEED):
+    """
+    Compare the wall times of the stages across the commits in a history file.
+
+    Only runs with the same scale and seed are compared.
+
+    Returns
+    -------
+    A pandas DataFrame of the mean wall time of each stage (rows) for each
+    commit (columns), in the order that the commits were first run.
+    """
+    history_df = pd.read_csv(history_filename)
+    history_df = history_df[(history_df['FLIGHTS_COUNT'] == flights_count) &
+                            (history_df['SEED'] == seed)]
+    commits = list(dict.fromkeys(history_df['COMMIT']))
+    stages = list(dict.fromkeys(history_df['STAGE']))
+    comparison_df = history_df.pivot_table(index='STAGE', columns='COMMIT',
+                                           values='WALL_TIME', aggfunc='mean')
+    return comparison_df.reindex(index=stages, columns=commits)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: benchmark_pipeline.py <directory> [flights_count] [seed]'
+              ' [stages] [history_filename] [database]')
+        sys.exit(errno.EINVAL)
+
+    try:
+        flights_count = int(sys.argv[2]) if len(sys.argv) >= 3 \
+            else DEFAULT_FLIGHTS_COUNT
+        seed = int(sys.argv[3]) if len(sys.argv) >= 4 else DEFAULT_SEED
+    except ValueError:
+        log.error(f'invalid flights_count or seed: {sys.argv[2:4]}')
+        sys.exit(errno.EINVAL)
+
+    stages = sys.argv[4].split(',') if (len(sys.argv) >= 5) and sys.argv[4] else None
+    history_filename = sys.argv[5] if len(sys.argv) >= 6 else DEFAULT_HISTORY_FILENAME
+    database = (len(sys.argv) >= 7) and (sys.argv[6].lower() in ('database', 'true'))
+
+    try:
+        run_benchmarks(sys.argv[1], flights_count=flights_count, seed=seed,
+                       stages=stages, history_filename=history_filename,
+                       database=database)
+    except ValueError as ex:
+        log.error(str(ex))
+        sys.exit(errno.EINVAL)
+
+    print(compare_benchmarks(history_filename, flights_count=flights_count,
+                             seed=seed).to_string(float_format='{:.3f}'.format))
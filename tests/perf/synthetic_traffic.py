@@ -0,0 +1,617 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+"""
+Generates reproducible synthetic traffic data for benchmarking the pipeline.
+
+The data is generated from a seed, so the same seed and scale always
+produce the same files. It consists of:
+    - CPR, FR24 flights and FR24 points files for each day,
+    - an APDS file for the date range,
+    - airports, movements reporting airports and airport stands files,
+    - sectors and user airspaces files.
+
+The flights fly great circle routes between random airports, climbing to and
+descending from a cruising altitude. Each flight is reported by CPR and/or
+FR24 ADS-B at different sample rates, so that the files can be matched and
+merged by the pipeline. Flights that depart late in the day continue into the
+next day's files.
+"""
+
+import os
+import sys
+import bz2
+import gzip
+import errno
+from datetime import datetime
+import numpy as np
+from pru.trajectory_fields import iso8601_date_parser, iso8601_previous_day, \
+    iso8601_date_range, is_valid_iso8601_date
+from pru.trajectory_files import DEFAULT_AIRPORTS_FILENAME, \
+    DEFAULT_AIRPORT_MOVEMENTS_FILENAME, create_original_cpr_filename, \
+    create_original_fr24_data_filenames
+from pru.logger import logger
+
+log = logger(__name__)
+
+DEFAULT_FLIGHTS_COUNT = 1000
+""" The default number of flights departing each day. """
+
+DEFAULT_AIRPORTS_COUNT = 50
+""" The default number of airports. """
+
+DEFAULT_STANDS_COUNT = 20
+""" The default number of stands at each airport. """
+
+DEFAULT_SEED = 0
+""" The default random number generator seed. """
+
+MIN_LATITUDE = 36.0
+MAX_LATITUDE = 60.0
+MIN_LONGITUDE = -10.0
+MAX_LONGITUDE = 25.0
+""" The bounds of the synthetic airspace [degrees]. """
+
+SECTOR_ROWS = 8
+SECTOR_COLUMNS = 10
+""" The number of sectors across the synthetic airspace. """
+
+SECTOR_FLIGHT_LEVELS = [(0, 245), (245, 660)]
+""" The lower and upper flight levels of the sectors. """
+
+USER_AIRSPACE_RADIUS = 40.0
+""" The radius of the user airspaces around airports [Nautical Miles]. """
+
+EARTH_RADIUS_NM = 3440.065
+""" The radius of the earth [Nautical Miles]. """
+
+CRUISE_SPEED = 450.0
+""" The cruising ground speed [Knots]. """
+
+CLIMB_RATE = 2000
+""" The climb and descent rate [feet per minute]. """
+
+CRUISE_ALTITUDES = [29000, 33000, 35000, 37000, 39000]
+""" The cruising altitudes [feet]. """
+
+AIRCRAFT_TYPES = ['A319', 'A320', 'A321', 'B738', 'E190', 'A333', 'B77W']
+""" The synthetic aircraft types. """
+
+CPR_PERIOD = 30.0
+FR24_PERIOD = 15.0
+""" The mean periods between reported positions [Seconds]. """
+
+CPR_COVERAGE = 0.95
+FR24_COVERAGE = 0.9
+""" The probabilities that a flight is reported by CPR or FR24. """
+
+APDS_FILENAME_PREFIX = 'FAC_APDS_FLIGHT_IR691_'
+""" The prefix of the APDS filename. """
+
+STANDS_FILENAME = 'stands_synthetic.csv'
+SECTORS_FILENAME = 'sectors_synthetic.csv'
+USER_AIRSPACES_FILENAME = 'user_airspaces_synthetic.csv'
+""" The names of the reference data files. """
+
+APDS_FIELDS = 'APDS_ID,AP_C_FLTID,AP_C_REG,ADEP_ICAO,ADES_ICAO,SRC_PHASE,' \
+    'MVT_TIME_UTC,BLOCK_TIME_UTC,SCHED_TIME_UTC,ARCTYP,AP_C_RWY,AP_C_STND,' \
+    'C40_CROSS_TIME,C40_CROSS_LAT,C40_CROSS_LON,C40_CROSS_FL,C40_BEARING,' \
+    'C100_CROSS_TIME,C100_CROSS_LAT,C100_CROSS_LON,C100_CROSS_FL,C100_BEARING\n'
+""" The fields of an APDS file. """
+
+FR24_FLIGHT_FIELDS = 'FLIGHT_ID,START_TIME,ADEP,ADES,CALLSIGN,FLIGHT,REG,MODEL,ADDRESS\n'
+FR24_POINT_FIELDS = 'FLIGHT_ID,LAT,LON,TRACK,ALT,SPEED,SQUAWK,RADAR_ID,EVENT_TIME,' \
+    'ON_GROUND,VERT_SPEED\n'
+""" The fields of the FR24 files. """
+
+SECONDS_PER_DAY = 86400
+
+
+def airport_codes(index):
+    """ The ICAO and IATA codes of the airport at index. """
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    first, second = divmod(index, len(letters))
+    return 'ZZ' + letters[first % len(letters)] + letters[second], \
+        'Q' + letters[first % len(letters)] + letters[second]
+
+
+def day_start_time(date):
+    """ The start time of an ISO8601 date [Seconds since the epoch]. """
+    return int((iso8601_date_parser(date) - datetime(1970, 1, 1)).total_seconds())
+
+
+def format_times(times):
+    """ Format times [Seconds since the epoch] as ISO8601 strings, without the Z. """
+    return np.datetime_as_string(np.asarray(times, dtype='datetime64[s]'), unit='s')
+
+
+def generate_airports(airports_count=DEFAULT_AIRPORTS_COUNT, seed=DEFAULT_SEED):
+    """
+    Generate the synthetic airports.
+
+    Returns
+    -------
+    A dict of arrays of the airport ICAO and IATA codes, latitudes and longitudes.
+    """
+    rng = np.random.default_rng([seed, airports_count])
+    codes = [airport_codes(i) for i in range(airports_count)]
+    return {'ICAO': [code[0] for code in codes],
+            'IATA': [code[1] for code in codes],
+            'LAT': rng.uniform(MIN_LATITUDE, MAX_LATITUDE, airports_count),
+            'LON': rng.uniform(MIN_LONGITUDE, MAX_LONGITUDE, airports_count)}
+
+
+def to_xyz(latitudes, longitudes):
+    """ Convert latitudes and longitudes [degrees] to unit vectors. """
+    lats = np.deg2rad(latitudes)
+    lons = np.deg2rad(longitudes)
+    return np.stack([np.cos(lats) * np.cos(lons),
+                     np.cos(lats) * np.sin(lons),
+                     np.sin(lats)], axis=-1)
+
+
+def great_circle_positions(start, finish, fractions):
+    """
+    Interpolate positions along the great circle between two points.
+
+    Returns
+    -------
+    Arrays of the latitudes and longitudes [degrees] of the positions.
+    """
+    angle = np.arccos(np.clip(np.dot(start, finish), -1.0, 1.0))
+    sin_angle = np.sin(angle)
+    a = np.sin((1.0 - fractions) * angle) / sin_angle
+    b = np.sin(fractions * angle) / sin_angle
+    points = np.outer(a, start) + np.outer(b, finish)
+    latitudes = np.rad2deg(np.arcsin(np.clip(points[:, 2], -1.0, 1.0)))
+    longitudes = np.rad2deg(np.arctan2(points[:, 1], points[:, 0]))
+    return latitudes, longitudes
+
+
+def bearings(latitudes, longitudes):
+    """ The initial bearings [degrees] from each position to the next. """
+    lats = np.deg2rad(latitudes)
+    lons = np.deg2rad(longitudes)
+    delta_lons = np.diff(lons)
+    y = np.sin(delta_lons) * np.cos(lats[1:])
+    x = np.cos(lats[:-1]) * np.sin(lats[1:]) - \
+        np.sin(lats[:-1]) * np.cos(lats[1:]) * np.cos(delta_lons)
+    values = np.mod(np.rad2deg(np.arctan2(y, x)), 360.0)
+    return np.append(values, values[-1:]) if len(values) else np.zeros(len(lats))
+
+
+class SyntheticFlight:
+    """
+    A synthetic flight, with the identifiers used by each data source.
+    """
+    __slots__ = ('index', 'cpr_id', 'fr24_id', 'callsign', 'registration',
+                 'aircraft_type', 'address', 'squawk', 'departure', 'destination',
+                 'start_time', 'duration', 'cruise_altitude', 'has_cpr', 'has_fr24',
+                 'seed')
+
+    def __init__(self, **kwargs):
+        'SyntheticFlight constructor'
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    @property
+    def finish_time(self):
+        'The time that the flight lands [Seconds since the epoch].'
+        return self.start_time + self.duration
+
+    def positions(self, airports, period, source):
+        """
+        Sample the positions of the flight.
+
+        Parameters
+        ----------
+        airports: dict
+            The airports generated by generate_airports.
+
+        period: float
+            The mean period between positions [Seconds].
+
+        source: int
+            The data source, so that each source samples different times.
+
+        Returns
+        -------
+        A dict of arrays of the times, latitudes, longitudes, altitudes,
+        ground speeds, tracks and vertical rates of the positions.
+        """
+        rng = np.random.default_rng([self.seed, self.index, source])
+        count = max(int(self.duration // period), 2)
+        offsets = np.arange(count) * period + \
+            rng.uniform(0.0, 0.5 * period, count)
+        offsets = np.clip(offsets, 0.0, self.duration)
+        times = self.start_time + np.round(offsets).astype(np.int64)
+
+        start = to_xyz(airports['LAT'][self.departure], airports['LON'][self.departure])
+        finish = to_xyz(airports['LAT'][self.destination],
+                        airports['LON'][self.destination])
+        latitudes, longitudes = great_circle_positions(start, finish,
+                                                       offsets / self.duration)
+
+        # Climb to and descend from the cruise altitude
+        climb_rate = CLIMB_RATE / 60.0
+        altitudes = np.minimum(climb_rate * offsets,
+                               climb_rate * (self.duration - offsets))
+        altitudes = np.minimum(altitudes, self.cruise_altitude)
+        altitudes = (np.round(altitudes / 100.0) * 100).astype(np.int64)
+        vertical_rates = np.where(altitudes >= self.cruise_altitude, 0,
+                                  np.where(offsets < 0.5 * self.duration,
+                                           CLIMB_RATE, -CLIMB_RATE))
+        speeds = CRUISE_SPEED + rng.normal(0.0, 5.0, count)
+        return {'TIME': times, 'LAT': latitudes, 'LON': longitudes,
+                'ALT': altitudes, 'SPEED': speeds,
+                'TRACK': bearings(latitudes, longitudes),
+                'VERT_SPEED': vertical_rates}
+
+
+def generate_flights(date, airports, flights_count=DEFAULT_FLIGHTS_COUNT,
+                     seed=DEFAULT_SEED):
+    """
+    Generate the synthetic flights departing on a date.
+
+    The flights of a date only depend upon the date, airports and seed,
+    so the flights of consecutive days can be generated independently.
+
+    Returns
+    -------
+    A list of SyntheticFlights.
+    """
+    ordinal = iso8601_date_parser(date).toordinal()
+    rng = np.random.default_rng([seed, ordinal])
+    airports_count = len(airports['ICAO'])
+    departures = rng.integers(0, airports_count, flights_count)
+    destinations = (departures + rng.integers(1, airports_count, flights_count)) \
+        % airports_count
+    start_times = day_start_time(date) + \
+        np.sort(rng.integers(0, SECONDS_PER_DAY, flights_count))
+    cruise_altitudes = rng.choice(CRUISE_ALTITUDES, flights_count)
+    aircraft_types = rng.choice(AIRCRAFT_TYPES, flights_count)
+    squawks = rng.integers(0, 8, (flights_count, 4))
+    has_cprs = rng.random(flights_count) < CPR_COVERAGE
+    has_fr24s = rng.random(flights_count) < FR24_COVERAGE
+
+    xyz = to_xyz(airports['LAT'], airports['LON'])
+    day_index = ordinal % 1000
+    flights = []
+    for i in range(flights_count):
+        angle = np.arccos(np.clip(np.dot(xyz[departures[i]], xyz[destinations[i]]),
+                                  -1.0, 1.0))
+        duration = int(3600.0 * angle * EARTH_RADIUS_NM / CRUISE_SPEED) + 600
+        flights.append(SyntheticFlight(
+            index=i, cpr_id=day_index * 100000 + i + 1,
+            fr24_id='{:08x}'.format(0x10000000 + day_index * 0x100000 + i),
+            callsign='SYN{:04d}'.format(i % 10000),
+            registration='G-{}{:04d}'.format(chr(ord('A') + day_index % 26), i),
+            aircraft_type=str(aircraft_types[i]),
+            address='{:06X}'.format(0x400000 + (day_index % 16) * 0x10000 + i),
+            squawk=''.join(str(d) for d in squawks[i]),
+            departure=int(departures[i]), destination=int(destinations[i]),
+            start_time=int(start_times[i]), duration=duration,
+            cruise_altitude=int(cruise_altitudes[i]),
+            has_cpr=bool(has_cprs[i]), has_fr24=bool(has_fr24s[i]),
+            seed=seed * 100000 + ordinal))
+    return flights
+
+
+def flights_on_day(date, airports, flights_count=DEFAULT_FLIGHTS_COUNT,
+                   seed=DEFAULT_SEED):
+    """
+    The flights that are airborne on a date: the flights departing on the
+    previous day that land on the date and the flights departing on the date.
+    """
+    start_time = day_start_time(date)
+    prev_flights = generate_flights(iso8601_previous_day(date), airports,
+                                    flights_count, seed)
+    return [flight for flight in prev_flights if flight.finish_time >= start_time] + \
+        generate_flights(date, airports, flights_count, seed)
+
+
+def format_dms(values):
+    """ Format angles [degrees] as integer degrees, minutes and seconds arrays. """
+    total = np.round(np.abs(values) * 3600.0).astype(np.int64)
+    return total // 3600, (total // 60) % 60, total % 60
+
+
+def write_cpr_file(date, flights, airports, directory='.'):
+    """
+    Write a synthetic CPR file for the date.
+
+    Returns
+    -------
+    The filename and number of lines written.
+    """
+    start_time = day_start_time(date)
+    finish_time = start_time + SECONDS_PER_DAY
+
+    rows = []
+    for flight in flights:
+        if not flight.has_cpr:
+            continue
+        positions = flight.positions(airports, CPR_PERIOD, 0)
+        in_day = (positions['TIME'] >= start_time) & (positions['TIME'] < finish_time)
+        if not in_day.any():
+            continue
+        for key in positions:
+            positions[key] = positions[key][in_day]
+        positions['FLIGHT'] = np.full(len(positions['TIME']), len(rows))
+        eobt = format_times([flight.start_time - 600])[0]
+        positions['EOBT'] = '{}/{}/{} {}'.format(eobt[2:4], eobt[5:7], eobt[8:10],
+                                                 eobt[11:19])
+        rows.append((flight, positions))
+
+    times = np.concatenate([positions['TIME'] for _, positions in rows])
+    flight_indicies = np.concatenate([positions['FLIGHT'] for _, positions in rows])
+    position_indicies = np.concatenate([np.arange(len(positions['TIME']))
+                                        for _, positions in rows])
+    order = np.argsort(times, kind='stable')
+
+    lat_d, lat_m, lat_s = format_dms(np.concatenate([p['LAT'] for _, p in rows]))
+    lon_d, lon_m, lon_s = format_dms(np.concatenate([p['LON'] for _, p in rows]))
+    track_d, track_m, track_s = format_dms(np.concatenate([p['TRACK'] for _, p in rows]))
+    lat_hemispheres = np.where(np.concatenate([p['LAT'] for _, p in rows]) < 0.0, 'S', 'N')
+    lon_hemispheres = np.where(np.concatenate([p['LON'] for _, p in rows]) < 0.0, 'W', 'E')
+    time_strings = format_times(times)
+
+    filename = os.path.join(directory, create_original_cpr_filename(date))
+    with gzip.open(filename, 'wt', newline='') as file:
+        for line, i in enumerate(order, 1):
+            flight, positions = rows[flight_indicies[i]]
+            j = position_indicies[i]
+            iso_time = time_strings[i]
+            cpr_time = '{}/{}/{} {}'.format(iso_time[2:4], iso_time[5:7],
+                                            iso_time[8:10], iso_time[11:19])
+            fields = [str(line), str(flight.cpr_id), cpr_time, cpr_time,
+                      str(line // 1000), str(line % 1000), '8', '1',
+                      flight.callsign, airports['ICAO'][flight.departure],
+                      airports['ICAO'][flight.destination],
+                      positions['EOBT'],
+                      '{:02d}{:02d}{:02d}{} {:03d}{:02d}{:02d}{}'.format(
+                          lat_d[i], lat_m[i], lat_s[i], lat_hemispheres[i],
+                          lon_d[i], lon_m[i], lon_s[i], lon_hemispheres[i]),
+                      str(positions['ALT'][j] // 100), 'A', flight.squawk,
+                      '{:.0f}'.format(positions['SPEED'][j]),
+                      "{:03d} {:02d}'{:02d}''".format(track_d[i] % 360, track_m[i],
+                                                      track_s[i]),
+                      str(positions['VERT_SPEED'][j]), '', 'AA{:08d}'.format(flight.cpr_id),
+                      flight.address]
+            file.write(';'.join(fields) + '\n')
+
+    return filename, len(order)
+
+
+def write_fr24_files(date, flights, airports, directory='.'):
+    """
+    Write synthetic FR24 flights and points files for the date.
+
+    Returns
+    -------
+    The filenames and number of points written.
+    """
+    start_time = day_start_time(date)
+    finish_time = start_time + SECONDS_PER_DAY
+    flights_filename, points_filename = [os.path.join(directory, filename) for filename
+                                         in create_original_fr24_data_filenames(date)]
+
+    rows = []
+    with bz2.open(flights_filename, 'wt', newline='') as file:
+        file.write(FR24_FLIGHT_FIELDS)
+        for flight in flights:
+            if not flight.has_fr24:
+                continue
+            positions = flight.positions(airports, FR24_PERIOD, 1)
+            in_day = (positions['TIME'] >= start_time) & (positions['TIME'] < finish_time)
+            if not in_day.any():
+                continue
+            for key in positions:
+                positions[key] = positions[key][in_day]
+            rows.append((flight, positions))
+            file.write(','.join([flight.fr24_id,
+                                 format_times([flight.start_time])[0] + 'Z',
+                                 airports['IATA'][flight.departure],
+                                 airports['IATA'][flight.destination],
+                                 flight.callsign, flight.callsign,
+                                 flight.registration, flight.aircraft_type,
+                                 flight.address]) + '\n')
+
+    times = np.concatenate([positions['TIME'] for _, positions in rows])
+    flight_indicies = np.concatenate([np.full(len(positions['TIME']), k)
+                                      for k, (_, positions) in enumerate(rows)])
+    position_indicies = np.concatenate([np.arange(len(positions['TIME']))
+                                        for _, positions in rows])
+    order = np.argsort(times, kind='stable')
+    time_strings = format_times(times)
+
+    with bz2.open(points_filename, 'wt', newline='') as file:
+        file.write(FR24_POINT_FIELDS)
+        for i in order:
+            flight, positions = rows[flight_indicies[i]]
+            j = position_indicies[i]
+            file.write('{},{:.5f},{:.5f},{:.0f},{},{:.0f},{},R{:02d},{}Z,0,{}\n'.format(
+                flight.fr24_id, positions['LAT'][j], positions['LON'][j],
+                positions['TRACK'][j], positions['ALT'][j], positions['SPEED'][j],
+                flight.squawk, flight.index % 50, time_strings[i],
+                positions['VERT_SPEED'][j]))
+
+    return flights_filename, points_filename, len(order)
+
+
+def write_apds_file(from_date, to_date, airports, flights_count=DEFAULT_FLIGHTS_COUNT,
+                    seed=DEFAULT_SEED, directory='.'):
+    """
+    Write a synthetic APDS file for the flights departing between the dates.
+
+    Returns
+    -------
+    The filename and number of lines written.
+    """
+    rng = np.random.default_rng([seed, len(airports['ICAO']), 2])
+    filename = os.path.join(directory, ''.join([APDS_FILENAME_PREFIX, from_date, '_',
+                                                to_date, '.csv.bz2']))
+    count = 0
+    with bz2.open(filename, 'wt', newline='') as file:
+        file.write(APDS_FIELDS)
+        for date in iso8601_date_range(from_date, to_date):
+            for flight in generate_flights(date, airports, flights_count, seed):
+                departure = airports['ICAO'][flight.departure]
+                destination = airports['ICAO'][flight.destination]
+                stands = rng.integers(1, DEFAULT_STANDS_COUNT + 1, 2)
+                times = format_times([flight.start_time,
+                                      flight.start_time - 900,
+                                      flight.start_time - 1200,
+                                      flight.finish_time,
+                                      flight.finish_time + 600,
+                                      flight.finish_time + 900])
+                for phase, offset, stand in (('DEP', 0, stands[0]),
+                                             ('ARR', 3, stands[1])):
+                    apds_id = '{}{}'.format(flight.cpr_id, 0 if phase == 'DEP' else 1)
+                    file.write(','.join([apds_id, flight.callsign, flight.registration,
+                                         departure, destination, phase,
+                                         times[offset] + 'Z', times[offset + 1] + 'Z',
+                                         times[offset + 2] + 'Z', flight.aircraft_type,
+                                         '27L', 'S{}'.format(stand)] + [''] * 10) + '\n')
+                    count += 1
+
+    return filename, count
+
+
+def write_reference_files(airports, seed=DEFAULT_SEED, directory='.'):
+    """
+    Write the synthetic airports, movements reporting airports, stands,
+    sectors and user airspaces files.
+
+    Returns
+    -------
+    A list of the filenames written.
+    """
+    rng = np.random.default_rng([seed, len(airports['ICAO']), 3])
+    filenames = [os.path.join(directory, filename) for filename in
+                 [DEFAULT_AIRPORTS_FILENAME, DEFAULT_AIRPORT_MOVEMENTS_FILENAME,
+                  STANDS_FILENAME, SECTORS_FILENAME, USER_AIRSPACES_FILENAME]]
+
+    with open(filenames[0], 'w') as file:
+        file.write('IATA_AP_CODE,ICAO_AP_CODE,ISO_CT_CODE,LATITUDE,LONGITUDE\n')
+        for i, icao in enumerate(airports['ICAO']):
+            file.write('{},{},ZZ,{:.5f},{:.5f}\n'.format(
+                airports['IATA'][i], icao, airports['LAT'][i], airports['LON'][i]))
+
+    with open(filenames[1], 'w') as file:
+        file.write('AIRPORT,LONGITUDE,LATITUDE\n')
+        for i, icao in enumerate(airports['ICAO']):
+            file.write('{},{:.5f},{:.5f}\n'.format(icao, airports['LON'][i],
+                                                   airports['LAT'][i]))
+
+    with open(filenames[2], 'w') as file:
+        file.write('ICAO_ID,STAND_ID,LAT,LON\n')
+        for i, icao in enumerate(airports['ICAO']):
+            offsets = rng.uniform(-0.01, 0.01, (DEFAULT_STANDS_COUNT, 2))
+            for stand in range(DEFAULT_STANDS_COUNT):
+                file.write('{},S{},{:.5f},{:.5f}\n'.format(
+                    icao, stand + 1, airports['LAT'][i] + offsets[stand, 0],
+                    airports['LON'][i] + offsets[stand, 1]))
+
+    lat_step = (MAX_LATITUDE - MIN_LATITUDE) / SECTOR_ROWS
+    lon_step = (MAX_LONGITUDE - MIN_LONGITUDE) / SECTOR_COLUMNS
+    with open(filenames[3], 'w') as file:
+        file.write('AC_ID,AV_AIRSPACE_ID,AV_ICAO_STATE_ID,MIN_FLIGHT_LEVEL,'
+                   'MAX_FLIGHT_LEVEL,AV_NAME,SECTOR_TYPE,OBJECT_ID,WKT\n')
+        object_id = 0
+        for row in range(SECTOR_ROWS):
+            lat0 = MIN_LATITUDE + row * lat_step
+            lat1 = lat0 + lat_step
+            for column in range(SECTOR_COLUMNS):
+                lon0 = MIN_LONGITUDE + column * lon_step
+                lon1 = lon0 + lon_step
+                wkt = 'POLYGON (({0} {2}, {1} {2}, {1} {3}, {0} {3}, {0} {2}))'.format(
+                    lon0, lon1, lat0, lat1)
+                for lower, upper in SECTOR_FLIGHT_LEVELS:
+                    object_id += 1
+                    name = 'SYN{:02d}{:02d}{}'.format(row, column,
+                                                      'L' if lower == 0 else 'U')
+                    file.write('ZZ,{},ZZ,{},{},{},ES,{},"{}"\n'.format(
+                        name, lower, upper, name, object_id, wkt))
+
+    with open(filenames[4], 'w') as file:
+        file.write('ORG_ID,USER_ID,SECTOR_NAME,LATITUDE,LONGITUDE,RADIUS,'
+                   'MIN_FLIGHT_LEVEL,MAX_FLIGHT_LEVEL,IS_CYLINDER,WKT\n')
+        for i, icao in enumerate(airports['ICAO']):
+            file.write('SYN,benchmark,{}_TMA,{:.5f},{:.5f},{},0,100,True,\n'.format(
+                icao, airports['LAT'][i], airports['LON'][i], USER_AIRSPACE_RADIUS))
+
+    return filenames
+
+
+def generate_synthetic_data(from_date, to_date, directory='.', *,
+                            flights_count=DEFAULT_FLIGHTS_COUNT,
+                            airports_count=DEFAULT_AIRPORTS_COUNT,
+                            seed=DEFAULT_SEED):
+    """
+    Generate synthetic traffic data files for a range of dates.
+
+    Parameters
+    ----------
+    from_date: string
+        The first date in ISO8601 format, e.g. 2017-08-01
+
+    to_date: string
+        The last date in ISO8601 format, e.g. 2017-08-02
+
+    directory: string
+        The directory to write the files in, default: the current directory.
+
+    flights_count: int
+        The number of flights departing each day, default DEFAULT_FLIGHTS_COUNT.
+
+    airports_count: int
+        The number of airports, default DEFAULT_AIRPORTS_COUNT.
+
+    seed: int
+        The random number generator seed, default DEFAULT_SEED.
+
+    Returns
+    -------
+    A list of the filenames written.
+    """
+    os.makedirs(directory, exist_ok=True)
+    airports = generate_airports(airports_count, seed)
+    filenames = write_reference_files(airports, seed, directory)
+
+    for date in iso8601_date_range(from_date, to_date):
+        flights = flights_on_day(date, airports, flights_count, seed)
+        cpr_filename, cpr_count = write_cpr_file(date, flights, airports, directory)
+        log.info('written file: %s, %d positions', cpr_filename, cpr_count)
+        *fr24_filenames, fr24_count = write_fr24_files(date, flights, airports,
+                                                       directory)
+        log.info('written files: %s, %d points', str(fr24_filenames), fr24_count)
+        filenames += [cpr_filename] + fr24_filenames
+
+    apds_filename, apds_count = write_apds_file(from_date, to_date, airports,
+                                                flights_count, seed, directory)
+    log.info('written file: %s, %d movements', apds_filename, apds_count)
+    filenames.append(apds_filename)
+
+    return filenames
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: synthetic_traffic.py <from_date> <to_date>'
+              ' [flights_count] [seed] [directory]')
+        sys.exit(errno.EINVAL)
+
+    from_date = sys.argv[1]
+    to_date = sys.argv[2]
+    if not is_valid_iso8601_date(from_date) or not is_valid_iso8601_date(to_date):
+        log.error(f'invalid dates: {from_date}, {to_date}')
+        sys.exit(errno.EINVAL)
+
+    flights_count = int(sys.argv[3]) if len(sys.argv) >= 4 else DEFAULT_FLIGHTS_COUNT
+    seed = int(sys.argv[4]) if len(sys.argv) >= 5 else DEFAULT_SEED
+    directory = sys.argv[5] if len(sys.argv) >= 6 else '.'
+
+    generate_synthetic_data(from_date, to_date, directory,
+                            flights_count=flights_count, seed=seed)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import bz2
+import gzip
+import tempfile
+import pandas as pd
+from synthetic_traffic import *
+from benchmark_pipeline import select_stages, run_benchmarks, compare_benchmarks
+
+DATE = '2017-08-01'
+FLIGHTS_COUNT = 20
+
+
+def read_text(filename):
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rt') as file:
+            return file.read()
+    elif filename.endswith('.bz2'):
+        with bz2.open(filename, 'rt') as file:
+            return file.read()
+    with open(filename, 'r') as file:
+        return file.read()
+
+
+class TestSyntheticTraffic(unittest.TestCase):
+
+    def test_generate_flights(self):
+        airports = generate_airports()
+        flights = generate_flights(DATE, airports, FLIGHTS_COUNT)
+        self.assertEqual(len(flights), FLIGHTS_COUNT)
+
+        # The flights are reproducible
+        flights2 = generate_flights(DATE, airports, FLIGHTS_COUNT)
+        self.assertEqual([f.cpr_id for f in flights], [f.cpr_id for f in flights2])
+        self.assertEqual([f.start_time for f in flights],
+                         [f.start_time for f in flights2])
+
+        for flight in flights:
+            self.assertNotEqual(flight.departure, flight.destination)
+            self.assertTrue(flight.duration > 0)
+
+        positions = flights[0].positions(airports, CPR_PERIOD, 0)
+        self.assertTrue(len(positions['TIME']) > 2)
+        self.assertTrue((positions['TIME'][1:] >= positions['TIME'][:-1]).all())
+        self.assertTrue((positions['ALT'] >= 0).all())
+        self.assertTrue((positions['ALT'] <= flights[0].cruise_altitude).all())
+
+    def test_generate_synthetic_data(self):
+        with tempfile.TemporaryDirectory() as directory1, \
+                tempfile.TemporaryDirectory() as directory2:
+            filenames1 = generate_synthetic_data(DATE, DATE, directory1,
+                                                 flights_count=FLIGHTS_COUNT)
+            filenames2 = generate_synthetic_data(DATE, DATE, directory2,
+                                                 flights_count=FLIGHTS_COUNT)
+            self.assertEqual(len(filenames1), 9)
+
+            # The same seed generates the same data
+            for filename1, filename2 in zip(filenames1, filenames2):
+                self.assertEqual(os.path.basename(filename1),
+                                 os.path.basename(filename2))
+                self.assertEqual(read_text(filename1), read_text(filename2))
+
+    def test_convert_synthetic_data(self):
+        from apps.convert_cpr_data import convert_cpr_data
+        from apps.convert_fr24_data import convert_fr24_data
+
+        current_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            generate_synthetic_data(DATE, DATE, directory,
+                                    flights_count=FLIGHTS_COUNT)
+            os.chdir(directory)
+            try:
+                self.assertEqual(convert_cpr_data(create_original_cpr_filename(DATE)), 0)
+                self.assertEqual(convert_fr24_data(create_original_fr24_data_filenames(DATE)), 0)
+
+                cpr_flights = pd.read_csv('cpr_flights_2017-08-01.csv')
+                fr24_flights = pd.read_csv('iata_fr24_flights_2017-08-01.csv')
+            finally:
+                os.chdir(current_directory)
+
+        self.assertTrue(len(cpr_flights) > FLIGHTS_COUNT // 2)
+        self.assertTrue(len(fr24_flights) > FLIGHTS_COUNT // 2)
+
+        # Most flights are reported by both CPR and FR24
+        common_addresses = set(cpr_flights['AIRCRAFT_ADDRESS']) & \
+            set(fr24_flights['AIRCRAFT_ADDRESS'])
+        self.assertTrue(len(common_addresses) > FLIGHTS_COUNT // 2)
+
+    def test_select_stages(self):
+        self.assertEqual(len(select_stages()), 17)
+        self.assertEqual(select_stages(['clean_fr24', 'convert']),
+                         ['convert_cpr', 'convert_fr24', 'convert_airports',
+                          'extract_fleet', 'convert_apds', 'clean_fr24'])
+        self.assertRaises(ValueError, select_stages, ['unknown'])
+
+    def test_run_benchmarks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            history_filename = os.path.join(directory, 'history.csv')
+            benchmark_df = run_benchmarks(os.path.join(directory, 'data'),
+                                          flights_count=FLIGHTS_COUNT,
+                                          stages=['convert_cpr', 'convert_fr24'],
+                                          history_filename=history_filename)
+            self.assertEqual(list(benchmark_df['STAGE']),
+                             ['convert_cpr', 'convert_fr24'])
+            self.assertTrue((benchmark_df['ROWS_IN'] > 0).all())
+            self.assertTrue((benchmark_df['ERROR_CODE'] == 0).all())
+
+            comparison_df = compare_benchmarks(history_filename,
+                                               flights_count=FLIGHTS_COUNT)
+            self.assertEqual(list(comparison_df.index),
+                             ['convert_cpr', 'convert_fr24'])
+            self.assertEqual(len(comparison_df.columns), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from pru.airport_codes import *
+
+AIRPORTS_LINES = ['IATA_AP_CODE,ICAO_AP_CODE,ISO_CT_CODE,LATITUDE,LONGITUDE',
+                  'LHR,EGLL,GB,51.4775,-0.461389',
+                  'CDG,LFPG,FR,49.009722,2.547778',
+                  'NAN,NFFN,FJ,-17.755392,177.443378',
+                  ',EGLL,GB,0.0,0.0',
+                  'LGW,EGKK,GB,51.148056,-0.190278',
+                  'LGW,EGKX,GB,0.0,0.0']
+
+MOVEMENTS_AIRPORTS_LINES = ['AIRPORT,LONGITUDE,LATITUDE',
+                            'EGLL,-0.461389,51.4775',
+                            'LFPG,2.547778,49.009722']
+
+
+def write_lines(filename, lines):
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+class TestAirportCodes(unittest.TestCase):
+
+    def test_airport_codes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'airports.csv')
+            write_lines(filename, AIRPORTS_LINES)
+            airport_codes = read_airport_codes(filename)
+
+        self.assertEqual(len(airport_codes), 6)
+        self.assertEqual(airport_codes.airports['IATA_ID'][2], 'NAN')
+
+        # The last airport of a repeated IATA code is used
+        icao_ids = airport_codes.translate_iata_ids(['CDG', 'NAN', np.nan, 'EGLL', 'LGW', ''])
+        self.assertEqual(list(icao_ids[[0, 1, 3, 4, 5]]), ['LFPG', 'NFFN', 'EGLL', 'EGKX', ''])
+        self.assertTrue(np.isnan(icao_ids[2]))
+
+        # The first airport of a repeated ICAO code is used
+        airports = airport_codes.find_airports(['LFPG', 'EGLL', 'LHR', np.nan])
+        self.assertEqual(list(airports), [1, 0, -1, -1])
+        self.assertEqual(airport_codes.airports['LAT'][airports[1]], 51.4775)
+
+        empty_codes = AirportCodes(create_airports_array([], [], [], []))
+        self.assertEqual(list(empty_codes.find_airports(['EGLL'])), [-1])
+        self.assertEqual(list(empty_codes.translate_iata_ids(['LHR'])), ['LHR'])
+
+    def test_compile_airport_codes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'movements_reporting_airports.csv')
+            compiled_filename = create_compiled_airports_filename(filename)
+            self.assertEqual(compiled_filename,
+                             os.path.join(directory, 'movements_reporting_airports.npy'))
+
+            write_lines(filename, MOVEMENTS_AIRPORTS_LINES)
+            airport_codes = compile_airport_codes(filename)
+            self.assertTrue(os.path.exists(compiled_filename))
+            self.assertEqual(list(airport_codes.airports['IATA_ID']), ['', ''])
+
+            compiled_codes = compile_airport_codes(filename)
+            self.assertTrue(isinstance(compiled_codes.airports, np.memmap))
+            self.assertEqual(list(compiled_codes.find_airports(['LFPG', 'EGLL'])), [1, 0])
+            self.assertEqual(list(compiled_codes.airports['LON']), [-0.461389, 2.547778])
+            del compiled_codes
+
+            # The compiled file is replaced when the csv file is newer
+            write_lines(filename, MOVEMENTS_AIRPORTS_LINES[:2])
+            modified_time = os.path.getmtime(compiled_filename) + 1.0
+            os.utime(filename, (modified_time, modified_time))
+            self.assertEqual(len(compile_airport_codes(filename)), 1)
+            self.assertEqual(len(compile_airport_codes(compiled_filename)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from pru.airport_stands import *
+
+STANDS_LINES = ['ICAO_ID,STAND_ID,LAT,LON',
+                'EGLL,216,51.47036111,-0.44630556',
+                'EGLL,217,51.46994444,-0.44630556',
+                'EGLL,216,0.0,0.0',
+                'LFPG,A1,49.00972222,2.54777778',
+                'LFPG,216,49.0,2.5']
+
+
+def write_stands(filename, lines):
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+class TestAirportStands(unittest.TestCase):
+
+    def test_airport_stands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'stands.csv')
+            write_stands(filename, STANDS_LINES)
+            airport_stands = read_airport_stands(filename)
+
+        # Stand ids are strings and the first position of a stand is used
+        self.assertEqual(len(airport_stands), 4)
+        self.assertTrue(('EGLL', '216') in airport_stands)
+        self.assertFalse(('EGLL', 216) in airport_stands)
+        self.assertEqual(airport_stands['EGLL', '216'], (51.47036111, -0.44630556))
+        self.assertEqual(airport_stands.positions[('LFPG', '216')], (49.0, 2.5))
+
+        latitudes, longitudes = airport_stands.find_positions(
+            ['LFPG', 'EGLL', 'EGLL', 'EGLL', 'EDDF'], ['216', '217', 'A1', '216', '216'])
+        self.assertEqual(list(latitudes[[0, 1, 3]]), [49.0, 51.46994444, 51.47036111])
+        self.assertEqual(list(longitudes[[0, 1, 3]]), [2.5, -0.44630556, -0.44630556])
+        self.assertTrue(np.isnan(latitudes[[2, 4]]).all())
+        self.assertTrue(np.isnan(longitudes[[2, 4]]).all())
+
+        latitudes, longitudes = AirportStands().find_positions(['EGLL'], ['216'])
+        self.assertTrue(np.isnan(latitudes[0]))
+        self.assertEqual(len(airport_stands.find_positions([], [])[0]), 0)
+
+    def test_compile_airport_stands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'stands.csv')
+            compiled_filename = create_compiled_stands_filename(filename)
+            self.assertEqual(compiled_filename, os.path.join(directory, 'stands.npz'))
+
+            write_stands(filename, STANDS_LINES)
+            airport_stands = compile_airport_stands(filename)
+            self.assertTrue(os.path.exists(compiled_filename))
+
+            compiled_stands = compile_airport_stands(compiled_filename)
+            self.assertEqual(compiled_stands.positions, airport_stands.positions)
+            self.assertEqual(compile_airport_stands(filename).positions,
+                             airport_stands.positions)
+
+            # The compiled file is replaced when the csv file is newer
+            write_stands(filename, STANDS_LINES[:2])
+            modified_time = os.path.getmtime(compiled_filename) + 1.0
+            os.utime(filename, (modified_time, modified_time))
+            self.assertEqual(len(compile_airport_stands(filename)), 1)
+            self.assertEqual(len(AirportStands.load(compiled_filename)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
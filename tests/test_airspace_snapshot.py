@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from shapely import wkt
+from pru.airspace_snapshot import *
+
+SECTORS_LINES = ['AC_ID,AV_AIRSPACE_ID,AV_ICAO_STATE_ID,MIN_FLIGHT_LEVEL,'
+                 'MAX_FLIGHT_LEVEL,AV_NAME,SECTOR_TYPE,OBJECT_ID,WKT',
+                 '428,EGTTLON,EG,0,245,LONDON,ES,1,'
+                 '"POLYGON ((-1 51, 1 51, 1 52, -1 52, -1 51))"',
+                 '428,EGTTLONU,EG,245,660,LONDON UPPER,ES,2,'
+                 '"POLYGON ((-1 51, 1 51, 1 52, -1 52, -1 51))"',
+                 '428,LFFFPAR,LF,0,195,PARIS,ES,3,'
+                 '"MULTIPOLYGON (((1 48, 3 48, 3 49, 1 49, 1 48)))"',
+                 '428,LFFFBAD,LF,0,195,BAD,ES,4,"POLYGON ((1 48"',
+                 '428,LFFFWIDE,LF,0,195,' + 'W' * 101 + ',ES,5,'
+                 '"POLYGON ((1 48, 3 48, 3 49, 1 49, 1 48))"']
+
+
+def write_lines(filename, lines):
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+class TestAirspaceSnapshot(unittest.TestCase):
+
+    def test_calculate_bounding_cap(self):
+        lat, lon, radius = calculate_bounding_cap([0.0, 0.0], [-1.0, 1.0])
+        self.assertAlmostEqual(lat, 0.0)
+        self.assertAlmostEqual(lon, 0.0)
+        self.assertAlmostEqual(radius, np.deg2rad(1.0))
+
+        lat, lon, radius = calculate_bounding_cap([10.0], [20.0])
+        self.assertAlmostEqual(lat, 10.0)
+        self.assertAlmostEqual(lon, 20.0)
+        self.assertAlmostEqual(radius, 0.0)
+
+    def test_compile_airspace_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'elementary_sectors.csv')
+            snapshot_filename = create_snapshot_filename(filename, '1805')
+            self.assertEqual(snapshot_filename,
+                             os.path.join(directory, 'elementary_sectors_1805.npz'))
+
+            write_lines(filename, SECTORS_LINES)
+            snapshot = compile_airspace_snapshot(filename, '1805')
+            self.assertTrue(os.path.exists(snapshot_filename))
+
+            # The bad and too wide sectors are not read
+            self.assertEqual(len(snapshot), 3)
+            self.assertEqual(snapshot.airac_cycle, '1805')
+            self.assertEqual(snapshot.checksum, calculate_file_checksum(filename))
+            self.assertEqual(list(snapshot.sectors['AV_AIRSPACE_ID']),
+                             ['EGTTLON', 'EGTTLONU', 'LFFFPAR'])
+            self.assertEqual(list(snapshot.sectors['MAX_ALTITUDE']),
+                             [24500, 66000, 19500])
+            self.assertTrue(snapshot.geometry(2).equals(
+                wkt.loads('MULTIPOLYGON (((1 48, 3 48, 3 49, 1 49, 1 48)))')))
+
+            loaded_snapshot = compile_airspace_snapshot(snapshot_filename)
+            self.assertEqual(loaded_snapshot.checksum, snapshot.checksum)
+            self.assertEqual(loaded_snapshot.wkb(1), snapshot.wkb(1))
+            self.assertTrue(np.array_equal(loaded_snapshot.sectors, snapshot.sectors))
+
+            # Find sectors by position and altitude range
+            self.assertEqual(list(loaded_snapshot.find_sectors([51.5], [0.0], 1000, 2000)), [0])
+            self.assertEqual(list(loaded_snapshot.find_sectors([51.5, 48.5], [0.0, 2.0],
+                                                               10000, 30000)), [0, 1, 2])
+            self.assertEqual(len(loaded_snapshot.find_sectors([0.0], [0.0], 0, 60000)), 0)
+
+            # The snapshot is compiled again when the sectors file changes
+            write_lines(filename, SECTORS_LINES[:2])
+            self.assertEqual(len(compile_airspace_snapshot(filename, '1805')), 1)
+            self.assertEqual(len(compile_airspace_snapshot(snapshot_filename)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
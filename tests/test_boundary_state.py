@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import errno
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+from uuid import uuid4
+from pru.flight_matching import merge_consecutive_flights
+from pru.boundary_state import *
+from pru.stage_metrics import STAGE_METRICS_FILENAME_ENV
+from apps.match_consecutive_day_trajectories import match_consecutive_day_boundary_states
+
+FLIGHTS_COUNT = 200
+POSITIONS_COUNT = 5
+
+
+def generate_day(date, seed):
+    """ Generate random flights and positions for a day. """
+    random = np.random.RandomState(seed)
+    starts = np.datetime64(date, 'ns') + \
+        random.randint(-3600, 86400, FLIGHTS_COUNT).astype('timedelta64[s]')
+    durations = random.randint(600, 6 * 3600, FLIGHTS_COUNT).astype('timedelta64[s]')
+    # The flights of a day finish by the end of the day
+    day_finish = np.datetime64(date, 'ns') + np.timedelta64(1, 'D')
+    durations = np.minimum(starts + durations, day_finish) - starts
+    addresses = np.array(['{:06x}'.format(i) for i in range(10)], dtype=object)
+    airports = np.array(['EGLL', 'LFPG', 'EDDF', 'EHAM'], dtype=object)
+    flights_df = pd.DataFrame({'FLIGHT_ID': [uuid4() for i in range(FLIGHTS_COUNT)],
+                               'CALLSIGN': random.choice(addresses, FLIGHTS_COUNT),
+                               'AIRCRAFT_ADDRESS': random.choice(addresses, FLIGHTS_COUNT),
+                               'ADEP': random.choice(airports, FLIGHTS_COUNT),
+                               'ADES': random.choice(airports, FLIGHTS_COUNT),
+                               'PERIOD_START': pd.to_datetime(starts, utc=True),
+                               'PERIOD_FINISH': pd.to_datetime(starts + durations, utc=True)})
+    flights_df.loc[::7, 'AIRCRAFT_ADDRESS'] = None
+    flights_df.loc[::11, 'ADEP'] = None
+
+    ratios = np.linspace(0.0, 1.0, POSITIONS_COUNT)
+    times = [start + (ratios * duration).astype('timedelta64[ns]')
+             for start, duration in zip(starts, durations)]
+    points_df = pd.DataFrame({'TIME': np.concatenate(times),
+                              'LAT': random.uniform(40.0, 55.0, FLIGHTS_COUNT * POSITIONS_COUNT),
+                              'LON': random.uniform(-5.0, 15.0, FLIGHTS_COUNT * POSITIONS_COUNT),
+                              'ALT': random.uniform(0.0, 40000.0, FLIGHTS_COUNT * POSITIONS_COUNT)},
+                             index=np.repeat(flights_df['FLIGHT_ID'].values, POSITIONS_COUNT))
+    return flights_df, points_df
+
+
+def sorted_pairs(merge_df):
+    return sorted(zip(merge_df['FLIGHT_ID_x'], merge_df['FLIGHT_ID_y']))
+
+
+class TestBoundaryState(unittest.TestCase):
+
+    def test_find_boundary_flights(self):
+        date = '2017-08-01'
+        starts = pd.to_datetime(['2017-07-31T23:00:00', '2017-08-01T03:59:59',
+                                 '2017-08-01T04:00:00', '2017-08-01T12:00:00'], utc=True)
+        finishes = pd.to_datetime(['2017-08-01T01:00:00', '2017-08-01T19:59:59',
+                                   '2017-08-01T20:00:00', '2017-08-02T01:00:00'], utc=True)
+        flights_df = pd.DataFrame({'PERIOD_START': starts, 'PERIOD_FINISH': finishes})
+
+        is_head, is_tail = find_boundary_flights(flights_df, date, 4.0)
+        self.assertEqual(list(is_head), [True, True, False, False])
+        self.assertEqual(list(is_tail), [False, False, True, True])
+
+        is_head, is_tail = find_boundary_flights(flights_df, date, 0.0)
+        self.assertEqual(list(is_head), [True, False, False, False])
+        self.assertEqual(list(is_tail), [False, False, False, True])
+
+    def test_write_and_read_boundary_state(self):
+        date = '2017-08-01'
+        flights_df, points_df = generate_day(date, 1)
+        positions = FlightPositions(points_df)
+        is_head, is_tail = find_boundary_flights(flights_df, date)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'cpr_fr24_boundary_state_2017-08-01.npz')
+            count = write_boundary_state(filename, flights_df, positions, date)
+            self.assertEqual(count, (is_head | is_tail).sum())
+
+            tail_df, tail_positions = read_boundary_state(filename, is_tail=True)
+            head_df, head_positions = read_boundary_state(filename, is_tail=False)
+
+        for is_flight, boundary_df, boundary_positions in \
+                [(is_tail, tail_df, tail_positions), (is_head, head_df, head_positions)]:
+            expected_df = flights_df.loc[is_flight, BOUNDARY_FLIGHT_FIELDS]
+            pd.testing.assert_frame_equal(boundary_df,
+                                          expected_df.reset_index(drop=True))
+
+            expected = positions.select(expected_df['FLIGHT_ID'].values)
+            self.assertEqual(list(boundary_positions.flight_ids),
+                             list(expected.flight_ids))
+            for values, expected_values in zip(boundary_positions.to_arrays()[1:],
+                                               expected.to_arrays()[1:]):
+                self.assertTrue(np.array_equal(values, expected_values))
+
+    def test_write_boundary_state_ends(self):
+        date = '2017-08-01'
+        flights_df, points_df = generate_day(date, 4)
+        is_head, is_tail = find_boundary_flights(flights_df, date)
+
+        # Only the positions of the flights that are written are required
+        tail_points_df = points_df.loc[points_df.index.isin(flights_df.loc[is_tail, 'FLIGHT_ID'])]
+        tail_points_df = tail_points_df.rename_axis('FLIGHT_ID').reset_index()
+        tail_points_df['FLIGHT_ID'] = tail_points_df['FLIGHT_ID'].astype(str)
+        positions = create_flight_positions(tail_points_df)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'cpr_fr24_boundary_tail_2017-08-01.npz')
+            count = write_boundary_state(filename, flights_df, positions, date,
+                                         is_tail=True)
+            self.assertEqual(count, is_tail.sum())
+
+            tail_df, tail_positions = read_boundary_state(filename, is_tail=True)
+            head_df, head_positions = read_boundary_state(filename, is_tail=False)
+            self.assertEqual(read_boundary_hours(filename), DEFAULT_BOUNDARY_HOURS)
+
+            # The boundary hours must be longer than the maximum time difference
+            next_filename = os.path.join(directory, 'cpr_fr24_boundary_head_2017-08-02.npz')
+            write_boundary_state(next_filename, flights_df, positions, '2017-08-02',
+                                 0.01, is_tail=False)
+            self.assertEqual(read_boundary_hours(next_filename), 0.01)
+            metrics_filename = os.path.join(directory, 'stage_metrics.csv')
+            with mock.patch.dict(os.environ, {STAGE_METRICS_FILENAME_ENV: metrics_filename}):
+                self.assertEqual(match_consecutive_day_boundary_states([filename, next_filename]),
+                                 errno.EINVAL)
+
+        pd.testing.assert_frame_equal(tail_df,
+                                      flights_df.loc[is_tail, BOUNDARY_FLIGHT_FIELDS]
+                                      .reset_index(drop=True))
+        self.assertEqual(list(tail_positions.flight_ids), list(tail_df['FLIGHT_ID']))
+        expected = FlightPositions(points_df).select(tail_df['FLIGHT_ID'].values)
+        for values, expected_values in zip(tail_positions.to_arrays()[1:],
+                                           expected.to_arrays()[1:]):
+            self.assertTrue(np.array_equal(values, expected_values))
+
+        self.assertEqual(len(head_df), 0)
+        self.assertEqual(len(head_positions.flight_ids), 0)
+
+    def test_boundary_state_matches(self):
+        """ The boundary flights contain the consecutive day matches. """
+        prev_flights_df, prev_points_df = generate_day('2017-08-01', 2)
+        next_flights_df, next_points_df = generate_day('2017-08-02', 3)
+        _, is_tail = find_boundary_flights(prev_flights_df, '2017-08-01')
+        is_head, _ = find_boundary_flights(next_flights_df, '2017-08-02')
+
+        for on in ['AIRCRAFT_ADDRESS', 'CALLSIGN', ['ADEP', 'ADES']]:
+            expected = merge_consecutive_flights(prev_flights_df, next_flights_df,
+                                                 on, 150.0)
+            self.assertTrue(len(expected) > 0)
+            result = merge_consecutive_flights(prev_flights_df.loc[is_tail],
+                                               next_flights_df.loc[is_head],
+                                               on, 150.0)
+            self.assertEqual(sorted_pairs(result), sorted_pairs(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import tempfile
+from pru.airport_stands import AirportStands
+from apps.convert_apt_data import *
+
+APDS_HEADER = ','.join(field.name for field in ApdsField)
+APDS_EMPTY_FIELDS = ',' * (len(ApdsField) - ApdsField.AP_C_STND - 1)
+
+APDS_LINES = [APDS_HEADER,
+              '3,BAW1,G-ABCD,EGLL,LFPG,DEP,2017-08-01T10:05:00Z,2017-08-01T09:50:00Z,'
+              '2017-08-01T09:45:00Z,A320,27L,216' + APDS_EMPTY_FIELDS,
+              '1,AFR1,F-ABCD,LFPG,EGLL,ARR,2017-08-01T11:00:00Z,2017-08-01T11:10:00Z,'
+              ',A321,27R,217' + APDS_EMPTY_FIELDS,
+              '2,DLH1,D-ABCD,EDDF,EGLL,ARR,,,2017-08-01T12:00:00Z,A320,,'
+              + APDS_EMPTY_FIELDS,
+              '1,AFR2,F-ABCE,LFPG,EGLL,DEP,2017-08-01T09:00:00Z,,,A321,,'
+              + APDS_EMPTY_FIELDS]
+
+
+class TestConvertAptFunctions(unittest.TestCase):
+
+    def test_read_apds_flights(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'FAC_APDS_FLIGHT_IR691_2017-08-01_2017-08-01.csv')
+            with open(filename, 'w') as file:
+                file.write('\n'.join(APDS_LINES) + '\n')
+            apds_df, lines_count = read_apds_flights(filename)
+
+        # Flights are sorted by id and the first line of a flight is used
+        self.assertEqual(lines_count, 4)
+        self.assertEqual(list(apds_df['APDS_ID']), ['1', '2', '3'])
+        self.assertEqual(list(apds_df['AP_C_FLTID']), ['AFR1', 'DLH1', 'BAW1'])
+        self.assertEqual(apds_df.loc[1, 'MVT_TIME_UTC'], '')
+
+        flights_df = convert_apds_flights(apds_df)
+        self.assertEqual(list(flights_df.columns),
+                         ['FLIGHT_ID', 'CALLSIGN', 'AIRCRAFT_REG', 'AIRCRAFT_TYPE', 'ADEP', 'ADES'])
+        self.assertEqual(list(flights_df['ADEP']), ['LFPG', 'EDDF', 'EGLL'])
+
+        events_df = convert_apds_events(apds_df)
+        self.assertEqual(list(events_df['FLIGHT_ID']), ['1', '1', '2', '3', '3', '3'])
+        self.assertEqual(list(events_df['EVENT_TYPE']),
+                         [FlightEventType.WHEELS_ON, FlightEventType.GATE_IN,
+                          FlightEventType.SCHEDULED_IN_BLOCK,
+                          FlightEventType.SCHEDULED_OFF_BLOCK,
+                          FlightEventType.GATE_OUT, FlightEventType.WHEELS_OFF])
+        self.assertEqual(str(events_df['TIME'][0]), '2017-08-01 11:00:00')
+        self.assertEqual(str(events_df['TIME'][5]), '2017-08-01 10:05:00')
+
+        # Arrival stands are at ADES and departure stands are at ADEP
+        airport_stands = AirportStands(['EGLL', 'EGLL', 'LFPG'], ['216', '217', '217'],
+                                       [51.5, 51.4, 49.0], [-0.5, -0.4, 2.5])
+        positions_df = convert_apds_positions(apds_df, airport_stands)
+        self.assertEqual(list(positions_df['FLIGHT_ID']), ['1', '3'])
+        self.assertEqual(list(positions_df['LAT']), [51.4, 51.5])
+        self.assertEqual(list(positions_df['SURVEILLANCE_SOURCE']),
+                         ['APDS EGLL 217', 'APDS EGLL 216'])
+        self.assertEqual(str(positions_df['TIME'][1]), '2017-08-01 09:50:00')
+
+        positions_df = convert_apds_positions(apds_df, AirportStands())
+        self.assertEqual(len(positions_df), 0)
+
+    def test_convert_apds_data(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                filename = 'FAC_APDS_FLIGHT_IR691_2017-08-01_2017-08-01.csv'
+                with open(filename, 'w') as file:
+                    file.write('\n'.join(APDS_LINES) + '\n')
+                with open('stands.csv', 'w') as file:
+                    file.write('ICAO_ID,STAND_ID,LAT,LON\nEGLL,216,51.5,-0.5\n')
+
+                self.assertEqual(convert_apds_data(filename, 'stands.csv'), 0)
+                flights, positions, events = \
+                    [open(output_filename).read() for output_filename in
+                     create_convert_apds_filenames('2017-08-01', '2017-08-01')]
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(flights.splitlines()[1:],
+                         ['1,AFR1,F-ABCD,A321,,LFPG,EGLL',
+                          '2,DLH1,D-ABCD,A320,,EDDF,EGLL',
+                          '3,BAW1,G-ABCD,A320,,EGLL,LFPG'])
+        self.assertEqual(positions.splitlines()[1:],
+                         ['3,,2017-08-01T09:50:00Z,51.50000,-0.50000,,,,,1,APDS EGLL 216,,'])
+        self.assertEqual(events.splitlines()[1:],
+                         ['1,3,2017-08-01T11:00:00Z', '1,4,2017-08-01T11:10:00Z',
+                          '2,5,2017-08-01T12:00:00Z', '3,0,2017-08-01T09:45:00Z',
+                          '3,1,2017-08-01T09:50:00Z', '3,2,2017-08-01T10:05:00Z'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,9 @@
 # Consult your license regarding permissions and restrictions.
 
 import unittest
+import os
+import tempfile
+import pandas as pd
 from numpy.testing import assert_almost_equal
 from apps.convert_cpr_data import *
 
@@ -72,6 +75,104 @@ class TestConvertCprFunctions(unittest.TestCase):
         result2 = cpr_track2decimal(track2)
         assert_almost_equal(result2, 31.97027778)
 
+    def test_cpr_latlongs2decimals(self):
+        """Test vectorised conversion of CPR Lat Long positions."""
+        latlongs = pd.Series(['540138S 0274539E', '480908N 0001922W', 'BAD', ''])
+        lats, longs = cpr_latlongs2decimals(latlongs)
+        for latlong, lat, lng in zip(latlongs, lats, longs):
+            self.assertEqual((lat, lng), cpr_latlong2decimal(latlong))
+
+    def test_cpr_tracks2decimals(self):
+        """Test vectorised conversion of CPR track magnetic fields."""
+        tracks = pd.Series(["234 07'27''", "031 58'13''", ''])
+        result = cpr_tracks2decimals(tracks)
+        self.assertEqual(result[0], cpr_track2decimal(tracks[0]))
+        self.assertEqual(result[1], cpr_track2decimal(tracks[1]))
+        self.assertEqual(result[2], -1.0)
+
+    def test_summarise_cpr_flights(self):
+        """Test the summaries and unique positions of CPR flights."""
+        lines = [['2', '17/08/01 00:00:10', '8', '1', '', 'EGLL', 'LFPG', '17/07/31 23:30:00',
+                  '480908N 0001922W', '100', '1234', '400', "031 58'13''", '0', 'ABC123'],
+                 ['1', '17/08/01 00:00:05', '8', '1', 'AB', 'EDDF', 'EHAM', '',
+                  '540138S 0274539E', '200', '0000', '', '', '', ''],
+                 ['2', '17/08/01 00:00:00', '8', '1', 'XY', 'ZZZZ', 'ZZZZ', '',
+                  '480908N 0001922W', '110', '4321', '410', '', '0', 'DEF456'],
+                 ['2', '17/08/01 00:00:10', '8', '1', 'YZ', 'ZZZZ', 'ZZZZ', '',
+                  '480908N 0001922W', '100', '1234', '999', '', '0', 'ABC123'],
+                 ['', '17/08/01 00:00:20', '8', '1', 'XY', 'ZZZZ', 'ZZZZ', '',
+                  '480908N 0001922W', '100', '1234', '400', '', '0', 'ABC123'],
+                 ['2', '17/08/01 00:00:20', '', '', 'XY', 'ZZZZ', 'ZZZZ', '',
+                  '480908N 0001922W', '120', '0000', '420', '', '0', 'DEF456'],
+                 ['2', '17/08/01 00:00:30', '8', '1', 'XY', 'ZZZZ', 'ZZZZ', '',
+                  '480908N 0001922W', '130', '1234', '430', '', '0', 'ABC123']]
+        cpr_df = pd.DataFrame(lines, columns=CPR_FIELDS)
+        positions_df = convert_cpr_positions(cpr_df)
+        flight_lines_df = positions_df[['KEY'] + CPR_FLIGHT_COLUMNS]
+        positions_df = positions_df.drop(columns=CPR_FLIGHT_COLUMNS)
+        self.assertEqual(len(positions_df), 6)
+
+        flights_df = summarise_cpr_flights(positions_df, flight_lines_df)
+        self.assertEqual(list(flights_df.index), ['1', '2'])
+        self.assertEqual(list(flights_df['CALLSIGN']), ['AB', 'XY'])
+        self.assertEqual(list(flights_df['ADEP']), ['EDDF', 'EGLL'])
+        self.assertEqual(list(flights_df['EOBT']), ['', '17/07/31 23:30:00'])
+        self.assertEqual(list(flights_df['AIRCRAFT_ADDRESS']), ['', '0xABC123'])
+        self.assertEqual(list(flights_df['SOURCE_IDS']), ['', '0xDEF456'])
+        self.assertEqual(list(flights_df['SSR_CODES']), ['', '1234 4321'])
+        self.assertEqual(str(flights_df.loc['2', 'PERIOD_START']), '2017-08-01 00:00:00')
+        self.assertEqual(str(flights_df.loc['2', 'PERIOD_FINISH']), '2017-08-01 00:00:30')
+
+        # The duplicate position with a different speed is removed
+        positions_df = remove_duplicate_positions(positions_df)
+        self.assertEqual(list(positions_df['KEY']), ['1', '2', '2', '2', '2'])
+        self.assertEqual(list(positions_df['ALT']), [20000, 11000, 10000, 12000, 13000])
+        self.assertEqual(list(positions_df['SPEED_GND']), [0.0, 410.0, 400.0, 420.0, 430.0])
+        self.assertEqual(list(positions_df['SAC']), [8, 8, 8, 0, 8])
+
+    def test_read_cpr_positions(self):
+        """Test reading CPR positions in blocks of lines."""
+        lines = []
+        for i in range(20):
+            fields = [''] * len(CprField)
+            fields[CprField.TACT_ID] = str(i % 3 + 1)
+            fields[CprField.DATE_TIME] = '17/08/01 00:{:02d}:00'.format(i)
+            fields[CprField.CALLSIGN] = 'AB' if i > 1 else ''
+            fields[CprField.LAT_LONG] = '480908N 0001922W'
+            fields[CprField.FLIGHT_LEVEL] = str(100 + i)
+            fields[CprField.SSR_CODE] = '1234'
+            lines.append(';'.join(fields))
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, '1.201708011001tacop104ARCHIVED_OPLOG_ALL_CPR')
+            with open(filename, 'w') as file:
+                file.write('\n'.join(lines) + '\n')
+
+            expected = read_cpr_positions(filename)
+            self.assertEqual(expected[2], 20)
+            self.assertEqual(list(expected[0]['ALT']), [100 * (100 + i) for i in range(20)])
+            self.assertEqual(list(expected[1]['KEY']), ['1', '2', '3', '1', '2'])
+
+            for processes, blocksize in [(1, 100), (2, 100), (2, 1000)]:
+                result = read_cpr_positions(filename, processes, blocksize)
+                pd.testing.assert_frame_equal(result[0], expected[0])
+                self.assertEqual(result[2], expected[2])
+
+                # The flight lines may differ, but not their summaries
+                pd.testing.assert_frame_equal(summarise_cpr_flights(result[0], result[1]),
+                                              summarise_cpr_flights(expected[0], expected[1]))
+
+            # An empty file has empty positions and flight lines
+            with open(filename, 'w') as file:
+                pass
+            result = read_cpr_positions(filename)
+            self.assertEqual(result[2], 0)
+            self.assertEqual(len(result[0]), 0)
+            self.assertEqual(list(result[0].columns), list(expected[0].columns))
+            self.assertEqual(len(result[1]), 0)
+            self.assertEqual(list(result[1].columns), list(expected[1].columns))
+            self.assertEqual(len(summarise_cpr_flights(result[0], result[1])), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
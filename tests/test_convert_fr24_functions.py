@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import io
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from apps.convert_fr24_data import *
+
+FLIGHTS_LINES = ['FLIGHT_ID,START_TIME,ADEP,ADES,CALLSIGN,FLIGHT,REG,MODEL,ADDRESS',
+                 '0000000b,2017-08-01T00:00:00Z,EGLL,LFPG,BAW1,BA1,G-ABCD,A320,400001',
+                 '0000000a,2017-08-01T00:00:00Z,LFPG,EGLL,AFR1,AF1,F-ABCD,A321,390001',
+                 '0000000b,2017-08-01T01:00:00Z,XXXX,XXXX,XXX,XX,X-XXXX,A320,400001',
+                 '0000000c,2017-08-01T00:00:00Z,,,GLD1,,D-ABCD,GLID,3C0001',
+                 '0000000d,2017-08-01T00:00:00Z,,,TST1,,D-ABCE,A320,000000',
+                 '0000000e,2017-08-01T00:00:00Z,EDDF,EGLL,DLH1,LH1,D-ABCF,A320,3C0002']
+
+POINTS_LINES = ['FLIGHT_ID,LAT,LON,TRACK,ALT,SPEED,SQUAWK,RADAR_ID,EVENT_TIME,ON_GROUND,VERT_SPEED',
+                '0000000a,49.0,2.5,90,1000,200,1234,R1,2017-08-01T00:00:10Z,0,1000',
+                '0000000b,51.5,-0.5,,0,,,R2,2017-08-01T00:00:05Z,1,',
+                '0000000a,49.1,2.6,91,2000,210,0000,R1,2017-08-01T00:00:00Z,0,1000',
+                '0000000c,52.0,10.0,0,500,50,7000,R3,2017-08-01T00:00:00Z,0,0',
+                '0000000a,49.0,2.5,90,1000,250,1234,R1,2017-08-01T00:00:10Z,0,1000',
+                '0000000b,51.6,-0.6,180,100,100,4567,R2,2017-08-01T00:00:05Z,0,500',
+                '0000000f,50.0,5.0,0,500,50,7000,R3,2017-08-01T00:00:00Z,0,0',
+                '0000000e,50.0,8.5,270,3000,300,5670,R4,2017-08-01T00:00:00Z,0,0',
+                '0000000a,49.2,2.7,92,3000,220,2345,R1,2017-08-01T00:00:10Z,0,1000',
+                '0000000e,50.0,8.5,270,3000,300,5670,R4,2017-08-01T00:00:00Z,0,0']
+
+
+def write_lines(filename, lines):
+    with open(filename, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+class TestConvertFr24Functions(unittest.TestCase):
+
+    def test_read_fr24_flights(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'FR24_ADSB_DATA_FLIGHTS_2017-08-01.csv')
+            write_lines(filename, FLIGHTS_LINES)
+            flights_df = read_fr24_flights(filename)
+
+        # Special aircraft types and invalid addresses are not valid
+        self.assertEqual(list(flights_df['KEY']), ['0000000a', '0000000b', '0000000e'])
+        self.assertEqual(list(flights_df['FLIGHT_ID']), ['0x0000000a', '0x0000000b', '0x0000000e'])
+        self.assertEqual(list(flights_df['AIRCRAFT_ADDRESS']), ['0x390001', '0x400001', '0x3C0002'])
+        # The first line of a flight is used
+        self.assertEqual(flights_df.loc[1, 'CALLSIGN'], 'BAW1')
+        self.assertEqual(flights_df.loc[1, 'ADEP'], 'EGLL')
+
+    def test_partition_flights(self):
+        partitions = partition_flights(np.arange(10), 10, 3)
+        self.assertEqual(list(partitions), [0, 0, 0, 0, 1, 1, 1, 2, 2, 2])
+        self.assertEqual(list(partition_flights(np.arange(2), 2, 1)), [0, 0])
+
+    def test_partition_columns(self):
+        points_df = pd.read_csv(io.StringIO('\n'.join(POINTS_LINES)), header=0,
+                                names=[field.name for field in AdsbPointField],
+                                dtype=str, na_filter=False)
+        columns = convert_fr24_points(points_df, pd.Index(['0000000a', '0000000b']))
+        self.assertEqual(list(columns['FLIGHT']), [0, 1, 0, 0, 1, 0])
+        self.assertEqual(list(columns['SPEED_GND']), [200.0, 0.0, 210.0, 250.0, 100.0, 220.0])
+        self.assertEqual(list(columns['TRACK_GND']), [90.0, -1.0, 91.0, 90.0, 180.0, 92.0])
+        self.assertEqual(list(columns['VERT_SPEED']), [1000, 0, 1000, 1000, 500, 1000])
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'partition_0.npy')
+            with open(filename, 'wb') as file:
+                write_partition_columns(file, columns)
+                write_partition_columns(file, {column: values[:2]
+                                               for column, values in columns.items()})
+            points_df = read_partition_columns(filename)
+
+        self.assertEqual(len(points_df), 8)
+        self.assertEqual(list(points_df.columns), list(PARTITION_COLUMNS))
+        self.assertEqual(list(points_df['RADAR_ID']), ['R1', 'R2', 'R1', 'R1', 'R2', 'R1', 'R1', 'R2'])
+
+    def test_convert_empty_partition(self):
+        flights_df = pd.DataFrame({'KEY': ['0000000a'], 'FLIGHT_ID': ['0x0000000a'],
+                                   'CALLSIGN': ['AFR1'], 'AIRCRAFT_REG': ['F-ABCD'],
+                                   'AIRCRAFT_TYPE': ['A321'], 'AIRCRAFT_ADDRESS': ['0x390001'],
+                                   'ADEP': ['LFPG'], 'ADES': ['EGLL']})
+        flights_df.index.name = 'FLIGHT'
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'partition_0.npy')
+            open(filename, 'wb').close()
+            self.assertEqual(convert_partition(filename, flights_df, filename + '.flights',
+                                               filename + '.positions'), (0, 0))
+            self.assertEqual(os.path.getsize(filename + '.flights'), 0)
+            self.assertEqual(os.path.getsize(filename + '.positions'), 0)
+
+    def test_convert_fr24_data(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                filenames = ['FR24_ADSB_DATA_FLIGHTS_2017-08-01.csv',
+                             'FR24_ADSB_DATA_POINTS_2017-08-01.csv']
+                write_lines(filenames[0], FLIGHTS_LINES)
+                write_lines(filenames[1], POINTS_LINES)
+                outputs = []
+                for partitions, processes in [(1, 1), (3, 1), (3, 2)]:
+                    self.assertEqual(convert_fr24_data(filenames, partitions, processes,
+                                                       blocksize=100), 0)
+                    outputs.append([open(filename).read()
+                                    for filename in create_convert_fr24_filenames('2017-08-01')])
+            finally:
+                os.chdir(cwd)
+
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(outputs[2], outputs[0])
+
+        # Flight e only has duplicate positions, so it is not valid
+        flights, positions = outputs[0]
+        self.assertEqual(flights.splitlines()[1:],
+                         ['0x0000000a,AFR1,F-ABCD,A321,0x390001,LFPG,EGLL,[1234 2345],'
+                          '2017-08-01T00:00:00Z,2017-08-01T00:00:10Z,[]',
+                          '0x0000000b,BAW1,G-ABCD,A320,0x400001,EGLL,LFPG,[4567],'
+                          '2017-08-01T00:00:05Z,2017-08-01T00:00:05Z,[]'])
+        self.assertEqual(positions.splitlines()[1:],
+                         ["0x0000000a,,2017-08-01T00:00:00Z,49.10000,2.60000,2000,210.0,91.000,"
+                          "1000,0,FR24 R1,0x390001,'0000'",
+                          "0x0000000a,,2017-08-01T00:00:10Z,49.00000,2.50000,1000,200.0,90.000,"
+                          "1000,0,FR24 R1,0x390001,'1234'",
+                          "0x0000000a,,2017-08-01T00:00:10Z,49.20000,2.70000,3000,220.0,92.000,"
+                          "1000,0,FR24 R1,0x390001,'2345'",
+                          "0x0000000b,,2017-08-01T00:00:05Z,51.50000,-0.50000,0,0.0,-1.000,"
+                          "0,1,FR24 R2,0x400001,''",
+                          "0x0000000b,,2017-08-01T00:00:05Z,51.60000,-0.60000,100,100.0,180.000,"
+                          "500,0,FR24 R2,0x400001,'4567'"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import io
+import numpy as np
+import pandas as pd
+from pru.trajectory_fields import POSITION_FIELDS
+from pru.csv_writers import *
+
+
+class TestCsvWriters(unittest.TestCase):
+
+    def test_format_datetimes(self):
+        times = np.array(['2017-08-01T00:00:00', '2017-08-01T12:34:56.789'],
+                         dtype='datetime64[ns]')
+        self.assertEqual(format_datetimes(times),
+                         ['2017-08-01T00:00:00Z', '2017-08-01T12:34:56Z'])
+        self.assertEqual(format_datetimes(pd.to_datetime(times, utc=True)),
+                         ['2017-08-01T00:00:00Z', '2017-08-01T12:34:56Z'])
+        self.assertEqual(format_datetimes(times[:0]), [])
+
+    def test_create_row_format(self):
+        self.assertEqual(create_row_format(['A', 'B', 'C']), '{},{},{}\n')
+        self.assertEqual(create_row_format(['A', 'B', 'C'], {'B': '{:.1f}'}),
+                         '{},{:.1f},{}\n')
+        self.assertEqual(create_row_format(['A', 'B', 'C'], {'B': '{:.1f}'}, ['A', 'C']),
+                         '{},,{}\n')
+
+    def test_write_positions(self):
+        positions_df = pd.DataFrame({'FLIGHT_ID': ['0x1', '0x2', '0x3'],
+                                     'TIME': pd.to_datetime(['2017-08-01T00:00:01',
+                                                             '2017-08-01T00:00:02',
+                                                             '2017-08-01T00:00:03']),
+                                     'LAT': [1.0, 2.123456, -3.5],
+                                     'LON': [4.0, 5.0, 6.0],
+                                     'ALT': [100, 200, 300],
+                                     'SSR_CODE': ['1234', '0000', '']})
+        expected = ["0x1,,2017-08-01T00:00:01Z,1.00000,4.00000,100,,,,,,,'1234'\n",
+                    "0x2,,2017-08-01T00:00:02Z,2.12346,5.00000,200,,,,,,,'0000'\n",
+                    "0x3,,2017-08-01T00:00:03Z,-3.50000,6.00000,300,,,,,,,''\n"]
+
+        for chunksize in [1, 2, 3, 10]:
+            file = io.StringIO()
+            self.assertEqual(write_positions(file, positions_df, chunksize=chunksize), 3)
+            self.assertEqual(file.getvalue(), ''.join(expected))
+
+        # All of the columns are output, in POSITION_FIELDS order
+        self.assertEqual(expected[0].count(','), POSITION_FIELDS.count(','))
+
+        file = io.StringIO()
+        self.assertEqual(write_positions(file, positions_df.iloc[:0]), 0)
+        self.assertEqual(file.getvalue(), '')
+
+    def test_write_flights_and_events(self):
+        flights_df = pd.DataFrame({'FLIGHT_ID': [1, 2],
+                                   'CALLSIGN': ['ABC123', ''],
+                                   'SSR_CODES': ['1234 5670', ''],
+                                   'PERIOD_START': pd.to_datetime(['2017-08-01T00:00:01',
+                                                                   '2017-08-01T00:01:00']),
+                                   'PERIOD_FINISH': pd.to_datetime(['2017-08-01T01:00:00',
+                                                                    '2017-08-01T02:00:00']),
+                                   'SOURCE_IDS': ["'0x123456'", '']})
+        file = io.StringIO()
+        self.assertEqual(write_flights(file, flights_df), 2)
+        self.assertEqual(file.getvalue(),
+                         "1,ABC123,,,,,,[1234 5670],2017-08-01T00:00:01Z,"
+                         "2017-08-01T01:00:00Z,['0x123456']\n"
+                         "2,,,,,,,[],2017-08-01T00:01:00Z,2017-08-01T02:00:00Z,[]\n")
+
+        events_df = pd.DataFrame({'FLIGHT_ID': ['1', '2'],
+                                  'EVENT_TYPE': [0, 3],
+                                  'TIME': pd.to_datetime(['2017-08-01T00:00:01',
+                                                          '2017-08-01T00:01:00'])})
+        file = io.StringIO()
+        self.assertEqual(write_events(file, events_df), 2)
+        self.assertEqual(file.getvalue(),
+                         '1,0,2017-08-01T00:00:01Z\n2,3,2017-08-01T00:01:00Z\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
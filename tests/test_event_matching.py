@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from pru.event_matching import *
+
+FLIGHTS_COUNT = 100
+
+
+def generate_flights(first_id, seed):
+    """ Generate random flights and events with few distinct key values. """
+    random = np.random.RandomState(seed)
+    airports = np.array(['EGLL', 'LFPG', 'EDDF'], dtype=object)
+    flights_df = pd.DataFrame({'FLIGHT_ID': np.arange(first_id, first_id + FLIGHTS_COUNT),
+                               'CALLSIGN': random.choice(['A1', 'B2', 'C3'], FLIGHTS_COUNT),
+                               'ADEP': random.choice(airports, FLIGHTS_COUNT),
+                               'ADES': random.choice(airports, FLIGHTS_COUNT)})
+    flights_df.loc[::9, 'CALLSIGN'] = None
+
+    events_count = 3 * FLIGHTS_COUNT
+    times = np.datetime64('2017-08-01T00:00:00', 'ns') + \
+        (random.randint(0, 600, events_count) * 10).astype('timedelta64[s]')
+    events_df = pd.DataFrame({'FLIGHT_ID': random.choice(flights_df['FLIGHT_ID'], events_count),
+                              'EVENT_TYPE': random.randint(0, 2, events_count),
+                              'TIME': times})
+    return flights_df, events_df
+
+
+def expected_matches(flights_1, events_1, flights_2, events_2, tolerance):
+    """ Match events with a pandas merge and a time filter. """
+    flight_events_1 = pd.merge(flights_1, events_1, on='FLIGHT_ID')
+    flight_events_2 = pd.merge(flights_2, events_2, on='FLIGHT_ID')
+    merge_df = pd.merge(flight_events_1, flight_events_2, on=EVENT_KEY_FIELDS)
+    merge_df = merge_df.loc[(merge_df.TIME_x - merge_df.TIME_y).abs() <=
+                            pd.Timedelta(seconds=tolerance)]
+    merge_df = merge_df.loc[merge_df['CALLSIGN'].notnull()]
+    return sorted(zip(merge_df['FLIGHT_ID_x'], merge_df['FLIGHT_ID_y']))
+
+
+class TestEventMatching(unittest.TestCase):
+
+    def test_event_index(self):
+        flights_1, events_1 = generate_flights(0, 1)
+        flights_2, events_2 = generate_flights(1000, 2)
+
+        event_index = EventIndex()
+        self.assertEqual(len(event_index), 0)
+        event_index.update(flights_1, events_1)
+        self.assertTrue(0 < len(event_index) <= len(events_1))
+
+        for tolerance in [0.0, 10.0, 25.0, 600.0]:
+            index_ids, flight_ids = event_index.find_matches(flights_2, events_2, tolerance)
+            expected = expected_matches(flights_1, events_1, flights_2, events_2, tolerance)
+            self.assertTrue(len(expected) > 0)
+            self.assertEqual(sorted(zip(index_ids, flight_ids)), expected)
+
+        # Update the index with more events
+        flights_3, events_3 = generate_flights(2000, 3)
+        event_index.update(flights_3, events_3)
+        index_ids, flight_ids = event_index.find_matches(flights_2, events_2, 10.0)
+        expected = expected_matches(pd.concat([flights_1, flights_3]),
+                                    pd.concat([events_1, events_3]),
+                                    flights_2, events_2, 10.0)
+        self.assertEqual(sorted(zip(index_ids, flight_ids)), expected)
+
+    def test_save_and_load(self):
+        flights_1, events_1 = generate_flights(0, 4)
+        flights_2, events_2 = generate_flights(1000, 5)
+        event_index = EventIndex()
+        event_index.update(flights_1, events_1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'event_index.npz')
+            event_index.save(filename)
+            loaded_index = EventIndex.load(filename)
+
+            empty_filename = os.path.join(directory, 'empty_index.npz')
+            EventIndex().save(empty_filename)
+            empty_index = EventIndex.load(empty_filename)
+
+        self.assertEqual(len(loaded_index), len(event_index))
+        self.assertEqual(loaded_index.keys, event_index.keys)
+        self.assertEqual(list(loaded_index.flight_ids), list(event_index.flight_ids))
+
+        expected = event_index.find_matches(flights_2, events_2, 20.0)
+        result = loaded_index.find_matches(flights_2, events_2, 20.0)
+        self.assertEqual(list(result[0]), list(expected[0]))
+        self.assertEqual(list(result[1]), list(expected[1]))
+
+        self.assertEqual(len(empty_index), 0)
+        index_ids, flight_ids = empty_index.find_matches(flights_2, events_2)
+        self.assertEqual(len(index_ids), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import numpy as np
+import pandas as pd
+from pru.flight_matching import *
+
+FLIGHTS_COUNT = 200
+
+
+def generate_flights(first_id, seed):
+    """ Generate random flights with few distinct key values. """
+    random = np.random.RandomState(seed)
+    starts = np.datetime64('2017-08-01T00:00:00', 'ns') + \
+        random.randint(0, 86400, FLIGHTS_COUNT).astype('timedelta64[s]')
+    durations = random.randint(600, 4 * 3600, FLIGHTS_COUNT).astype('timedelta64[s]')
+    addresses = np.array(['{:06x}'.format(i) for i in range(10)], dtype=object)
+    airports = np.array(['EGLL', 'LFPG', 'EDDF', 'EHAM'], dtype=object)
+    flights_df = pd.DataFrame({'FLIGHT_ID': np.arange(first_id, first_id + FLIGHTS_COUNT),
+                               'CALLSIGN': random.choice(addresses, FLIGHTS_COUNT),
+                               'AIRCRAFT_ADDRESS': random.choice(addresses, FLIGHTS_COUNT),
+                               'ADEP': random.choice(airports, FLIGHTS_COUNT),
+                               'ADES': random.choice(airports, FLIGHTS_COUNT),
+                               'PERIOD_START': starts,
+                               'PERIOD_FINISH': starts + durations})
+    flights_df.loc[::7, 'AIRCRAFT_ADDRESS'] = None
+    return flights_df
+
+
+def sorted_pairs(merge_df):
+    return sorted(zip(merge_df['FLIGHT_ID_x'], merge_df['FLIGHT_ID_y']))
+
+
+class TestFlightMatching(unittest.TestCase):
+
+    def test_find_overlapping_intervals(self):
+        codes = np.array([0, 0, 1, -1], dtype=np.int64)
+        starts = np.array([0, 10, 0, 0], dtype=np.int64)
+        finishes = np.array([5, 20, 100, 100], dtype=np.int64)
+
+        right_codes = np.array([0, 0, 1, 0], dtype=np.int64)
+        right_starts = np.array([5, 21, 50, 3], dtype=np.int64)
+        right_finishes = np.array([10, 30, 60, 4], dtype=np.int64)
+
+        left_indicies, right_indicies = \
+            find_overlapping_intervals(codes, starts, finishes, right_codes,
+                                       right_starts, right_finishes)
+        self.assertEqual(list(left_indicies), [0, 0, 1, 2])
+        self.assertEqual(list(right_indicies), [0, 3, 0, 2])
+
+        # No intervals
+        empty = np.array([], dtype=np.int64)
+        left_indicies, right_indicies = \
+            find_overlapping_intervals(empty, empty, empty,
+                                       right_codes, right_starts, right_finishes)
+        self.assertEqual(len(left_indicies), 0)
+        self.assertEqual(len(right_indicies), 0)
+
+    def test_merge_overlapping_flights(self):
+        flights_1 = generate_flights(0, 1)
+        flights_2 = generate_flights(1000, 2)
+
+        for on in ['AIRCRAFT_ADDRESS', 'CALLSIGN', ['ADEP', 'ADES']]:
+            merge_df = pd.merge(flights_1, flights_2, on=on)
+            expected = merge_df.loc[(merge_df.PERIOD_START_x <= merge_df.PERIOD_FINISH_y) &
+                                    (merge_df.PERIOD_START_y <= merge_df.PERIOD_FINISH_x)]
+            expected = expected.loc[expected[on].notnull().all(axis=1)
+                                    if isinstance(on, list) else expected[on].notnull()]
+
+            result = merge_overlapping_flights(flights_1, flights_2, on)
+            self.assertTrue(len(result) > 0)
+            self.assertEqual(sorted_pairs(result), sorted_pairs(expected))
+            self.assertEqual(set(result.columns), set(expected.columns))
+
+            # The rows are ordered by left flight
+            self.assertTrue((np.diff(result['FLIGHT_ID_x'].values) >= 0).all())
+
+    def test_merge_consecutive_flights(self):
+        flights_1 = generate_flights(0, 3)
+        flights_2 = generate_flights(1000, 4)
+        flights_2['PERIOD_START'] += np.timedelta64(1, 'D')
+        flights_2['PERIOD_FINISH'] += np.timedelta64(1, 'D')
+
+        for max_time_difference in [0.0, 3600.0, 86400.0, 1.5]:
+            for on in ['AIRCRAFT_ADDRESS', 'CALLSIGN', ['ADEP', 'ADES']]:
+                merge_df = pd.merge(flights_1, flights_2, on=on)
+                expected = merge_df.loc[((merge_df.PERIOD_START_y - merge_df.PERIOD_FINISH_x) /
+                                         np.timedelta64(1, 's')) < max_time_difference]
+                expected = expected.loc[expected[on].notnull().all(axis=1)
+                                        if isinstance(on, list) else expected[on].notnull()]
+
+                result = merge_consecutive_flights(flights_1, flights_2, on,
+                                                   max_time_difference)
+                self.assertEqual(sorted_pairs(result), sorted_pairs(expected))
+
+        # A next flight starting exactly max_time_difference after the end
+        # of a previous flight is not matched
+        flights_2 = flights_1.copy()
+        flights_2['FLIGHT_ID'] += 1000
+        flights_2['PERIOD_START'] = flights_1['PERIOD_FINISH'] + np.timedelta64(60, 's')
+        result = merge_consecutive_flights(flights_1, flights_2, 'CALLSIGN', 60.0)
+        self.assertFalse(any(x + 1000 == y for x, y in sorted_pairs(result)))
+        result = merge_consecutive_flights(flights_1, flights_2, 'CALLSIGN', 61.0)
+        self.assertTrue(all(x + 1000 in set(result['FLIGHT_ID_y'])
+                            for x in flights_1['FLIGHT_ID']))
+
+    def test_disjoint_set(self):
+        disjoint_set = DisjointSet(6)
+        self.assertEqual(len(disjoint_set), 6)
+        self.assertEqual(list(disjoint_set.roots()), [0, 1, 2, 3, 4, 5])
+
+        self.assertTrue(disjoint_set.union(0, 3))
+        self.assertTrue(disjoint_set.union(4, 5))
+        self.assertTrue(disjoint_set.union(5, 3))
+        self.assertFalse(disjoint_set.union(0, 4))
+        self.assertEqual(disjoint_set.find(4), disjoint_set.find(0))
+        self.assertNotEqual(disjoint_set.find(1), disjoint_set.find(0))
+
+        roots = disjoint_set.roots()
+        self.assertEqual(len(set(roots[[0, 3, 4, 5]])), 1)
+        self.assertEqual(len(set(roots)), 3)
+
+    def test_allocate_group_ids(self):
+        uuids = generate_uuids(100)
+        self.assertEqual(len(set(uuids)), 100)
+        self.assertTrue(all(u.version == 4 for u in uuids))
+        self.assertEqual(generate_uuids(0), [])
+
+        disjoint_set = DisjointSet(5)
+        disjoint_set.union(1, 3)
+        disjoint_set.union(3, 4)
+        ids = allocate_group_ids(disjoint_set)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids[1], ids[3])
+        self.assertEqual(ids[1], ids[4])
+        self.assertEqual(len(set(ids)), 3)
+
+        self.assertEqual(len(allocate_group_ids(DisjointSet(0))), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import io
+from pru.line_blocks import *
+
+
+def count_lines(block):
+    return block.count(b'\n')
+
+
+class TestLineBlocks(unittest.TestCase):
+
+    def test_read_line_blocks(self):
+        data = b''.join(b'line %d\n' % i for i in range(100))
+        for blocksize in [1, 7, 8, 100, len(data), 2 * len(data)]:
+            blocks = list(read_line_blocks(io.BytesIO(data), blocksize))
+            self.assertEqual(b''.join(blocks), data)
+            for block in blocks:
+                self.assertTrue(len(block) > 0)
+                self.assertTrue(block.endswith(b'\n'))
+
+        # The last line may not have a line end
+        blocks = list(read_line_blocks(io.BytesIO(b'a\nbc\ndef'), 3))
+        self.assertEqual(blocks, [b'a\n', b'bc\n', b'def'])
+        self.assertEqual(list(read_line_blocks(io.BytesIO(b''))), [])
+
+    def test_map_line_blocks(self):
+        data = b''.join(b'line %d\n' % i for i in range(1000))
+        blocks = list(read_line_blocks(io.BytesIO(data), 100))
+        expected = [count_lines(block) for block in blocks]
+        self.assertEqual(sum(expected), 1000)
+        for processes in [1, 2]:
+            self.assertEqual(list(map_line_blocks(count_lines, blocks, processes)),
+                             expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
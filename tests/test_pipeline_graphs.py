@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import errno
+import tempfile
+import concurrent.futures as cf
+from unittest import mock
+from pru.task_graph import TaskGraph, count_failed_tasks
+import scripts.pipeline_graphs as pipeline_graphs
+from scripts.pipeline_graphs import *
+
+DATE = '2017-08-01'
+
+
+def write_airports(airports_filename, local_directory='.'):
+    """ Write an airports file, returning the path like get_airports. """
+    with open(os.path.join(local_directory, airports_filename), 'w') as file:
+        file.write('AIRPORT,LONGITUDE,LATITUDE\n')
+    return local_directory
+
+
+def return_path(airports_filename, local_directory='.'):
+    """ Return the path without writing a file, like get_airports. """
+    return local_directory
+
+
+def check_files(filenames):
+    """ A task that succeeds if all of the files exist. """
+    return 0 if all(os.path.exists(filename) for filename in filenames) \
+        else errno.ENOENT
+
+
+class TestPipelineGraphs(unittest.TestCase):
+
+    def test_get_processed_files(self):
+        with mock.patch.object(pipeline_graphs, 'get_processed', return_value=[True, True]):
+            self.assertTrue(get_processed_files('refined', ['a.csv', 'b.csv']))
+        with mock.patch.object(pipeline_graphs, 'get_processed', return_value=[True, False]):
+            self.assertFalse(get_processed_files('refined', ['a.csv', 'b.csv']))
+        with mock.patch.object(pipeline_graphs, 'get_processed', return_value=False):
+            self.assertFalse(get_processed_files('refined', ['a.csv']))
+
+    def test_get_airports_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(pipeline_graphs, 'get_airports', side_effect=return_path):
+                self.assertFalse(get_airports_file('airports.csv', directory))
+            with mock.patch.object(pipeline_graphs, 'get_airports', side_effect=write_airports):
+                self.assertTrue(get_airports_file('airports.csv', directory))
+
+    def test_intersections_graph_downloads(self):
+        graph = create_intersections_graph(DATE)
+        self.assertIs(graph.tasks['get_trajectories'].function, get_processed_files)
+        self.assertIs(graph.tasks['get_flights'].function, get_processed_files)
+        self.assertIs(graph.tasks['get_movements_airports'].function, get_airports_file)
+
+        # Run the download tasks with the data store return values
+        download_graph = TaskGraph()
+        for name in ['get_trajectories', 'get_flights', 'get_movements_airports']:
+            download_graph.add(graph.tasks[name])
+        outputs = [filename for task in download_graph.tasks.values()
+                   for filename in task.outputs]
+        download_graph.add_task('check_downloads', check_files, args=(outputs,),
+                                inputs=outputs)
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                for filename in outputs[:2]:
+                    open(filename, 'w').close()
+                with mock.patch.object(pipeline_graphs, 'get_processed', return_value=[True]), \
+                        mock.patch.object(pipeline_graphs, 'get_airports', side_effect=write_airports), \
+                        cf.ThreadPoolExecutor(max_workers=1) as executor:
+                    results = download_graph.run(cpu_budget=1, executor=executor)
+                self.assertEqual(count_failed_tasks(results), 0)
+
+                with mock.patch.object(pipeline_graphs, 'get_processed', return_value=[False]), \
+                        mock.patch.object(pipeline_graphs, 'get_airports', side_effect=write_airports), \
+                        cf.ThreadPoolExecutor(max_workers=1) as executor:
+                    results = download_graph.run(cpu_budget=1, executor=executor)
+                self.assertEqual(results['get_trajectories'], errno.EIO)
+                self.assertEqual(results['get_movements_airports'], 0)
+                self.assertEqual(results['check_downloads'], errno.ECANCELED)
+            finally:
+                os.chdir(cwd)
+
+    def test_backfill_graph_dependencies(self):
+        next_date = '2017-08-02'
+        with tempfile.TemporaryDirectory() as directory:
+            graph = create_backfill_graph(DATE, next_date, directory=directory)
+            after_date = '2017-08-03'
+            self.assertEqual(set(name.rsplit('_', 1)[1] for name in graph.tasks),
+                             {DATE, next_date, after_date})
+
+            # Merging a day needs the next day's overnight match
+            self.assertIn('match_overnight_flights_' + next_date,
+                          graph.dependencies(graph.tasks['merge_overnight_data_' + DATE]))
+            self.assertIn('import_data_' + DATE,
+                          graph.dependencies(graph.tasks['match_overnight_flights_' + next_date]))
+
+            # A day is imported without waiting for the previous day
+            self.assertFalse(graph.dependencies(graph.tasks['import_data_' + next_date]))
+            self.assertEqual(graph.dependencies(graph.tasks['find_sector_intersections_' + DATE]),
+                             {'analyse_positions_' + DATE})
+            self.assertEqual(graph.tasks['analyse_positions_' + DATE].outputs,
+                             [DEFAULT_TRAJECTORIES_PREFIX +
+                              create_trajectories_filename(CPR_FR24, DATE)])
+
+            # Every task declares its day files, so it is not up to date without them
+            for task in graph.tasks.values():
+                self.assertTrue(task.outputs)
+                self.assertEqual(task.directory, os.path.join(directory, task.name[-10:]))
+                self.assertFalse(task.is_up_to_date(task.signatures()))
+
+    def test_graphs_verification_samples(self):
+        graph = create_import_data_graph(DATE, samples=5)
+        self.assertEqual(graph.tasks['match_cpr_fr24'].kwargs, {'samples': 5})
+
+        with tempfile.TemporaryDirectory() as directory:
+            graph = create_backfill_graph(DATE, DATE, directory=directory, samples=5)
+            self.assertEqual(graph.tasks['import_data_' + DATE].args[-1], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import json
+import errno
+import tempfile
+from datetime import datetime
+from pru.stage_metrics import *
+
+
+@measure_stage
+def inner_stage(rows):
+    count_rows_in(rows)
+    count_rows_out(rows // 2)
+    return 0
+
+
+@measure_stage
+def outer_stage(rows):
+    count_rows_in(1)
+    inner_stage(rows)
+    return True
+
+
+@measure_stage
+def failed_stage():
+    return False
+
+
+@measure_stage
+def raise_exception():
+    raise ValueError('stage failed')
+
+
+class TestStageMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'stage_metrics.csv')
+        os.environ[STAGE_METRICS_FILENAME_ENV] = self.filename
+
+    def tearDown(self):
+        del os.environ[STAGE_METRICS_FILENAME_ENV]
+        self.directory.cleanup()
+
+    def test_result_error_code(self):
+        self.assertEqual(result_error_code(0), 0)
+        self.assertEqual(result_error_code(errno.ENOENT), errno.ENOENT)
+        self.assertEqual(result_error_code(True), 0)
+        self.assertEqual(result_error_code(False), errno.EIO)
+        self.assertEqual(result_error_code(None), 0)
+
+    def test_measure_stage(self):
+        self.assertEqual(inner_stage(10), 0)
+        self.assertTrue(outer_stage(100))
+        self.assertFalse(failed_stage())
+        self.assertRaises(ValueError, raise_exception)
+
+        metrics_df = read_stage_metrics(self.filename)
+        self.assertEqual(len(metrics_df), 5)
+        self.assertEqual(list(metrics_df['STAGE']),
+                         ['inner_stage', 'inner_stage', 'outer_stage',
+                          'failed_stage', 'raise_exception'])
+
+        # The counts of the nested stage are added to the outer stage
+        self.assertEqual(list(metrics_df['ROWS_IN']), [10, 100, 101, 0, 0])
+        self.assertEqual(list(metrics_df['ROWS_OUT']), [5, 50, 50, 0, 0])
+        self.assertEqual(list(metrics_df['ERROR_CODE']),
+                         [0, 0, 0, errno.EIO, errno.EIO])
+        self.assertTrue((metrics_df['WALL_TIME'] >= 0.0).all())
+        self.assertTrue((metrics_df['PEAK_RSS'] > 0).all())
+
+    def test_count_rows_outside_stage(self):
+        # Counts outside of a stage are ignored
+        count_rows_in(10)
+        count_rows_out(10)
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_write_run_report(self):
+        report_filename = os.path.join(self.directory.name, 'report.json')
+        self.assertEqual(write_run_report(self.filename, report_filename),
+                         errno.ENOENT)
+
+        inner_stage(10)
+        inner_stage(30)
+        outer_stage(100)
+        self.assertEqual(write_run_report(self.filename, report_filename), 0)
+
+        with open(report_filename, 'r') as file:
+            report = json.load(file)
+        self.assertEqual(len(report['records']), 4)
+        self.assertEqual(set(report['stages'].keys()),
+                         {'inner_stage', 'outer_stage'})
+        self.assertEqual(report['stages']['inner_stage']['ROWS_IN'], 140)
+        self.assertEqual(report['stages']['inner_stage']['ROWS_OUT'], 70)
+        self.assertEqual(report['stages']['outer_stage']['ROWS_IN'], 101)
+        self.assertTrue('ROWS_IN_PER_SECOND' in report['stages']['outer_stage'])
+
+        # Only the records of the run are reported
+        os.remove(self.filename)
+        previous_metrics = StageMetrics('previous_stage')
+        previous_metrics.start_time = datetime(2018, 1, 1)
+        write_stage_metrics(previous_metrics, self.filename)
+        start_time = datetime.utcnow()
+        inner_stage(10)
+        self.assertEqual(write_run_report(self.filename, report_filename,
+                                          start_time), 0)
+
+        with open(report_filename, 'r') as file:
+            report = json.load(file)
+        self.assertEqual(len(report['records']), 1)
+        self.assertEqual(set(report['stages'].keys()), {'inner_stage'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import sys
+import errno
+import tempfile
+import concurrent.futures as cf
+from pru.task_graph import *
+
+
+def write_file(input_filenames, output_filename):
+    """ Write the concatenated input files and the output filename to a file. """
+    text = ''
+    for filename in input_filenames:
+        with open(filename, 'r') as file:
+            text += file.read()
+    with open(output_filename, 'w') as file:
+        file.write(text + os.path.basename(output_filename) + '\n')
+    return 0
+
+
+def fail_task():
+    return errno.ENOENT
+
+
+def raise_exception():
+    raise ValueError('task failed')
+
+
+def exit_task(code):
+    sys.exit(code)
+
+
+class TestTaskGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.directory.name, name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_graph(self):
+        a, b, c, d = [self.path(name) for name in 'abcd']
+        graph = TaskGraph()
+        # Add the tasks in reverse order to test the dependencies
+        graph.add_task('task_d', write_file, args=([b, c], d),
+                       inputs=[b, c], outputs=[d])
+        graph.add_task('task_c', write_file, args=([a], c),
+                       inputs=[a], outputs=[c])
+        graph.add_task('task_b', write_file, args=([a], b),
+                       inputs=[a], outputs=[b])
+        graph.add_task('task_a', write_file, args=([], a), outputs=[a])
+        return graph
+
+    def test_is_successful(self):
+        self.assertTrue(is_successful(0))
+        self.assertTrue(is_successful(None))
+        self.assertTrue(is_successful(True))
+        self.assertFalse(is_successful(False))
+        self.assertFalse(is_successful(errno.EINVAL))
+        self.assertFalse(is_successful('error'))
+
+    def test_sorted_tasks(self):
+        graph = self.create_graph()
+        self.assertEqual(graph.dependencies(graph.tasks['task_d']),
+                         {'task_b', 'task_c'})
+
+        order = graph.sorted_tasks()
+        self.assertEqual(order[0], 'task_a')
+        self.assertEqual(order[-1], 'task_d')
+
+        graph.add_task('task_e', fail_task, requires=['task_f'])
+        graph.add_task('task_f', fail_task, requires=['task_e'])
+        self.assertRaises(ValueError, graph.sorted_tasks)
+
+    def test_add_duplicates(self):
+        graph = self.create_graph()
+        self.assertRaises(ValueError, graph.add_task, 'task_a', fail_task)
+        self.assertRaises(ValueError, graph.add_task, 'task_e', fail_task,
+                          outputs=[self.path('a')])
+
+    def test_run(self):
+        graph = self.create_graph()
+        state_filename = self.path('state.json')
+        with cf.ThreadPoolExecutor(max_workers=2) as executor:
+            results = graph.run(cpu_budget=2, state_filename=state_filename,
+                                executor=executor)
+        self.assertEqual(results, {'task_a': 0, 'task_b': 0, 'task_c': 0,
+                                   'task_d': 0})
+        with open(self.path('d'), 'r') as file:
+            self.assertEqual(file.read(), 'a\nb\na\nc\nd\n')
+
+        state = read_task_state(state_filename)
+        self.assertEqual(set(state), {'task_a', 'task_b', 'task_c', 'task_d'})
+
+        # A rerun should skip all of the tasks
+        d_signature = file_signature(self.path('d'))
+        graph = self.create_graph()
+        with cf.ThreadPoolExecutor(max_workers=2) as executor:
+            results = graph.run(cpu_budget=2, state_filename=state_filename,
+                                executor=executor)
+        self.assertEqual(count_failed_tasks(results), 0)
+        self.assertEqual(file_signature(self.path('d')), d_signature)
+
+        # Removing an intermediate file should only rerun its task and its
+        # dependent task
+        os.remove(self.path('c'))
+        a_signature = file_signature(self.path('a'))
+        b_signature = file_signature(self.path('b'))
+        graph = self.create_graph()
+        with cf.ThreadPoolExecutor(max_workers=2) as executor:
+            results = graph.run(cpu_budget=2, state_filename=state_filename,
+                                executor=executor)
+        self.assertEqual(count_failed_tasks(results), 0)
+        self.assertEqual(file_signature(self.path('a')), a_signature)
+        self.assertEqual(file_signature(self.path('b')), b_signature)
+        self.assertTrue(os.path.exists(self.path('c')))
+        self.assertNotEqual(file_signature(self.path('d')), d_signature)
+
+    def test_run_failures(self):
+        graph = self.create_graph()
+        graph.add_task('task_e', fail_task, requires=['task_a'])
+        graph.add_task('task_f', raise_exception, requires=['task_a'])
+        graph.add_task('task_g', write_file, args=([], self.path('g')),
+                       requires=['task_e'], outputs=[self.path('g')])
+        state_filename = self.path('state.json')
+        with cf.ThreadPoolExecutor(max_workers=1) as executor:
+            results = graph.run(cpu_budget=1, state_filename=state_filename,
+                                executor=executor)
+        self.assertEqual(results['task_d'], 0)
+        self.assertEqual(results['task_e'], errno.ENOENT)
+        self.assertEqual(results['task_f'], errno.EIO)
+        self.assertEqual(results['task_g'], errno.ECANCELED)
+        self.assertEqual(count_failed_tasks(results), 3)
+        self.assertFalse(os.path.exists(self.path('g')))
+
+        state = read_task_state(state_filename)
+        self.assertEqual(set(state), {'task_a', 'task_b', 'task_c', 'task_d'})
+
+    def test_run_exits(self):
+        graph = TaskGraph()
+        graph.add_task('task_a', exit_task, args=(errno.ENOENT,))
+        graph.add_task('task_b', write_file, args=([], self.path('b')),
+                       requires=['task_a'], outputs=[self.path('b')])
+        graph.add_task('task_c', exit_task, args=('error',))
+        graph.add_task('task_d', exit_task, args=(0,))
+        graph.add_task('task_e', write_file, args=([], self.path('e')),
+                       requires=['task_d'], outputs=[self.path('e')])
+        with cf.ThreadPoolExecutor(max_workers=1) as executor:
+            results = graph.run(cpu_budget=1, executor=executor)
+        self.assertEqual(results, {'task_a': errno.ENOENT, 'task_b': errno.ECANCELED,
+                                   'task_c': errno.EIO, 'task_d': 0, 'task_e': 0})
+
+        results = graph.run(cpu_budget=2)
+        self.assertEqual(results['task_a'], errno.ENOENT)
+        self.assertEqual(results['task_b'], errno.ECANCELED)
+        self.assertEqual(results['task_e'], 0)
+
+    def test_run_in_processes(self):
+        graph = self.create_graph()
+        results = graph.run(cpu_budget=2, memory_budget=1.0)
+        self.assertEqual(count_failed_tasks(results), 0)
+        with open(self.path('d'), 'r') as file:
+            self.assertEqual(file.read(), 'a\nb\na\nc\nd\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
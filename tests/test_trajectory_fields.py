@@ -44,6 +44,22 @@ class TestTrajectoryFields(unittest.TestCase):
 
         self.assertEqual(result1, '2017-07-31')
 
+    def test_iso8601_next_day(self):
+        """Test next ISO8601 date function."""
+
+        self.assertEqual(iso8601_next_day('2017-07-31'), '2017-08-01')
+        self.assertEqual(iso8601_next_day('2017-12-31'), '2018-01-01')
+
+    def test_iso8601_date_range(self):
+        """Test ISO8601 date range function."""
+
+        dates = iso8601_date_range('2017-07-30', '2017-08-02')
+        self.assertEqual(dates, ['2017-07-30', '2017-07-31',
+                                 '2017-08-01', '2017-08-02'])
+        self.assertEqual(iso8601_date_range('2017-08-01', '2017-08-01'),
+                         ['2017-08-01'])
+        self.assertEqual(iso8601_date_range('2017-08-02', '2017-08-01'), [])
+
     def test_compact_date(self):
         """Test conversion of CPR date times."""
 
@@ -95,6 +95,12 @@ class TestTrajectoryFiles(unittest.TestCase):
         to_date = '2017-08-31'
         self.assertEqual(create_apds_positions_filename(from_date, to_date), test_name)
 
+    def test_create_apds_event_index_filename(self):
+        test_name = 'apds_event_index_2017-08-01_2017-08-31.npz'
+        from_date = '2017-08-01'
+        to_date = '2017-08-31'
+        self.assertEqual(create_apds_event_index_filename(from_date, to_date), test_name)
+
     def test_create_convert_apds_filenames(self):
         from_date = '2017-08-01'
         to_date = '2017-08-31'
@@ -163,6 +169,7 @@ class TestTrajectoryFiles(unittest.TestCase):
         self.assertEqual(names[0], 'cpr_fr24_flights_2017-08-01.csv')
         self.assertEqual(names[1], 'raw_cpr_fr24_positions_2017-08-01.csv')
         self.assertEqual(names[2], 'cpr_fr24_events_2017-08-01.csv')
+        self.assertEqual(names[3], 'cpr_fr24_boundary_head_2017-08-01.npz')
 
     def test_create_match_consecutive_day_input_filenames(self):
         test_date = '2017-08-01'
@@ -172,6 +179,12 @@ class TestTrajectoryFiles(unittest.TestCase):
         self.assertEqual(names[2], 'cpr_fr24_positions_2017-07-31.csv')
         self.assertEqual(names[3], 'cpr_fr24_positions_2017-08-01.csv')
 
+    def test_create_match_consecutive_day_boundary_filenames(self):
+        test_date = '2017-08-01'
+        names = create_match_consecutive_day_boundary_filenames(test_date)
+        self.assertEqual(names[0], 'cpr_fr24_boundary_tail_2017-07-31.npz')
+        self.assertEqual(names[1], 'cpr_fr24_boundary_head_2017-08-01.npz')
+
     def test_create_match_overnight_flights_input_filenames(self):
         test_date = '2017-08-01'
         names = create_match_overnight_flights_input_filenames(test_date)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import bz2
+import tempfile
+import pandas as pd
+from pru.trajectory_merging import *
+
+POSITIONS_1 = """FLIGHT_ID,TIME,ALT
+1,2017-08-01T10:00:00Z,100
+1,2017-08-01T10:01:00Z,200
+2,2017-08-01T09:00:00Z,1000
+3,2017-08-01T11:00:00Z,3000
+3,2017-08-01T11:02:00Z,3200
+"""
+
+POSITIONS_2 = """FLIGHT_ID,TIME,ALT
+0xa,2017-08-01T10:00:30Z,150
+0xa,2017-08-01T10:02:00Z,250
+0xb,2017-08-01T08:00:00Z,800
+0xc,2017-08-01T11:01:00Z,3100
+"""
+
+NEW_IDS_1 = {'1': 'b', '2': 'a', '3': 'c'}
+NEW_IDS_2 = {'0xa': 'b', '0xc': 'c'}
+
+
+class TestTrajectoryMerging(unittest.TestCase):
+
+    def test_merge_flight_items(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename_1 = os.path.join(directory, 'positions_1.csv')
+            filename_2 = os.path.join(directory, 'positions_2.csv')
+            with open(filename_1, 'w') as file:
+                file.write(POSITIONS_1)
+            with open(filename_2, 'w') as file:
+                file.write(POSITIONS_2)
+
+            fields, runs = find_flight_item_runs(filename_2, NEW_IDS_2)
+            self.assertEqual(fields, ['FLIGHT_ID', 'TIME', 'ALT'])
+            self.assertEqual([run[0] for run in runs], ['b', 'c'])
+
+            fields, flights = merge_flight_items([filename_1, filename_2],
+                                                 [NEW_IDS_1, NEW_IDS_2])
+            flights = list(flights)
+            self.assertEqual([flight_id for flight_id, _ in flights], ['a', 'b', 'c'])
+            self.assertEqual([row[0] for row in flights[1][1]], ['1', '0xa', '1', '0xa'])
+
+            # The merged items are the same as concatenating and sorting them
+            output_filename = os.path.join(directory, 'merged_positions.csv')
+            count = merge_flight_items_files(output_filename, [filename_1, filename_2],
+                                             [NEW_IDS_1, NEW_IDS_2])
+            self.assertEqual(count, 8)
+
+            expected_df = pd.concat([pd.read_csv(filename_1, dtype={'FLIGHT_ID': str}),
+                                     pd.read_csv(filename_2)], ignore_index=True)
+            expected_df['FLIGHT_ID'] = \
+                expected_df['FLIGHT_ID'].map({**NEW_IDS_1, **NEW_IDS_2})
+            expected_df = expected_df.dropna().sort_values(by=['FLIGHT_ID', 'TIME'])
+            merged_df = pd.read_csv(output_filename)
+            self.assertEqual(merged_df.values.tolist(), expected_df.values.tolist())
+
+            # Files without new ids are merged by their flight ids
+            bz2_filename = os.path.join(directory, 'positions_1.csv.bz2')
+            with bz2.open(bz2_filename, 'wt') as file:
+                file.write(POSITIONS_1)
+            count = merge_flight_items_files(output_filename, [bz2_filename])
+            self.assertEqual(count, 5)
+            self.assertEqual(list(pd.read_csv(output_filename)['FLIGHT_ID']),
+                             [1, 1, 2, 3, 3])
+
+            # Times with fractional seconds are merged in time order
+            with open(filename_1, 'w') as file:
+                file.write('FLIGHT_ID,TIME,ALT\n'
+                           '1,2017-08-01T10:00:00.7Z,100\n'
+                           '1,2017-08-01T10:00:01Z,200\n')
+            with open(filename_2, 'w') as file:
+                file.write('FLIGHT_ID,TIME,ALT\n'
+                           '1,2017-08-01T10:00:00.5Z,150\n')
+            fields, flights = merge_flight_items([filename_1, filename_2])
+            self.assertEqual([row[2] for row in next(flights)[1]], ['150', '100', '200'])
+
+            with open(filename_2, 'w') as file:
+                file.write('FLIGHT_ID,TIME,ALT\n'
+                           '1,2017-08-01 10:00:00,150\n')
+            fields, flights = merge_flight_items([filename_1, filename_2])
+            self.assertRaises(ValueError, list, flights)
+
+            # Blank lines are ignored and lines without a comma are invalid
+            with open(filename_2, 'w') as file:
+                file.write(POSITIONS_2 + '\n')
+            fields, runs = find_flight_item_runs(filename_2)
+            self.assertEqual([run[0] for run in runs], ['0xa', '0xb', '0xc'])
+            count = merge_flight_items_files(output_filename, [filename_2])
+            self.assertEqual(count, 4)
+
+            with open(filename_2, 'w') as file:
+                file.write(POSITIONS_2 + '0xd\n')
+            self.assertRaises(ValueError, find_flight_item_runs, filename_2)
+
+            # Files with different fields can't be merged
+            with open(filename_2, 'w') as file:
+                file.write('FLIGHT_ID,TIME\n')
+            self.assertRaises(ValueError, merge_flight_items, [filename_1, filename_2])
+
+    def test_read_dataframe_with_new_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'positions.csv')
+            with open(filename, 'w') as file:
+                file.write(POSITIONS_1)
+
+            ids_df = pd.DataFrame({'NEW_FLIGHT_ID': ['c', 'a']},
+                                  index=pd.Index([3, 1], name='FLIGHT_ID'))
+            for chunksize in [1, 2, 100]:
+                df = read_dataframe_with_new_ids(filename, ids_df, chunksize=chunksize)
+                self.assertEqual(list(df.columns), ['NEW_FLIGHT_ID', 'FLIGHT_ID', 'TIME', 'ALT'])
+                self.assertEqual(list(df['NEW_FLIGHT_ID']), ['a', 'a', 'c', 'c'])
+                self.assertEqual(list(df['ALT']), [100, 200, 3000, 3200])
+                self.assertEqual(df['TIME'].iloc[0], pd.Timestamp('2017-08-01T10:00:00Z'))
+
+            # A flight may have more than one new id
+            ids_df = pd.DataFrame({'NEW_FLIGHT_ID': ['c', 'a', 'd']},
+                                  index=pd.Index([3, 1, 3], name='FLIGHT_ID'))
+            df = read_dataframe_with_new_ids(filename, ids_df, chunksize=2)
+            self.assertEqual(list(df['NEW_FLIGHT_ID']), ['a', 'a', 'c', 'd', 'c', 'd'])
+
+            with open(filename, 'w') as file:
+                file.write('FLIGHT_ID,TIME,ALT\n')
+            df = read_dataframe_with_new_ids(filename, ids_df)
+            self.assertEqual(len(df), 0)
+            self.assertEqual(list(df.columns), ['NEW_FLIGHT_ID', 'FLIGHT_ID', 'TIME', 'ALT'])
+
+    def test_relabel_flight_items(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'positions.csv')
+            with open(filename, 'w') as file:
+                file.write(POSITIONS_1.rstrip('\n'))
+            output_filename = os.path.join(directory, 'new_positions.csv')
+
+            self.assertEqual(relabel_flight_items(filename, output_filename,
+                                                  {'1': 'b', '3': 'a'}), 4)
+            df = pd.read_csv(output_filename)
+            self.assertEqual(list(df['FLIGHT_ID']), ['b', 'b', 'a', 'a'])
+            self.assertEqual(list(df['ALT']), [100, 200, 3000, 3200])
+
+            # Sort the flights by new flight id
+            self.assertEqual(relabel_flight_items(filename, output_filename, NEW_IDS_1,
+                                                  sort_buffer_size=100), 5)
+            df = pd.read_csv(output_filename)
+            self.assertEqual(list(df['FLIGHT_ID']), ['a', 'b', 'b', 'c', 'c'])
+            self.assertEqual(list(df['ALT']), [1000, 100, 200, 3000, 3200])
+
+            self.assertEqual(remove_flight_items(filename, output_filename, {'2', '3'}), 2)
+            with open(output_filename) as file:
+                self.assertEqual(file.read(), POSITIONS_1[:POSITIONS_1.index('2,')])
+
+            # Select the lines of the copied flights
+            selected = []
+            self.assertEqual(remove_flight_items(filename, output_filename, {'1'},
+                                                 select_lines=lambda flight_id, lines:
+                                                 selected.append((flight_id, lines))), 3)
+            self.assertEqual([flight_id for flight_id, _ in selected], ['2', '3'])
+            self.assertEqual(b''.join(selected[1][1]).decode(),
+                             POSITIONS_1[POSITIONS_1.index('3,'):])
+
+    def test_copy_flight_runs_blank_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'positions.csv')
+            with open(filename, 'w') as file:
+                file.write(POSITIONS_1.replace('2,', '\n2,') + '\n')
+            output_filename = os.path.join(directory, 'new_positions.csv')
+
+            self.assertEqual(relabel_flight_items(filename, output_filename, NEW_IDS_1), 5)
+            df = pd.read_csv(output_filename)
+            self.assertEqual(list(df['FLIGHT_ID']), ['b', 'b', 'a', 'c', 'c'])
+
+            with open(filename, 'w') as file:
+                file.write(POSITIONS_1 + '4\n')
+            self.assertRaises(ValueError, relabel_flight_items, filename,
+                              output_filename, NEW_IDS_1)
+
+    def test_create_new_ids_map(self):
+        ids_df = pd.DataFrame({'NEW_FLIGHT_ID': ['x', 'y']},
+                              index=pd.Index([123, 456], name='FLIGHT_ID'))
+        self.assertEqual(create_new_ids_map(ids_df), {'123': 'x', '456': 'y'})
+
+
+if __name__ == '__main__':
+    unittest.main()
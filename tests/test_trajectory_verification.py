@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import bisect
+import numpy as np
+import pandas as pd
+from pru.EcefPoint import EcefPoint
+from pru.EcefArc import EcefArc
+from pru.EcefPoint import distance_radians as ecef_distance_radians
+from pru.trajectory_functions import rad2nm, calculate_common_period, \
+    calculate_delta_time, calculate_value_reference, calculate_value, \
+    calculate_speed
+from pru.trajectory_verification import *
+
+DISTANCE_THRESHOLD = 3.0
+ALT_THRESHOLD = 500.0
+
+
+def position(points, index, ratio):
+    """ The scalar calculate_position, using EcefArcs. """
+    point = points[index]
+    if ratio > 0.0 and index < len(points) - 1:
+        arc = EcefArc(point, points[index + 1])
+        point = arc.position(ratio * arc.length)
+    return point
+
+
+def distance_nm(a, b):
+    return rad2nm(ecef_distance_radians(a, b))
+
+
+def compare_positions(a_times, b_times, a_points, b_points, a_alts, b_alts,
+                      distance_threshold, alt_threshold, time_threshold,
+                      speed_threshold):
+    """ A scalar reference implementation of compare_trajectory_positions. """
+    start_time, finish_time = calculate_common_period(a_times, b_times)
+    delta_time = calculate_delta_time(finish_time, start_time)
+    if delta_time < 0.0:
+        a_index, a_ratio = calculate_value_reference(a_times, start_time, is_time=True)
+        b_index, b_ratio = calculate_value_reference(b_times, start_time, is_time=True)
+        distance = distance_nm(position(a_points, a_index, a_ratio),
+                               position(b_points, b_index, b_ratio))
+        if distance > distance_threshold:
+            return False
+
+        delta_alt = abs(calculate_value(a_alts, a_index, a_ratio) -
+                        calculate_value(b_alts, b_index, b_ratio))
+        if delta_alt > alt_threshold:
+            return False
+
+        a_index, a_ratio = calculate_value_reference(a_times, finish_time, is_time=True)
+        b_index, b_ratio = calculate_value_reference(b_times, finish_time, is_time=True)
+        distance = distance_nm(position(a_points, a_index, a_ratio),
+                               position(b_points, b_index, b_ratio))
+        delta_alt = abs(calculate_value(a_alts, a_index, a_ratio) -
+                        calculate_value(b_alts, b_index, b_ratio))
+
+    elif finish_time == start_time:
+        a_index = bisect.bisect_left(a_times, start_time)
+        b_index = bisect.bisect_left(b_times, start_time)
+        distance = distance_nm(a_points[a_index], b_points[b_index])
+        delta_alt = abs(a_alts[a_index] - b_alts[b_index])
+
+    else:
+        if delta_time <= time_threshold:
+            distance = distance_nm(a_points[0], b_points[-1])
+            return calculate_speed(distance, delta_time) <= speed_threshold
+        else:
+            return False
+
+    return (distance <= distance_threshold) and (delta_alt <= alt_threshold)
+
+
+def compare_samples(a_times, b_times, a_points, b_points, a_alts, b_alts,
+                    distance_threshold, alt_threshold, samples):
+    """ A scalar reference implementation of comparing overlapping positions at samples. """
+    start_time, finish_time = calculate_common_period(a_times, b_times)
+    period = (finish_time - start_time).astype(np.int64)
+    for step in range(samples):
+        time = start_time + np.timedelta64(period * step // (samples - 1), 'ns')
+        a_index, a_ratio = calculate_value_reference(a_times, time, is_time=True)
+        b_index, b_ratio = calculate_value_reference(b_times, time, is_time=True)
+        distance = distance_nm(position(a_points, a_index, a_ratio),
+                               position(b_points, b_index, b_ratio))
+        delta_alt = abs(calculate_value(a_alts, a_index, a_ratio) -
+                        calculate_value(b_alts, b_index, b_ratio))
+        if (distance > distance_threshold) or (delta_alt > alt_threshold):
+            return False
+
+    return True
+
+
+def generate_positions(flights_count, seed):
+    """ Generate random flight positions on a few routes. """
+    random = np.random.RandomState(seed)
+    start_time = np.datetime64('2017-08-01T10:00:00', 'ns')
+    frames = []
+    for flight_id in range(flights_count):
+        count = random.randint(1, 12)
+        times = start_time + np.sort(random.choice(np.arange(0, 3600, 30), count,
+                                                   replace=False)).astype('timedelta64[s]')
+        route = flight_id % 3
+        frames.append(pd.DataFrame({'FLIGHT_ID': flight_id,
+                                    'TIME': times,
+                                    'LAT': 50.0 + route * 0.02 + np.linspace(0.0, 1.0, count),
+                                    'LON': np.linspace(0.0, 1.0, count) + random.rand() * 0.05,
+                                    'ALT': 10000.0 + random.randint(0, 4, count) * 200.0}))
+    return pd.concat(frames).set_index('FLIGHT_ID')
+
+
+def flight_arrays(positions_df, flight_id):
+    flight_df = positions_df.loc[[flight_id]]
+    points = [EcefPoint.from_lat_long((lat, lon)).coords
+              for lat, lon in zip(flight_df['LAT'], flight_df['LON'])]
+    return flight_df['TIME'].values, points, flight_df['ALT'].values
+
+
+class TestTrajectoryVerification(unittest.TestCase):
+
+    def test_flight_positions(self):
+        positions_df = generate_positions(5, 0)
+        positions = FlightPositions(positions_df)
+        self.assertEqual(len(positions), 5)
+        self.assertEqual(list(positions.flight_indicies([4, 0, 9])), [4, 0, -1])
+        self.assertEqual(list(positions.position_counts([0, 9])),
+                         [len(positions_df.loc[[0]]), 0])
+
+        # bisect_left matches bisect.bisect_left within each flight
+        times = positions_df['TIME'].values.astype(np.int64)
+        flights = np.repeat(np.arange(5), 3)
+        query_times = np.concatenate([times[positions.starts[i]] +
+                                      np.array([0, 15, 30]) * 1000000000
+                                      for i in range(5)])
+        indicies = positions.bisect_left(flights, query_times)
+        for flight, time, index in zip(flights, query_times, indicies):
+            flight_times = list(positions_df.loc[[flight], 'TIME'].values.astype(np.int64))
+            self.assertEqual(index, bisect.bisect_left(flight_times, time))
+
+    def test_compare_flight_positions(self):
+        a_positions_df = generate_positions(30, 1)
+        b_positions_df = generate_positions(30, 2)
+        a_positions = FlightPositions(a_positions_df)
+        b_positions = FlightPositions(b_positions_df)
+
+        a_ids, b_ids = np.meshgrid(np.arange(30), np.arange(30), indexing='ij')
+        a_ids = a_ids.ravel()
+        b_ids = b_ids.ravel()
+
+        for time_threshold in [0.0, 600.0]:
+            results = compare_flight_positions(a_positions, a_ids, b_positions, b_ids,
+                                               distance_threshold=DISTANCE_THRESHOLD,
+                                               alt_threshold=ALT_THRESHOLD,
+                                               time_threshold=time_threshold)
+            expected = []
+            for a_id, b_id in zip(a_ids, b_ids):
+                a_times, a_points, a_alts = flight_arrays(a_positions_df, a_id)
+                b_times, b_points, b_alts = flight_arrays(b_positions_df, b_id)
+                expected.append(compare_positions(a_times, b_times, a_points, b_points,
+                                                  a_alts, b_alts, DISTANCE_THRESHOLD,
+                                                  ALT_THRESHOLD, time_threshold, 750.0))
+
+            self.assertTrue(any(expected))
+            self.assertFalse(all(expected))
+            self.assertEqual(list(results), expected)
+
+        # Flights without positions do not match
+        results = compare_flight_positions(a_positions, [0, 99], b_positions, [99, 0])
+        self.assertEqual(list(results), [False, False])
+
+    def test_compare_flight_positions_samples(self):
+        a_positions_df = generate_positions(30, 13)
+        b_positions_df = generate_positions(30, 14)
+        a_positions = FlightPositions(a_positions_df)
+        b_positions = FlightPositions(b_positions_df)
+
+        a_ids, b_ids = np.meshgrid(np.arange(30), np.arange(30), indexing='ij')
+        a_ids = a_ids.ravel()
+        b_ids = b_ids.ravel()
+
+        end_results = compare_flight_positions(a_positions, a_ids, b_positions, b_ids,
+                                               distance_threshold=DISTANCE_THRESHOLD,
+                                               alt_threshold=ALT_THRESHOLD)
+        results = compare_flight_positions(a_positions, a_ids, b_positions, b_ids,
+                                           distance_threshold=DISTANCE_THRESHOLD,
+                                           alt_threshold=ALT_THRESHOLD, samples=7)
+        expected = []
+        for a_id, b_id, end_result in zip(a_ids, b_ids, end_results):
+            a_times, a_points, a_alts = flight_arrays(a_positions_df, a_id)
+            b_times, b_points, b_alts = flight_arrays(b_positions_df, b_id)
+            start_time, finish_time = calculate_common_period(a_times, b_times)
+            if start_time < finish_time:
+                expected.append(compare_samples(a_times, b_times, a_points, b_points,
+                                                a_alts, b_alts, DISTANCE_THRESHOLD,
+                                                ALT_THRESHOLD, 7))
+            else:
+                expected.append(end_result)
+
+        self.assertTrue(any(expected))
+        self.assertEqual(list(results), expected)
+
+        # More samples can only reject more pairs
+        self.assertFalse((results & ~end_results).any())
+        self.assertTrue((end_results & ~results).any())
+
+        # Two samples are the start and finish of the common period
+        results = compare_flight_positions(a_positions, a_ids, b_positions, b_ids,
+                                           distance_threshold=DISTANCE_THRESHOLD,
+                                           alt_threshold=ALT_THRESHOLD, samples=2)
+        self.assertEqual(list(results), list(end_results))
+
+    def test_shard_pairs(self):
+        shards = shard_pairs(pd.Series(['a', 'b', 'a', None, 'c']), 2)
+        self.assertEqual(list(shards), [0, 1, 0, 0, 0])
+
+        keys = pd.DataFrame({'ADEP': ['EGLL', 'EGLL', 'LFPG', 'EGLL'],
+                             'ADES': ['LFPG', 'EDDF', 'EGLL', 'LFPG']})
+        shards = shard_pairs(keys, 3)
+        self.assertEqual(list(shards), [0, 1, 2, 0])
+
+    def test_compare_flight_positions_in_shards(self):
+        a_positions = FlightPositions(generate_positions(50, 3))
+        b_positions = FlightPositions(generate_positions(50, 4))
+
+        a_ids, b_ids = np.meshgrid(np.arange(50), np.arange(50), indexing='ij')
+        a_ids = a_ids.ravel()
+        b_ids = b_ids.ravel()
+        keys = pd.Series(b_ids % 7)
+
+        expected = compare_flight_positions(a_positions, a_ids, b_positions, b_ids,
+                                            distance_threshold=DISTANCE_THRESHOLD)
+        results = compare_flight_positions_in_shards(a_positions, a_ids,
+                                                     b_positions, b_ids, keys,
+                                                     processes=2,
+                                                     distance_threshold=DISTANCE_THRESHOLD)
+        self.assertTrue(expected.any())
+        self.assertEqual(list(results), list(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
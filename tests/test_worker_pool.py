@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2018 Via Technology Ltd. All Rights Reserved.
+# Consult your license regarding permissions and restrictions.
+
+import unittest
+import os
+import sys
+import errno
+import tempfile
+from pru.worker_pool import *
+
+
+def app_function(value, *, error_code=0):
+    return error_code
+
+
+def task_function(is_ok):
+    return is_ok
+
+
+def raise_exception():
+    raise ValueError('app failed')
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def test_run_app_function(self):
+        result = run_app_function(app_function, (1,), {})
+        self.assertEqual(result.name, 'app_function')
+        self.assertEqual(result.error_code, 0)
+        self.assertTrue(result)
+        self.assertEqual(result.pid, os.getpid())
+        self.assertTrue(result.wall_time >= 0.0)
+        self.assertTrue(result.cpu_time >= 0.0)
+        self.assertIsNone(result.exception)
+
+        result = run_app_function(app_function, (1,), {'error_code': errno.ENOENT})
+        self.assertEqual(result.error_code, errno.ENOENT)
+        self.assertFalse(result)
+
+        self.assertEqual(run_app_function(task_function, (True,), {}).error_code, 0)
+        self.assertEqual(run_app_function(task_function, (False,), {}).error_code,
+                         errno.EIO)
+
+        result = run_app_function(raise_exception, (), {})
+        self.assertEqual(result.error_code, errno.EIO)
+        self.assertIn('app failed', result.exception)
+
+    def test_worker_pool(self):
+        with WorkerPool(2, modules=['json', 'not_a_module']) as pool:
+            pids = pool.warm_up()
+            self.assertEqual(len(pids), 2)
+            self.assertNotIn(os.getpid(), pids)
+
+            result = pool.run_app(app_function, 1, error_code=errno.EINVAL)
+            self.assertEqual(result.error_code, errno.EINVAL)
+            self.assertIn(result.pid, pids)
+
+            results = pool.map_app(task_function, [(True,), (False,), (True,)])
+            self.assertEqual([r.error_code for r in results], [0, errno.EIO, 0])
+
+    def test_warm_up_slow_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'slow_worker_module.py'), 'w') as file:
+                file.write('import time\ntime.sleep(0.5)\n')
+            sys.path.insert(0, directory)
+            try:
+                with WorkerPool(3, modules=['slow_worker_module']) as pool:
+                    self.assertEqual(len(pool.warm_up()), 3)
+            finally:
+                sys.path.remove(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()